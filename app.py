@@ -1,14 +1,19 @@
 import streamlit as st
 import os
 import time
-from utils.data_handler import load_data, extract_breakpoints
-from components.price_chart import render_progressive_chart, build_progressive_figure
+from utils.data_handler import load_data, extract_breakpoints, get_dataset_key
+from components.price_chart import render_progressive_chart, build_progressive_figure, get_price_pyramid, get_indicator_series
 from components.trading_interface import render_trading_interface
-from components.portfolio_stats import render_portfolio_stats, render_performance_charts
+from components.portfolio_stats import render_portfolio_stats, render_performance_charts, render_range_review, render_decision_analytics, render_policy_robustness, get_reference_paths, reference_lines
 from components.admin_panel import render_admin_panel
-from utils.session_manager import initialize_session_state, reset_simulation_state
+from components.game_room import get_current_room, render_room_view, render_room_lobby
+from utils.session_manager import initialize_session_state, reset_simulation_state, load_session_from_store, save_session_to_store, begin_session_run, end_session_run
 from utils.portfolio_manager import initialize_portfolios, update_player_portfolios
-from utils.visual_configs import CURRENCY_INDICATOR
+from utils.visual_configs import CURRENCY_INDICATOR, get_hoverlabel_config
+from utils.chart_payload import enable_fast_json
+from utils.instruments import InstrumentSet, instrument_frame, instrument_names
+from utils.margin import settle_until
+from utils.cost_models import day_volume
 
 # Page configuration
 st.set_page_config(
@@ -17,6 +22,112 @@ st.set_page_config(
     layout="wide"
 )
 
+# Serialize chart payloads with orjson when available
+enable_fast_json()
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def load_ticker_data(ticker_path, modified_time):
+    """Load a predefined ticker once and share it across reruns and sessions"""
+    df = load_data(ticker_path)
+    # Build per-dataset structures once at load time
+    get_price_pyramid(df)
+    return df
+
+def get_ticker_data(ticker):
+    """Get the (cached) DataFrame for a predefined ticker"""
+    ticker_path = os.path.join('data', f"{ticker}.csv")
+    return load_ticker_data(ticker_path, os.path.getmtime(ticker_path))
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _build_instruments(dataset_key, _df):
+    """Build the price matrix and resting-order crossing indices once per dataset (shared across sessions)"""
+    return InstrumentSet(_df)
+
+def get_instruments(df):
+    """Get the (cached) InstrumentSet of a dataset"""
+    return _build_instruments(get_dataset_key(df), df)
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _build_instrument_frame(dataset_key, instrument, _df):
+    """Build the single-instrument view of one instrument once per dataset (shared across sessions)"""
+    frame = instrument_frame(_df, instrument)
+    get_price_pyramid(frame)
+    return frame
+
+def get_selected_instrument(df):
+    """Index of the instrument charted and traded (clamped to the dataset)"""
+    instrument = st.session_state.selected_instrument
+    if instrument >= len(get_instruments(df)):
+        instrument = st.session_state.selected_instrument = 0
+    return instrument
+
+def get_chart_data(df):
+    """Single-instrument data of the selected instrument, for the chart"""
+    return _build_instrument_frame(get_dataset_key(df), get_selected_instrument(df), df)
+
+def render_instrument_selector(df):
+    """Let players pick the instrument to chart and trade when the dataset has several"""
+    names = instrument_names(df)
+    if len(names) < 2:
+        return
+    st.session_state.selected_instrument = st.selectbox(
+        "Instrument",
+        range(len(names)),
+        index=get_selected_instrument(df),
+        format_func=lambda i: names[i],
+        key="instrument_selector"
+    )
+
+def commit_staged_trades(df, breakpoints):
+    """
+    Apply the orders staged at the current breakpoint before the simulation moves on.
+
+    Resting orders are scheduled in one batch: each gets the day (before the
+    next breakpoint) on which its price is first crossed.
+
+    Returns:
+        bool: False if the commit failed (portfolios are left unchanged)
+    """
+    try:
+        st.session_state.trade_buffer.commit(
+            st.session_state.portfolios, st.session_state.trade_journal, st.session_state.order_book
+        )
+    except ValueError as e:
+        st.error(f"Could not apply staged trades: {e}")
+        return False
+    current_index = st.session_state.current_day_index
+    next_breakpoints = [bp for bp in breakpoints if bp > current_index]
+    expiry_day = next_breakpoints[0] - 1 if next_breakpoints else len(df) - 1
+    st.session_state.order_book.schedule(
+        get_instruments(df).crossing_indices, expiry_day, st.session_state.trade_journal, st.session_state.portfolios
+    )
+    return True
+
+def advance_to_day(df, day_index):
+    """
+    Move the clock forward to day_index, applying margin calls and resting-order
+    fills on the way and valuing every portfolio on every day passed
+    """
+    instruments = get_instruments(df)
+    filled, margin_calls = settle_until(
+        st.session_state.portfolios, df, instruments, st.session_state.order_book,
+        st.session_state.current_day_index, day_index, st.session_state.trade_journal
+    )
+    player_names = st.session_state.player_names
+    tickers = [f" {name}" for name in instruments.names] if instruments.is_multi else [""]
+    for order in filled:
+        st.toast(
+            f"{player_names.get(order.player_num, f'Player {order.player_num}')}: "
+            f"{order.order_type.replace('_', ' ')} filled, {order.quantity}{tickers[order.instrument]} "
+            f"@ {CURRENCY_INDICATOR}{order.fill_price:.2f}"
+        )
+    for call in margin_calls:
+        st.toast(
+            f"{player_names.get(call.player_num, f'Player {call.player_num}')}: "
+            f"margin call, {call.quantity} shorted{tickers[call.instrument]} shares covered @ {CURRENCY_INDICATOR}{call.price:.2f}"
+        )
+    st.session_state.current_day_index = day_index
+
 def handle_progress_controls():
     """Handle start/pause/skip buttons"""
     st.markdown("### Progress Control")
@@ -27,8 +138,7 @@ def handle_progress_controls():
     if st.session_state.data_source == 'uploaded' and st.session_state.uploaded_data is not None:
         df = st.session_state.uploaded_data
     elif st.session_state.data_source == 'predefined':
-        ticker_path = os.path.join('data', f"{st.session_state.selected_ticker}.csv")
-        df = load_data(ticker_path)
+        df = get_ticker_data(st.session_state.selected_ticker)
     if df is not None:
         breakpoints = extract_breakpoints(df)
 
@@ -41,10 +151,12 @@ def handle_progress_controls():
 
     with col1:
         if st.button("Start", use_container_width=True, disabled=at_end):
+            if df is None or len(df) == 0 or not commit_staged_trades(df, breakpoints):
+                st.stop()
             st.session_state.auto_progress = True
             st.session_state.waiting_for_trade = False
             st.session_state.trade_made = False
-            st.session_state.current_day_index += 1
+            advance_to_day(df, st.session_state.current_day_index + 1)
             st.rerun()
 
     with col2:
@@ -54,7 +166,7 @@ def handle_progress_controls():
 
     with col3:
         if st.button("Skip", use_container_width=True, disabled=at_end):
-            if df is None or len(df) == 0:
+            if df is None or len(df) == 0 or not commit_staged_trades(df, breakpoints):
                 st.stop()
             current_index = st.session_state.current_day_index
             next_breakpoints = [bp for bp in breakpoints if bp > current_index]
@@ -62,17 +174,28 @@ def handle_progress_controls():
                 next_index = next_breakpoints[0]
             else:
                 next_index = len(df) - 1
-            st.session_state.current_day_index = next_index
+            advance_to_day(df, next_index)
             # Pause and set waiting status based on whether the destination is a breakpoint
             st.session_state.auto_progress = False
             st.session_state.waiting_for_trade = next_index in breakpoints
             st.session_state.trade_made = False
             st.rerun()
 
+    # Nothing follows the last day, so orders staged on it are applied on request
+    # (the trading grid and stats render after this, so no rerun is needed)
+    if at_end and st.button("Commit Trades", key="commit_trades", use_container_width=True,
+                            disabled=not st.session_state.trade_buffer.has_orders()):
+        if commit_staged_trades(df, breakpoints):
+            st.session_state.trade_made = False
+
 def render_trading_grid(df, current_day_index, breakpoints):
     """Render the trading decision grid for all players"""
     # Store current date in session state for trading history
     st.session_state.current_date = df.iloc[current_day_index]['Date']
+    instrument = get_selected_instrument(df)
+    st.session_state.current_volume = day_volume(df, current_day_index, instrument)
+    current_price = get_instruments(df).prices[current_day_index, instrument]
+    names = instrument_names(df)
     
     with st.container():
         # Create a 2x2 grid for trading decisions
@@ -87,15 +210,75 @@ def render_trading_grid(df, current_day_index, breakpoints):
                             if current_day_index in breakpoints:
                                 st.session_state.waiting_for_trade = True
                             render_trading_interface(
-                                df.iloc[current_day_index]['Price'],
+                                current_price,
                                 st.session_state.portfolios[player_num],
                                 player_num,
-                                is_breakpoint=current_day_index in breakpoints
+                                is_breakpoint=current_day_index in breakpoints,
+                                instrument=instrument,
+                                names=names
                             )
 
+def _frame_settings_key(df):
+    """Fingerprint of everything a chart frame depends on"""
+    return (get_dataset_key(df), st.session_state.chart_hoverlabel_font_size, st.session_state.chart_mode,
+            st.session_state.chart_indicators, st.session_state.starting_cash, st.session_state.cost_model)
+
+def _build_chart_frame(df, chart_df, current_day_index, breakpoints, hoverlabel, chart_mode, pyramid, indicators,
+                       reference_paths):
+    """
+    Build one frame (safe to call off the script thread): the ticker price and
+    chart figure of the charted instrument, and the downsampled reference
+    lines of the performance chart.
+    """
+    return {
+        'price': chart_df.iloc[current_day_index]['Price'],
+        'figure': build_progressive_figure(
+            chart_df, current_day_index, breakpoints,
+            hoverlabel=hoverlabel, chart_mode=chart_mode, pyramid=pyramid, indicators=indicators
+        ),
+        'reference': reference_lines(reference_paths, df, current_day_index)
+    }
+
+def start_frame_precompute(df, breakpoints):
+    """Precompute chart frames up to the next breakpoint in the background"""
+    chart_df = get_chart_data(df)
+    current_index = st.session_state.current_day_index
+    if current_index >= len(df) - 1:
+        return
+    next_breakpoints = [bp for bp in breakpoints if bp > current_index]
+    target_index = next_breakpoints[0] if next_breakpoints else len(df) - 1
+    hoverlabel = get_hoverlabel_config()
+    chart_mode = st.session_state.chart_mode
+    pyramid = get_price_pyramid(chart_df)
+    indicators = get_indicator_series(chart_df, st.session_state.chart_indicators)
+    paths = get_reference_paths(df)
+    st.session_state.frame_precomputer.start(
+        _frame_settings_key(chart_df),
+        current_index + 1,
+        target_index,
+        len(df),
+        lambda day_index: _build_chart_frame(
+            df, chart_df, day_index, breakpoints, hoverlabel, chart_mode, pyramid, indicators, paths
+        )
+    )
+
 def _render_chart_frame(ticker_placeholder, chart_placeholder, df, current_day_index, breakpoints):
-    """Render only the ticker and chart into provided placeholders"""
-    current_price = df.iloc[current_day_index]['Price']
+    """
+    Render only the ticker and chart into provided placeholders.
+
+    Returns:
+        Dict: The frame shown (its reference lines feed the performance chart)
+    """
+    chart_df = get_chart_data(df)
+    # Use the precomputed frame when the background worker already built it
+    frame = st.session_state.frame_precomputer.pop(current_day_index, _frame_settings_key(chart_df))
+    if frame is None:
+        frame = _build_chart_frame(
+            df, chart_df, current_day_index, breakpoints,
+            get_hoverlabel_config(), st.session_state.chart_mode, get_price_pyramid(chart_df),
+            get_indicator_series(chart_df, st.session_state.chart_indicators), get_reference_paths(df)
+        )
+    current_price = frame['price']
     ticker_placeholder.markdown(
         f"""
         <div style='text-align: center; padding: 10px; margin-bottom: 5px;'>
@@ -104,11 +287,14 @@ def _render_chart_frame(ticker_placeholder, chart_placeholder, df, current_day_i
         """,
         unsafe_allow_html=True
     )
-    fig = build_progressive_figure(df, current_day_index, breakpoints)
-    chart_placeholder.plotly_chart(fig, use_container_width=True)
+    chart_placeholder.plotly_chart(frame['figure'], use_container_width=True)
+    return frame
 
 def handle_auto_progress_live(df, breakpoints, ticker_placeholder, chart_placeholder):
     """Update only ticker and chart in-place during auto progression"""
+    # Build upcoming frames in the background: during a pause this uses the idle
+    # time while players decide, during playback it keeps the worker ahead
+    start_frame_precompute(df, breakpoints)
     if not st.session_state.auto_progress or st.session_state.waiting_for_trade:
         return
     # Keep updating within the same run until breakpoint/end
@@ -120,7 +306,7 @@ def handle_auto_progress_live(df, breakpoints, ticker_placeholder, chart_placeho
             return
 
         # Advance one step
-        st.session_state.current_day_index += 1
+        advance_to_day(df, st.session_state.current_day_index + 1)
 
         # Update only the chart/ticker
         _render_chart_frame(ticker_placeholder, chart_placeholder, df, st.session_state.current_day_index, breakpoints)
@@ -159,8 +345,18 @@ def inject_custom_css():
     )
 
 def main():
+    begin_session_run()
     # Initialize session state
     initialize_session_state()
+    # Pick up the game if another worker (or a previous process) saved a newer version
+    load_session_from_store()
+    
+    # Sessions in a shared game room follow the room instead of a local game
+    room = get_current_room()
+    if room is not None:
+        render_room_view(room)
+        inject_custom_css()
+        return
     
     # Create header with title and progress controls
     header_col1, header_col2 = st.columns([3, 1])
@@ -195,9 +391,10 @@ def main():
             col1, col2 = st.columns([3, 1])  # 75% for chart, 25% for trading decisions
             
             with col1:
+                render_instrument_selector(df)
                 ticker_placeholder = st.empty()
                 chart_placeholder = st.empty()
-                _render_chart_frame(ticker_placeholder, chart_placeholder, df, st.session_state.current_day_index, breakpoints)
+                frame = _render_chart_frame(ticker_placeholder, chart_placeholder, df, st.session_state.current_day_index, breakpoints)
             
             with col2:
                 render_trading_grid(df, st.session_state.current_day_index, breakpoints)
@@ -206,7 +403,10 @@ def main():
             render_portfolio_stats(df, st.session_state.current_day_index)
             
             # Render performance charts and trading history
-            render_performance_charts()
+            render_performance_charts(instrument_names(df), frame['reference'])
+            render_range_review(df, breakpoints)
+            render_decision_analytics(df, breakpoints)
+            render_policy_robustness(df, breakpoints, get_selected_instrument(df))
 
             # Handle auto progress logic (only ticker/chart update)
             handle_auto_progress_live(df, breakpoints, ticker_placeholder, chart_placeholder)
@@ -218,8 +418,7 @@ def main():
             breakpoints = []
     else:
         # Load predefined ticker data
-        ticker_path = os.path.join('data', f"{st.session_state.selected_ticker}.csv")
-        df = load_data(ticker_path)
+        df = get_ticker_data(st.session_state.selected_ticker)
         breakpoints = extract_breakpoints(df)
         
         # Ensure current_day_index is within bounds
@@ -230,9 +429,10 @@ def main():
         col1, col2 = st.columns([3, 1])  # 75% for chart, 25% for trading decisions
         
         with col1:
+            render_instrument_selector(df)
             ticker_placeholder = st.empty()
             chart_placeholder = st.empty()
-            _render_chart_frame(ticker_placeholder, chart_placeholder, df, st.session_state.current_day_index, breakpoints)
+            frame = _render_chart_frame(ticker_placeholder, chart_placeholder, df, st.session_state.current_day_index, breakpoints)
         
         with col2:
             render_trading_grid(df, st.session_state.current_day_index, breakpoints)
@@ -241,11 +441,17 @@ def main():
         render_portfolio_stats(df, st.session_state.current_day_index)
         
         # Render performance charts and trading history
-        render_performance_charts()
+        render_performance_charts(instrument_names(df), frame['reference'])
+        render_range_review(df, breakpoints)
+        render_decision_analytics(df, breakpoints)
+        render_policy_robustness(df, breakpoints, get_selected_instrument(df))
 
         # Handle auto progress logic (only ticker/chart update)
         handle_auto_progress_live(df, breakpoints, ticker_placeholder, chart_placeholder)
 
+    # Shared multiplayer rooms
+    render_room_lobby(df, breakpoints)
+
     # Render admin settings panel - force expanded if no uploaded data
     should_expand = st.session_state.data_source == 'uploaded' and st.session_state.uploaded_data is None
     render_admin_panel(df, breakpoints, force_expanded=should_expand)
@@ -254,4 +460,9 @@ def main():
     inject_custom_css()
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # Also runs when the script ends through st.rerun() / st.stop()
+        save_session_to_store()
+        end_session_run()
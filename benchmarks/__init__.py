@@ -0,0 +1,3 @@
+"""
+Performance benchmarks for the Trading Decision Simulator.
+"""
\ No newline at end of file
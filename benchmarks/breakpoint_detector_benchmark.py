@@ -0,0 +1,24 @@
+"""
+Time breakpoint detection on long synthetic price series.
+
+Usage:
+    python -m benchmarks.breakpoint_detector_benchmark [num_rows]
+"""
+import sys
+import time
+import numpy as np
+from utils.breakpoint_detector import BREAKPOINT_METHODS, detect_breakpoints
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    rng = np.random.default_rng(0)
+    prices = 100 * np.exp(np.cumsum(rng.standard_normal(num_rows) * 0.0126))
+    print(f"{num_rows:,} rows")
+    for method in BREAKPOINT_METHODS:
+        start = time.perf_counter()
+        flags = detect_breakpoints(prices, method)
+        elapsed = time.perf_counter() - start
+        print(f"{method:<11} {elapsed * 1000:>7.1f} ms  {int(flags.sum()):>8,} breakpoints")
+
+if __name__ == '__main__':
+    main()
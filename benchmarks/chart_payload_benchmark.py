@@ -0,0 +1,65 @@
+"""
+Measure bytes per frame and encode time of the progressive price chart payload.
+
+Compares the original encoding (pandas columns, stdlib JSON) with the compact
+encoding used by the charts (epoch-ms dates, float32 WebGL series, orjson) and
+with base64 typed arrays.
+
+Usage:
+    python -m benchmarks.chart_payload_benchmark [num_points]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+from utils.chart_payload import to_epoch_ms, compact_values, serialize_figure, orjson
+from utils.visual_configs import get_scatter_class
+
+def make_series(num_points: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, num_points)))
+    return pd.DataFrame({
+        'Date': pd.date_range('2024-01-01', periods=num_points, freq='min'),
+        'Price': prices
+    })
+
+def build_frame(df: pd.DataFrame, current_day_index: int, compact: bool) -> go.Figure:
+    masked = df['Price'].copy()
+    masked.iloc[current_day_index + 1:] = np.nan
+    if compact:
+        x, y = to_epoch_ms(df['Date']), compact_values(masked)
+    else:
+        x, y = df['Date'], masked
+    fig = go.Figure(get_scatter_class(len(df))(x=x, y=y, mode='lines', name='Price'))
+    fig.update_layout(xaxis_type='date')
+    return fig
+
+def measure(fig: go.Figure, engine: str, binary: bool, repeats: int = 5):
+    pio.json.config.default_engine = engine
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        payload = serialize_figure(fig, binary=binary)
+        timings.append(time.perf_counter() - start)
+    return len(payload.encode('utf-8')), min(timings)
+
+def main(num_points: int = 100_000):
+    df = make_series(num_points)
+    current_day_index = num_points - 1
+    engines = ['json'] + (['orjson'] if orjson is not None else [])
+
+    rows = [('original (pandas, json)', build_frame(df, current_day_index, compact=False), 'json', False)]
+    for engine in engines:
+        rows.append((f'compact ({engine})', build_frame(df, current_day_index, compact=True), engine, False))
+        rows.append((f'typed arrays ({engine})', build_frame(df, current_day_index, compact=True), engine, True))
+
+    print(f"Progressive chart frame, {num_points:,} points")
+    print(f"{'encoding':<28}{'bytes/frame':>14}{'encode ms':>12}")
+    for label, fig, engine, binary in rows:
+        size, seconds = measure(fig, engine, binary)
+        print(f"{label:<28}{size:>14,}{seconds * 1000:>12.1f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,48 @@
+"""
+Measure the memory saved by compact storage of a large intraday OHLCV dataset.
+
+Prices are quoted in cents, so int32 ticks store them exactly. Also times
+the reads the app makes: one day's row, and a whole Date column decoded.
+
+Usage:
+    python -m benchmarks.compact_data_benchmark [num_rows]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from utils.compact_data import COMPACT_PRICE_MODES, CompactDataset
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    rng = np.random.default_rng(0)
+    prices = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.0002, num_rows))), 2)
+    df = pd.DataFrame({
+        'Date': pd.date_range('2020-01-01', periods=num_rows, freq='s'),
+        'Open': prices.astype('float32'),
+        'High': (prices + 0.05).astype('float32'),
+        'Low': (prices - 0.05).astype('float32'),
+        'Volume': rng.integers(0, 10_000, num_rows),
+        'Price': prices,
+        'Breakpoint': np.arange(num_rows) % 500 == 0
+    })
+    print(f"{num_rows:,} rows, {df.memory_usage(index=True, deep=True).sum() / 1024 ** 2:,.1f} MB as a DataFrame")
+
+    for mode in COMPACT_PRICE_MODES:
+        start = time.perf_counter()
+        data = CompactDataset.from_frame(df, mode)
+        compact_time = time.perf_counter() - start
+        start = time.perf_counter()
+        data.iloc[num_rows // 2]
+        row_time = time.perf_counter() - start
+        start = time.perf_counter()
+        dates = data['Date']
+        column_time = time.perf_counter() - start
+        report = data.memory_report()
+        print(f"{mode:>8}: {report.compact_bytes / 1024 ** 2:,.1f} MB per session ({report.saved_pct:.0f}% saved), "
+              f"largest price change {report.max_price_error:.2g}, compact {compact_time * 1000:.0f} ms, "
+              f"one row {row_time * 1e6:.0f} us, Date column {column_time * 1000:.0f} ms, "
+              f"dates exact: {dates.equals(df['Date'])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Time re-pricing every trade of a tournament under a new fee schedule.
+
+Usage:
+    python -m benchmarks.cost_models_benchmark [num_players] [trades_per_player]
+"""
+import sys
+import time
+import numpy as np
+from utils.cost_models import COST_PRESETS, apply_cost_model
+from utils.portfolio_manager import initialize_portfolios
+
+def main():
+    num_players = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    trades_per_player = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rng = np.random.default_rng(0)
+    portfolios = initialize_portfolios(num_players, 1e9, cost_model=COST_PRESETS['retail'])
+
+    start = time.perf_counter()
+    for portfolio in portfolios.values():
+        calc = portfolio['pnl_calculator']
+        quantities = rng.integers(1, 100, trades_per_player)
+        prices = rng.uniform(50, 150, trades_per_player)
+        volumes = rng.integers(1_000, 1_000_000, trades_per_player)
+        for quantity, price, volume in zip(quantities, prices, volumes):
+            calc.execute_trade('buy', int(quantity), float(price), float(volume))
+        portfolio['cash'] = calc.cash
+    elapsed = time.perf_counter() - start
+    num_trades = num_players * trades_per_player
+    print(f"execute_trade: {num_trades:,} trades in {elapsed:.2f} s ({elapsed / num_trades * 1e6:.1f} us/trade)")
+
+    for name in ('institutional', 'none', 'retail'):
+        start = time.perf_counter()
+        apply_cost_model(portfolios, COST_PRESETS[name])
+        print(f"Re-price under '{name}': {(time.perf_counter() - start) * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    main()
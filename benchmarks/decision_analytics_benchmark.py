@@ -0,0 +1,51 @@
+"""
+Time scoring every player's decisions at every breakpoint.
+
+Each player trades a random instrument at most breakpoints; the analytics
+flatten all trading histories once and score the whole players x
+breakpoints grid with array operations.
+
+Usage:
+    python -m benchmarks.decision_analytics_benchmark [num_players] [num_breakpoints] [num_instruments]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from utils.decision_analytics import decision_analytics, decision_table, trade_log_arrays
+from utils.portfolio_manager import initialize_portfolios
+
+def main():
+    num_players = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    num_breakpoints = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    num_instruments = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    num_days = num_breakpoints * 20
+    rng = np.random.default_rng(0)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (num_days, num_instruments)), axis=0))
+    dates = pd.Series(pd.date_range('2000-01-01', periods=num_days))
+    breakpoints = np.arange(0, num_days, 20)
+    portfolios = initialize_portfolios(num_players, 1e6)
+    for portfolio in portfolios.values():
+        for day in breakpoints[rng.random(num_breakpoints) < 0.7].tolist():
+            instrument = int(rng.integers(num_instruments))
+            portfolio['trading_history'].append({
+                'action': 'buy' if rng.random() < 0.5 else 'sell', 'price': float(prices[day, instrument]),
+                'quantity': int(rng.integers(1, 100)), 'date': dates.iloc[day], 'instrument': instrument
+            })
+    names = {player_num: f"Player {player_num}" for player_num in portfolios}
+
+    start = time.perf_counter()
+    trades = trade_log_arrays(portfolios, dates)
+    flattened = time.perf_counter()
+    analytics = decision_analytics(prices, breakpoints, num_days - 1, trades, num_players, 1e6)
+    scored = time.perf_counter()
+    table = decision_table(analytics, names, dates)
+    tabled = time.perf_counter()
+    print(f"{num_players} players x {num_breakpoints} breakpoints x {num_instruments} instruments, "
+          f"{len(trades.day):,} trades")
+    print(f"Flatten {(flattened - start) * 1000:.1f} ms, score {(scored - flattened) * 1000:.1f} ms, "
+          f"table {(tabled - scored) * 1000:.1f} ms ({len(table):,} rows)")
+    print(f"Mean regret per decision {np.nanmean(analytics.regret):,.2f}")
+
+if __name__ == '__main__':
+    main()
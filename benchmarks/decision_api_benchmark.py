@@ -0,0 +1,116 @@
+"""
+Measure decision throughput of the bot decision API against a local bot fleet.
+
+Starts a DecisionAPI on a free local port with one headless room parked at a
+breakpoint, then has every bot join over HTTP and submit batches of
+alternating buy/sell decisions over WebSocket (and, separately, over HTTP)
+as fast as the server answers. Reports validated decisions per second.
+
+Usage:
+    python -m benchmarks.decision_api_benchmark [num_bots] [batches_per_bot] [batch_size]
+"""
+import asyncio
+import json
+import socket
+import sys
+import time
+import numpy as np
+import pandas as pd
+from tornado.httpclient import AsyncHTTPClient
+from tornado.websocket import websocket_connect
+from utils.decision_api import DecisionAPI, create_headless_room
+from utils.game_room import RoomRegistry
+
+ROOM_ID = 'bench'
+
+def make_dataset(num_days: int = 500) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    breakpoints = np.zeros(num_days, dtype=bool)
+    breakpoints[::50] = True
+    return pd.DataFrame({
+        'Date': pd.date_range('2024-01-01', periods=num_days, freq='D'),
+        'Price': 100 * np.exp(np.cumsum(rng.normal(0, 0.01, num_days))),
+        'Breakpoint': breakpoints
+    })
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def make_batch(batch_size: int):
+    # Alternating buy/sell keeps every decision affordable
+    return [
+        {'action': 'buy' if i % 2 == 0 else 'sell', 'quantity': 1}
+        for i in range(batch_size)
+    ]
+
+async def join(client, base_url: str, bot_index: int) -> str:
+    response = await client.fetch(f"{base_url}/join", method='POST', body=json.dumps({'name': f"bot-{bot_index}"}))
+    return json.loads(response.body)['session_id']
+
+async def websocket_bot(ws_url: str, session_id: str, batches: int, batch_size: int) -> int:
+    connection = await websocket_connect(ws_url)
+    await connection.read_message()  # initial state
+    accepted = 0
+    batch = make_batch(batch_size)
+    for batch_id in range(batches):
+        message = json.dumps({'type': 'decisions', 'id': batch_id, 'session_id': session_id, 'decisions': batch})
+        await connection.write_message(message)
+        while True:
+            reply = json.loads(await connection.read_message())
+            if reply['type'] == 'state':
+                continue
+            if reply.get('error') == 'busy':
+                await asyncio.sleep(0.01)
+                await connection.write_message(message)
+                continue
+            accepted += sum(result is None for result in reply['results'])
+            break
+    connection.close()
+    return accepted
+
+async def http_bot(client, base_url: str, session_id: str, batches: int, batch_size: int) -> int:
+    accepted = 0
+    body = json.dumps({'session_id': session_id, 'decisions': make_batch(batch_size)})
+    for _ in range(batches):
+        response = await client.fetch(f"{base_url}/decisions", method='POST', body=body, raise_error=False)
+        if response.code == 200:
+            accepted += sum(result is None for result in json.loads(response.body)['results'])
+    return accepted
+
+async def run(num_bots: int, batches_per_bot: int, batch_size: int) -> None:
+    registry = RoomRegistry()
+    df = make_dataset()
+    registry.get_or_create(ROOM_ID, lambda: create_headless_room(
+        ROOM_ID, df, max_players=num_bots, decision_timeout_sec=3600
+    ))
+    port = free_port()
+    DecisionAPI(registry).make_app().listen(port, address='127.0.0.1')
+    base_url = f"http://127.0.0.1:{port}/rooms/{ROOM_ID}"
+    ws_url = f"ws://127.0.0.1:{port}/rooms/{ROOM_ID}/ws"
+
+    client = AsyncHTTPClient(max_clients=num_bots)
+    session_ids = await asyncio.gather(*(join(client, base_url, i) for i in range(num_bots)))
+
+    start = time.perf_counter()
+    accepted = await asyncio.gather(*(websocket_bot(ws_url, s, batches_per_bot, batch_size) for s in session_ids))
+    elapsed = time.perf_counter() - start
+    print(f"WebSocket: {sum(accepted):>9,} decisions in {elapsed:6.2f} s = {sum(accepted) / elapsed:>10,.0f} decisions/s")
+
+    start = time.perf_counter()
+    accepted = await asyncio.gather(*(http_bot(client, base_url, s, batches_per_bot, batch_size) for s in session_ids))
+    elapsed = time.perf_counter() - start
+    print(f"HTTP:      {sum(accepted):>9,} decisions in {elapsed:6.2f} s = {sum(accepted) / elapsed:>10,.0f} decisions/s")
+
+    registry.close(ROOM_ID)
+
+def main():
+    num_bots = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    batches_per_bot = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    print(f"{num_bots} bots x {batches_per_bot} batches x {batch_size} decisions")
+    asyncio.run(run(num_bots, batches_per_bot, batch_size))
+
+if __name__ == '__main__':
+    main()
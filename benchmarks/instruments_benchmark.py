@@ -0,0 +1,53 @@
+"""
+Time valuing every portfolio per tick on a multi-instrument dataset.
+
+Each tick values all players with one (players x instruments) @ (instruments,)
+product and records their daily metrics; the per-tick cost should stay flat
+as the game gets longer.
+
+Usage:
+    python -m benchmarks.instruments_benchmark [num_instruments] [num_players] [num_ticks]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from utils.instruments import update_portfolio_values
+from utils.portfolio_manager import initialize_portfolios
+
+def main():
+    num_instruments = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    num_players = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    num_ticks = int(sys.argv[3]) if len(sys.argv) > 3 else 20_000
+    rng = np.random.default_rng(0)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (num_ticks, num_instruments)), axis=0))
+    dates = pd.date_range('2024-01-01', periods=num_ticks, freq='min')
+    portfolios = initialize_portfolios(num_players, 1e9, margin_requirement=0.5)
+    for portfolio in portfolios.values():
+        calc = portfolio['pnl_calculator']
+        for instrument, quantity in enumerate(rng.integers(-100, 100, num_instruments)):
+            if quantity:
+                calc.execute_trade('buy' if quantity > 0 else 'sell', abs(int(quantity)), float(prices[0, instrument]),
+                                   instrument=instrument)
+        portfolio['cash'] = calc.cash
+
+    window = max(1, num_ticks // 10)
+    start = time.perf_counter()
+    window_start = start
+    for tick in range(num_ticks):
+        update_portfolio_values(portfolios, prices[tick], dates[tick])
+        if (tick + 1) % window == 0:
+            now = time.perf_counter()
+            print(f"ticks {tick + 1 - window:>7,}-{tick + 1:>7,}: {(now - window_start) / window * 1e6:.0f} us/tick")
+            window_start = now
+    elapsed = time.perf_counter() - start
+    print(f"{num_players} players x {num_instruments} instruments, {num_ticks:,} ticks: "
+          f"{elapsed:.2f} s ({elapsed / num_ticks * 1e6:.0f} us/tick)")
+
+    calc = portfolios[1]['pnl_calculator']
+    expected = calc.cash + float(calc.holdings @ prices[-1])
+    print(f"Player 1 final value {calc.portfolio_values[-1]:,.2f} (check {expected:,.2f}), "
+          f"{len(calc.daily_metrics):,} metric rows")
+
+if __name__ == '__main__':
+    main()
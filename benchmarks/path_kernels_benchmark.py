@@ -0,0 +1,118 @@
+"""
+Time every path kernel at game scale with each backend.
+
+On a random walk of num_days days:
+
+    max_drawdowns      num_paths value paths of the whole length
+    running_drawdowns  one player's value on every day
+    margin_call_days   num_players three-instrument portfolios scanned over
+                       every day (most are never called, so the scan runs to the end)
+    fill_orders        one fill per 10 days, decided in order
+
+Each kernel runs with NumPy, with numba (when installed, after compiling)
+and, on a slice of the input, as the plain Python loop it is written as
+(its time is scaled to the whole input); the backends' results must be
+identical.
+
+Usage:
+    python -m benchmarks.path_kernels_benchmark [num_days] [num_paths] [num_players]
+"""
+import sys
+import time
+import numpy as np
+from utils import path_kernels
+from utils.path_kernels import KERNEL_BACKENDS, fill_orders, margin_call_days, max_drawdowns, running_drawdowns
+
+# Fraction of the input run through the plain Python loop
+PYTHON_LOOP_FRACTION = 0.01
+
+def _time(call):
+    start = time.perf_counter()
+    result = call()
+    return result, time.perf_counter() - start
+
+def _run(name, loop_call, calls):
+    """Time one kernel: the Python loop on a slice, then each backend on the whole input"""
+    _, loop_time = _time(loop_call)
+    loop_time /= PYTHON_LOOP_FRACTION
+    print(f"{name}")
+    print(f"  {'python loop':<12} {loop_time * 1000:>10.1f} ms (scaled from {PYTHON_LOOP_FRACTION:.0%} of the input)")
+    results = {}
+    for backend in KERNEL_BACKENDS:
+        if backend == 'numba' and path_kernels.numba is None:
+            print("  numba        not installed")
+            continue
+        call, warm_up = calls(backend)
+        _, first_call = _time(warm_up)
+        results[backend], elapsed = _time(call)
+        print(f"  {backend:<12} {elapsed * 1000:>10.1f} ms ({loop_time / elapsed:,.0f}x the loop), first call {first_call * 1000:.0f} ms")
+    if len(results) == 2:
+        print(f"  backends identical: {np.array_equal(results['numba'], results['numpy'])}")
+
+def main():
+    num_days = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    num_paths = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    num_players = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    rng = np.random.default_rng(0)
+    print(f"{num_days:,} days (default backend: {path_kernels.DEFAULT_BACKEND})")
+    loop_days = max(1, int(num_days * PYTHON_LOOP_FRACTION))
+
+    values = 1e6 * np.exp(np.cumsum(rng.normal(0, 0.01, (num_paths, num_days)), axis=1))
+    _run(
+        f"max_drawdowns: {num_paths:,} paths",
+        lambda: path_kernels._max_drawdowns_loop(values[:, :loop_days], np.empty(num_paths)),
+        lambda backend: (lambda: max_drawdowns(values, backend), lambda: max_drawdowns(values[:1, :100], backend))
+    )
+
+    path = values[0]
+    _run(
+        "running_drawdowns: one player",
+        lambda: path_kernels._running_drawdowns_loop(path[:loop_days], 1e6, np.empty(loop_days)),
+        lambda backend: (lambda: running_drawdowns(path, 1e6, backend), lambda: running_drawdowns(path[:100], 1e6, backend))
+    )
+
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.005, (num_days, 3)), axis=0))
+    holdings = rng.integers(-20, 20, (num_players, 3)).astype(np.float64)
+    holdings[:, 0] = -np.abs(holdings[:, 0]) - 1
+    cash = np.full(num_players, 1e5)
+    margins = np.full(num_players, 0.5)
+    _run(
+        f"margin_call_days: {num_players:,} players x 3 instruments",
+        lambda: path_kernels._margin_call_days_loop(
+            prices, cash, holdings, margins, 0, loop_days - 1, np.empty(num_players, dtype=np.int64)
+        ),
+        lambda backend: (
+            lambda: margin_call_days(prices, cash, holdings, margins, 0, num_days - 1, backend),
+            lambda: margin_call_days(prices[:100], cash, holdings, margins, 0, 99, backend)
+        )
+    )
+
+    num_fills = max(1, num_days // 10)
+    fills = dict(
+        rows=rng.integers(0, num_players, num_fills),
+        instruments=rng.integers(0, 3, num_fills),
+        buys=rng.random(num_fills) < 0.5,
+        exits=np.zeros(num_fills, dtype=bool),
+        quantities=rng.integers(1, 50, num_fills),
+        prices=rng.uniform(50, 150, num_fills),
+        fees=np.full(num_fills, 1.0),
+        cash=np.full(num_players, 1e5),
+        holdings=np.zeros((num_players, 3), dtype=np.int64),
+        margins=np.full(num_players, 0.5)
+    )
+    loop_fills = max(1, int(num_fills * PYTHON_LOOP_FRACTION))
+    _run(
+        f"fill_orders: {num_fills:,} fills",
+        lambda: path_kernels._fill_orders_loop(
+            *(np.array(fills[name][:loop_fills]) for name in ('rows', 'instruments', 'buys', 'exits', 'quantities', 'prices', 'fees')),
+            fills['cash'].copy(), fills['holdings'].copy(), fills['margins'], np.empty(loop_fills, dtype=bool)
+        ),
+        lambda backend: (
+            lambda: fill_orders(**fills, backend=backend),
+            lambda: fill_orders(**{name: value[:10] if name in ('rows', 'instruments', 'buys', 'exits', 'quantities', 'prices', 'fees') else value
+                                   for name, value in fills.items()}, backend=backend)
+        )
+    )
+
+if __name__ == '__main__':
+    main()
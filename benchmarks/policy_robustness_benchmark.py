@@ -0,0 +1,49 @@
+"""
+Time the Monte Carlo evaluation of a recorded decision policy.
+
+A player trades at every breakpoint of a synthetic dataset (against the
+trend of the last few weeks); the policy fitted to those decisions is then
+replayed on bootstrapped and synthetic paths, in one process and across a
+process pool.
+
+Usage:
+    python -m benchmarks.policy_robustness_benchmark [num_days] [num_paths] [workers]
+"""
+import os
+import sys
+import time
+import numpy as np
+from utils.policy_robustness import CHUNK_BYTES, ROBUSTNESS_METHODS, policy_robustness
+from utils.portfolio_manager import initialize_portfolios
+from utils.scenario_generator import generate_scenario
+
+def main():
+    num_days = int(sys.argv[1]) if len(sys.argv) > 1 else 2520
+    num_paths = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    df = generate_scenario('gbm', num_days, seed=0)
+    prices = df['Price'].to_numpy()
+    breakpoints = np.flatnonzero(df['Breakpoint'].to_numpy()).tolist()
+    portfolio = initialize_portfolios(1, 1e6)[1]
+    for day in breakpoints:
+        falling = prices[day] < prices[max(day - 20, 0)]
+        portfolio['trading_history'].append({
+            'action': 'buy' if falling else 'sell', 'price': float(prices[day]), 'quantity': 500,
+            'date': df['Date'].iloc[day], 'instrument': 0
+        })
+    chunk_paths = max(1, min(num_paths, CHUNK_BYTES // (24 * num_days)))
+    print(f"{num_days:,} days, {len(breakpoints):,} breakpoints, {num_paths:,} paths "
+          f"({chunk_paths:,} paths per chunk)")
+
+    for method in ROBUSTNESS_METHODS:
+        for pool_size in (1, workers):
+            start = time.perf_counter()
+            result = policy_robustness(df, breakpoints, portfolio, num_days - 1, 1e6, num_paths, method,
+                                       workers=pool_size)
+            elapsed = time.perf_counter() - start
+            summary = result.summary()
+            print(f"{method:<9} {pool_size:>2} process(es): {elapsed:.2f} s ({num_paths / elapsed:,.0f} paths/s), "
+                  f"median return {summary['Median Return %']:.1f}%, median max DD {summary['Median Max DD %']:.1f}%")
+
+if __name__ == '__main__':
+    main()
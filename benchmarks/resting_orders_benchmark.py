@@ -0,0 +1,44 @@
+"""
+Time batch fill detection for resting orders and margin-call detection for
+short positions on a long price series.
+
+Usage:
+    python -m benchmarks.resting_orders_benchmark [num_rows] [num_orders]
+"""
+import sys
+import time
+import numpy as np
+from utils.resting_orders import PriceCrossingIndex
+from utils.margin import find_margin_calls
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    num_orders = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    rng = np.random.default_rng(0)
+    prices = 100 * np.exp(np.cumsum(rng.standard_normal(num_rows) * 0.01))
+
+    start = time.perf_counter()
+    index = PriceCrossingIndex(prices)
+    print(f"Index build ({num_rows:,} rows): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    # Orders 5% away from the price, resting up to 100k rows
+    starts = rng.integers(0, num_rows - 1, num_orders)
+    ends = np.minimum(starts + rng.integers(1, 100_000, num_orders), num_rows - 1)
+    below = rng.random(num_orders) < 0.5
+    levels = prices[starts] * np.where(below, 0.95, 1.05)
+    start = time.perf_counter()
+    days = index.first_crossing(starts, ends, levels, below)
+    elapsed = time.perf_counter() - start
+    print(f"{num_orders:,} orders: {elapsed * 1000:.1f} ms ({elapsed / num_orders * 1e6:.2f} us/order), "
+          f"{(days >= 0).mean():.0%} filled")
+
+    # One short per player, all checked over the whole series at once
+    cash = rng.uniform(15_000, 30_000, num_orders)
+    positions = -rng.integers(1, 100, num_orders)
+    start = time.perf_counter()
+    days, _ = find_margin_calls(index, cash, positions, np.full(num_orders, 0.5), 0, num_rows - 1)
+    elapsed = time.perf_counter() - start
+    print(f"{num_orders:,} short positions: {elapsed * 1000:.1f} ms, {(days >= 0).mean():.0%} called")
+
+if __name__ == '__main__':
+    main()
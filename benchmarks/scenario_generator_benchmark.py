@@ -0,0 +1,48 @@
+"""
+Measure synthetic scenario throughput per model, in memory and as CSV files.
+
+Usage:
+    python -m benchmarks.scenario_generator_benchmark [num_rows] [num_scenarios] [workers]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.scenario_generator import MODELS, generate_scenario, generate_scenarios, write_scenario
+
+def _generate(task) -> int:
+    child_seed, model, num_rows = task
+    return len(generate_scenario(model, num_rows, seed=child_seed))
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    num_scenarios = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    print(f"{num_scenarios} scenarios x {num_rows:,} rows")
+
+    for model in MODELS:
+        start = time.perf_counter()
+        for _ in generate_scenarios(num_scenarios, 0, model=model, num_rows=num_rows):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"{model:<17} 1 process:  {num_scenarios / elapsed * 60:>8,.0f} scenarios/min")
+
+    tasks = [(child, 'gbm', num_rows) for child in np.random.SeedSequence(0).spawn(num_scenarios * workers)]
+    with ProcessPoolExecutor(workers) as pool:
+        list(pool.map(_generate, tasks[:workers]))  # warm up the workers
+        start = time.perf_counter()
+        list(pool.map(_generate, tasks))
+        elapsed = time.perf_counter() - start
+    print(f"{'gbm':<17} {workers} processes: {len(tasks) / elapsed * 60:>7,.0f} scenarios/min")
+
+    df = generate_scenario('gbm', num_rows, seed=0)
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        write_scenario(df, os.path.join(directory, 'scenario.csv'))
+        elapsed = time.perf_counter() - start
+    print(f"CSV write: {elapsed:.2f} s per scenario ({num_rows / elapsed:,.0f} rows/s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Time the hindsight-optimal and baseline strategies of a long dataset.
+
+Breakpoints come from the zigzag detector, as for uploaded data without a
+Breakpoint column.
+
+Usage:
+    python -m benchmarks.strategy_oracle_benchmark [num_days] [zigzag_threshold]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from utils.breakpoint_detector import detect_breakpoints
+from utils.cost_models import COST_PRESETS
+from utils.strategy_oracle import reference_paths
+
+def main():
+    num_days = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    rng = np.random.default_rng(0)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, num_days)))
+    df = pd.DataFrame({'Date': pd.date_range('2000-01-01', periods=num_days, freq='min'), 'Price': prices})
+    breakpoints = np.flatnonzero(detect_breakpoints(prices, method='zigzag', threshold=threshold)).tolist()
+    print(f"{num_days:,} days, {len(breakpoints):,} breakpoints")
+
+    for name in ('none', 'retail'):
+        start = time.perf_counter()
+        paths = reference_paths(df, breakpoints, 10000, COST_PRESETS[name])
+        elapsed = time.perf_counter() - start
+        print(f"Costs '{name}': {elapsed * 1000:.1f} ms, optimal {paths.optimal[-1]:,.0f} "
+              f"({len(paths.optimal_trades):,} trades), buy & hold {paths.buy_and_hold[-1]:,.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,22 @@
 import streamlit as st
+import pandas as pd
 import os
+import time
 from datetime import datetime
-from components.price_chart import render_full_price_preview
+from components.price_chart import render_full_price_preview, get_window_indices, get_price_pyramid
 from components.csv_uploader import render_csv_uploader, download_sample_csv
+from components.portfolio_stats import get_reference_lines
 from utils.portfolio_manager import reset_all_portfolios
 from utils.portfolio_manager import initialize_portfolios
 from utils.session_manager import reset_simulation_state
+from utils.trade_buffer import TradeBuffer
 from utils.visual_configs import CURRENCY_INDICATOR
+from utils.session_memory import get_memory_tracker
+from utils.indicators import INDICATORS, INDICATOR_LABELS, DEFAULT_PERIODS
+from utils.margin import DEFAULT_MARGIN_REQUIREMENT
+from utils.cost_models import CostModel, COST_PRESETS, COST_PRESET_LABELS, apply_cost_model
+from utils.compact_data import CompactDataset, COMPACT_PRICE_MODES, COMPACT_LABELS
+from utils.data_handler import get_dataset_key
 
 def handle_data_source_selection():
     """Handle data source selection between predefined tickers and uploaded CSV"""
@@ -43,7 +53,7 @@ def handle_ticker_selection():
     if selected_ticker != st.session_state.selected_ticker:
         st.session_state.selected_ticker = selected_ticker
         st.session_state.current_day_index = 0
-        st.session_state.portfolios = initialize_portfolios(st.session_state.num_players, st.session_state.starting_cash)
+        st.session_state.portfolios = initialize_portfolios(st.session_state.num_players, st.session_state.starting_cash, st.session_state.margin_requirement, st.session_state.cost_model)
         st.session_state.uploaded_data = None  # Clear uploaded data when switching to predefined
         reset_simulation_state()
         st.rerun()
@@ -53,18 +63,128 @@ def handle_csv_upload():
     # Show download sample button first
     download_sample_csv()
     
+    compact_modes = [None] + list(COMPACT_PRICE_MODES)
+    st.session_state.compact_data = st.radio(
+        "Storage",
+        options=compact_modes,
+        format_func=COMPACT_LABELS.get,
+        index=compact_modes.index(st.session_state.compact_data),
+        horizontal=True,
+        help="Compact storage keeps prices as float32 or int32 ticks, dates as int32 offsets and breakpoints as a bitmap, "
+             "for multi-million-row datasets. Changing it reloads the uploaded data."
+    )
+    
     # Render CSV uploader
     uploaded_df = render_csv_uploader()
     
     if uploaded_df is not None:
+        stored = st.session_state.uploaded_data
+        if isinstance(stored, CompactDataset):
+            changed = stored.price_mode != st.session_state.compact_data or stored.source_key != get_dataset_key(uploaded_df)
+        else:
+            changed = stored is None or st.session_state.compact_data is not None or not uploaded_df.equals(stored)
         # Store the uploaded data in session state
-        if st.session_state.uploaded_data is None or not uploaded_df.equals(st.session_state.uploaded_data):
-            st.session_state.uploaded_data = uploaded_df
+        if changed:
+            if st.session_state.compact_data is not None:
+                try:
+                    st.session_state.uploaded_data = CompactDataset.from_frame(uploaded_df, st.session_state.compact_data)
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                    return
+            else:
+                st.session_state.uploaded_data = uploaded_df
+            # Build per-dataset structures once at load time
+            get_price_pyramid(st.session_state.uploaded_data)
             st.session_state.current_day_index = 0
-            st.session_state.portfolios = initialize_portfolios(st.session_state.num_players, st.session_state.starting_cash)
+            st.session_state.portfolios = initialize_portfolios(st.session_state.num_players, st.session_state.starting_cash, st.session_state.margin_requirement, st.session_state.cost_model)
             reset_simulation_state()
             st.success("📊 Custom data loaded successfully! You can now start the simulation.")
             st.rerun()
+    
+    if isinstance(st.session_state.uploaded_data, CompactDataset):
+        report = st.session_state.uploaded_data.memory_report()
+        st.caption(
+            f"🗜️ Compact storage: {report.compact_bytes / 1024 ** 2:,.1f} MB per session instead of "
+            f"{report.full_bytes / 1024 ** 2:,.1f} MB ({report.saved_pct:.0f}% saved); "
+            f"largest price change {report.max_price_error:.2g}"
+        )
+
+def render_session_memory():
+    """Render the heaviest sessions of this server process and idle-session eviction"""
+    st.markdown("### Session Memory")
+    tracker = get_memory_tracker()
+    sessions = tracker.sessions()
+    memory_col1, memory_col2, memory_col3 = st.columns(3)
+    with memory_col1:
+        st.metric("Tracked Sessions", len(sessions))
+    with memory_col2:
+        st.metric("Total Size", f"{tracker.total_bytes() / 1024 ** 2:,.1f} MB")
+    with memory_col3:
+        if st.button("🧹 Evict Idle Sessions", help="Drop the in-memory game state of every idle session; it is reloaded from the state store when the session returns"):
+            evicted = sum(tracker.evict(session['session_id']) for session in sessions)
+            st.success(f"Evicted {evicted} idle session(s)")
+    
+    if sessions:
+        st.dataframe(pd.DataFrame([{
+            'Session': session['session_id'][:8],
+            'Game': (session['game_id'] or '')[:8],
+            'Size (MB)': round(session['size_bytes'] / 1024 ** 2, 2),
+            'Idle (min)': round(session['idle_sec'] / 60, 1),
+            'Status': 'running' if session['running'] else 'evicted' if session['evicted'] else 'idle',
+            'Largest Entry': max(session['breakdown'], key=session['breakdown'].get) if session['breakdown'] else ''
+        } for session in sessions[:10]]), hide_index=True, use_container_width=True)
+
+def render_cost_settings():
+    """Render the fee schedule; applying it re-prices every trade made so far"""
+    st.markdown("### Trading Costs")
+    current = st.session_state.cost_model
+    presets = list(COST_PRESETS) + ['custom']
+    current_preset = next((name for name, model in COST_PRESETS.items() if model == current), 'custom')
+    preset = st.selectbox(
+        "Fee Schedule",
+        options=presets,
+        index=presets.index(current_preset),
+        format_func=lambda name: COST_PRESET_LABELS.get(name, "Custom"),
+        help="Fees and slippage charged on every trade, including resting-order fills and margin calls"
+    )
+    base = COST_PRESETS.get(preset, current)
+    cost_cols = st.columns(4)
+    fields = [
+        ('fixed_fee', f"Fixed Fee ({CURRENCY_INDICATOR})", 0.5),
+        ('commission_bps', "Commission (bps)", 1.0),
+        ('spread_bps', "Spread (bps)", 1.0),
+        ('slippage_coef', "Slippage Coefficient", 0.05)
+    ]
+    values = {}
+    for col, (field, label, step) in zip(cost_cols, fields):
+        with col:
+            values[field] = st.number_input(
+                label,
+                min_value=0.0,
+                value=float(getattr(base, field)),
+                step=step,
+                disabled=preset != 'custom',
+                key=f"cost_{field}_{preset}"
+            )
+    new_cost_model = CostModel(**values)
+    if st.button("Apply Fee Schedule", disabled=new_cost_model == current,
+                 help="Re-price all trades made so far under the new schedule and update every player's cash"):
+        start = time.perf_counter()
+        try:
+            num_trades = apply_cost_model(st.session_state.portfolios, new_cost_model, st.session_state.trade_journal)
+        except ValueError as e:
+            st.error(f"Could not apply fee schedule: {e}")
+            return
+        st.session_state.cost_model = new_cost_model
+        # Staged orders were validated under the old schedule
+        try:
+            st.session_state.trade_buffer = TradeBuffer.from_state(
+                st.session_state.trade_buffer.to_state(), st.session_state.portfolios
+            )
+        except ValueError:
+            st.session_state.trade_buffer.discard()
+        st.toast(f"Re-priced {num_trades} trade(s) in {(time.perf_counter() - start) * 1000:.1f} ms")
+        st.rerun()
 
 def render_admin_panel(df, breakpoints, force_expanded=False):
     """Render the admin settings panel"""
@@ -100,6 +220,29 @@ def render_admin_panel(df, breakpoints, force_expanded=False):
                     reset_simulation_state()
                     st.success(f"Simulation reset. All players now start with {CURRENCY_INDICATOR}{st.session_state.starting_cash:,.2f}.")
                     st.rerun()
+                
+                # Short selling on margin
+                allow_short = st.checkbox(
+                    "Allow Short Selling",
+                    value=st.session_state.margin_requirement is not None,
+                    help="Sells beyond holdings open a short position; shorts are covered automatically when their margin runs out"
+                )
+                new_margin_requirement = None
+                if allow_short:
+                    new_margin_requirement = st.number_input(
+                        "Margin Requirement (%)",
+                        min_value=10,
+                        max_value=500,
+                        value=int(round((st.session_state.margin_requirement or DEFAULT_MARGIN_REQUIREMENT) * 100)),
+                        step=5,
+                        help="Equity a short position must keep, as a percentage of its market value"
+                    ) / 100
+                if new_margin_requirement != st.session_state.margin_requirement:
+                    st.session_state.margin_requirement = new_margin_requirement
+                    # Applies to open positions from the next day on
+                    for portfolio in st.session_state.portfolios.values():
+                        portfolio['pnl_calculator'].margin_requirement = new_margin_requirement
+                    st.rerun()
             
             with admin_col2:
                 # Number of players setting
@@ -121,12 +264,16 @@ def render_admin_panel(df, breakpoints, force_expanded=False):
                         preserved_names[i] = st.session_state.player_names.get(i, f"Player {i}")
                     st.session_state.player_names = preserved_names
                     # Reinitialize portfolios for all players with current starting cash
-                    st.session_state.portfolios = initialize_portfolios(new_num_players, st.session_state.starting_cash)
+                    st.session_state.portfolios = initialize_portfolios(new_num_players, st.session_state.starting_cash, st.session_state.margin_requirement, st.session_state.cost_model)
                     # Reset simulation state
                     reset_simulation_state()
                     st.success(f"Players set to {st.session_state.num_players}. Simulation reset with starting cash {CURRENCY_INDICATOR}{st.session_state.starting_cash:,.2f}.")
                     st.rerun()
 
+            # Fee schedule for all players
+            st.markdown("---")
+            render_cost_settings()
+            
             # Player Names Configuration
             st.markdown("---")
             st.markdown("### Player Names")
@@ -144,7 +291,7 @@ def render_admin_panel(df, breakpoints, force_expanded=False):
                         # Update name and reset simulation/portfolios to apply across all views
                         st.session_state.player_names[player_num] = new_player_name
                         reset_simulation_state()
-                        st.session_state.portfolios = initialize_portfolios(st.session_state.num_players, st.session_state.starting_cash)
+                        st.session_state.portfolios = initialize_portfolios(st.session_state.num_players, st.session_state.starting_cash, st.session_state.margin_requirement, st.session_state.cost_model)
                         st.success("Player names updated. Simulation reset.")
                         st.rerun()
             
@@ -167,6 +314,42 @@ def render_admin_panel(df, breakpoints, force_expanded=False):
                     st.session_state.chart_hoverlabel_font_size = new_font_size
                     st.success(f"Chart hover font size set to {new_font_size}px")
                     st.rerun()
+                
+                new_chart_mode = st.selectbox(
+                    "Price Chart Style",
+                    options=['line', 'candlestick'],
+                    format_func=lambda x: "Line" if x == 'line' else "Candlestick + Volume",
+                    index=0 if st.session_state.chart_mode == 'line' else 1,
+                    help="Candles are aggregated automatically so long series stay responsive"
+                )
+                
+                if new_chart_mode != st.session_state.chart_mode:
+                    st.session_state.chart_mode = new_chart_mode
+                    st.rerun()
+                
+                current_periods = dict(st.session_state.chart_indicators)
+                selected_indicators = st.multiselect(
+                    "Indicators",
+                    options=list(INDICATORS),
+                    default=list(current_periods),
+                    format_func=INDICATOR_LABELS.get,
+                    help="Overlays are computed once per dataset and only show revealed days"
+                )
+                new_indicators = tuple(
+                    (name, int(st.number_input(
+                        f"{INDICATOR_LABELS[name]} Period",
+                        min_value=2,
+                        max_value=500,
+                        value=current_periods.get(name, DEFAULT_PERIODS[name]),
+                        step=1,
+                        key=f"indicator_period_{name}"
+                    )))
+                    for name in selected_indicators
+                )
+                
+                if new_indicators != st.session_state.chart_indicators:
+                    st.session_state.chart_indicators = new_indicators
+                    st.rerun()
             
             with ui_col2:
                 # Time to run setting
@@ -182,11 +365,24 @@ def render_admin_panel(df, breakpoints, force_expanded=False):
                 if new_time_to_run != st.session_state.time_to_run_sec:
                     st.session_state.time_to_run_sec = new_time_to_run
                     st.success(f"Simulation duration set to {st.session_state.time_to_run_sec} seconds")
+                
+                new_periods_per_year = st.number_input(
+                    "Periods per Year",
+                    min_value=1,
+                    max_value=525600,
+                    value=int(st.session_state.periods_per_year),
+                    step=1,
+                    help="Rows of the dataset per year, used to annualize Sharpe, Sortino, Calmar and volatility (252 for daily data)"
+                )
+                
+                if new_periods_per_year != st.session_state.periods_per_year:
+                    st.session_state.periods_per_year = new_periods_per_year
+                    st.rerun()
 
             # Quick Actions
             st.markdown("---")
             st.markdown("### Quick Actions")
-            action_col1, action_col2 = st.columns(2)
+            action_col1, action_col2, action_col3 = st.columns(3)
             
             with action_col1:
                 if st.button("🔄 Reset Simulation", help="Reset simulation to beginning with current settings"):
@@ -195,9 +391,35 @@ def render_admin_panel(df, breakpoints, force_expanded=False):
                     st.session_state.waiting_for_trade = False
                     st.session_state.trade_made = False
                     reset_all_portfolios()
+                    st.session_state.trade_journal.reset()
+                    st.session_state.trade_buffer.discard()
+                    st.session_state.order_book.clear()
                     st.success("Simulation reset to beginning")
                     st.rerun()
             
+            with action_col3:
+                if df is not None and st.session_state.current_day_index > 0:
+                    rewind_day = st.number_input(
+                        "Rewind to Day",
+                        min_value=0,
+                        max_value=st.session_state.current_day_index,
+                        value=st.session_state.current_day_index,
+                        step=1,
+                        help="Day index to return to; trades made on or after that day are undone"
+                    )
+                    if st.button("⏪ Rewind", help="Restore all portfolios to the selected day from the trade journal"):
+                        st.session_state.trade_buffer.discard()
+                        # Resting orders still live on that day are rebuilt from the journal
+                        st.session_state.trade_journal.rewind(
+                            st.session_state.portfolios, df, rewind_day, st.session_state.order_book
+                        )
+                        st.session_state.current_day_index = rewind_day
+                        st.session_state.auto_progress = False
+                        st.session_state.waiting_for_trade = rewind_day in breakpoints
+                        st.session_state.trade_made = False
+                        st.success(f"Simulation rewound to day {rewind_day}")
+                        st.rerun()
+            
             with action_col2:
                 if st.button("👥 Reset Player Names", help="Reset all player names to default"):
                     for i in range(1, st.session_state.num_players + 1):
@@ -223,7 +445,21 @@ def render_admin_panel(df, breakpoints, force_expanded=False):
                 
                 # Render the full price chart preview only if toggle is enabled
                 if show_preview:
-                    preview_fig = render_full_price_preview(df, breakpoints)
+                    start_index, end_index = 0, len(df) - 1
+                    first_date = df.iloc[0]['Date'].to_pydatetime()
+                    last_date = df.iloc[-1]['Date'].to_pydatetime()
+                    if first_date < last_date:
+                        # Zooming re-queries the price pyramid at the matching resolution
+                        zoom_window = st.slider(
+                            "Zoom Window",
+                            min_value=first_date,
+                            max_value=last_date,
+                            value=(first_date, last_date),
+                            format="YYYY-MM-DD",
+                            help="Select the date range shown in the preview"
+                        )
+                        start_index, end_index = get_window_indices(df, zoom_window[0], zoom_window[1])
+                    preview_fig = render_full_price_preview(df, breakpoints, start_index, end_index)
                     st.plotly_chart(preview_fig, use_container_width=True)
             
             # Display current settings
@@ -240,6 +476,10 @@ def render_admin_panel(df, breakpoints, force_expanded=False):
                 data_source_label = "Custom CSV" if st.session_state.data_source == 'uploaded' else "Predefined"
                 st.metric("Data Source", data_source_label)
             
+            # Session memory accounting across all sessions of this process
+            st.markdown("---")
+            render_session_memory()
+            
             # Download Summary Image
             st.markdown("---")
             st.markdown("### Export & Download")
@@ -256,7 +496,9 @@ def render_admin_panel(df, breakpoints, force_expanded=False):
                         st.session_state.current_day_index,
                         st.session_state.portfolios,
                         st.session_state.player_names,
-                        st.session_state.num_players
+                        st.session_state.num_players,
+                        st.session_state.periods_per_year,
+                        get_reference_lines(df, st.session_state.current_day_index)
                     )
                     
                     # Generate timestamp for filename
@@ -280,6 +522,6 @@ def render_admin_panel(df, breakpoints, force_expanded=False):
         # Application metadata
         # Reminder: whenever a change goes in, update VERSION_DATE.
         APP_CREATOR = "Pitch"
-        VERSION_DATE = "2025-08-10"
+        VERSION_DATE = "2026-10-19"
         st.markdown("---")
         st.caption(f"Creator: {APP_CREATOR} | Version date: {VERSION_DATE}")
\ No newline at end of file
@@ -3,6 +3,12 @@ import pandas as pd
 import io
 from typing import Optional, Tuple
 from utils.visual_configs import CURRENCY_INDICATOR
+from utils.data_handler import OHLCV_COLUMNS, process_instrument_columns, process_ohlcv_columns, has_ohlc
+from utils.instruments import INSTRUMENT_PREFIX, instrument_names
+from utils.breakpoint_detector import (
+    BREAKPOINT_METHODS, DEFAULT_MIN_SPACING, DEFAULT_SPACING, DEFAULT_VOL_RATIO, DEFAULT_ZIGZAG_THRESHOLD,
+    detect_breakpoints
+)
 
 def validate_csv_format(df: pd.DataFrame) -> Tuple[bool, str]:
     """
@@ -14,10 +20,14 @@ def validate_csv_format(df: pd.DataFrame) -> Tuple[bool, str]:
     Returns:
         Tuple[bool, str]: (is_valid, error_message)
     """
-    required_columns = ['Date', 'Price', 'Breakpoint']
+    # Breakpoint is optional; decision points are detected when it is missing
+    required_columns = ['Date']
     
-    # Check if all required columns exist
+    # Check if all required columns exist (Close or Price_<TICKER> columns can stand in for Price)
+    instrument_columns = [col for col in df.columns if col.startswith(INSTRUMENT_PREFIX)]
     missing_columns = [col for col in required_columns if col not in df.columns]
+    if 'Price' not in df.columns and 'Close' not in df.columns and not instrument_columns:
+        missing_columns.insert(1, f"Price (or Close, or {INSTRUMENT_PREFIX}<TICKER>)")
     if missing_columns:
         return False, f"Missing required columns: {', '.join(missing_columns)}"
     
@@ -31,14 +41,19 @@ def validate_csv_format(df: pd.DataFrame) -> Tuple[bool, str]:
     except:
         return False, "Date column contains invalid date formats. Use YYYY-MM-DD format"
     
-    # Validate Price column
-    try:
-        pd.to_numeric(df['Price'], errors='raise')
-    except:
-        return False, "Price column contains non-numeric values"
+    # Validate Price and optional OHLCV columns
+    for column in ['Price'] + list(OHLCV_COLUMNS) + instrument_columns:
+        if column in df.columns:
+            try:
+                pd.to_numeric(df[column], errors='raise')
+            except:
+                return False, f"{column} column contains non-numeric values"
+    
+    if has_ohlc(df) and (pd.to_numeric(df['High']) < pd.to_numeric(df['Low'])).any():
+        return False, "High must be greater than or equal to Low on every row"
     
     # Validate Breakpoint column
-    if not df['Breakpoint'].isin([0, 1, True, False]).all():
+    if 'Breakpoint' in df.columns and not df['Breakpoint'].isin([0, 1, True, False]).all():
         return False, "Breakpoint column must contain only 0/1 or True/False values"
     
     # Check minimum number of rows
@@ -47,6 +62,49 @@ def validate_csv_format(df: pd.DataFrame) -> Tuple[bool, str]:
     
     return True, "Valid format"
 
+def render_breakpoint_detection(prices: pd.Series):
+    """
+    Render breakpoint detection settings for data without a Breakpoint column.
+    
+    Args:
+        prices: Price column of the uploaded data
+        
+    Returns:
+        np.ndarray: Detected Breakpoint column
+    """
+    st.info("No Breakpoint column found - decision points are detected automatically")
+    method_labels = {
+        'zigzag': "Swing highs/lows",
+        'volatility': "Volatility regime changes",
+        'fixed': "Fixed spacing"
+    }
+    method = st.selectbox(
+        "Detection method",
+        BREAKPOINT_METHODS,
+        format_func=method_labels.get,
+        key="breakpoint_method"
+    )
+    
+    params = {}
+    if method == 'zigzag':
+        params['threshold'] = st.slider(
+            "Swing size (%)", min_value=1, max_value=50, value=int(DEFAULT_ZIGZAG_THRESHOLD * 100),
+            key="breakpoint_threshold", help="Price move that confirms a swing high or low"
+        ) / 100
+    elif method == 'volatility':
+        params['vol_ratio'] = st.slider(
+            "Volatility ratio", min_value=1.1, max_value=4.0, value=DEFAULT_VOL_RATIO, step=0.1,
+            key="breakpoint_vol_ratio", help="Multiple of the median volatility that starts a volatile regime"
+        )
+    else:
+        params['spacing'] = st.number_input(
+            "Rows between breakpoints", min_value=1, value=DEFAULT_SPACING, key="breakpoint_spacing"
+        )
+    params['min_spacing'] = st.number_input(
+        "Minimum rows between breakpoints", min_value=1, value=DEFAULT_MIN_SPACING, key="breakpoint_min_spacing"
+    )
+    return detect_breakpoints(prices.to_numpy(), method, **params)
+
 def render_csv_uploader() -> Optional[pd.DataFrame]:
     """
     Render the CSV upload interface with format validation.
@@ -60,7 +118,11 @@ def render_csv_uploader() -> Optional[pd.DataFrame]:
     st.info("""
     **📋 CSV Format Requirements:**
     
-    **Required Columns:** `Date` (YYYY-MM-DD), `Price` (numeric), `Breakpoint` (0/1 or True/False)
+    **Required Columns:** `Date` (YYYY-MM-DD), `Price` (numeric)
+    
+    **Optional Breakpoint:** `Breakpoint` (0/1 or True/False); detected from the prices when missing
+    
+    **Optional OHLCV:** `Open`, `High`, `Low`, `Close`, `Volume` (`Close` is used as the price)
     
     **Example:** Date,Price,Breakpoint → 2024-01-01,185.25,0
     
@@ -72,7 +134,7 @@ def render_csv_uploader() -> Optional[pd.DataFrame]:
         "Choose a CSV file",
         type=['csv'],
         key="csv_uploader",
-        help="Upload a CSV file with Date, Price, and Breakpoint columns"
+        help="Upload a CSV file with Date, Price (or OHLCV), and optionally Breakpoint columns"
     )
     
     if uploaded_file is not None:
@@ -87,10 +149,21 @@ def render_csv_uploader() -> Optional[pd.DataFrame]:
                 # Process the data
                 df['Date'] = pd.to_datetime(df['Date'])
                 df = df.sort_values('Date').reset_index(drop=True)
+                df = process_ohlcv_columns(df)
+                df = process_instrument_columns(df)
                 df['Price'] = pd.to_numeric(df['Price'])
-                df['Breakpoint'] = df['Breakpoint'].astype(bool)
+                if 'Breakpoint' in df.columns:
+                    df['Breakpoint'] = df['Breakpoint'].astype(bool)
+                else:
+                    try:
+                        df['Breakpoint'] = render_breakpoint_detection(df['Price'])
+                    except ValueError as e:
+                        st.error(f"❌ Could not detect breakpoints: {e}")
+                        return None
                 
                 st.success("✅ CSV format is valid!")
+                if instrument_names(df):
+                    st.caption(f"Instruments: {', '.join(instrument_names(df))}")
                 
                 # # Show preview
                 # st.markdown("**Data Preview:**")
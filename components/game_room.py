@@ -0,0 +1,296 @@
+import streamlit as st
+import pandas as pd
+from components.price_chart import build_progressive_figure, get_price_pyramid, get_indicator_series
+from utils.game_room import GameRoom, RoomRegistry, MEMBER_TIMEOUT_SEC
+from utils.decision_api import DecisionAPI, DEFAULT_API_PORT
+from utils.visual_configs import CURRENCY_INDICATOR, get_hoverlabel_config
+from utils.resting_orders import ORDER_TYPES, TRIGGER_BELOW
+from utils.instruments import describe_holdings
+from components.trading_interface import ACTIONS, describe_order, max_order_quantity
+
+# Seconds a viewer waits for a room update before sending a keep-alive
+ROOM_POLL_TIMEOUT_SEC = 1.0
+
+@st.cache_resource(show_spinner=False)
+def get_room_registry() -> RoomRegistry:
+    """Get the registry of game rooms shared by every session on this server"""
+    return RoomRegistry()
+
+@st.cache_resource(show_spinner=False)
+def get_decision_api() -> DecisionAPI:
+    """Start the bot decision API for this server's rooms (once per process)"""
+    api = DecisionAPI(get_room_registry())
+    api.start_in_thread(DEFAULT_API_PORT)
+    return api
+
+def get_current_room():
+    """Get the room this session has joined, or None"""
+    if st.session_state.room_id is None:
+        return None
+    room = get_room_registry().get(st.session_state.room_id)
+    if room is None or room.closed or st.session_state.session_id not in room.members:
+        # The room was closed, or this session stopped sending heartbeats and was dropped
+        room = None
+        st.session_state.room_id = None
+        st.session_state.room_player_num = None
+    return room
+
+def create_room(room_id: str, df, breakpoints) -> GameRoom:
+    """Create a room for the dataset and chart settings of the creating session"""
+    hoverlabel = get_hoverlabel_config()
+    chart_mode = st.session_state.chart_mode
+    pyramid = get_price_pyramid(df)
+    indicators = get_indicator_series(df, st.session_state.chart_indicators)
+
+    def build_frame(day_index: int):
+        # The figure is built here, once per tick, and the same figure goes to every viewer
+        return {
+            'price': df.iloc[day_index]['Price'],
+            'figure': build_progressive_figure(
+                df, day_index, breakpoints,
+                hoverlabel=hoverlabel, chart_mode=chart_mode, pyramid=pyramid, indicators=indicators
+            )
+        }
+
+    return GameRoom(
+        room_id,
+        df,
+        st.session_state.starting_cash,
+        st.session_state.time_to_run_sec,
+        build_frame,
+        margin_requirement=st.session_state.margin_requirement,
+        cost_model=st.session_state.cost_model,
+        member_timeout_sec=MEMBER_TIMEOUT_SEC
+    )
+
+def render_room_lobby(df, breakpoints):
+    """Render the panel for creating, joining and leaving shared game rooms"""
+    room = get_current_room()
+    with st.expander("👥 Game Room", expanded=room is not None):
+        if room is not None:
+            player_num = st.session_state.room_player_num
+            role = f"Player {player_num}" if player_num is not None else "Spectator"
+            st.markdown(f"In room **{room.room_id}** as {role} · {len(room.members)} connected")
+            if st.button("🤖 Open Bot API", help="Let bots join this room and submit decisions over HTTP/WebSocket"):
+                get_decision_api()
+                st.session_state.bot_api_open = True
+            if st.session_state.get('bot_api_open'):
+                st.caption(f"Bots: `http://127.0.0.1:{DEFAULT_API_PORT}/rooms/{room.room_id}/` (see utils/decision_api.py)")
+            if player_num is not None and st.session_state.cost_model != room.cost_model:
+                if st.button("💸 Apply My Fee Schedule", help="Switch the room to the fee schedule from your Admin Settings and re-price every trade so far"):
+                    try:
+                        num_trades = room.set_cost_model(st.session_state.cost_model)
+                    except ValueError as e:
+                        st.error(f"Could not apply fee schedule: {e}")
+                    else:
+                        st.toast(f"Re-priced {num_trades} trade(s) for the whole room")
+                        st.rerun()
+            if st.button("Leave Room"):
+                room.leave(st.session_state.session_id)
+                if not room.members:
+                    # Last one out closes the room and stops its clock
+                    get_room_registry().close(room.room_id)
+                st.session_state.room_id = None
+                st.session_state.room_player_num = None
+                st.rerun()
+            return
+
+        st.caption("Play the current dataset with other browsers on one shared clock.")
+        registry = get_room_registry()
+        lobby_col1, lobby_col2, lobby_col3 = st.columns(3)
+        with lobby_col1:
+            room_id = st.text_input("Room Name", value="main").strip()
+        with lobby_col2:
+            display_name = st.text_input("Your Name", value="")
+        with lobby_col3:
+            as_player = st.radio("Join As", ["Player", "Spectator"], horizontal=True) == "Player"
+
+        existing = room_id in registry.room_ids()
+        if st.button("Join Room" if existing else "Create Room", disabled=not room_id or df is None):
+            room = registry.get_or_create(room_id, lambda: create_room(room_id, df, breakpoints))
+            st.session_state.room_player_num = room.join(st.session_state.session_id, display_name, as_player)
+            st.session_state.room_id = room_id
+            if as_player and st.session_state.room_player_num is None:
+                st.warning("All player seats are taken, joined as a spectator")
+            st.rerun()
+
+def _room_ticker_html(frame) -> str:
+    """HTML of the price ticker for a room frame"""
+    return f"""
+        <div style='text-align: center; padding: 10px; margin-bottom: 5px;'>
+            <h3 style='margin: 0; color: white; font-weight: 500;'>{CURRENCY_INDICATOR}{frame['price']:.2f}</h3>
+        </div>
+        """
+
+def _render_room_frame(room: GameRoom, ticker_placeholder, chart_placeholder) -> None:
+    """Render the room's shared frame; its figure was built once by the room's clock"""
+    frame = room.frame
+    ticker_placeholder.markdown(_room_ticker_html(frame), unsafe_allow_html=True)
+    chart_placeholder.plotly_chart(frame['figure'], use_container_width=True)
+
+def _render_room_controls(room: GameRoom, is_player: bool) -> None:
+    """Render Start/Pause/Skip for the shared clock (players only)"""
+    st.markdown("### Progress Control")
+    at_end = room.current_day_index >= len(room.df) - 1
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("Start", use_container_width=True, disabled=at_end or not is_player):
+            try:
+                room.start()
+            except ValueError as e:
+                st.error(f"Could not apply staged trades: {e}")
+                st.stop()
+            st.rerun()
+    with col2:
+        if st.button("Pause", use_container_width=True, disabled=at_end or not is_player):
+            room.pause()
+            st.rerun()
+    with col3:
+        if st.button("Skip", use_container_width=True, disabled=at_end or not is_player):
+            try:
+                room.skip()
+            except ValueError as e:
+                st.error(f"Could not apply staged trades: {e}")
+                st.stop()
+            st.rerun()
+
+def _render_room_trading(room: GameRoom, player_num: int) -> None:
+    """Render the order form for this session's seat in the room"""
+    names = room.instruments.names
+    is_breakpoint = room.waiting_for_trade
+    with st.container(border=True):
+        st.markdown(f"**{room.player_names[player_num]}**")
+        instrument = 0
+        if room.instruments.is_multi:
+            instrument = st.selectbox("Instrument", range(len(names)), format_func=lambda i: names[i], key="room_instrument")
+        ticker = names[instrument] if room.instruments.is_multi else None
+        current_price = room.instruments.prices[room.current_day_index, instrument]
+        available_cash, available_positions = room.trade_buffer.view(player_num, room.portfolios[player_num], instrument)
+        action = st.selectbox("Action", list(ACTIONS), key="room_action")
+        order_action = ACTIONS[action]
+        order_price = current_price
+        if order_action in ORDER_TYPES:
+            order_price = st.number_input(
+                f"Trigger Price ({CURRENCY_INDICATOR})",
+                min_value=0.01,
+                value=round(current_price * (0.95 if order_action in TRIGGER_BELOW else 1.05), 2),
+                step=0.01,
+                format="%.2f",
+                key="room_trigger_price"
+            )
+        max_quantity = max_order_quantity(
+            order_action, available_cash, available_positions, order_price,
+            room.portfolios[player_num]['pnl_calculator']
+        )
+        quantity = st.number_input(
+            f"Qty [{'Short' if available_positions < 0 else 'Holding'}{f' {ticker}' if ticker else ''} : {abs(available_positions)}]",
+            min_value=0,
+            max_value=max_quantity,
+            value=0 if max_quantity == 0 else 1,
+            step=1,
+            key="room_quantity"
+        )
+        st.metric("Value", f"{CURRENCY_INDICATOR}{quantity * order_price:.2f}", f"Cash: {CURRENCY_INDICATOR}{available_cash:.2f}")
+
+        if st.button("Execute Trade", key="room_execute_trade", disabled=not is_breakpoint):
+            try:
+                room.stage(
+                    player_num, order_action, 0 if action == "Hold" else quantity,
+                    order_price if order_action in ORDER_TYPES else None,
+                    instrument
+                )
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+        staged_orders = room.trade_buffer.staged_orders(player_num)
+        if st.button("Undo Last", key="room_undo_trade", disabled=not (is_breakpoint and staged_orders)):
+            room.undo(player_num)
+            st.rerun()
+        if staged_orders:
+            pending = ", ".join(
+                "Hold" if order.action == 'hold' else describe_order(
+                    order.action, order.quantity, order.price, names[order.instrument] if ticker else None
+                )
+                for order in staged_orders
+            )
+            st.caption(f"Pending: {pending}")
+        resting_orders = room.order_book.live_orders(player_num)
+        if resting_orders:
+            resting = ", ".join(
+                describe_order(order.order_type, order.quantity, order.price, names[order.instrument] if ticker else None)
+                for order in resting_orders
+            )
+            st.caption(f"Resting: {resting}")
+
+def _render_room_leaderboard(room: GameRoom) -> None:
+    """Render every seated player's standing"""
+    st.markdown("### Room Leaderboard")
+    rows = room.leaderboard()
+    if not rows:
+        st.info("No players have joined this room yet.")
+        return
+    leaderboard_df = pd.DataFrame([{
+        'Player': row['name'],
+        'Portfolio Value': f"{CURRENCY_INDICATOR}{row['portfolio_value']:,.2f}",
+        'PnL': f"{CURRENCY_INDICATOR}{row['pnl']:,.2f}",
+        'Cash': f"{CURRENCY_INDICATOR}{row['cash']:,.2f}",
+        'Fees': f"{CURRENCY_INDICATOR}{row['fees']:,.2f}",
+        'Stock Qty': describe_holdings(row['holdings'], room.instruments.names)
+    } for row in rows])
+    st.dataframe(leaderboard_df, hide_index=True, use_container_width=True)
+
+def follow_room(room: GameRoom, ticker_placeholder, chart_placeholder, version: int) -> None:
+    """
+    Stream the room's ticks into this session until something other than the chart changes.
+
+    The session only waits for the room's clock and re-sends the shared
+    frame; it never advances the simulation itself. Each wait doubles as
+    the session's heartbeat, so closing the tab drops it from the room.
+    """
+    day_index = room.current_day_index
+    session_id = st.session_state.session_id
+    while True:
+        room.touch(session_id)
+        new_version = room.wait_for_update(version, ROOM_POLL_TIMEOUT_SEC)
+        if room.closed:
+            st.rerun()
+        if new_version == version:
+            # Keep-alive: lets Streamlit interrupt this loop when the user interacts
+            ticker_placeholder.markdown(_room_ticker_html(room.frame), unsafe_allow_html=True)
+            continue
+        version = new_version
+        if room.running and not room.waiting_for_trade and room.current_day_index != day_index:
+            day_index = room.current_day_index
+            _render_room_frame(room, ticker_placeholder, chart_placeholder)
+            continue
+        # Pause, breakpoint, trades or membership changed: refresh the whole page
+        st.rerun()
+
+def render_room_view(room: GameRoom) -> None:
+    """Render the shared game for this session and follow the room's clock"""
+    version = room.version
+    player_num = st.session_state.room_player_num
+    is_player = player_num is not None
+
+    header_col1, header_col2 = st.columns([3, 1])
+    with header_col1:
+        st.title("Trading Decision Simulator")
+        st.caption(f"Room **{room.room_id}** · Day {room.current_day_index + 1} of {len(room.df)}")
+    with header_col2:
+        _render_room_controls(room, is_player)
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        ticker_placeholder = st.empty()
+        chart_placeholder = st.empty()
+        _render_room_frame(room, ticker_placeholder, chart_placeholder)
+    with col2:
+        if is_player:
+            _render_room_trading(room, player_num)
+        else:
+            st.info("👀 Spectating")
+
+    _render_room_leaderboard(room)
+    render_room_lobby(room.df, room.breakpoints)
+
+    follow_room(room, ticker_placeholder, chart_placeholder, version)
@@ -1,8 +1,75 @@
 import streamlit as st
 import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
 from utils.visual_configs import PLAYER_COLORS
-from utils.visual_configs import CURRENCY_INDICATOR, get_hoverlabel_config
+from utils.visual_configs import CURRENCY_INDICATOR, get_hoverlabel_config, get_scatter_class
+from utils.chart_payload import to_epoch_ms, compact_values
+from utils.instruments import day_prices, describe_holdings, instrument_columns, instrument_names, update_portfolio_values
+from utils.risk_metrics import ROLLING_WINDOW, VAR_CONFIDENCE
+from utils.strategy_oracle import REFERENCE_LABELS, reference_paths
+from utils.decision_analytics import decision_analytics, decision_table, player_summary, trade_log_arrays
+from utils.policy_robustness import ROBUSTNESS_METHODS, default_workers, policy_robustness
+from utils.data_handler import extract_breakpoints, get_dataset_key
+
+# Maximum points per player or reference strategy line (about the chart's pixel width)
+REFERENCE_MAX_POINTS = 1500
+
+# Line style of each reference strategy
+REFERENCE_STYLES = {
+    'optimal': dict(color='#888888', dash='dash'),
+    'buy_and_hold': dict(color='#888888', dash='dot'),
+    'cash': dict(color='#BBBBBB', dash='dashdot')
+}
+
+# Per-decision score shown in the heatmap: (column of the decision table, color scale)
+DECISION_METRICS = {
+    'Regret': ('Regret', 'Reds'),
+    'Timing %': ('Timing %', 'RdYlGn'),
+    'Sizing %': ('Sizing %', 'RdYlGn')
+}
+
+# Simulated paths the policy robustness panel offers
+ROBUSTNESS_PATH_COUNTS = (500, 1000, 5000, 10000)
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _build_reference_paths(dataset_key, initial_cash, cost_model, _df):
+    """Compute the reference strategies once per (dataset, starting cash, fee schedule) (shared across sessions)"""
+    return reference_paths(_df, extract_breakpoints(_df), initial_cash, cost_model)
+
+def get_reference_paths(df):
+    """Get the (cached) reference strategies of a dataset for this game's starting cash and fees"""
+    return _build_reference_paths(get_dataset_key(df), st.session_state.starting_cash, st.session_state.cost_model, df)
+
+def get_reference_lines(df, current_day_index):
+    """
+    Reference strategy values to draw next to the players' portfolio values.
+
+    Returns:
+        Dict[str, Tuple[pd.Series, np.ndarray]]: (dates, values) per strategy name
+    """
+    return reference_lines(get_reference_paths(df), df, current_day_index)
+
+def reference_lines(paths, df, current_day_index):
+    """
+    Downsample reference paths up to a day (safe to call off the script thread).
+
+    The baselines are shown up to the current day; the hindsight-optimal
+    path would give the next moves away, so it only appears once the game
+    is over.
+
+    Returns:
+        Dict[str, Tuple[pd.Series, np.ndarray]]: (dates, values) per strategy name
+    """
+    finished = current_day_index >= len(df) - 1
+    end = current_day_index + 1
+    rows = np.unique(np.linspace(0, end - 1, min(end, REFERENCE_MAX_POINTS)).astype(np.int64))
+    dates = df.loc[rows, 'Date']
+    return {
+        name: (dates, values[rows])
+        for name, values in paths.lines().items()
+        if name != 'optimal' or finished
+    }
 
 def render_portfolio_stats(df, current_day_index):
     """Render portfolio statistics for all players"""
@@ -18,6 +85,14 @@ def render_portfolio_stats(df, current_day_index):
         unsafe_allow_html=True
     )
 
+    # Value every portfolio at today's prices in one pass
+    current_date = df.iloc[current_day_index]['Date']
+    names = instrument_names(df)
+    values = dict(zip(
+        st.session_state.portfolios,
+        update_portfolio_values(st.session_state.portfolios, day_prices(df, current_day_index), current_date)
+    ))
+
     # Create a horizontal layout for stats
     cols = st.columns(st.session_state.num_players)
     
@@ -28,20 +103,17 @@ def render_portfolio_stats(df, current_day_index):
                 st.markdown(f'<div class="player-{player_num}">{st.session_state.player_names[player_num]}</div>', unsafe_allow_html=True)
                 
                 # Current position calculations
-                current_price = df.iloc[current_day_index]['Price']
-                current_date = df.iloc[current_day_index]['Date']
                 portfolio = st.session_state.portfolios[player_num]
                 pnl_calc = portfolio['pnl_calculator']
                 
-                pnl_calc.update_portfolio_value(current_price, current_date)
-                portfolio_value = pnl_calc.get_portfolio_value(current_price)
-                pnl = pnl_calc.get_current_pnl()
-                metrics = pnl_calc.get_performance_metrics()
+                portfolio_value = values[player_num]
+                pnl = portfolio_value - pnl_calc.initial_cash
+                metrics = pnl_calc.get_performance_metrics(st.session_state.periods_per_year)
                 
                 # Calculate additional metrics
                 cash_in_hand = portfolio['cash']
-                equity_in_hand = portfolio['positions'] * current_price
-                stock_qty = portfolio['positions']
+                equity_in_hand = portfolio_value - pnl_calc.cash
+                stock_qty = describe_holdings(pnl_calc.holdings, names)
                 total_investment = pnl_calc.initial_cash
                 total_returns_pct = metrics['total_return']
                 drawdown = metrics['max_drawdown']
@@ -56,6 +128,7 @@ def render_portfolio_stats(df, current_day_index):
                         'Cash in Hand',
                         'Equity in Hand',
                         'Stock Qty',
+                        'Fees Paid',
                         'Total Returns %',
                         'Drawdown',
                         'Sharpe'
@@ -66,7 +139,8 @@ def render_portfolio_stats(df, current_day_index):
                         f"{CURRENCY_INDICATOR}{pnl:,.2f}",
                         f"{CURRENCY_INDICATOR}{cash_in_hand:,.2f}",
                         f"{CURRENCY_INDICATOR}{equity_in_hand:,.2f}",
-                        f"{stock_qty:,}",
+                        stock_qty,
+                        f"{CURRENCY_INDICATOR}{pnl_calc.get_fees_paid():,.2f}",
                         f"{total_returns_pct:.2f}%",
                         f"{drawdown:.2f}%",
                         f"{sharpe:.3f}"
@@ -92,9 +166,45 @@ def render_portfolio_stats(df, current_day_index):
                 
                 styled_df = filtered_df.style.apply(color_returns, axis=1)
                 st.dataframe(styled_df, hide_index=True, use_container_width=True)
+                
+                with st.expander("Risk Metrics", expanded=False):
+                    st.dataframe(pd.DataFrame(format_risk_metrics(metrics)), hide_index=True, use_container_width=True)
+
+def format_risk_metrics(metrics):
+    """Risk metrics from get_performance_metrics() as Metric/Value table columns"""
+    return {
+        'Metric': [
+            'Max Drawdown',
+            'Sharpe (annualized)',
+            'Sortino',
+            'Calmar',
+            'Annualized Return',
+            f'Volatility ({ROLLING_WINDOW} periods)',
+            'Hit Rate',
+            f'VaR {VAR_CONFIDENCE:.0%}',
+            f'CVaR {VAR_CONFIDENCE:.0%}'
+        ],
+        'Value': [
+            f"{metrics['max_drawdown']:.2f}%",
+            f"{metrics['annualized_sharpe']:.3f}",
+            f"{metrics['sortino_ratio']:.3f}",
+            f"{metrics['calmar_ratio']:.3f}",
+            f"{metrics['annualized_return']:.2f}%",
+            f"{metrics['rolling_volatility']:.2f}%",
+            f"{metrics['hit_rate']:.1f}%",
+            f"{metrics['value_at_risk']:.2f}%",
+            f"{metrics['conditional_var']:.2f}%"
+        ]
+    }
 
-def render_performance_charts():
-    """Render performance charts and trading history"""
+def render_performance_charts(names=(), reference=None):
+    """
+    Render performance charts and trading history.
+
+    Args:
+        names: Tickers of a multi-instrument dataset (adds a Ticker column to the history)
+        reference: Reference strategy lines from get_reference_lines()
+    """
     # Create portfolio value chart if any player has metrics
     fig = go.Figure()
     has_any_metrics = False
@@ -102,9 +212,12 @@ def render_performance_charts():
     for player_num in range(1, st.session_state.num_players + 1):
         daily_metrics = st.session_state.portfolios[player_num]['pnl_calculator'].daily_metrics
         if not daily_metrics.empty:
-            fig.add_trace(go.Scatter(
-                x=daily_metrics['date'],
-                y=daily_metrics['portfolio_value'],
+            # Every day is valued, so long games are thinned to about the chart's width
+            rows = np.unique(np.linspace(0, len(daily_metrics) - 1, min(len(daily_metrics), REFERENCE_MAX_POINTS)).astype(np.int64))
+            scatter_class = get_scatter_class(len(rows))
+            fig.add_trace(scatter_class(
+                x=to_epoch_ms(daily_metrics['date'].iloc[rows]),
+                y=compact_values(daily_metrics['portfolio_value'].iloc[rows]),
                 mode='lines',
                 name=st.session_state.player_names[player_num],
                 line=dict(color=PLAYER_COLORS[player_num])
@@ -112,9 +225,18 @@ def render_performance_charts():
             has_any_metrics = True
 
     if has_any_metrics:
+        for name, (dates, values) in (reference or {}).items():
+            fig.add_trace(go.Scatter(
+                x=to_epoch_ms(dates),
+                y=compact_values(values),
+                mode='lines',
+                name=REFERENCE_LABELS[name],
+                line=dict(width=1, **REFERENCE_STYLES[name])
+            ))
         fig.update_layout(
             title='Portfolio Values Over Time',
             xaxis_title='Date',
+            xaxis_type='date',
             yaxis_title=f'Value ({CURRENCY_INDICATOR})',
             showlegend=True,
             height=300,
@@ -145,26 +267,188 @@ def render_performance_charts():
                             if hasattr(date_str, 'strftime'):
                                 date_str = date_str.strftime('%m/%d/%Y')
 
-                            trade_data.append({
+                            row = {
                                 'Date': date_str,
                                 'Action': trade['action'].upper(),
                                 'Qty': trade['quantity'],
                                 'Price': f"{CURRENCY_INDICATOR}{trade['price']:.2f}"
-                            })
+                            }
+                            if len(names) > 1:
+                                row['Ticker'] = names[trade.get('instrument', 0)]
+                            trade_data.append(row)
 
                         # Display as a styled dataframe
                         trade_df = pd.DataFrame(trade_data)
 
-                        # Apply conditional styling for buy/sell actions
+                        # Apply conditional styling for buy/sell actions (margin-call covers are buys)
                         def color_trades(row):
-                            if row['Action'] == 'BUY':
-                                return ['', 'color: green', '', '']
+                            padding = [''] * (len(row) - 2)
+                            if row['Action'] in ('BUY', 'COVER'):
+                                return ['', 'color: green'] + padding
                             elif row['Action'] == 'SELL':
-                                return ['', 'color: red', '', '']
+                                return ['', 'color: red'] + padding
                             else:  # HOLD
-                                return ['', 'color: gray', '', '']
+                                return ['', 'color: gray'] + padding
 
                         styled_trade_df = trade_df.style.apply(color_trades, axis=1)
                         st.dataframe(styled_trade_df, hide_index=True, use_container_width=True)
                     else:
-                        st.write("No trades yet")
\ No newline at end of file
+                        st.write("No trades yet")
+
+def render_range_review(df, breakpoints):
+    """
+    Render per-player statistics between two decision points of the game so far.
+
+    Each player's value history is indexed once and extended as days are
+    added (PnLCalculator.range_stats), so reruns and moving the window only
+    query the index.
+    """
+    current_day_index = st.session_state.current_day_index
+    days = sorted({0, current_day_index} | {bp for bp in breakpoints if bp <= current_day_index})
+    if len(days) < 2:
+        return
+    breakpoint_numbers = {bp: number for number, bp in enumerate(breakpoints, 1)}
+    dates = df.loc[days, 'Date']
+
+    def format_day(day):
+        label = f"Breakpoint {breakpoint_numbers[day]}" if day in breakpoint_numbers else f"Day {day}"
+        return f"{label} ({dates[day].strftime('%m/%d/%Y')})"
+
+    labels = {format_day(day): day for day in days}
+    with st.expander("🔍 Range Review", expanded=False):
+        start_label, end_label = st.select_slider(
+            "Window",
+            options=list(labels),
+            value=(format_day(days[0]), format_day(days[-1])),
+            help="Return, volatility, Sharpe and drawdown of every player between two decision points"
+        )
+        start_day, end_day = labels[start_label], labels[end_label]
+        rows = []
+        for player_num in range(1, st.session_state.num_players + 1):
+            stats = st.session_state.portfolios[player_num]['pnl_calculator'].range_stats()
+            summary = stats.query_dates(dates[start_day], dates[end_day], st.session_state.periods_per_year)
+            if summary is None:
+                continue
+            rows.append({
+                'Player': st.session_state.player_names[player_num],
+                'Return': f"{summary.total_return:.2f}%",
+                'Annualized': f"{summary.annualized_return:.2f}%",
+                'Volatility': f"{summary.volatility:.2f}%",
+                'Sharpe': f"{summary.sharpe_ratio:.3f}",
+                'Max Drawdown': f"{summary.max_drawdown:.2f}%",
+                'High': f"{CURRENCY_INDICATOR}{summary.high:,.2f}",
+                'Low': f"{CURRENCY_INDICATOR}{summary.low:,.2f}"
+            })
+        if rows:
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
+def render_decision_analytics(df, breakpoints):
+    """
+    Render how every player's decisions at the breakpoints so far compare
+    with the best action available at each of them.
+
+    The last scored segment ends at the current day, so nothing after it is
+    looked at. All players and breakpoints are scored at once with array
+    operations (utils.decision_analytics).
+    """
+    current_day_index = st.session_state.current_day_index
+    decision_days = [bp for bp in breakpoints if bp < current_day_index]
+    if not decision_days:
+        return
+    num_players = st.session_state.num_players
+    player_names = st.session_state.player_names
+    dates = df['Date']
+    portfolios = {player_num: st.session_state.portfolios[player_num] for player_num in range(1, num_players + 1)}
+    analytics = decision_analytics(
+        df[instrument_columns(df)].to_numpy(dtype=np.float64), decision_days, current_day_index,
+        trade_log_arrays(portfolios, dates), num_players, st.session_state.starting_cash,
+        st.session_state.margin_requirement
+    )
+
+    with st.expander("🎯 Decision Analytics", expanded=False):
+        st.caption("Each breakpoint is scored against the best single action available at it "
+                   "(all wealth in the instrument that rose most until the next breakpoint, the largest short "
+                   "the margin allows in the one that fell most, or cash), before fees. Resting orders that "
+                   "fill between breakpoints can beat it, which shows as negative regret.")
+        summary = pd.DataFrame(player_summary(analytics, player_names))
+        st.dataframe(summary.style.format({
+            'Total Regret': f"{CURRENCY_INDICATOR}{{:,.2f}}",
+            'Mean Timing %': "{:.2f}%",
+            'Gain Captured %': "{:.1f}%"
+        }, na_rep="-"), hide_index=True, use_container_width=True)
+
+        metric = st.radio("Heatmap", list(DECISION_METRICS), horizontal=True, key="decision_metric")
+        column, colorscale = DECISION_METRICS[metric]
+        table = decision_table(analytics, player_names, dates)
+        grid = table[column].to_numpy().reshape(num_players, len(decision_days))
+        fig = go.Figure(go.Heatmap(
+            z=grid,
+            x=[f"BP {number}" for number in range(1, len(decision_days) + 1)],
+            y=[player_names[player_num] for player_num in range(1, num_players + 1)],
+            customdata=np.broadcast_to(dates.iloc[decision_days].dt.strftime('%m/%d/%Y').to_numpy(), grid.shape),
+            colorscale=colorscale,
+            zmid=None if metric == 'Regret' else 0,
+            hovertemplate=f"%{{y}}<br>%{{x}} (%{{customdata}})<br>{metric}: %{{z:,.2f}}<extra></extra>"
+        ))
+        fig.update_layout(height=max(250, 30 * num_players + 120), margin=dict(l=10, r=10, t=30, b=10),
+                          yaxis=dict(autorange='reversed'))
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.dataframe(table, hide_index=True, use_container_width=True)
+
+def render_policy_robustness(df, breakpoints, instrument=0):
+    """
+    Render a Monte Carlo check of one player's decisions: the exposure they
+    took at each breakpoint, as a function of the trailing return, replayed
+    on simulated variations of the dataset (utils.policy_robustness).
+
+    The simulation runs on request and its result is kept for the session.
+    """
+    current_day_index = st.session_state.current_day_index
+    if not any(bp < current_day_index for bp in breakpoints):
+        return
+    player_names = st.session_state.player_names
+    with st.expander("🎲 Policy Robustness", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            player_num = st.selectbox("Player", range(1, st.session_state.num_players + 1),
+                                      format_func=lambda num: player_names[num], key="robustness_player")
+        with col2:
+            method = st.radio("Paths", ROBUSTNESS_METHODS, horizontal=True, key="robustness_method",
+                              format_func=lambda name: {'bootstrap': "Block Bootstrap", 'synthetic': "Synthetic (GBM)"}[name],
+                              help="Resampled blocks of the returns so far, or a model calibrated to them")
+        with col3:
+            num_paths = st.selectbox("Simulations", ROBUSTNESS_PATH_COUNTS, index=1, key="robustness_paths")
+
+        run_key = (player_num, method, num_paths, instrument, current_day_index)
+        if st.button("Run Simulation", key="run_robustness"):
+            with st.spinner("Simulating..."):
+                try:
+                    st.session_state.policy_robustness = (run_key, policy_robustness(
+                        df, breakpoints, st.session_state.portfolios[player_num], current_day_index,
+                        st.session_state.starting_cash, num_paths, method, instrument=instrument,
+                        workers=default_workers(), periods_per_year=st.session_state.periods_per_year
+                    ))
+                except ValueError as e:
+                    st.warning(str(e))
+        stored = st.session_state.get('policy_robustness')
+        if stored is None or stored[0] != run_key:
+            st.caption("The player's exposure at each breakpoint, as a function of the return over the "
+                       "previous days, is replayed on simulated paths of the days so far with the same breakpoints (before fees).")
+            return
+        result = stored[1]
+
+        summary = result.summary()
+        st.dataframe(pd.DataFrame([{
+            name: f"{value:,.2f}%" if name.endswith('%') else f"{value:,}" for name, value in summary.items()
+        }]), hide_index=True, use_container_width=True)
+        hist_col1, hist_col2 = st.columns(2)
+        for column, values, historical, title in (
+            (hist_col1, result.final_returns, result.historical_return, "Final Return (%)"),
+            (hist_col2, result.max_drawdowns, result.historical_drawdown, "Max Drawdown (%)")
+        ):
+            fig = go.Figure(go.Histogram(x=values, nbinsx=50, marker_color=PLAYER_COLORS[player_num]))
+            fig.add_vline(x=historical, line_dash='dash', line_color='#888888', annotation_text="Actual path so far")
+            fig.update_layout(title=title, height=300, margin=dict(l=10, r=10, t=40, b=10), showlegend=False)
+            with column:
+                st.plotly_chart(fig, use_container_width=True)
@@ -1,29 +1,195 @@
 import streamlit as st
 import plotly.graph_objects as go
-from utils.data_handler import mask_future_data
-from utils.visual_configs import CURRENCY_INDICATOR, get_hoverlabel_config
+import numpy as np
+from typing import Dict, List
+from plotly.subplots import make_subplots
+from utils.data_handler import get_dataset_key, has_ohlc
+from utils.visual_configs import CURRENCY_INDICATOR, get_hoverlabel_config, get_scatter_class
+from utils.chart_payload import to_epoch_ms, compact_values
+from utils.price_pyramid import PricePyramid
+from utils.indicators import PANEL_INDICATORS, compute_indicator
 
-def build_progressive_figure(df, current_day_index: int, breakpoints: list) -> go.Figure:
+# Maximum points per series in the full price preview (about the chart's pixel width)
+PREVIEW_MAX_BUCKETS = 1500
+
+# Maximum candles drawn per frame in candlestick mode
+MAX_CANDLES = 300
+
+# Maximum price points drawn per frame in line mode
+MAX_LINE_POINTS = 1500
+
+# Line colors for indicator overlays, assigned in order
+INDICATOR_COLORS = ['orange', 'purple', 'teal', 'brown', 'magenta', 'olive']
+
+def build_vertical_lines_trace(x_values, y0: float, y1: float, color: str = 'red', width: int = 2, name: str = 'Breakpoints') -> go.Scatter:
+    """
+    Build a single trace drawing one vertical line per x value.
+
+    Lines are joined into one polyline separated by gaps, which is much cheaper
+    to render than adding one layout shape per line.
+
+    Args:
+        x_values: X positions of the vertical lines
+        y0: Bottom of every line
+        y1: Top of every line
+        color: Line color
+        width: Line width
+        name: Trace name
+
+    Returns:
+        go.Scatter: Trace (SVG or WebGL depending on size) with all lines batched
+    """
+    x_values = np.asarray(x_values, dtype=object)
+    num_lines = len(x_values)
+
+    xs = np.empty(num_lines * 3, dtype=object)
+    xs[0::3] = x_values
+    xs[1::3] = x_values
+    xs[2::3] = None
+
+    ys = np.empty(num_lines * 3, dtype=object)
+    ys[0::3] = y0
+    ys[1::3] = y1
+    ys[2::3] = None
+
+    scatter_class = get_scatter_class(len(xs))
+    return scatter_class(
+        x=xs,
+        y=ys,
+        mode='lines',
+        name=name,
+        line=dict(color=color, width=width),
+        hoverinfo='skip',
+        showlegend=False
+    )
+
+def add_candlestick_traces(fig: go.Figure, df, current_day_index: int, pyramid: PricePyramid,
+                           price_row: int = None, volume_row: int = None) -> Dict[str, np.ndarray]:
+    """
+    Add revealed OHLC candles (and volume bars) aggregated to at most MAX_CANDLES bars.
+
+    Bars come from the price pyramid, so each frame ships a bounded number of
+    candles however long the series is, and the last candle only covers rows up
+    to current_day_index.
+
+    Returns:
+        Dict[str, np.ndarray]: The candles drawn (see PricePyramid.query)
+    """
+    candles = pyramid.query(0, current_day_index, MAX_CANDLES)
+    candle_dates = to_epoch_ms(df.loc[candles['start'], 'Date'].values)
+
+    fig.add_trace(go.Candlestick(
+        x=candle_dates,
+        open=compact_values(candles['open']),
+        high=compact_values(candles['high']),
+        low=compact_values(candles['low']),
+        close=compact_values(candles['close']),
+        name='Price'
+    ), row=price_row, col=None if price_row is None else 1)
+
+    if volume_row is not None:
+        fig.add_trace(go.Bar(
+            x=candle_dates,
+            y=candles['volume'],
+            name='Volume',
+            marker_color='gray'
+        ), row=volume_row, col=1)
+    return candles
+
+def add_indicator_traces(fig: go.Figure, dates_ms: np.ndarray, indicators: List[Dict], rows,
+                         price_row: int = None, panel_row: int = None) -> None:
+    """
+    Add indicator lines for the revealed rows.
+
+    Indicators are computed once per dataset and are causal, so each frame
+    only takes the values at the given rows; nothing is recomputed per frame.
+
+    Args:
+        fig: Figure to add to
+        dates_ms: Epoch milliseconds of the given rows
+        indicators: Indicator series from get_indicator_series()
+        rows: Row indices (or a slice) to draw, e.g. the revealed prefix or one row per candle
+        price_row: Subplot row of the price
+        panel_row: Subplot row for indicators drawn below the price (RSI)
+    """
+    color_index = 0
+    for indicator in indicators:
+        row = panel_row if indicator['name'] in PANEL_INDICATORS else price_row
+        for label, values in indicator['lines'].items():
+            y = values[rows]
+            fig.add_trace(get_scatter_class(len(y))(
+                x=dates_ms,
+                y=compact_values(y),
+                mode='lines',
+                name=label,
+                line=dict(
+                    color=INDICATOR_COLORS[color_index % len(INDICATOR_COLORS)],
+                    width=1,
+                    dash='dot' if indicator['name'] == 'bollinger' else None
+                )
+            ), row=row, col=None if row is None else 1)
+            if indicator['name'] != 'bollinger' or label.endswith('lower'):
+                color_index += 1
+
+def build_progressive_figure(df, current_day_index: int, breakpoints: list, hoverlabel: dict = None,
+                             chart_mode: str = 'line', pyramid: PricePyramid = None,
+                             indicators: List[Dict] = None) -> go.Figure:
     """
     Build the progressive price chart figure (without rendering) for a given index.
 
+    Args:
+        df: DataFrame with price data
+        current_day_index: Last revealed day
+        breakpoints: Breakpoint indices
+        hoverlabel: Hoverlabel config; read from session state when omitted.
+            Pass it explicitly when building frames off the script thread.
+        chart_mode: 'line' or 'candlestick' (with a volume panel when the data has Volume)
+        pyramid: Price pyramid the revealed prices are downsampled through; looked up when omitted
+        indicators: Indicator series from get_indicator_series() to overlay
+
     Returns:
         go.Figure: Configured Plotly figure for current state
     """
-    # Create masked data for future prices
-    masked_df = mask_future_data(df, current_day_index)
+    indicators = indicators or []
+    if pyramid is None:
+        pyramid = get_price_pyramid(df)
+    with_volume = chart_mode == 'candlestick' and pyramid.has_volume
+    with_panel = any(indicator['name'] in PANEL_INDICATORS for indicator in indicators)
 
-    # Create figure
-    fig = go.Figure()
+    # Optional volume and indicator panels below the price
+    row_heights = [0.75] + [0.25] * (with_volume + with_panel)
+    if len(row_heights) > 1:
+        fig = make_subplots(rows=len(row_heights), cols=1, shared_xaxes=True,
+                            row_heights=row_heights, vertical_spacing=0.03)
+        price_row = 1
+        volume_row = 2 if with_volume else None
+        panel_row = len(row_heights) if with_panel else None
+    else:
+        fig = go.Figure()
+        price_row = volume_row = panel_row = None
 
-    # Add price line
-    fig.add_trace(go.Scatter(
-        x=df['Date'],
-        y=masked_df['Price'],
-        mode='lines',
-        name='Price',
-        line=dict(color='blue')
-    ))
+    if chart_mode == 'candlestick':
+        buckets = add_candlestick_traces(fig, df, current_day_index, pyramid, price_row, volume_row)
+        bucket_dates = to_epoch_ms(df.loc[buckets['start'], 'Date'].values)
+    else:
+        # Only the revealed prefix goes out, downsampled through the pyramid to
+        # at most MAX_LINE_POINTS closes, so no future prices are in the payload
+        buckets = pyramid.query(0, current_day_index, MAX_LINE_POINTS)
+        bucket_dates = to_epoch_ms(df.loc[buckets['start'], 'Date'].values)
+        fig.add_trace(get_scatter_class(len(bucket_dates))(
+            x=bucket_dates,
+            y=compact_values(buckets['close']),
+            mode='lines',
+            name='Price',
+            line=dict(color='blue')
+        ), row=price_row, col=None if price_row is None else 1)
+    # Indicators are sampled at the last revealed row of each bucket
+    indicator_rows = np.append(buckets['start'][1:] - 1, current_day_index)
+    indicator_dates = bucket_dates
+
+    add_indicator_traces(fig, indicator_dates, indicators, indicator_rows, price_row, panel_row)
+    if panel_row is not None:
+        fig.update_yaxes(range=[0, 100], title_text='RSI', row=panel_row, col=1)
 
     # Only show breakpoints that have already occurred
     past_breakpoints = [bp for bp in breakpoints if bp <= current_day_index]
@@ -31,7 +197,7 @@ def build_progressive_figure(df, current_day_index: int, breakpoints: list) -> g
         breakpoint_dates = df.loc[past_breakpoints, 'Date']
         breakpoint_prices = df.loc[past_breakpoints, 'Price']
 
-        fig.add_trace(go.Scatter(
+        fig.add_trace(get_scatter_class(len(past_breakpoints))(
             x=breakpoint_dates,
             y=breakpoint_prices,
             mode='markers',
@@ -41,7 +207,7 @@ def build_progressive_figure(df, current_day_index: int, breakpoints: list) -> g
                 size=10,
                 symbol='diamond'
             )
-        ))
+        ), row=price_row, col=None if price_row is None else 1)
 
     # Update layout with improved styling
     fig.update_layout(
@@ -51,6 +217,10 @@ def build_progressive_figure(df, current_day_index: int, breakpoints: list) -> g
         showlegend=True,
         height=600,
         xaxis=dict(
+            type='date',
+            # Keep the full timeline in view; candles only cover revealed days
+            range=[df.iloc[0]['Date'], df.iloc[-1]['Date']] if chart_mode == 'candlestick' else None,
+            rangeslider=dict(visible=False),
             showgrid=True,
             gridcolor='rgba(211, 211, 211, 0.2)',
             gridwidth=1
@@ -60,7 +230,7 @@ def build_progressive_figure(df, current_day_index: int, breakpoints: list) -> g
             gridcolor='rgba(211, 211, 211, 0.2)',
             gridwidth=1
         ),
-        hoverlabel=get_hoverlabel_config()
+        hoverlabel=hoverlabel if hoverlabel is not None else get_hoverlabel_config()
     )
 
     # Add vertical line for current day with improved styling
@@ -108,45 +278,121 @@ def render_progressive_chart(df, current_day_index: int, breakpoints: list) -> N
     )
 
     # Build figure and render
-    fig = build_progressive_figure(df, current_day_index, breakpoints)
+    indicators = get_indicator_series(df, st.session_state.get('chart_indicators', ()))
+    fig = build_progressive_figure(df, current_day_index, breakpoints, indicators=indicators)
     st.plotly_chart(fig, use_container_width=True)
 
-def render_full_price_preview(df, breakpoints):
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _build_price_pyramid(dataset_key: str, _df) -> PricePyramid:
+    """Build the price pyramid once per dataset (shared across sessions)"""
+    return PricePyramid(
+        _df['Price'].to_numpy(),
+        open_prices=_df['Open'].to_numpy() if has_ohlc(_df) else None,
+        high_prices=_df['High'].to_numpy() if has_ohlc(_df) else None,
+        low_prices=_df['Low'].to_numpy() if has_ohlc(_df) else None,
+        volumes=_df['Volume'].to_numpy() if 'Volume' in _df.columns else None
+    )
+
+def get_price_pyramid(df) -> PricePyramid:
+    """Get the multi-resolution price pyramid (with OHLCV bars when present) for a dataset"""
+    return _build_price_pyramid(get_dataset_key(df), df)
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _compute_indicator(dataset_key: str, name: str, period: int, _df) -> Dict[str, np.ndarray]:
+    """Compute an indicator once per (dataset, indicator, params) (shared across sessions)"""
+    return compute_indicator(name, _df['Price'].to_numpy(), period)
+
+def get_indicator_series(df, indicators) -> List[Dict]:
+    """
+    Get the full-series values of the selected indicators for a dataset.
+
+    Args:
+        df: DataFrame with price data
+        indicators: (name, period) pairs, e.g. st.session_state.chart_indicators
+
+    Returns:
+        List[Dict]: {'name': ..., 'period': ..., 'lines': {label: values}} per indicator
     """
-    Render full price chart preview with all breakpoints marked
+    dataset_key = get_dataset_key(df)
+    return [
+        {'name': name, 'period': period, 'lines': _compute_indicator(dataset_key, name, period, df)}
+        for name, period in indicators
+    ]
+
+def get_window_indices(df, start_date, end_date):
     """
+    Convert a visible date window into inclusive row indices.
+
+    Returns:
+        Tuple[int, int]: (start_index, end_index)
+    """
+    dates = df['Date'].values
+    start_index = int(np.searchsorted(dates, np.datetime64(start_date), side='left'))
+    end_index = int(np.searchsorted(dates, np.datetime64(end_date), side='right')) - 1
+    return min(start_index, len(df) - 1), max(end_index, 0)
+
+def render_full_price_preview(df, breakpoints, start_index: int = None, end_index: int = None):
+    """
+    Render full price chart preview with all breakpoints marked.
+
+    Prices come from the dataset's price pyramid at the finest level that keeps
+    the visible window within PREVIEW_MAX_BUCKETS points, so the payload stays
+    bounded by the chart width for any history length. Zoomed-out levels are
+    drawn as a high/low band around the closing price.
+    """
+    start_index = 0 if start_index is None else start_index
+    end_index = len(df) - 1 if end_index is None else end_index
+    buckets = get_price_pyramid(df).query(start_index, end_index, PREVIEW_MAX_BUCKETS)
+    bucket_dates = to_epoch_ms(df.loc[buckets['start'], 'Date'].values)
+    scatter_class = get_scatter_class(len(bucket_dates))
+
     fig = go.Figure()
     
+    if buckets['level'] > 0:
+        # High/low band for each bucket
+        fig.add_trace(scatter_class(
+            x=bucket_dates,
+            y=compact_values(buckets['low']),
+            mode='lines',
+            line=dict(width=0),
+            hoverinfo='skip',
+            showlegend=False
+        ))
+        fig.add_trace(scatter_class(
+            x=bucket_dates,
+            y=compact_values(buckets['high']),
+            mode='lines',
+            name='High/Low Range',
+            line=dict(width=0),
+            fill='tonexty',
+            fillcolor='rgba(0, 0, 255, 0.2)'
+        ))
+    
     # Add price line
-    fig.add_trace(go.Scatter(
-        x=df['Date'],
-        y=df['Price'],
+    fig.add_trace(scatter_class(
+        x=bucket_dates,
+        y=compact_values(buckets['close']),
         mode='lines',
         name='Price',
         line=dict(color='blue', width=2)
     ))
     
-    # Add vertical lines for all breakpoints
-    for bp in breakpoints:
-        fig.add_shape(
-            type="line",
-            x0=df.iloc[bp]['Date'],
-            x1=df.iloc[bp]['Date'],
-            y0=df['Price'].min(),
-            y1=df['Price'].max(),
-            line=dict(
-                color="red",
-                width=2,
-                dash="solid"
-            )
-        )
+    visible_breakpoints = [bp for bp in breakpoints if start_index <= bp <= end_index]
+    
+    # Add vertical lines for all breakpoints as one batched trace
+    if visible_breakpoints:
+        fig.add_trace(build_vertical_lines_trace(
+            df.loc[visible_breakpoints, 'Date'],
+            buckets['low'].min(),
+            buckets['high'].max()
+        ))
     
     # Add breakpoint markers
-    if breakpoints:
-        breakpoint_dates = df.loc[breakpoints, 'Date']
-        breakpoint_prices = df.loc[breakpoints, 'Price']
+    if visible_breakpoints:
+        breakpoint_dates = df.loc[visible_breakpoints, 'Date']
+        breakpoint_prices = df.loc[visible_breakpoints, 'Price']
         
-        fig.add_trace(go.Scatter(
+        fig.add_trace(get_scatter_class(len(visible_breakpoints))(
             x=breakpoint_dates,
             y=breakpoint_prices,
             mode='markers',
@@ -166,6 +412,8 @@ def render_full_price_preview(df, breakpoints):
         showlegend=True,
         height=400,
         xaxis=dict(
+            type='date',
+            range=[df.iloc[start_index]['Date'], df.iloc[end_index]['Date']],
             showgrid=True,
             gridcolor='rgba(211, 211, 211, 0.2)',
             gridwidth=1
@@ -1,18 +1,50 @@
 import streamlit as st
-from typing import Dict
+from typing import Dict, Optional, Sequence
 from utils.visual_configs import PLAYER_COLORS
 from utils.visual_configs import CURRENCY_INDICATOR
+from utils.pnl_calculator import PnLCalculator
+from utils.resting_orders import ORDER_TYPES, ORDER_TYPE_LABELS, TRIGGER_BELOW, EXIT_ORDERS
 
-def render_trading_interface(current_price: float, portfolio: Dict, player_num: int, is_breakpoint: bool = False) -> None:
+# Action labels shown in the selector -> staged action
+ACTIONS = {'Buy': 'buy', 'Sell': 'sell', 'Hold': 'hold', **{label: order_type for order_type, label in ORDER_TYPE_LABELS.items()}}
+
+def describe_order(action: str, quantity: int, price: float, ticker: Optional[str] = None) -> str:
+    """Short text for a staged or resting order, e.g. 'Stop-Loss 5 @ $95.00' (or 'Stop-Loss 5 AAA @ $95.00')"""
+    shares = f"{quantity} {ticker}" if ticker else f"{quantity}"
+    if action in ORDER_TYPES:
+        return f"{ORDER_TYPE_LABELS[action]} {shares} @ {CURRENCY_INDICATOR}{price:.2f}"
+    return f"{action.title()} {shares}"
+
+def max_order_quantity(action: str, cash: float, positions: int, price: float, pnl_calc: PnLCalculator) -> int:
+    """
+    Largest quantity an order can have given the staged cash and positions.
+
+    Buys leave room for the spread and fees of the calculator's cost model;
+    sells may go short on margin.
+    """
+    if action in ('buy', 'limit_buy'):
+        fill_price, _ = pnl_calc.trade_terms('buy', 1, price)
+        cost_model = pnl_calc.cost_model
+        share_cost = fill_price * (1 + cost_model.commission_bps / 1e4)
+        return max(0, int((cash - cost_model.fixed_fee) / share_cost))
+    if action in EXIT_ORDERS:
+        return max(0, positions)
+    return PnLCalculator.max_sell_quantity(cash, positions, price, pnl_calc.margin_requirement)
+
+def render_trading_interface(current_price: float, portfolio: Dict, player_num: int, is_breakpoint: bool = False,
+                             instrument: int = 0, names: Sequence[str] = ()) -> None:
     """
     Render trading interface for user decisions.
     
     Args:
-        current_price: Current price per share
+        current_price: Current price per share of the traded instrument
         portfolio: Current portfolio state
         player_num: Player number (1-4)
         is_breakpoint: Whether the current day is a breakpoint
+        instrument: Instrument the orders trade (column of a multi-instrument dataset)
+        names: Tickers of a multi-instrument dataset
     """
+    ticker = names[instrument] if len(names) > 1 else None
     # Add all styles in one block
     st.markdown(
         f"""
@@ -48,15 +80,35 @@ def render_trading_interface(current_price: float, portfolio: Dict, player_num:
         # Trading action selection
         action = st.selectbox(
             "Action",
-            ["Buy", "Sell", "Hold"],
-            key=f"action_radio_{player_num}"
+            list(ACTIONS),
+            key=f"action_radio_{player_num}",
+            help="Limit, stop-loss and take-profit orders rest until their price is crossed before the next breakpoint"
         )
+        order_action = ACTIONS[action]
+        
+        # Cash and positions include orders already staged at this breakpoint
+        trade_buffer = st.session_state.trade_buffer
+        available_cash, available_positions = trade_buffer.view(player_num, portfolio, instrument)
+        
+        # Resting orders trade at their trigger price instead of the current price
+        order_price = current_price
+        if order_action in ORDER_TYPES:
+            order_price = st.number_input(
+                f"Trigger Price ({CURRENCY_INDICATOR})",
+                min_value=0.01,
+                value=round(current_price * (0.95 if order_action in TRIGGER_BELOW else 1.05), 2),
+                step=0.01,
+                format="%.2f",
+                key=f"trigger_price_{player_num}"
+            )
         
         # Use a single row layout instead of columns
-        max_quantity = int(portfolio['cash'] / current_price) if action == "Buy" else portfolio['positions']
-        remaining_positions = portfolio['positions']
+        max_quantity = max_order_quantity(
+            order_action, available_cash, available_positions, order_price, portfolio['pnl_calculator']
+        )
+        remaining_positions = available_positions
         quantity = st.number_input(
-            f"Qty [Holding : {remaining_positions}]",
+            f"Qty [{'Short' if remaining_positions < 0 else 'Holding'}{f' {ticker}' if ticker else ''} : {abs(remaining_positions)}]",
             min_value=0,
             max_value=max_quantity,
             value=0 if max_quantity == 0 else 1,
@@ -65,11 +117,11 @@ def render_trading_interface(current_price: float, portfolio: Dict, player_num:
         )
         
         # Calculate and display trade impact
-        trade_value = quantity * current_price
+        trade_value = quantity * order_price
         
         # Calculate remaining values after trade
-        remaining_cash = portfolio['cash'] - trade_value if action == "Buy" else portfolio['cash']
-        total_cash = portfolio['cash']
+        remaining_cash = available_cash - trade_value if action == "Buy" else available_cash
+        total_cash = available_cash
         
         # Grey-out display during auto-progress to indicate it is not updating
         is_auto = st.session_state.get('auto_progress', False) and not st.session_state.get('waiting_for_trade', False)
@@ -92,38 +144,62 @@ def render_trading_interface(current_price: float, portfolio: Dict, player_num:
                 f"Cash: {CURRENCY_INDICATOR}{total_cash:.2f}"
             )
         
-        # Execute trade button
+        # Orders are staged and only applied when the simulation resumes
+        staged_orders = trade_buffer.staged_orders(player_num)
         if st.button("Execute Trade", key=f"execute_trade_{player_num}", disabled=not is_breakpoint):
-            if action == "Hold":
-                st.success("Holding position")
-                portfolio['trading_history'].append({
-                    'action': 'hold',
-                    'price': current_price,
-                    'quantity': 0,
-                    'date': st.session_state.current_date
-                })
+            try:
+                trade_buffer.stage(
+                    player_num,
+                    portfolio,
+                    order_action,
+                    0 if action == "Hold" else quantity,
+                    order_price,
+                    st.session_state.current_day_index,
+                    st.session_state.current_date,
+                    st.session_state.get('current_volume'),
+                    instrument
+                )
                 st.session_state.trade_made = True
-            else:
-                try:
-                    portfolio['pnl_calculator'].execute_trade(
-                        action.lower(),
-                        quantity,
-                        current_price
-                    )
-                    # Update portfolio to match PnL calculator
-                    portfolio['cash'] = portfolio['pnl_calculator'].cash
-                    portfolio['positions'] = portfolio['pnl_calculator'].positions
-                    st.success(f"{action} order executed successfully")
-                    portfolio['trading_history'].append({
-                        'action': action.lower(),
-                        'price': current_price,
-                        'quantity': quantity,
-                        'date': st.session_state.current_date
-                    })
-                    st.session_state.trade_made = True
-                except ValueError as e:
-                    st.error(str(e))
-            
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+        
+        if st.button("Undo Last", key=f"undo_trade_{player_num}", disabled=not (is_breakpoint and staged_orders)):
+            trade_buffer.undo(player_num)
+            st.session_state.trade_made = trade_buffer.has_orders()
             st.rerun()
+        if st.button("Amend Last", key=f"amend_trade_{player_num}", disabled=not (is_breakpoint and staged_orders),
+                     help="Replace the last staged order with the action and quantity above"):
+            try:
+                trade_buffer.amend(
+                    player_num,
+                    portfolio,
+                    order_action,
+                    0 if action == "Hold" else quantity,
+                    order_price,
+                    instrument
+                )
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+        
+        # Pending orders for this breakpoint
+        if staged_orders:
+            pending = ", ".join(
+                "Hold" if order.action == 'hold' else describe_order(
+                    order.action, order.quantity, order.price, names[order.instrument] if ticker else None
+                )
+                for order in staged_orders
+            )
+            st.caption(f"Pending: {pending}")
+        
+        # Resting orders waiting for their price until the next breakpoint
+        resting_orders = st.session_state.order_book.live_orders(player_num)
+        if resting_orders:
+            resting = ", ".join(
+                describe_order(order.order_type, order.quantity, order.price, names[order.instrument] if ticker else None)
+                for order in resting_orders
+            )
+            st.caption(f"Resting: {resting}")
         
         st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,6 @@
+import os
+from utils.state_store import STATE_STORE_ENV
+
+# AppTest runs save games through the process-wide state store; keep them in
+# memory instead of writing trading_state.db into the working directory
+os.environ[STATE_STORE_ENV] = 'memory'
@@ -0,0 +1,18 @@
+from pathlib import Path
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = str(Path(__file__).resolve().parents[1] / 'app.py')
+
+def rerun(at: AppTest) -> None:
+    """
+    Run the app again.
+
+    AppTest reads the value of a radio or selectbox back through its formatted
+    labels, which fails for widgets with a format_func; pin each to its label.
+    """
+    for widget in list(at.radio) + list(at.selectbox):
+        try:
+            widget.index
+        except ValueError:
+            widget.set_value(widget.options[widget.proto.default])
+    at.run()
@@ -0,0 +1,51 @@
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+from utils.compact_data import CompactDataset
+from utils.data_handler import extract_breakpoints, load_data
+from tests.helpers import APP_PATH, rerun
+
+def test_order_staged_at_final_breakpoint_is_committed():
+    df = load_data('data/SAMPLE_SWINGS.csv')
+    last_day = len(df) - 1
+    assert extract_breakpoints(df)[-1] == last_day
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    for breakpoint in extract_breakpoints(df):
+        at.session_state['current_day_index'] = breakpoint
+        at.session_state['waiting_for_trade'] = True
+        rerun(at)
+        assert not at.exception
+    assert next(button for button in at.button if button.label == 'Skip').disabled
+
+    portfolio = at.session_state.portfolios[1]
+    price = float(df['Price'].iloc[last_day])
+    at.session_state.trade_buffer.stage(1, portfolio, 'buy', 5, price, last_day, df['Date'].iloc[last_day])
+    rerun(at)
+    assert not at.button(key='commit_trades').disabled
+
+    at.button(key='commit_trades').click()
+    rerun(at)
+    assert not at.exception
+    assert not at.session_state.trade_buffer.has_orders()
+    assert portfolio['positions'] == 5
+    assert portfolio['cash'] < at.session_state.starting_cash
+
+def test_compact_upload_plays_without_expanding():
+    # The default ticker's data, moved ten years on so the upload is told apart
+    df = load_data('data/SAMPLE_SWINGS.csv')
+    df['Date'] += pd.Timedelta(days=3650)
+    data = CompactDataset.from_frame(df, 'float32')
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    at.session_state['data_source'] = 'uploaded'
+    at.session_state['uploaded_data'] = data
+    for chart_mode in ('line', 'candlestick'):
+        at.session_state['chart_mode'] = chart_mode
+        for day in (0, extract_breakpoints(df)[1], len(df) - 1):
+            at.session_state['current_day_index'] = day
+            rerun(at)
+            assert not at.exception
+    assert at.session_state.uploaded_data is data
+    assert at.session_state.current_date == df['Date'].iloc[len(df) - 1]
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from utils.breakpoint_detector import BREAKPOINT_METHODS, detect_breakpoints
+from utils.data_handler import load_data
+
+@pytest.mark.parametrize('method', BREAKPOINT_METHODS)
+@pytest.mark.parametrize('bad_price', [0.0, -5.0, np.nan])
+def test_detect_breakpoints_rejects_non_positive_prices(method, bad_price):
+    prices = np.linspace(100.0, 150.0, 60)
+    prices[30] = bad_price
+    with pytest.raises(ValueError, match="positive"):
+        detect_breakpoints(prices, method)
+
+def test_load_data_reports_non_positive_prices(tmp_path):
+    path = tmp_path / 'prices.csv'
+    path.write_text("Date,Price\n2024-01-01,100\n2024-01-02,0\n2024-01-03,110\n2024-01-04,90\n2024-01-05,120\n")
+    with pytest.raises(ValueError, match="positive"):
+        load_data(str(path))
+
+def test_detect_breakpoints_marks_swings():
+    prices = np.array([100.0, 120.0, 140.0, 120.0, 100.0, 120.0, 140.0])
+    flags = detect_breakpoints(prices, 'zigzag', threshold=0.1, min_spacing=1)
+    assert flags.dtype == bool
+    assert np.flatnonzero(flags).tolist() == [0, 2, 4]
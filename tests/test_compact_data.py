@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+from utils.compact_data import CompactDataset
+
+def _frame():
+    rng = np.random.default_rng(2)
+    num_rows = 10_000
+    return pd.DataFrame({
+        'Date': pd.date_range('2024-01-01', periods=num_rows, freq='min'),
+        'Price': np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.001, num_rows))), 2),
+        'Volume': rng.integers(0, 1000, num_rows),
+        'Breakpoint': np.arange(num_rows) % 100 == 0
+    })
+
+def test_memory_report_saves_with_one_session():
+    df = _frame()
+    data = CompactDataset.from_frame(df, 'ticks')
+    single = data.memory_report()
+    assert single.full_bytes == df.memory_usage(index=True, deep=True).sum()
+    assert single.saved_bytes == single.full_bytes - single.compact_bytes > 0
+    assert data.memory_report(3).saved_bytes == 3 * single.saved_bytes
+
+def test_row_reads_match_the_dataframe():
+    df = _frame()
+    data = CompactDataset.from_frame(df, 'ticks')
+    rows = [0, 100, 4321, len(df) - 1]
+    for day in rows + [-1]:
+        assert data.iloc[day].equals(df.iloc[day])
+    pd.testing.assert_frame_equal(data.iloc[95:105], df.iloc[95:105])
+    pd.testing.assert_series_equal(data.loc[rows, 'Date'], df.loc[rows, 'Date'])
+    pd.testing.assert_series_equal(data['Volume'], df['Volume'])
+    assert data.breakpoints() == np.flatnonzero(df['Breakpoint']).tolist()
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from utils.cost_models import COST_PRESETS, NO_COSTS, CostModel, apply_cost_model, replay_trade_costs
+from utils.pnl_calculator import PnLCalculator
+from utils.portfolio_manager import initialize_portfolios
+from utils.trade_journal import TradeJournal
+
+RETAIL = COST_PRESETS['retail']
+
+def _trade_log(seed, num_trades=200):
+    """Random buys and sells (never more than held) with and without volumes"""
+    rng = np.random.default_rng(seed)
+    trades, held = [], 0
+    for _ in range(num_trades):
+        action = 'buy' if held == 0 or rng.random() < 0.6 else 'sell'
+        quantity = int(rng.integers(1, 20)) if action == 'buy' else int(rng.integers(1, held + 1))
+        held += quantity if action == 'buy' else -quantity
+        volume = None if rng.random() < 0.3 else float(rng.integers(100, 10_000))
+        trades.append((action, quantity, float(rng.uniform(50, 150)), volume))
+    return trades
+
+def _play(trades, cost_model, initial_cash=1e6, margin_requirement=None):
+    calc = PnLCalculator(initial_cash, margin_requirement, cost_model)
+    for action, quantity, price, volume in trades:
+        calc.execute_trade(action, quantity, price, volume)
+    return calc
+
+@pytest.mark.parametrize('cost_model', list(COST_PRESETS.values()))
+def test_replay_matches_trade_by_trade_execution(cost_model):
+    trades = [_trade_log(seed) for seed in range(3)]
+    calcs = [_play(log, cost_model) for log in trades]
+    logs = [calc.trade_columns() for calc in calcs]
+    cash_flows, fees = replay_trade_costs(
+        np.repeat(np.arange(len(logs)), [log.shape[1] for log in logs]),
+        *np.concatenate(logs, axis=1), cost_model, len(logs)
+    )
+    for calc, log, cash_flow, fee in zip(calcs, trades, cash_flows, fees):
+        assert calc.initial_cash + cash_flow == pytest.approx(calc.cash, abs=1e-6)
+        expected_fees = sum(calc.trade_terms(action, quantity, price, volume)[1] for action, quantity, price, volume in log)
+        assert fee == pytest.approx(expected_fees, abs=1e-6)
+
+def test_apply_matches_playing_under_the_new_model():
+    trades = {1: _trade_log(1), 2: _trade_log(2)}
+    portfolios = initialize_portfolios(2, 1e6, cost_model=NO_COSTS)
+    for player_num, log in trades.items():
+        portfolios[player_num]['pnl_calculator'] = _play(log, NO_COSTS)
+    journal = TradeJournal(snapshot_interval=1)
+    journal.record_trade(0, 1, 'hold', 0, 100.0, portfolios)
+    assert len(journal.snapshots) == 2
+
+    assert apply_cost_model(portfolios, RETAIL, journal) == sum(len(log) for log in trades.values())
+    for player_num, log in trades.items():
+        expected = _play(log, RETAIL)
+        calc = portfolios[player_num]['pnl_calculator']
+        assert calc.cost_model == RETAIL
+        assert calc.cash == pytest.approx(expected.cash, abs=1e-6)
+        assert portfolios[player_num]['cash'] == calc.cash
+        assert calc.holdings.tolist() == expected.holdings.tolist()
+    # Snapshots priced under the old model are gone
+    assert len(journal.snapshots) == 1
+
+def test_rejects_a_long_only_player_who_could_not_have_afforded_a_buy():
+    portfolios = initialize_portfolios(2, 1000.0)
+    # Player 1 spends all their cash, sells and buys it all back: the final
+    # cash is fine under fees, but the first buy was never affordable
+    for action in ('buy', 'sell', 'buy'):
+        portfolios[1]['pnl_calculator'].execute_trade(action, 10, 100.0)
+    portfolios[2]['pnl_calculator'].execute_trade('buy', 1, 100.0)
+    costly = CostModel(fixed_fee=5.0)
+
+    with pytest.raises(ValueError, match=r"Player\(s\) 1 could not"):
+        apply_cost_model(portfolios, costly)
+    # Nothing changed for anyone
+    for portfolio in portfolios.values():
+        assert portfolio['pnl_calculator'].cost_model == NO_COSTS
+    assert portfolios[1]['pnl_calculator'].cash == 0.0
+    assert portfolios[2]['pnl_calculator'].cash == 900.0
+
+def test_margin_players_are_left_to_margin_calls():
+    portfolios = initialize_portfolios(1, 1000.0, margin_requirement=0.5)
+    portfolios[1]['pnl_calculator'].execute_trade('buy', 10, 100.0)
+    apply_cost_model(portfolios, CostModel(fixed_fee=5.0))
+    assert portfolios[1]['cash'] == -5.0
+
+def test_spending_exactly_the_cash_is_allowed():
+    portfolios = initialize_portfolios(1, 1000.0)
+    portfolios[1]['pnl_calculator'].execute_trade('buy', 3, 100.0 / 3)
+    portfolios[1]['pnl_calculator'].execute_trade('buy', 9, 100.0)
+    apply_cost_model(portfolios, NO_COSTS)
+    assert portfolios[1]['cash'] == pytest.approx(0.0, abs=1e-9)
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.decision_analytics import decision_analytics, trade_log_arrays
+from utils.portfolio_manager import initialize_portfolios
+
+# Two segments: 100 -> 80 (breakpoint 0 to 2), then 80 -> 120 (breakpoint 2 to 4)
+PRICES = np.array([[100.0], [90.0], [80.0], [100.0], [120.0]])
+DATES = pd.Series(pd.date_range('2024-01-01', periods=len(PRICES)))
+
+def _analytics(trades, margin_requirement):
+    portfolios = initialize_portfolios(1, 1000.0, margin_requirement)
+    portfolios[1]['trading_history'] = [
+        {'action': action, 'price': PRICES[day, 0], 'quantity': quantity, 'date': DATES[day], 'instrument': 0}
+        for day, action, quantity in trades
+    ]
+    return decision_analytics(PRICES, [0, 2], 4, trade_log_arrays(portfolios, DATES), 1, 1000.0, margin_requirement)
+
+def test_well_timed_short_has_no_negative_regret():
+    # Short 20 shares (2x the 1000 of wealth at a 0.5 margin) before the fall, cover and buy before the rise
+    analytics = _analytics([(0, 'sell', 20), (2, 'cover', 20), (2, 'buy', 17)], 0.5)
+    assert analytics.actual_pnl[0].tolist() == pytest.approx([400.0, 680.0])
+    assert analytics.best_pnl[0].tolist() == pytest.approx([400.0, 700.0])
+    assert analytics.regret[0].tolist() == pytest.approx([0.0, 20.0])
+
+def test_long_only_best_ignores_falls():
+    analytics = _analytics([], None)
+    assert analytics.best_pnl[0].tolist() == pytest.approx([0.0, 500.0])
+    assert analytics.regret[0].tolist() == pytest.approx([0.0, 500.0])
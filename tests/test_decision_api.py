@@ -0,0 +1,95 @@
+import asyncio
+import json
+import socket
+import pandas as pd
+from tornado.httpclient import AsyncHTTPClient
+from utils.decision_api import DecisionAPI, create_headless_room
+from utils.game_room import RoomRegistry
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _serve(check):
+    """Run check(room, post, get) against an API serving one room parked at its first breakpoint"""
+    df = pd.DataFrame({
+        'Date': pd.date_range('2024-01-01', periods=10),
+        'Price': [100.0 + i for i in range(10)],
+        'Breakpoint': [True] + [False] * 8 + [True]
+    })
+    registry = RoomRegistry()
+    room = registry.get_or_create('r', lambda: create_headless_room('r', df, decision_timeout_sec=None))
+
+    async def run():
+        port = _free_port()
+        server = DecisionAPI(registry).make_app().listen(port, address='127.0.0.1')
+        client = AsyncHTTPClient()
+        base_url = f"http://127.0.0.1:{port}/rooms/r"
+
+        async def post(path, body):
+            response = await client.fetch(base_url + path, method='POST', body=json.dumps(body), raise_error=False)
+            return response.code, json.loads(response.body) if response.code == 200 else None
+
+        async def get(path):
+            response = await client.fetch(base_url + path, raise_error=False)
+            return response.code, json.loads(response.body) if response.code == 200 else None
+
+        try:
+            await check(room, post, get)
+        finally:
+            server.stop()
+
+    try:
+        asyncio.run(run())
+    finally:
+        registry.close('r')
+
+def test_decisions_only_trade_the_session_seat():
+    async def check(room, post, get):
+        human = room.join('browser-session', 'Alice')
+        code, joined = await post('/join', {'name': 'bot'})
+        assert code == 200
+        bot = joined['player_num']
+
+        code, body = await post('/decisions', {'session_id': joined['session_id'], 'decisions': [
+            {'player': human, 'action': 'buy', 'quantity': 1},
+            {'action': 'buy', 'quantity': 2},
+            {'player': bot, 'action': 'buy', 'quantity': 1},
+            'not a decision'
+        ]})
+        assert code == 200
+        assert body['results'] == ["Decisions are only accepted for your own seat", None, None, "Invalid decision"]
+        assert not room.trade_buffer.staged_orders(human)
+        assert [order.quantity for order in room.trade_buffer.staged_orders(bot)] == [2, 1]
+
+    _serve(check)
+
+def test_decisions_need_a_joined_session():
+    async def check(room, post, get):
+        human = room.join('browser-session', 'Alice')
+        assert (await post('/decisions', {'decisions': [{'player': human, 'action': 'buy', 'quantity': 1}]}))[0] == 403
+        assert (await post('/decisions', {'session_id': 'guess', 'decisions': []}))[0] == 403
+        # A browser session cannot be claimed through /join
+        code, joined = await post('/join', {'name': 'bot', 'session_id': 'browser-session'})
+        assert joined['session_id'] != 'browser-session'
+        assert joined['player_num'] != human
+        # An issued session gets its own seat back
+        assert (await post('/join', {'session_id': joined['session_id']}))[1]['player_num'] == joined['player_num']
+        assert not room.trade_buffer.has_orders()
+
+    _serve(check)
+
+def test_state_only_shows_the_session_seat():
+    async def check(room, post, get):
+        human = room.join('browser-session', 'Alice')
+        room.order_book.add(human, 'stop_loss', 1, 90.0, 0)
+        assert (await get('/state'))[0] == 403
+        assert (await get(f'/state?player={human}'))[0] == 403
+        _, joined = await post('/join', {'name': 'bot'})
+        code, state = await get(f"/state?session_id={joined['session_id']}&player={human}")
+        assert code == 200 and state['waiting_for_trade']
+        assert state['player']['player_num'] == joined['player_num']
+        assert state['player']['resting_orders'] == []
+
+    _serve(check)
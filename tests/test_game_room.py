@@ -0,0 +1,47 @@
+import time
+from utils.data_handler import extract_breakpoints, load_data
+from utils.game_room import GameRoom, RoomRegistry
+
+def test_order_staged_at_final_breakpoint_is_committed():
+    df = load_data('data/SAMPLE_SWINGS.csv')
+    last_day = len(df) - 1
+    assert extract_breakpoints(df)[-1] == last_day
+
+    room = GameRoom('final', df, 10000.0, 60.0, lambda day_index: {})
+    try:
+        player_num = room.join('session', 'Bot')
+        while room.current_day_index < last_day:
+            room.skip()
+        assert room.waiting_for_trade
+
+        assert room.stage_batch([(player_num, 'buy', 5)]) == [None]
+        portfolio = room.portfolios[player_num]
+        assert not room.trade_buffer.has_orders()
+        assert portfolio['positions'] == 5
+        assert portfolio['cash'] < 10000.0
+    finally:
+        room.close()
+
+def test_idle_members_expire_and_the_empty_room_closes():
+    df = load_data('data/SAMPLE_SWINGS.csv')
+    registry = RoomRegistry()
+    room = registry.get_or_create('idle', lambda: GameRoom('idle', df, 10000.0, 60.0, lambda day_index: {}, member_timeout_sec=0.2))
+    try:
+        room.join('active', 'Alice')
+        room.join('gone', 'Bob')
+        deadline = time.monotonic() + 5
+        while 'gone' in room.members and time.monotonic() < deadline:
+            room.touch('active')
+            time.sleep(0.02)
+        # Only the session that kept sending heartbeats is left
+        assert list(room.members) == ['active']
+        assert not room.closed
+
+        room._thread.join(timeout=5)
+        assert room.closed
+        assert registry.get('idle') is None
+        # The name can be reused for a fresh room
+        assert registry.get_or_create('idle', lambda: GameRoom('idle', df, 10000.0, 60.0, lambda day_index: {})) is not room
+    finally:
+        for room_id in registry.room_ids():
+            registry.close(room_id)
@@ -0,0 +1,109 @@
+import math
+import numpy as np
+import pytest
+from utils.indicators import bollinger_bands, compute_indicator, ema, linear_recursion, rsi, sma
+
+PERIODS = [1, 2, 14, 50]
+
+def _prices(length=3000, level=100.0, seed=0):
+    rng = np.random.default_rng(seed)
+    prices = level * np.exp(np.cumsum(rng.normal(0, 0.01, length)))
+    # Flat stretches give windows without any gains or losses
+    if length > 240:
+        prices[200:240] = prices[199]
+    return prices
+
+def _sma(prices, period):
+    return [math.nan if t < period - 1 else sum(prices[t - period + 1:t + 1]) / period for t in range(len(prices))]
+
+def _ema(prices, period):
+    alpha = 2 / (period + 1)
+    smoothed, out = prices[0] if prices else 0.0, []
+    for t, price in enumerate(prices):
+        if t:
+            smoothed = alpha * price + (1 - alpha) * smoothed
+        out.append(smoothed if t >= period - 1 else math.nan)
+    return out
+
+def _bollinger(prices, period, width=2.0):
+    upper, lower = [], []
+    for t, mean in enumerate(_sma(prices, period)):
+        if t < period - 1:
+            upper.append(math.nan)
+            lower.append(math.nan)
+            continue
+        std = math.sqrt(sum((p - mean) ** 2 for p in prices[t - period + 1:t + 1]) / period)
+        upper.append(mean + width * std)
+        lower.append(mean - width * std)
+    return upper, lower
+
+def _rsi(prices, period):
+    out = [math.nan] * len(prices)
+    if len(prices) <= period:
+        return out
+    changes = [b - a for a, b in zip(prices, prices[1:])]
+    avg_gain = sum(max(c, 0.0) for c in changes[:period]) / period
+    avg_loss = sum(max(-c, 0.0) for c in changes[:period]) / period
+    for t in range(period, len(prices)):
+        if t > period:
+            change = changes[t - 1]
+            avg_gain = (avg_gain * (period - 1) + max(change, 0.0)) / period
+            avg_loss = (avg_loss * (period - 1) + max(-change, 0.0)) / period
+        total = avg_gain + avg_loss
+        out[t] = 100 * avg_gain / total if total > 0 else 50.0
+    return out
+
+def _close(actual, expected, scale=1.0):
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9 * scale)
+
+@pytest.mark.parametrize('level', [1.0, 1e6])
+@pytest.mark.parametrize('period', PERIODS)
+def test_moving_averages_match_loops(period, level):
+    prices = _prices(level=level)
+    series = prices.tolist()
+    _close(sma(prices, period), _sma(series, period), level)
+    _close(ema(prices, period), _ema(series, period), level)
+    upper, lower = _bollinger(series, period)
+    bands = bollinger_bands(prices, period)
+    # Variance from running sums cancels to rounding noise, whose square root
+    # is about 1e-7 of the price level
+    np.testing.assert_allclose(bands['upper'], upper, rtol=1e-9, atol=1e-6 * level)
+    np.testing.assert_allclose(bands['lower'], lower, rtol=1e-9, atol=1e-6 * level)
+
+@pytest.mark.parametrize('period', PERIODS)
+def test_rsi_matches_wilder_loop(period):
+    prices = _prices()
+    _close(rsi(prices, period), _rsi(prices.tolist(), period))
+
+@pytest.mark.parametrize('length', [0, 1, 5])
+def test_short_series(length):
+    prices = _prices()[:length]
+    for period in (1, 5, 14):
+        _close(sma(prices, period), _sma(prices.tolist(), period))
+        _close(ema(prices, period), _ema(prices.tolist(), period))
+        _close(rsi(prices, period), _rsi(prices.tolist(), period))
+
+def test_indicators_are_causal():
+    prices = _prices(500)
+    for name in ('sma', 'ema', 'bollinger', 'rsi'):
+        full = compute_indicator(name, prices, 20)
+        prefix = compute_indicator(name, prices[:300], 20)
+        for label, values in prefix.items():
+            _close(values, full[label][:300], 100)
+
+@pytest.mark.parametrize('a', [0.0, 0.5, 0.9, 0.999, 1.0])
+def test_linear_recursion_matches_a_loop(a):
+    shocks = np.random.default_rng(1).normal(size=(2, 5000))
+    expected = np.empty_like(shocks)
+    for row in range(2):
+        y = 3.0
+        for t in range(shocks.shape[1]):
+            y = a * y + shocks[row, t]
+            expected[row, t] = y
+    _close(linear_recursion(shocks, a, 3.0), expected, np.abs(expected).max())
+
+def test_unknown_indicator_and_period_are_rejected():
+    with pytest.raises(ValueError, match="Unknown indicator"):
+        compute_indicator('macd', _prices(10), 5)
+    with pytest.raises(ValueError, match="at least 1 row"):
+        sma(_prices(10), 0)
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+from utils.instruments import InstrumentSet
+from utils.margin import liquidate_margin_calls
+from utils.portfolio_manager import initialize_portfolios
+
+def _bars(opens):
+    """Five days rising from 100 to 150, with the given opens"""
+    closes = [100.0, 110.0, 125.0, 140.0, 150.0]
+    return pd.DataFrame({
+        'Date': pd.date_range('2024-01-01', periods=5),
+        'Price': closes,
+        'Open': opens,
+        'High': [close + 1 for close in closes],
+        'Low': [min(open_, close) - 1 for open_, close in zip(opens, closes)]
+    })
+
+def _short_portfolios():
+    """Player 1 shorts 10 shares at 100 from 1000 cash; player 2 stays in cash"""
+    portfolios = initialize_portfolios(2, 1000.0, 0.5)
+    calc = portfolios[1]['pnl_calculator']
+    calc.execute_trade('sell', 10, 100.0)
+    portfolios[1]['cash'], portfolios[1]['positions'] = calc.cash, calc.positions
+    return portfolios
+
+def test_margin_call_covers_at_the_call_level():
+    portfolios = _short_portfolios()
+    df = _bars([100.0, 108.0, 120.0, 130.0, 145.0])
+    calls = liquidate_margin_calls(portfolios, df, InstrumentSet(df), 1, 4)
+
+    # Equity 2000 - 10 P falls below 0.5 * 10 P once P reaches 2000 / 15
+    level = 2000.0 / 15
+    assert [(call.player_num, call.day, call.quantity) for call in calls] == [(1, 3, 10)]
+    assert calls[0].price == pytest.approx(level)
+    assert portfolios[1]['positions'] == 0
+    assert portfolios[1]['cash'] == pytest.approx(2000.0 - 10 * level)
+    assert portfolios[1]['trading_history'][-1]['date'] == df['Date'].iloc[3]
+    assert portfolios[2]['trading_history'] == []
+
+def test_margin_call_gapping_through_the_level_covers_at_the_open():
+    portfolios = _short_portfolios()
+    df = _bars([100.0, 108.0, 120.0, 138.0, 145.0])
+    calls = liquidate_margin_calls(portfolios, df, InstrumentSet(df), 1, 4)
+    assert [(call.day, call.price) for call in calls] == [(3, 138.0)]
+
+def test_margin_call_outside_the_window_is_not_applied():
+    portfolios = _short_portfolios()
+    df = _bars([100.0, 108.0, 120.0, 130.0, 145.0])
+    assert liquidate_margin_calls(portfolios, df, InstrumentSet(df), 1, 2) == []
+    assert portfolios[1]['positions'] == -10
+
+def test_multi_instrument_margin_call_covers_at_the_close():
+    df = pd.DataFrame({
+        'Date': pd.date_range('2024-01-01', periods=4),
+        'Price': [100.0, 120.0, 140.0, 160.0],
+        'Price_AAA': [100.0, 120.0, 140.0, 160.0],
+        'Price_BBB': [50.0, 50.0, 50.0, 50.0]
+    })
+    portfolios = initialize_portfolios(1, 1000.0, 0.5)
+    calc = portfolios[1]['pnl_calculator']
+    calc.execute_trade('buy', 2, 50.0, instrument=1)
+    calc.execute_trade('sell', 10, 100.0, instrument=0)
+
+    calls = liquidate_margin_calls(portfolios, df, InstrumentSet(df), 1, 3)
+    # Equity 1900 + 100 - 10 P is below 0.5 * 10 P from P = 2000 / 15 on, first closed at day 2
+    assert [(call.day, call.quantity, call.price, call.instrument) for call in calls] == [(2, 10, 140.0, 0)]
+    assert calc.holding(0) == 0
+    assert calc.holding(1) == 2
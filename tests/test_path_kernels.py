@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from utils import path_kernels
+from utils.path_kernels import fill_orders, margin_call_days, max_drawdowns, running_drawdowns
+from utils.pnl_calculator import PnLCalculator
+
+needs_numba = pytest.mark.skipif(path_kernels.numba is None, reason="numba is not installed")
+
+def _value_paths(rng, num_paths, num_days):
+    return 1000 * np.exp(np.cumsum(rng.normal(0, 0.02, (num_paths, num_days)), axis=1))
+
+def _margin_case(rng):
+    """Day x instrument closes and players short, long or flat in three instruments"""
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, (500, 3)), axis=0))
+    holdings = rng.integers(-20, 20, (40, 3)).astype(np.float64)
+    holdings[:5] = np.abs(holdings[:5])
+    cash = rng.uniform(1000, 8000, 40)
+    margins = rng.uniform(0.2, 0.8, 40)
+    return prices, cash, holdings, margins
+
+def _fill_case(rng):
+    """Fills of four players in two instruments, many of them too large to go through"""
+    count = 300
+    buys = rng.random(count) < 0.5
+    return dict(
+        rows=rng.integers(0, 4, count),
+        instruments=rng.integers(0, 2, count),
+        buys=buys,
+        quantities=rng.integers(1, 30, count),
+        prices=rng.uniform(50, 150, count),
+        fees=rng.uniform(0, 2, count),
+        cash=np.full(4, 3000.0),
+        holdings=rng.integers(0, 20, (4, 2)),
+        margins=np.array([np.nan, 0.5, np.nan, 0.25]),
+        exits=~buys & (rng.random(count) < 0.3)
+    )
+
+def test_fill_orders_follow_apply_trade():
+    case = _fill_case(np.random.default_rng(1))
+    accepted = fill_orders(**case, backend='numpy')
+    cash = case['cash'].tolist()
+    holdings = case['holdings'].tolist()
+    for k, row in enumerate(case['rows']):
+        instrument = case['instruments'][k]
+        margin = None if np.isnan(case['margins'][row]) else case['margins'][row]
+        if case['exits'][k] and case['quantities'][k] > holdings[row][instrument]:
+            # Exits never sell more than the long they close
+            assert not accepted[k]
+            continue
+        try:
+            cash[row], holdings[row][instrument] = PnLCalculator.apply_trade(
+                cash[row], holdings[row][instrument], 'buy' if case['buys'][k] else 'sell',
+                int(case['quantities'][k]), float(case['prices'][k]), margin, float(case['fees'][k])
+            )
+            assert accepted[k]
+        except ValueError:
+            assert not accepted[k]
+    assert 0 < accepted.sum() < len(accepted)
+
+def test_margin_call_days_match_a_day_by_day_check():
+    prices, cash, holdings, margins = _margin_case(np.random.default_rng(2))
+    days = margin_call_days(prices, cash, holdings, margins, 10, 480, backend='numpy')
+    for row in range(len(cash)):
+        equity = cash[row] + prices[10:481] @ holdings[row]
+        short_value = prices[10:481] @ np.maximum(-holdings[row], 0)
+        called = np.flatnonzero(equity < margins[row] * short_value)
+        short = (holdings[row] < 0).any()
+        assert days[row] == (10 + called[0] if short and len(called) else -1)
+    assert (days >= 0).any() and (days == -1).any()
+
+def test_running_drawdowns_start_from_the_peak():
+    drawdowns = running_drawdowns([90.0, 120.0, 60.0], 100.0, backend='numpy')
+    assert drawdowns.tolist() == pytest.approx([10.0, 0.0, 50.0])
+
+@needs_numba
+def test_backends_are_identical():
+    rng = np.random.default_rng(3)
+    values = _value_paths(rng, 20, 300)
+    assert np.array_equal(max_drawdowns(values, backend='numba'), max_drawdowns(values, backend='numpy'))
+    for row in values:
+        assert np.array_equal(running_drawdowns(row, 1050.0, backend='numba'), running_drawdowns(row, 1050.0, backend='numpy'))
+
+    prices, cash, holdings, margins = _margin_case(rng)
+    for start, end in [(0, 499), (10, 480), (300, 200)]:
+        assert np.array_equal(
+            margin_call_days(prices, cash, holdings, margins, start, end, backend='numba'),
+            margin_call_days(prices, cash, holdings, margins, start, end, backend='numpy')
+        )
+
+    case = _fill_case(rng)
+    assert np.array_equal(fill_orders(**case, backend='numba'), fill_orders(**case, backend='numpy'))
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="Unknown kernel backend"):
+        running_drawdowns([1.0], 1.0, backend='gpu')
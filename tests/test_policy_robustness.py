@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.policy_robustness import policy_robustness
+from utils.portfolio_manager import initialize_portfolios
+from utils.scenario_generator import MODELS, simulate_log_returns
+
+def _game(num_days=200, seed=4):
+    rng = np.random.default_rng(seed)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, num_days)))
+    dates = pd.date_range('2024-01-01', periods=num_days)
+    df = pd.DataFrame({'Date': dates, 'Price': prices})
+    portfolio = initialize_portfolios(1, 10000.0)[1]
+    portfolio['trading_history'] = [
+        {'action': action, 'price': prices[day], 'quantity': 20, 'date': dates[day], 'instrument': 0}
+        for day, action in [(20, 'buy'), (40, 'sell'), (60, 'buy')]
+    ]
+    return df, [20, 40, 60, 80, 120, 160], portfolio
+
+def test_results_do_not_depend_on_unrevealed_days():
+    df, breakpoints, portfolio = _game()
+    altered = df.copy()
+    altered.loc[101:, 'Price'] *= 3
+    for method in ('bootstrap', 'synthetic'):
+        result = policy_robustness(df, breakpoints, portfolio, 100, 10000.0, 50, method)
+        other = policy_robustness(altered, breakpoints, portfolio, 100, 10000.0, 50, method)
+        assert other.historical_return == result.historical_return
+        assert other.historical_drawdown == result.historical_drawdown
+        assert np.array_equal(other.final_returns, result.final_returns)
+
+@pytest.mark.parametrize('model', MODELS)
+def test_batched_paths_match_the_model(model):
+    batch = simulate_log_returns(model, 500, np.random.default_rng(1), num_paths=400)
+    single = np.concatenate([simulate_log_returns(model, 500, np.random.default_rng(seed)) for seed in range(40)])
+    assert batch.shape == (400, 500)
+    assert np.isfinite(batch).all()
+    # Same distribution of returns, not the same draws
+    assert batch.std() == pytest.approx(single.std(), rel=0.15)
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+from components.price_chart import MAX_LINE_POINTS, build_progressive_figure
+from utils.chart_payload import to_epoch_ms
+from utils.indicators import compute_indicator
+from utils.price_pyramid import PricePyramid
+
+def _series(num_rows):
+    rng = np.random.default_rng(5)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, num_rows)))
+    return pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=num_rows, freq='min'), 'Price': prices})
+
+def _line(df, day_index, indicators=None):
+    fig = build_progressive_figure(df, day_index, [], hoverlabel={}, pyramid=PricePyramid(df['Price']),
+                                   indicators=indicators)
+    return {trace.name: trace for trace in fig.data}
+
+def test_line_mode_sends_the_revealed_prefix():
+    df = _series(500)
+    traces = _line(df, 120)
+    price = traces['Price']
+    assert list(price.x) == list(to_epoch_ms(df['Date'].iloc[:121]))
+    np.testing.assert_allclose(price.y, df['Price'].iloc[:121], rtol=1e-6)
+
+def test_long_line_mode_frames_are_downsampled_without_lookahead():
+    df = _series(200_000)
+    day_index = 150_000
+    sma = {'name': 'sma', 'period': 20, 'lines': compute_indicator('sma', df['Price'].to_numpy(), 20)}
+    traces = _line(df, day_index, [sma])
+    price = traces['Price']
+    assert len(price.x) <= MAX_LINE_POINTS
+    # The newest point is today's price and nothing after today is drawn
+    assert price.x[-1] <= to_epoch_ms(df['Date'].iloc[[day_index]])[0]
+    assert price.y[-1] == pytest.approx(df['Price'].iloc[day_index], rel=1e-6)
+    assert np.nanmax(price.y) <= df['Price'].iloc[:day_index + 1].max() * (1 + 1e-6)
+    # Indicators share the price points and end at today's value
+    overlay = traces[next(iter(sma['lines']))]
+    assert len(overlay.x) == len(price.x)
+    assert overlay.y[-1] == pytest.approx(next(iter(sma['lines'].values()))[day_index], rel=1e-6)
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.pnl_calculator import PnLCalculator
+from utils.range_stats import RangeStats
+
+def _values():
+    rng = np.random.default_rng(3)
+    return 1000 * np.exp(np.cumsum(rng.normal(0, 0.02, 300)))
+
+@pytest.mark.parametrize('block', [4, 16, 256])
+def test_extremes_match_a_scan(block):
+    values = _values()
+    stats = RangeStats(values, block=block)
+    for start, end in [(0, 299), (5, 6), (17, 200), (128, 255), (42, 42), (255, 256), (3, 290), (31, 33)]:
+        window = values[start:end + 1]
+        peaks = np.maximum.accumulate(window)
+        high, low, drawdown = stats.extremes(start, end)
+        assert high == pytest.approx(window.max())
+        assert low == pytest.approx(window.min())
+        assert drawdown == pytest.approx((1 - window / peaks).max())
+
+def test_numpy_integer_rows():
+    stats = RangeStats(_values())
+    assert stats.extremes(np.int64(10), np.int64(90)) == stats.extremes(10, 90)
+    assert stats.query(np.int64(10), np.int64(90)) == stats.query(10, 90)
+
+def test_query_dates_uses_one_period_per_row():
+    values = _values()
+    dates = pd.date_range('2024-01-01', periods=len(values) - 1)
+    stats = RangeStats(values, dates)
+    summary = stats.query_dates(dates[9], dates[99], periods_per_year=252)
+    assert (summary.start, summary.end, summary.periods) == (10, 100, 90)
+    assert summary.total_return == pytest.approx((values[100] / values[10] - 1) * 100)
+    assert summary.annualized_return == pytest.approx(((values[100] / values[10]) ** (252 / 90) - 1) * 100)
+
+def test_updates_match_a_fresh_index():
+    values = list(_values())
+    dates = list(pd.date_range('2024-01-01', periods=len(values) - 1))
+    stats = RangeStats(values[:100], dates[:99], block=16)
+    # Append, replace the last row, then drop rows
+    stats.update(values[:250], dates[:249], 100)
+    values[249] *= 0.5
+    stats.update(values[:250], dates[:249], 249)
+    stats.update(values[:180], dates[:179], 180)
+    stats.update(values[:200], dates[:199], 180)
+
+    fresh = RangeStats(values[:200], dates[:199], block=16)
+    assert len(stats) == 200
+    np.testing.assert_array_equal(stats.dates, fresh.dates)
+    for start, end in [(0, 199), (10, 150), (170, 199), (99, 101)]:
+        assert stats.query(start, end) == fresh.query(start, end)
+
+def test_calculator_extends_its_index():
+    calculator = PnLCalculator(1000)
+    dates = pd.date_range('2024-01-01', periods=600)
+    calculator.record_values(dates[:400], _values()[:300].tolist() + [1000.0] * 100, 1.0)
+    stats = calculator.range_stats()
+    calculator.update_portfolio_value(1.0, dates[399], 1200.0)
+    calculator.record_values(dates[400:], np.linspace(900, 1100, 200), 1.0)
+    snapshot = calculator.snapshot()
+    calculator.record_values(dates[599:], [500.0], 1.0)
+    calculator.restore(snapshot)
+
+    assert calculator.range_stats() is stats
+    fresh = RangeStats(calculator.portfolio_values, calculator.daily_metrics['date'])
+    for start, end in [(0, 600), (250, 450), (399, 401)]:
+        assert stats.query(start, end) == fresh.query(start, end)
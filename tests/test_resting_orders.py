@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import path_kernels
+from utils.portfolio_manager import initialize_portfolios
+from utils.resting_orders import PriceCrossingIndex, RestingOrderBook, _BlockMinTable
+
+def _first_at_or_below(values, start, end, level):
+    """Reference answer by a plain scan"""
+    for row in range(start, end + 1):
+        if values[row] <= level:
+            return row
+    return -1
+
+@pytest.mark.parametrize('block', [1, 4, 32])
+def test_block_min_table_matches_scan(block):
+    rng = np.random.default_rng(7)
+    values = rng.normal(size=203).cumsum()
+    table = _BlockMinTable(values, block)
+    # Windows starting and ending on, just before and just after block boundaries
+    edges = sorted({max(0, min(len(values) - 1, b * block + d)) for b in range(len(values) // block + 1) for d in (-1, 0, 1)})
+    starts, ends = np.array([(s, e) for s in edges[::3] for e in edges[::2]]).T
+    levels = rng.uniform(values.min() - 1, values.max() + 1, size=len(starts))
+    expected = [_first_at_or_below(values, s, e, level) for s, e, level in zip(starts, ends, levels)]
+    assert table.first_at_or_below(starts, ends, levels).tolist() == expected
+
+def test_block_min_table_empty_windows():
+    table = _BlockMinTable(np.array([5.0, 1.0, 3.0, 0.0, 2.0]), 2)
+    starts, ends, levels = np.array([3, 4, 2]), np.array([2, 1, 2]), np.array([10.0, 10.0, 1.0])
+    # Empty windows (start > end) never cross; a one-row window only sees its row
+    assert table.first_at_or_below(starts, ends, levels).tolist() == [-1, -1, -1]
+    assert table.first_at_or_below(np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])).tolist() == []
+
+def test_crossing_index_fills_gaps_at_the_open():
+    index = PriceCrossingIndex(
+        [100.0, 98.0, 90.0, 112.0],
+        open_prices=[100.0, 99.0, 92.0, 111.0],
+        high_prices=[101.0, 99.5, 93.0, 113.0],
+        low_prices=[99.0, 97.0, 89.0, 110.0]
+    )
+    days = index.first_crossing([1, 1, 1], [3, 3, 3], [95.0, 120.0, 110.0], [True, False, False])
+    assert days.tolist() == [2, -1, 3]
+    # Day 2 opens below 95 and day 3 opens above 110: both fill at the open
+    assert index.fill_prices([2, 3], [95.0, 110.0], [True, False]).tolist() == [92.0, 111.0]
+
+def test_fill_due_cancels_orders_an_earlier_fill_paid_for():
+    df = pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=4), 'Price': [100.0, 95.0, 90.0, 85.0]})
+    portfolios = initialize_portfolios(1, 1000.0)
+    book = RestingOrderBook()
+    book.add(1, 'limit_buy', 10, 96.0, 0)
+    book.add(1, 'limit_buy', 10, 91.0, 0)
+    book.schedule(PriceCrossingIndex.from_frame(df), 3)
+    assert [order.fill_day for order in book.orders] == [1, 2]
+
+    filled = book.fill_due(portfolios, df, 3)
+    # The first fill spends 950 of the 1000, so the second cannot be paid for
+    assert [(order.fill_day, order.fill_price) for order in filled] == [(1, 95.0)]
+    assert portfolios[1]['cash'] == pytest.approx(50.0)
+    assert portfolios[1]['positions'] == 10
+    assert len(portfolios[1]['trading_history']) == 1
+    assert book.live_orders() == []
+
+@pytest.mark.parametrize('backend', [backend for backend in path_kernels.KERNEL_BACKENDS
+                                     if backend != 'numba' or path_kernels.numba is not None])
+def test_exit_orders_never_open_a_short(monkeypatch, backend):
+    monkeypatch.setattr(path_kernels, 'DEFAULT_BACKEND', backend)
+    df = pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=4), 'Price': [100.0, 110.0, 100.0, 90.0]})
+    portfolios = initialize_portfolios(1, 10000.0, margin_requirement=0.5)
+    calculator = portfolios[1]['pnl_calculator']
+    calculator.execute_trade('buy', 10, 100.0)
+    portfolios[1]['positions'] = calculator.positions
+    book = RestingOrderBook()
+    book.add(1, 'take_profit', 10, 110.0, 0)
+    book.add(1, 'stop_loss', 10, 90.0, 0)
+    book.schedule(PriceCrossingIndex.from_frame(df), 3)
+    assert [order.fill_day for order in book.orders] == [1, 3]
+
+    filled = book.fill_due(portfolios, df, 3)
+    # The take-profit closed the long, so the stop-loss has nothing left to exit
+    assert [order.order_type for order in filled] == ['take_profit']
+    assert portfolios[1]['positions'] == 0
+    assert calculator.holdings[0] == 0
@@ -0,0 +1,107 @@
+import math
+import numpy as np
+import pytest
+from utils.risk_metrics import RiskTracker, empty_metrics
+
+WINDOW = 5
+CONFIDENCE = 0.9
+
+def _brute_force(values, periods_per_year=252, window=WINDOW, confidence=CONFIDENCE):
+    """Every metric recomputed from the whole series with plain loops"""
+    if len(values) < 2:
+        return empty_metrics()
+    returns = [value / previous - 1 if previous != 0 else 0.0 for previous, value in zip(values, values[1:])]
+    count = len(returns)
+    scale = math.sqrt(periods_per_year)
+
+    mean = sum(returns) / count
+    std = math.sqrt(sum((r - mean) ** 2 for r in returns) / (count - 1)) if count > 1 else 0.0
+    sharpe = mean / std if std > 0 else 0
+    downside = math.sqrt(sum(min(r, 0.0) ** 2 for r in returns) / count)
+
+    max_drawdown = 0.0
+    for t in range(len(values)):
+        peak = max(values[:t + 1])
+        if peak > 0:
+            max_drawdown = max(max_drawdown, (peak - values[t]) / peak * 100)
+    growth = values[-1] / values[0]
+    annualized_return = math.expm1(min(math.log(growth) * periods_per_year / count, 700.0)) * 100 if growth > 0 else -100.0
+
+    recent = returns[-window:]
+    rolling_volatility = 0.0
+    if len(recent) > 1:
+        recent_mean = sum(recent) / len(recent)
+        rolling_volatility = math.sqrt(sum((r - recent_mean) ** 2 for r in recent) / (len(recent) - 1)) * scale * 100
+
+    moves = [r for r in returns if r != 0]
+    tail_size = min(count, max(1, math.ceil((1 - confidence) * count - 1e-9)))
+    tail = sorted(returns)[:tail_size]
+    return {
+        'total_return': (values[-1] / values[0] - 1) * 100,
+        'max_drawdown': max_drawdown,
+        'sharpe_ratio': sharpe,
+        'annualized_sharpe': sharpe * scale,
+        'sortino_ratio': mean / downside * scale if downside > 0 else 0,
+        'calmar_ratio': annualized_return / max_drawdown if max_drawdown > 0 else 0,
+        'annualized_return': annualized_return,
+        'rolling_volatility': rolling_volatility,
+        'hit_rate': sum(r > 0 for r in moves) / len(moves) * 100 if moves else 0,
+        'value_at_risk': max(0.0, -tail[-1] * 100),
+        'conditional_var': max(0.0, -sum(tail) / tail_size * 100)
+    }
+
+def _assert_metrics(tracker, values, periods_per_year=252):
+    actual = tracker.metrics(periods_per_year)
+    expected = _brute_force(values, periods_per_year)
+    assert actual.keys() == expected.keys()
+    for name, value in expected.items():
+        assert actual[name] == pytest.approx(value, rel=1e-7, abs=1e-9), name
+
+def _series(seed, length=120):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.001, 0.02, length)
+    # Flat stretches give zero returns (no move for the hit rate)
+    returns[rng.random(length) < 0.2] = 0.0
+    return (10000 * np.cumprod(1 + returns)).tolist()
+
+@pytest.mark.parametrize('seed', range(3))
+def test_streaming_matches_brute_force(seed):
+    values = _series(seed)
+    tracker = RiskTracker(values[0], WINDOW, CONFIDENCE)
+    _assert_metrics(tracker, values[:1])
+    for end in range(2, len(values) + 1):
+        tracker.update(values[end - 1])
+        _assert_metrics(tracker, values[:end])
+    _assert_metrics(tracker, values, periods_per_year=52)
+
+def test_replace_latest_matches_brute_force():
+    rng = np.random.default_rng(7)
+    values = _series(7, 60)
+    tracker = RiskTracker(values[0], WINDOW, CONFIDENCE)
+    series = [values[0]]
+    for value in values[1:]:
+        tracker.update(value)
+        series.append(value)
+        # Re-value the day a few times, sometimes to a new low or high
+        for _ in range(rng.integers(0, 3)):
+            series[-1] = value * rng.uniform(0.8, 1.2)
+            tracker.replace_latest(series[-1])
+        _assert_metrics(tracker, series)
+
+def test_replace_latest_without_a_value_records_one():
+    tracker = RiskTracker(100.0, WINDOW, CONFIDENCE)
+    tracker.replace_latest(90.0)
+    _assert_metrics(tracker, [100.0, 90.0])
+
+@pytest.mark.parametrize('length', [1, 2, 3, 11, 80])
+def test_from_values_matches_brute_force_and_keeps_streaming(length):
+    values = _series(11, 100)
+    tracker = RiskTracker.from_values(values[:length], WINDOW, CONFIDENCE)
+    _assert_metrics(tracker, values[:length])
+    if length > 1:
+        tracker.replace_latest(values[length - 1] * 0.9)
+        _assert_metrics(tracker, values[:length - 1] + [values[length - 1] * 0.9])
+        tracker.replace_latest(values[length - 1])
+    for end in range(length + 1, len(values) + 1):
+        tracker.update(values[end - 1])
+        _assert_metrics(tracker, values[:end])
@@ -0,0 +1,101 @@
+import copy
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+from utils import session_manager, state_store
+from utils.pnl_calculator import PnLCalculator
+from utils.state_store import MemoryStateStore, decode_state, encode_state
+from tests.helpers import APP_PATH, rerun
+
+def test_losing_save_loads_the_winning_game(monkeypatch):
+    store = MemoryStateStore()
+    monkeypatch.setattr(state_store, '_default_store', store)
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.query_params['game'] = 'race'
+    at.run()
+    assert at.session_state.store_version == 1
+
+    # Another worker saves the same game between this run's load and save
+    save_changes = session_manager._save_changes
+    def racing_save(store, prefix):
+        meta = decode_state(store.load(prefix + 'meta'))
+        if meta['settings']['current_day_index'] != 7:
+            other = copy.deepcopy(meta)
+            other['version'] += 1
+            other['settings']['current_day_index'] = 7
+            assert store.save_versioned({prefix + 'meta': encode_state(other)}, prefix + 'meta', meta['version'])
+        return save_changes(store, prefix)
+    monkeypatch.setattr(session_manager, '_save_changes', racing_save)
+
+    at.session_state['current_day_index'] = 3
+    rerun(at)
+    assert not at.exception
+    meta = decode_state(store.load('game/race/meta'))
+    assert at.session_state.current_day_index == meta['settings']['current_day_index'] == 7
+    assert at.session_state.store_version == meta['version'] >= 2
+
+def test_row_chunks_rebuild_the_calculator():
+    dates = pd.date_range('2024-01-01', periods=30)
+    calc = PnLCalculator(1000.0)
+    state = calc.to_state(rows=False)
+    chunks = []
+    for day in range(30):
+        calc.update_portfolio_value(100.0 + day, dates[day])
+        if day == 10:
+            calc.execute_trade('buy', 2, 110.0)
+        if day % 7 == 6:
+            # Revaluing the same day replaces the last row
+            calc.update_portfolio_value(101.0 + day, dates[day])
+            chunks.append(calc.rows_state(calc.unsaved_row()))
+            calc.mark_saved()
+    snapshot = calc.snapshot()
+    calc.update_portfolio_value(200.0, dates[29] + pd.Timedelta(days=1))
+    chunks.append(calc.rows_state(calc.unsaved_row()))
+    calc.mark_saved()
+    # A rewind truncates rows that were already saved
+    calc.restore(snapshot)
+    assert calc.unsaved_row() == 30
+    calc.restore((1000.0, 0, 0.0, 0, 6, 5))
+    chunks.append(calc.rows_state(calc.unsaved_row()))
+
+    # Chunks only carry the rows written since the previous one
+    assert [chunk['start'] for chunk in chunks] == [0, 7, 14, 21, 28, 5]
+    restored = PnLCalculator.from_state(state, chunks)
+    assert restored.portfolio_values == calc.portfolio_values
+    assert restored.daily_metrics.equals(calc.daily_metrics)
+    assert restored.current_price == calc.current_price
+
+def test_saves_append_history_and_skip_unchanged_parts(monkeypatch):
+    store = MemoryStateStore()
+    monkeypatch.setattr(state_store, '_default_store', store)
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.query_params['game'] = 'append'
+    at.run()
+    calc = at.session_state.portfolios[1]['pnl_calculator']
+    for day in range(1, 4):
+        # Value the portfolio on a new day, as the clock does
+        calc.update_portfolio_value(100.0 + day, pd.Timestamp('2024-01-01') + pd.Timedelta(days=day))
+        at.session_state['current_day_index'] = day
+        rerun(at)
+        assert not at.exception
+    meta = decode_state(store.load('game/append/meta'))
+    num_chunks, num_rows = meta['row_chunks'][1]
+    chunks = [decode_state(store.load(f"game/append/portfolio/1/rows/{chunk}")) for chunk in range(num_chunks)]
+    # Every save after the first one only appended the new days
+    assert chunks[0]['start'] == 0
+    assert all(chunk['start'] >= previous['start'] + len(previous['daily_metrics']['date']) - 1
+               for previous, chunk in zip(chunks, chunks[1:]))
+    assert len(chunks) == 4
+    assert num_rows == len(calc.portfolio_values) - 1
+
+    # A rerun that changes nothing writes nothing
+    rerun(at)
+    assert decode_state(store.load('game/append/meta'))['version'] == meta['version']
+
+    # Another worker picks the game up from the chunks
+    other = AppTest.from_file(APP_PATH, default_timeout=60)
+    other.query_params['game'] = 'append'
+    other.run()
+    assert not other.exception
+    loaded = other.session_state.portfolios[1]['pnl_calculator']
+    assert loaded.portfolio_values == calc.portfolio_values
+    assert loaded.daily_metrics.equals(calc.daily_metrics)
@@ -0,0 +1,97 @@
+import sys
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+import pytest
+from utils.pnl_calculator import PnLCalculator
+from utils.session_memory import SAMPLE_ITEMS, SessionMemoryTracker, estimate_size
+
+class _SessionState(dict):
+    """The parts of SessionStateProxy the tracker uses"""
+
+    @property
+    def filtered_state(self):
+        return dict(self)
+
+class _Frames:
+    """A frame precomputer that records being invalidated"""
+
+    def __init__(self):
+        self.invalidated = 0
+
+    def invalidate(self):
+        self.invalidated += 1
+
+def _session(size_bytes: int) -> _SessionState:
+    return _SessionState(portfolios=np.zeros(size_bytes, dtype=np.uint8), store_game_id='game')
+
+def _walk(obj, seen=None) -> int:
+    """Reference size: every item of every container walked"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return size + sum(_walk(key, seen) + _walk(value, seen) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, deque, set)):
+        return size + sum(_walk(item, seen) for item in obj)
+    if hasattr(obj, '__dict__'):
+        return size + _walk(vars(obj), seen)
+    return size
+
+def test_long_histories_are_sized_from_a_sample():
+    num_days = 20_000
+    calculator = PnLCalculator(10000)
+    values = 10000 + np.cumsum(np.random.default_rng(0).normal(0, 10, num_days))
+    calculator.record_values(pd.date_range('2000-01-01', periods=num_days), values, 1.0)
+    for _ in range(3 * SAMPLE_ITEMS):
+        calculator.execute_trade('buy', 1, 10.0)
+
+    start = time.perf_counter()
+    estimate = estimate_size(calculator)
+    elapsed = time.perf_counter() - start
+    assert estimate == pytest.approx(_walk(calculator), rel=0.05)
+    assert elapsed < 0.1
+
+def test_session_over_its_cap_drops_its_chart_frames():
+    tracker = SessionMemoryTracker(session_cap_bytes=1000, total_cap_bytes=10 ** 9, idle_evict_sec=3600)
+    small, large = _session(100), _session(5000)
+    small['frame_precomputer'], large['frame_precomputer'] = _Frames(), _Frames()
+    tracker.end_run('small', small)
+    tracker.end_run('large', large)
+    assert small['frame_precomputer'].invalidated == 0
+    assert large['frame_precomputer'].invalidated == 1
+    assert [row['session_id'] for row in tracker.sessions()] == ['large', 'small']
+
+def test_idle_sessions_are_evicted_least_recently_used_first():
+    tracker = SessionMemoryTracker(session_cap_bytes=10 ** 9, total_cap_bytes=25_000, idle_evict_sec=3600)
+    states = {session_id: _session(10_000) for session_id in ('old', 'newer', 'running')}
+    tracker.end_run('old', states['old'])
+    tracker.end_run('newer', states['newer'])
+    tracker.begin_run('running', states['running'])
+    # The running session's measurement pushes the total over the cap
+    tracker.end_run('running', states['running'])
+    tracker.begin_run('running', states['running'])
+
+    assert 'portfolios' not in states['old'] and states['old']['store_game_id'] is None
+    assert 'portfolios' in states['newer'] and 'portfolios' in states['running']
+    assert tracker.total_bytes() < 25_000
+    # Running sessions are never evicted
+    assert not tracker.evict('running')
+    assert tracker.evict('newer')
+    assert not tracker.evict('newer')
+
+def test_sessions_idle_past_the_timeout_are_evicted():
+    tracker = SessionMemoryTracker(session_cap_bytes=10 ** 9, total_cap_bytes=10 ** 9, idle_evict_sec=60)
+    state = _session(100)
+    tracker.end_run('idle', state)
+    assert tracker.enforce() == []
+    tracker._sessions['idle']['last_active'] -= 61
+    assert tracker.enforce() == ['idle']
+    assert 'portfolios' not in state
@@ -0,0 +1,32 @@
+import pytest
+from utils.state_store import MemoryStateStore, SQLiteStateStore
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStateStore()
+    return SQLiteStateStore(str(tmp_path / 'state.db'))
+
+def test_save_versioned_rejects_stale_writer(store):
+    assert store.save_versioned({'game/a/meta': b'first'}, 'game/a/meta', 0)
+    # A second worker that also read version 0 loses instead of overwriting
+    assert not store.save_versioned({'game/a/meta': b'second'}, 'game/a/meta', 0)
+    assert store.load('game/a/meta') == b'first'
+
+    assert store.save_versioned({'game/a/meta': b'third', 'game/a/journal': b'j'}, 'game/a/meta', 1)
+    assert store.load_many(['game/a/meta', 'game/a/journal']) == {'game/a/meta': b'third', 'game/a/journal': b'j'}
+
+def test_delete_prefix_resets_version(store):
+    assert store.save_versioned({'game/a/meta': b'first'}, 'game/a/meta', 0)
+    assert store.save_versioned({'game/a/meta': b'second'}, 'game/a/meta', 1)
+    store.delete_prefix('game/a/')
+    assert store.load('game/a/meta') is None
+    assert store.save_versioned({'game/a/meta': b'again'}, 'game/a/meta', 0)
+
+def test_sqlite_workers_share_versions(tmp_path):
+    path = str(tmp_path / 'state.db')
+    worker_a, worker_b = SQLiteStateStore(path), SQLiteStateStore(path)
+    assert worker_a.save_versioned({'game/a/meta': b'a'}, 'game/a/meta', 0)
+    assert not worker_b.save_versioned({'game/a/meta': b'b'}, 'game/a/meta', 0)
+    assert worker_b.save_versioned({'game/a/meta': b'b'}, 'game/a/meta', 1)
+    assert worker_a.load('game/a/meta') == b'b'
@@ -0,0 +1,78 @@
+import itertools
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from utils.cost_models import COST_PRESETS, NO_COSTS
+from utils.instruments import INSTRUMENT_PREFIX
+from utils.pnl_calculator import PnLCalculator
+from utils.strategy_oracle import CASH, REFERENCE_LABELS, optimal_states, reference_paths
+
+def _log_wealth(prices, days, states, entry_factor, exit_factor):
+    """Log wealth at the end of a holding path, marked to market (no final exit)"""
+    ends = list(days[1:]) + [len(prices) - 1]
+    wealth, held = 0.0, CASH
+    for day, end, state in zip(days, ends, states):
+        if state != held:
+            wealth += (math.log(exit_factor) if held != CASH else 0.0) + (math.log(entry_factor) if state != CASH else 0.0)
+            held = state
+        if state != CASH:
+            wealth += math.log(prices[end, state] / prices[day, state])
+    return wealth
+
+def _prices(seed, num_days=40, num_instruments=2):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.05, (num_days, num_instruments)), axis=0))
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('factors', [(1.0, 1.0), (0.99, 0.99), (0.9, 0.95)])
+def test_dp_matches_exhaustive_search(seed, factors):
+    prices = _prices(seed)
+    days = [0, 5, 11, 18, 24, 33]
+    options = [CASH] + list(range(prices.shape[1]))
+    best = max(_log_wealth(prices, days, path, *factors) for path in itertools.product(options, repeat=len(days)))
+    states = optimal_states(prices, days, *factors)
+    assert _log_wealth(prices, days, states.tolist(), *factors) == pytest.approx(best, abs=1e-12)
+
+def _frame(prices):
+    data = {'Date': pd.date_range('2024-01-01', periods=len(prices))}
+    if prices.shape[1] == 1:
+        data['Price'] = prices[:, 0]
+    else:
+        data.update({f"{INSTRUMENT_PREFIX}T{i}": prices[:, i] for i in range(prices.shape[1])})
+    return pd.DataFrame(data)
+
+def test_long_only_optimal_sits_out_a_falling_market():
+    assert REFERENCE_LABELS['optimal'] == "Long-Only Optimal"
+    prices = np.linspace(100, 50, 30)[:, None]
+    paths = reference_paths(_frame(prices), [0, 10, 20], 10000.0)
+    # A short would have profited; the long-only optimum just keeps the cash
+    assert paths.optimal_trades == []
+    assert paths.optimal.tolist() == paths.cash.tolist()
+    assert paths.buy_and_hold[-1] < 10000.0
+
+@pytest.mark.parametrize('cost_model', [NO_COSTS, COST_PRESETS['retail']])
+def test_optimal_trades_replay_as_long_only_trades(cost_model):
+    prices = _prices(3, num_days=60, num_instruments=2)
+    df = _frame(prices)
+    breakpoints = list(range(0, 60, 6))
+    paths = reference_paths(df, breakpoints, 10000.0, cost_model)
+    assert paths.optimal_trades
+
+    # Replayed by a calculator without short selling, every trade is accepted
+    calc = PnLCalculator(10000.0, None, cost_model)
+    for day, action, quantity, instrument in paths.optimal_trades:
+        assert day in breakpoints and quantity > 0
+        calc.execute_trade(action, quantity, prices[day, instrument], None, instrument)
+        assert calc.holding(instrument) >= 0
+    final = calc.cash + float(calc.holdings @ prices[-1, :len(calc.holdings)])
+    assert paths.optimal[-1] == pytest.approx(final)
+
+    # Up to whole shares and fixed fees, the path earns what the program planned
+    spread = cost_model.spread_bps / 2e4
+    commission = cost_model.commission_bps / 1e4
+    factors = (1 / ((1 + spread) * (1 + commission)), (1 - spread) * (1 - commission))
+    days = sorted(set(breakpoints))
+    planned = 10000.0 * math.exp(_log_wealth(prices, days, optimal_states(prices, days, *factors).tolist(), *factors))
+    assert paths.optimal[-1] == pytest.approx(planned, rel=0.05)
+    assert paths.optimal[-1] >= max(paths.buy_and_hold[-1], paths.cash[-1])
@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+from utils.portfolio_manager import initialize_portfolios
+from utils.resting_orders import RestingOrderBook
+from utils.trade_buffer import TradeBuffer
+from utils.trade_journal import TradeJournal
+
+DATE = pd.Timestamp('2024-01-01')
+
+def test_stage_undo_and_amend_walk_the_staged_chain():
+    portfolios = initialize_portfolios(1, 1000.0)
+    buffer = TradeBuffer()
+    buffer.stage(1, portfolios[1], 'buy', 5, 100.0, 0, DATE)
+    buffer.stage(1, portfolios[1], 'sell', 2, 100.0, 0, DATE)
+    assert buffer.view(1, portfolios[1]) == (700.0, 3)
+
+    assert buffer.undo(1)
+    assert buffer.view(1, portfolios[1]) == (500.0, 5)
+    buffer.amend(1, portfolios[1], 'buy', 8, 100.0)
+    assert [(order.action, order.quantity) for order in buffer.staged_orders(1)] == [('buy', 8)]
+    assert buffer.view(1, portfolios[1]) == (200.0, 8)
+
+    assert buffer.undo(1)
+    assert not buffer.undo(1)
+    assert not buffer.has_orders()
+    # Nothing was applied to the portfolio while staging
+    assert portfolios[1]['cash'] == 1000.0
+    assert portfolios[1]['pnl_calculator'].trades == []
+
+def test_rejected_amend_keeps_the_old_order():
+    portfolios = initialize_portfolios(1, 1000.0)
+    buffer = TradeBuffer()
+    buffer.stage(1, portfolios[1], 'buy', 5, 100.0, 0, DATE)
+    with pytest.raises(ValueError, match="Insufficient funds"):
+        buffer.amend(1, portfolios[1], 'buy', 20, 100.0)
+    assert [(order.action, order.quantity) for order in buffer.staged_orders(1)] == [('buy', 5)]
+
+def test_orders_from_an_earlier_breakpoint_are_discarded():
+    portfolios = initialize_portfolios(1, 1000.0)
+    buffer = TradeBuffer()
+    buffer.stage(1, portfolios[1], 'buy', 5, 100.0, 0, DATE)
+    buffer.stage(1, portfolios[1], 'buy', 1, 100.0, 3, DATE)
+    assert [order.quantity for order in buffer.staged_orders(1)] == [1]
+
+def test_commit_applies_orders_and_hands_resting_ones_to_the_book():
+    portfolios = initialize_portfolios(2, 1000.0)
+    buffer = TradeBuffer()
+    journal = TradeJournal()
+    order_book = RestingOrderBook()
+    buffer.stage(1, portfolios[1], 'buy', 5, 100.0, 0, DATE)
+    buffer.stage(1, portfolios[1], 'stop_loss', 5, 90.0, 0, DATE)
+    buffer.stage(2, portfolios[2], 'hold', 0, 100.0, 0, DATE)
+    buffer.commit(portfolios, journal, order_book)
+
+    assert (portfolios[1]['cash'], portfolios[1]['positions']) == (500.0, 5)
+    assert [entry['action'] for entry in portfolios[1]['trading_history']] == ['buy']
+    assert [entry['action'] for entry in portfolios[2]['trading_history']] == ['hold']
+    assert [(order.order_type, order.quantity) for order in order_book.live_orders(1)] == [('stop_loss', 5)]
+    assert [event[3] for event in journal.events if event[0] == 'trade'] == ['buy', 'hold']
+    assert not buffer.has_orders()
+
+def test_failed_commit_rolls_every_player_back():
+    portfolios = initialize_portfolios(2, 1000.0)
+    buffer = TradeBuffer()
+    journal = TradeJournal()
+    buffer.stage(1, portfolios[1], 'buy', 5, 100.0, 0, DATE)
+    buffer.stage(2, portfolios[2], 'buy', 5, 100.0, 0, DATE)
+    # Player 2's cash changes underneath the staged order
+    portfolios[2]['pnl_calculator'].cash = 100.0
+    events = list(journal.events)
+
+    with pytest.raises(ValueError, match="Insufficient funds"):
+        buffer.commit(portfolios, journal)
+
+    # Player 1's trade, applied first, is undone as well
+    assert (portfolios[1]['cash'], portfolios[1]['positions']) == (1000.0, 0)
+    assert portfolios[1]['pnl_calculator'].trades == []
+    assert portfolios[1]['trading_history'] == []
+    assert portfolios[2]['cash'] == 100.0
+    assert journal.events == events
+    # The staged orders are kept, so they can be amended and committed again
+    assert buffer.has_orders()
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.instruments import InstrumentSet, update_portfolio_values
+from utils.margin import settle_until
+from utils.portfolio_manager import initialize_portfolios
+from utils.resting_orders import RestingOrderBook
+from utils.trade_buffer import TradeBuffer
+from utils.trade_journal import TradeJournal
+
+BREAKPOINTS = [0, 8, 16, 24, 32]
+
+def _arrival_state(portfolios, orders):
+    """Everything rewind() restores: calculators, trading histories and resting orders"""
+    state = {}
+    for player_num, portfolio in portfolios.items():
+        calc = portfolio['pnl_calculator']
+        state[player_num] = (
+            calc.cash, tuple(calc.holdings.tolist()), list(calc.portfolio_values),
+            calc.daily_metrics.to_dict('list'), len(calc.trades), len(portfolio['trading_history'])
+        )
+    return state, list(orders)
+
+def _play():
+    """
+    Play a game one day at a time as the app does: stage market and resting
+    orders at every breakpoint, commit them on resume and settle each day.
+
+    Returns the game and the state on arrival at every day.
+    """
+    rng = np.random.default_rng(3)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, 40)))
+    df = pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=40), 'Price': prices})
+    instruments = InstrumentSet(df)
+    portfolios = initialize_portfolios(2, 10000.0, 0.5)
+    journal = TradeJournal(snapshot_interval=3)
+    order_book = RestingOrderBook()
+    buffer = TradeBuffer()
+    # The portfolio summary values the first day before the clock starts
+    update_portfolio_values(portfolios, instruments.day_prices(0), df['Date'].iloc[0])
+
+    arrivals = {}
+    for day in range(len(df)):
+        arrivals[day] = _arrival_state(portfolios, order_book.orders)
+        if day in BREAKPOINTS:
+            price = float(prices[day])
+            date = df['Date'].iloc[day]
+            buffer.stage(1, portfolios[1], 'buy', 5, price, day, date)
+            buffer.stage(1, portfolios[1], 'limit_buy', 3, round(price * 0.97, 2), day, date)
+            buffer.stage(2, portfolios[2], 'sell', 4, price, day, date)
+            # Far from the price, so it rests until the next breakpoint
+            buffer.stage(2, portfolios[2], 'limit_buy', 2, round(price * 0.5, 2), day, date)
+            buffer.commit(portfolios, journal, order_book)
+            expiry = next((bp - 1 for bp in BREAKPOINTS if bp > day), len(df) - 1)
+            order_book.schedule(instruments.crossing_indices, expiry, journal, portfolios)
+        if day < len(df) - 1:
+            settle_until(portfolios, df, instruments, order_book, day, day + 1, journal)
+    return df, portfolios, journal, order_book, arrivals
+
+def _assert_arrival(portfolios, orders, arrival):
+    state, orders = _arrival_state(portfolios, orders)
+    expected_state, expected_orders = arrival
+    assert orders == expected_orders
+    for player_num, expected in expected_state.items():
+        cash, holdings, values, metrics, num_trades, history_length = state[player_num]
+        assert cash == pytest.approx(expected[0])
+        assert holdings == expected[1]
+        assert values == pytest.approx(expected[2])
+        assert metrics['date'] == expected[3]['date']
+        assert metrics['portfolio_value'] == pytest.approx(expected[3]['portfolio_value'])
+        assert (num_trades, history_length) == expected[4:]
+
+def test_rewind_matches_the_state_on_arrival():
+    df, portfolios, journal, order_book, arrivals = _play()
+    # Rewinding truncates the journal each time, so every rewind also
+    # checks that the shortened journal still replays correctly
+    for day in [37, 33, 24, 17, 9, 5, 3, 1, 0]:
+        journal.rewind(portfolios, df, day, order_book)
+        _assert_arrival(portfolios, order_book.orders, arrivals[day])
+
+def test_seek_leaves_the_game_and_journal_untouched():
+    df, portfolios, journal, order_book, arrivals = _play()
+    final = _arrival_state(portfolios, order_book.orders)
+    events = list(journal.events)
+    version = journal.version
+    # Any order of days works, since nothing is truncated
+    for day in [9, 37, 0, 24, 1, 33, 17]:
+        copies, orders = journal.seek(portfolios, df, day)
+        _assert_arrival(copies, orders, arrivals[day])
+    assert _arrival_state(portfolios, order_book.orders) == final
+    assert journal.events == events and journal.version == version
+
+def test_rewind_rebuilds_orders_resting_from_an_earlier_breakpoint():
+    df, portfolios, journal, order_book, arrivals = _play()
+    journal.rewind(portfolios, df, 12, order_book)
+    # Player 2's deep limit buy from day 8 is still waiting on day 12
+    assert [(order.player_num, order.placed_day) for order in order_book.live_orders(2)] == [(2, 8)]
+    assert order_book.orders == arrivals[12][1]
+
+def test_rewind_before_the_first_snapshot_keeps_day_zero():
+    df, portfolios, journal, order_book, arrivals = _play()
+    journal.rewind(portfolios, df, 1, order_book)
+    dates = portfolios[1]['pnl_calculator'].daily_metrics['date'].tolist()
+    assert dates == df['Date'].iloc[:2].tolist()
+
+def test_journal_state_round_trip_keeps_orders():
+    df, portfolios, journal, order_book, arrivals = _play()
+    restored = TradeJournal.from_state(journal.to_state())
+    restored.rewind(portfolios, df, 20, order_book)
+    assert order_book.orders == arrivals[20][1]
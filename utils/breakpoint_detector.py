@@ -0,0 +1,243 @@
+"""
+Automatic decision points for price series that come without a Breakpoint column.
+
+Methods:
+    zigzag      Swing highs and lows: a pivot is confirmed once price retraces
+                threshold (e.g. 0.1 = 10%) from the most recent extreme
+    volatility  Volatility regime changes: entering a regime where the rolling
+                volatility exceeds vol_ratio times its median, and leaving it
+                once it falls back below the median
+    fixed       Every spacing rows
+
+Every method is O(n) and works on whole arrays; a minimum spacing between
+breakpoints is enforced afterwards (earliest breakpoint wins).
+
+Usage:
+    flags = detect_breakpoints(df['Price'].to_numpy(), method='zigzag', threshold=0.1)
+"""
+from typing import Tuple
+import numpy as np
+
+BREAKPOINT_METHODS = ['zigzag', 'volatility', 'fixed']
+DEFAULT_BREAKPOINT_METHOD = 'zigzag'
+
+# Default swing size for zigzag pivots (fraction of price)
+DEFAULT_ZIGZAG_THRESHOLD = 0.1
+
+# Default rolling window (rows) for volatility regimes
+DEFAULT_VOL_WINDOW = 20
+
+# Rolling volatility above this multiple of its median starts a high-volatility regime
+DEFAULT_VOL_RATIO = 1.5
+
+DEFAULT_SPACING = 20
+DEFAULT_MIN_SPACING = 5
+
+# Rows per lane of the lockstep zigzag scan (at least)
+_MIN_LANE_LENGTH = 2048
+
+def _zigzag_lanes(x: np.ndarray, h: float, state: Tuple[bool, float, int], start: int) -> np.ndarray:
+    """
+    Run the zigzag state machine over x[start:] in lockstep lanes.
+
+    The series is cut into lanes that are scanned column by column, so each
+    Python step handles one row of every lane at once. A lane's starting
+    state depends on the end of the lane before it; lanes start from a
+    guess, and lanes whose guess was wrong are rescanned with the state
+    their predecessor actually ended in until every lane agrees.
+
+    Args:
+        x: Log prices
+        h: Log swing size
+        state: (trending_up, extreme, extreme_index) in force at row start
+        start: First row to scan
+
+    Returns:
+        np.ndarray: Sorted indices of confirmed pivots
+    """
+    length = len(x) - start
+    if length <= 0:
+        return np.array([], dtype=np.int64)
+    lane_length = max(_MIN_LANE_LENGTH, int(np.sqrt(length)))
+    num_lanes = -(-length // lane_length)
+    # Pad with the last value: it is never a new extreme or a reversal
+    padded = np.full(num_lanes * lane_length, x[-1])
+    padded[:length] = x[start:]
+    columns = np.ascontiguousarray(padded.reshape(num_lanes, lane_length).T)
+    lane_starts = start + np.arange(num_lanes) * lane_length
+
+    # Guess: each lane continues the initial trend from its own first row
+    init_up = np.full(num_lanes, state[0])
+    init_ext = columns[0].copy()
+    init_idx = lane_starts.copy()
+    init_up[0], init_ext[0], init_idx[0] = state
+    lane_pivots = [np.array([], dtype=np.int64)] * num_lanes
+    todo = np.arange(num_lanes)
+
+    while len(todo):
+        lane_columns = columns if len(todo) == num_lanes else columns[:, todo]
+        up, ext, ext_idx = init_up[todo].copy(), init_ext[todo].copy(), init_idx[todo].copy()
+        base = lane_starts[todo]
+        found_lanes, found_pivots = [], []
+        for k in range(lane_length):
+            v = lane_columns[k]
+            reversal = np.where(up, v <= ext - h, v >= ext + h)
+            if reversal.any():
+                found_lanes.append(np.flatnonzero(reversal))
+                found_pivots.append(ext_idx[reversal])
+                up ^= reversal
+            new_extreme = reversal | np.where(up, v > ext, v < ext)
+            ext = np.where(new_extreme, v, ext)
+            ext_idx = np.where(new_extreme, base + k, ext_idx)
+
+        if found_lanes:
+            lanes = np.concatenate(found_lanes)
+            pivots = np.concatenate(found_pivots)
+            order = np.argsort(lanes, kind='stable')
+            lanes, pivots = lanes[order], pivots[order]
+            bounds = np.searchsorted(lanes, np.arange(len(todo) + 1))
+        else:
+            pivots = np.array([], dtype=np.int64)
+            bounds = np.zeros(len(todo) + 1, dtype=np.int64)
+        for i, lane in enumerate(todo):
+            lane_pivots[lane] = pivots[bounds[i]:bounds[i + 1]]
+
+        # Lanes whose successor started from a different state are rescanned
+        following = todo[todo + 1 < num_lanes] + 1
+        ended = np.isin(todo + 1, following)
+        wrong = (init_up[following] != up[ended]) | (init_ext[following] != ext[ended]) | (init_idx[following] != ext_idx[ended])
+        todo = following[wrong]
+        init_up[todo], init_ext[todo], init_idx[todo] = up[ended][wrong], ext[ended][wrong], ext_idx[ended][wrong]
+
+    return np.concatenate(lane_pivots)
+
+def zigzag_pivots(prices: np.ndarray, threshold: float = DEFAULT_ZIGZAG_THRESHOLD) -> np.ndarray:
+    """
+    Find swing highs and lows that are followed by a move of at least threshold.
+
+    Args:
+        prices: Positive price series
+        threshold: Minimum swing as a fraction of price
+
+    Returns:
+        np.ndarray: Sorted row indices of the confirmed swing highs and lows
+    """
+    if threshold <= 0:
+        raise ValueError("Zigzag threshold must be positive")
+    x = np.log(np.asarray(prices, dtype=np.float64))
+    h = np.log1p(threshold)
+    if len(x) == 0:
+        return np.array([], dtype=np.int64)
+
+    # The first move of h away from the first price sets the initial trend; the
+    # opposite extreme before it is the first pivot
+    moved = np.abs(x - x[0]) >= h
+    first = int(np.argmax(moved))
+    if not moved[first]:
+        return np.array([], dtype=np.int64)
+    up = bool(x[first] > x[0])
+    first_pivot = int(np.argmin(x[:first + 1]) if up else np.argmax(x[:first + 1]))
+    rest = _zigzag_lanes(x, h, (up, x[first], first), first + 1)
+    return np.concatenate([[first_pivot], rest]).astype(np.int64)
+
+def volatility_regime_changes(prices: np.ndarray, window: int = DEFAULT_VOL_WINDOW,
+                              vol_ratio: float = DEFAULT_VOL_RATIO) -> np.ndarray:
+    """
+    Find the rows where the volatility regime switches.
+
+    Rolling volatility of log returns is computed from running sums. A row
+    is in the high regime once the volatility exceeds vol_ratio times its
+    median and stays there until it falls below the median.
+
+    Returns:
+        np.ndarray: Sorted row indices where the regime changes
+    """
+    if window < 2:
+        raise ValueError("Volatility window must be at least 2 rows")
+    returns = np.diff(np.log(np.asarray(prices, dtype=np.float64)))
+    if len(returns) < window:
+        return np.array([], dtype=np.int64)
+    sums = np.concatenate([[0.0], np.cumsum(returns)])
+    squares = np.concatenate([[0.0], np.cumsum(returns * returns)])
+    window_sum = sums[window:] - sums[:-window]
+    window_squares = squares[window:] - squares[:-window]
+    variance = np.maximum(window_squares - window_sum * window_sum / window, 0.0) / (window - 1)
+    vol = np.sqrt(variance)
+    median = np.median(vol)
+
+    # +1 high, -1 normal, 0 in between (keeps the previous regime)
+    signal = np.where(vol > median * vol_ratio, 1, np.where(vol < median, -1, 0))
+    last_set = np.maximum.accumulate(np.where(signal != 0, np.arange(len(signal)), 0))
+    regime = np.where(signal[last_set] == 1, 1, -1)
+    # vol[i] covers returns up to row i + window
+    return np.flatnonzero(np.diff(regime) != 0) + window + 1
+
+def enforce_min_spacing(indices: np.ndarray, min_spacing: int) -> np.ndarray:
+    """
+    Drop breakpoints closer than min_spacing rows to the previous kept one.
+
+    Greedy from the start. Each candidate points at the first candidate it
+    allows next; the kept chain is collected by pointer doubling, so the
+    cost is O(k log k) array work instead of a Python loop over k candidates.
+
+    Args:
+        indices: Sorted candidate rows
+        min_spacing: Minimum distance between kept rows
+
+    Returns:
+        np.ndarray: Kept rows
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    if min_spacing <= 1 or len(indices) < 2:
+        return indices
+    count = len(indices)
+    # jump[i]: next candidate allowed after keeping i (count = none)
+    jump = np.append(np.searchsorted(indices, indices + min_spacing), count)
+    kept = np.zeros(count + 1, dtype=bool)
+    kept[0] = True
+    while True:
+        kept[jump[kept]] = True
+        if (jump[:count] == count).all():
+            break
+        jump = jump[jump]
+    return indices[kept[:count]]
+
+def detect_breakpoints(prices: np.ndarray, method: str = DEFAULT_BREAKPOINT_METHOD,
+                       threshold: float = DEFAULT_ZIGZAG_THRESHOLD, window: int = DEFAULT_VOL_WINDOW,
+                       vol_ratio: float = DEFAULT_VOL_RATIO, spacing: int = DEFAULT_SPACING,
+                       min_spacing: int = DEFAULT_MIN_SPACING) -> np.ndarray:
+    """
+    Build a Breakpoint column for a price series.
+
+    Args:
+        prices: Positive price series
+        method: 'zigzag', 'volatility' or 'fixed'
+        threshold: Zigzag swing size as a fraction of price
+        window: Rolling window for 'volatility'
+        vol_ratio: Volatility multiple that starts a high-volatility regime
+        spacing: Rows between 'fixed' breakpoints
+        min_spacing: Minimum rows between breakpoints
+
+    Returns:
+        np.ndarray: Boolean Breakpoint column
+
+    Raises:
+        ValueError: If a price is not positive (swings and volatility are measured on log prices)
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    if not (prices > 0).all():
+        raise ValueError("Prices must be positive to detect breakpoints")
+    if method == 'zigzag':
+        rows = zigzag_pivots(prices, threshold)
+    elif method == 'volatility':
+        rows = volatility_regime_changes(prices, window, vol_ratio)
+    elif method == 'fixed':
+        if spacing < 1:
+            raise ValueError("Breakpoint spacing must be at least 1 row")
+        rows = np.arange(spacing - 1, len(prices), spacing)
+    else:
+        raise ValueError(f"Unknown breakpoint method '{method}', expected one of {', '.join(BREAKPOINT_METHODS)}")
+
+    flags = np.zeros(len(prices), dtype=bool)
+    flags[enforce_min_spacing(rows, min_spacing)] = True
+    return flags
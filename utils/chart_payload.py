@@ -0,0 +1,123 @@
+import base64
+from typing import Dict
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from utils.visual_configs import WEBGL_POINT_THRESHOLD
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; Plotly falls back to the stdlib encoder
+    orjson = None
+
+# Numpy dtypes understood by Plotly.js typed-array specs
+TYPED_ARRAY_DTYPES = {
+    np.dtype('float64'): 'f8',
+    np.dtype('float32'): 'f4',
+    np.dtype('int32'): 'i4',
+    np.dtype('int16'): 'i2',
+    np.dtype('int8'): 'i1',
+    np.dtype('uint32'): 'u4',
+    np.dtype('uint16'): 'u2',
+    np.dtype('uint8'): 'u1',
+}
+
+def enable_fast_json() -> str:
+    """
+    Make Plotly (and therefore st.plotly_chart) serialize figures with orjson when installed.
+
+    Returns:
+        str: Name of the JSON engine in use
+    """
+    engine = 'orjson' if orjson is not None else 'json'
+    pio.json.config.default_engine = engine
+    return engine
+
+def to_epoch_ms(dates) -> np.ndarray:
+    """
+    Convert dates to milliseconds since the Unix epoch.
+
+    Plotly date axes accept epoch milliseconds directly, which are far shorter
+    to encode than ISO date strings.
+
+    Args:
+        dates: Date values (Series, DatetimeIndex or datetime64 array)
+
+    Returns:
+        np.ndarray: float64 epoch milliseconds
+    """
+    values = pd.to_datetime(np.asarray(dates)).values.astype('datetime64[ms]')
+    return values.astype(np.int64).astype(np.float64)
+
+def compact_values(values) -> np.ndarray:
+    """
+    Convert numeric chart values to a numpy array, downcasting long (WebGL)
+    series to float32 since that is the precision WebGL renders at anyway.
+
+    Args:
+        values: Numeric values; NaN marks gaps
+
+    Returns:
+        np.ndarray: float32 array for long series, float64 otherwise
+    """
+    dtype = np.float32 if len(values) > WEBGL_POINT_THRESHOLD else np.float64
+    return np.asarray(values, dtype=dtype)
+
+def encode_typed_array(values) -> Dict:
+    """
+    Encode a numeric array as a Plotly.js typed-array spec (base64 binary).
+
+    Args:
+        values: Numeric numpy array
+
+    Returns:
+        Dict: {'dtype': ..., 'bdata': ...} spec
+    """
+    values = np.ascontiguousarray(values)
+    if values.dtype not in TYPED_ARRAY_DTYPES:
+        values = values.astype(np.float64)
+    return {
+        'dtype': TYPED_ARRAY_DTYPES[values.dtype],
+        'bdata': base64.b64encode(values.tobytes()).decode('ascii')
+    }
+
+def figure_to_binary_dict(fig) -> Dict:
+    """
+    Convert a figure to a dict whose numeric x/y arrays are typed-array specs.
+
+    Dates are sent as epoch milliseconds. Non-numeric arrays (e.g. the gaps in
+    batched line traces) are left as plain JSON lists.
+
+    Args:
+        fig: Plotly figure
+
+    Returns:
+        Dict: Figure dict ready for JSON encoding
+    """
+    fig_dict = fig.to_plotly_json()
+    for trace in fig_dict.get('data', []):
+        for key in ('x', 'y'):
+            values = trace.get(key)
+            if not isinstance(values, np.ndarray):
+                continue
+            if np.issubdtype(values.dtype, np.datetime64):
+                values = to_epoch_ms(values)
+            if np.issubdtype(values.dtype, np.number):
+                trace[key] = encode_typed_array(values)
+    return fig_dict
+
+def serialize_figure(fig, binary: bool = False) -> str:
+    """
+    Serialize a figure to its JSON payload.
+
+    Args:
+        fig: Plotly figure
+        binary: Encode x/y data as base64 typed arrays (needs Plotly.js >= 2.28
+            on the client; Streamlit's bundled Plotly.js is older)
+
+    Returns:
+        str: JSON payload
+    """
+    if binary:
+        return pio.to_json(figure_to_binary_dict(fig), validate=False)
+    return pio.to_json(fig, validate=False)
@@ -0,0 +1,381 @@
+"""
+Compact in-memory storage of large uploaded datasets.
+
+load_data() returns float64 prices, datetime64[ns] dates and a bool
+Breakpoint column, and every session keeps its own copy of an upload. A
+CompactDataset stores the same data in a fraction of the memory:
+
+    prices       float32, or int32 ticks of the smallest power-of-ten tick
+                 size that represents every price (lossless for prices
+                 written with at most MAX_TICK_DECIMALS decimals)
+    dates        int32 offsets from the first date, in the coarsest unit
+                 that represents every date
+    breakpoints  A bitmap, one bit per day
+    Volume       int32 when it fits
+
+The app works on the CompactDataset itself and never expands it. Its
+accessors decode only the rows asked for: row reads (data.iloc[rows],
+data.loc[rows, column]) as the DataFrame would return them, and whole
+columns (data[column]) for the caller to use and drop. The per-dataset
+structures the app derives (the float64 price matrix of InstrumentSet, the
+price pyramid) are built the same way for standard and compact data, so a
+session saves the difference between the DataFrame and the compact copy.
+"""
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
+import pandas as pd
+from utils.data_handler import get_dataset_key
+from utils.instruments import INSTRUMENT_PREFIX
+
+COMPACT_PRICE_MODES = ('float32', 'ticks')
+
+COMPACT_LABELS = {
+    None: "Standard (float64)",
+    'float32': "Compact: float32 prices",
+    'ticks': "Compact: int32 price ticks"
+}
+
+# Finest tick size tried for int32 ticks (10^-MAX_TICK_DECIMALS)
+MAX_TICK_DECIMALS = 6
+
+# Date offset units, coarsest first, with their length in nanoseconds
+DATE_UNITS = {'D': 86_400 * 10 ** 9, 'h': 3_600 * 10 ** 9, 'm': 60 * 10 ** 9, 's': 10 ** 9, 'ms': 10 ** 6}
+
+INT32_MAX = np.iinfo(np.int32).max
+
+# Open/High/Low and the instrument columns are prices, like Price itself
+PRICE_COLUMNS = ('Price', 'Open', 'High', 'Low')
+
+class MemoryReport(NamedTuple):
+    """Memory of a dataset held by a number of sessions, in standard and compact storage"""
+    sessions: int
+    # Per session: the standard DataFrame, or the compact copy
+    full_bytes: int
+    compact_bytes: int
+    # Standard total minus compact total
+    saved_bytes: int
+    saved_pct: float
+    # Largest absolute change of any price (0 for lossless storage)
+    max_price_error: float
+
+def is_price_column(column: str) -> bool:
+    """Check whether a column holds prices"""
+    return column in PRICE_COLUMNS or column.startswith(INSTRUMENT_PREFIX)
+
+def tick_decimals(values: np.ndarray) -> int:
+    """
+    Number of decimals of the tick size that represents every price exactly in int32 ticks.
+
+    Exactly means the ticks decode back to the same value in the column's
+    own dtype (float32 for Open/High/Low).
+
+    Raises:
+        ValueError: If no tick size up to MAX_TICK_DECIMALS decimals does
+    """
+    values = np.asarray(values)
+    largest = float(np.abs(values).max()) if len(values) else 0.0
+    for decimals in range(MAX_TICK_DECIMALS + 1):
+        if largest * 10.0 ** decimals > INT32_MAX:
+            break
+        decoded = np.rint(values.astype(np.float64) * 10.0 ** decimals) / 10.0 ** decimals
+        if np.array_equal(decoded.astype(values.dtype), values):
+            return decimals
+    raise ValueError(
+        f"Prices cannot be stored as int32 ticks of at most {MAX_TICK_DECIMALS} decimals; use float32 storage"
+    )
+
+def _date_encoding(stamps: np.ndarray):
+    """Epoch, unit and int32 offsets of int64 nanosecond dates"""
+    epoch = int(stamps.min()) if len(stamps) else 0
+    offsets = stamps - epoch
+    for unit, length in DATE_UNITS.items():
+        if np.all(offsets % length == 0) and (len(offsets) == 0 or offsets.max() // length <= INT32_MAX):
+            return epoch, unit, (offsets // length).astype(np.int32)
+    raise ValueError("Dates cannot be stored as int32 offsets (finer than milliseconds or too far apart)")
+
+class CompactDataset:
+    """
+    A dataset from load_data() in compact storage, with accessors that
+    decode to the standard dtypes.
+    """
+
+    def __init__(self, columns: List[str], dtypes: Dict[str, str], arrays: Dict[str, np.ndarray],
+                 decimals: Dict[str, int], aliases: Dict[str, str], epoch: int, date_unit: str,
+                 date_offsets: np.ndarray, breakpoint_bits: np.ndarray, length: int, price_mode: str,
+                 source_key: str, full_bytes: int, max_price_error: float):
+        """
+        Use from_frame() or from_state() rather than this constructor.
+
+        Args:
+            columns: Column order of the standard DataFrame
+            dtypes: Standard dtype of every column
+            arrays: Stored array of every column but Date, Breakpoint and the aliases
+            decimals: Tick decimals of the price columns stored as int32 ticks
+            aliases: Columns that repeat another column (Price of multi-instrument data)
+            epoch: First date, in nanoseconds
+            date_unit: One of DATE_UNITS
+            date_offsets: int32 offsets of the dates from the epoch
+            breakpoint_bits: Breakpoint bitmap (little bit order)
+            length: Number of days
+            price_mode: One of COMPACT_PRICE_MODES
+            source_key: Dataset key of the standard DataFrame
+            full_bytes: Memory of the standard DataFrame
+            max_price_error: Largest absolute price change of the compact storage
+        """
+        if price_mode not in COMPACT_PRICE_MODES:
+            raise ValueError(f"Unknown price mode '{price_mode}', expected one of {', '.join(COMPACT_PRICE_MODES)}")
+        self.columns = list(columns)
+        self.dtypes = dict(dtypes)
+        self.arrays = arrays
+        self.decimals = dict(decimals)
+        self.aliases = dict(aliases)
+        self.epoch = int(epoch)
+        self.date_unit = date_unit
+        self.date_offsets = date_offsets
+        self.breakpoint_bits = breakpoint_bits
+        self.length = int(length)
+        self.price_mode = price_mode
+        self.source_key = source_key
+        self.full_bytes = int(full_bytes)
+        self.max_price_error = float(max_price_error)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, price_mode: str = 'float32') -> 'CompactDataset':
+        """
+        Compact a DataFrame from load_data().
+
+        Args:
+            df: DataFrame with Date, Price and Breakpoint columns
+            price_mode: One of COMPACT_PRICE_MODES
+
+        Returns:
+            CompactDataset: The same data in compact storage
+
+        Raises:
+            ValueError: If the prices or dates cannot be stored in the requested format
+        """
+        if price_mode not in COMPACT_PRICE_MODES:
+            raise ValueError(f"Unknown price mode '{price_mode}', expected one of {', '.join(COMPACT_PRICE_MODES)}")
+        if not pd.api.types.is_datetime64_ns_dtype(df['Date']):
+            raise ValueError("Date column must be datetime64[ns]")
+        epoch, date_unit, date_offsets = _date_encoding(df['Date'].to_numpy().view(np.int64))
+        breakpoints = df['Breakpoint'].to_numpy(dtype=bool)
+
+        # Multi-instrument Price repeats the first instrument: keep it once
+        aliases = {}
+        instruments = [column for column in df.columns if column.startswith(INSTRUMENT_PREFIX)]
+        if instruments and np.array_equal(df['Price'].to_numpy(), df[instruments[0]].to_numpy()):
+            aliases['Price'] = instruments[0]
+
+        arrays, decimals = {}, {}
+        max_price_error = 0.0
+        for column in df.columns:
+            if column in ('Date', 'Breakpoint') or column in aliases:
+                continue
+            values = df[column].to_numpy()
+            if is_price_column(column):
+                if price_mode == 'ticks':
+                    decimals[column] = tick_decimals(values)
+                    stored = np.rint(values.astype(np.float64) * 10.0 ** decimals[column]).astype(np.int32)
+                    decoded = stored / 10.0 ** decimals[column]
+                else:
+                    stored = values.astype(np.float32)
+                    decoded = stored.astype(np.float64)
+                if len(values):
+                    error = np.abs(decoded.astype(values.dtype).astype(np.float64) - values.astype(np.float64))
+                    max_price_error = max(max_price_error, float(error.max()))
+                arrays[column] = stored
+            elif column == 'Volume' and (len(values) == 0 or (values.min() >= 0 and values.max() <= INT32_MAX)):
+                arrays[column] = values.astype(np.int32)
+            else:
+                arrays[column] = values
+
+        return cls(
+            list(df.columns), {column: str(df[column].dtype) for column in df.columns}, arrays, decimals, aliases,
+            epoch, date_unit, date_offsets, np.packbits(breakpoints, bitorder='little'), len(df), price_mode,
+            get_dataset_key(df), int(df.memory_usage(index=True, deep=True).sum()), max_price_error
+        )
+
+    @property
+    def key(self) -> str:
+        """Dataset key of the expanded DataFrame (its prices may differ from the source's)"""
+        return f"{self.source_key}-{self.price_mode}"
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def attrs(self) -> Dict[str, str]:
+        """Dataset key for get_dataset_key(), like the attrs of the expanded DataFrame"""
+        return {'dataset_key': self.key}
+
+    @property
+    def iloc(self) -> '_RowIndexer':
+        """Rows by position, decoded: data.iloc[day] is one row, data.iloc[rows] a DataFrame"""
+        return _RowIndexer(self)
+
+    # Rows are labelled by position, like the RangeIndex of load_data()
+    loc = iloc
+
+    def __getitem__(self, key):
+        """A whole column as a Series (or columns as a DataFrame) in the standard dtypes"""
+        if isinstance(key, str):
+            return pd.Series(self.column(key).astype(self.dtypes[key], copy=False), name=key)
+        return self.rows(slice(None), key)
+
+    def _positions(self, rows) -> np.ndarray:
+        """Non-negative row positions of an index, a slice or an index array"""
+        if isinstance(rows, slice):
+            return np.arange(*rows.indices(self.length))
+        positions = np.asarray(rows, dtype=np.int64)
+        return np.where(positions < 0, positions + self.length, positions)
+
+    def take(self, name: str, rows) -> np.ndarray:
+        """
+        A column at some rows (a slice or an index array), decoded: prices as
+        float64, Volume as int64, dates as datetime64[ns], Breakpoint as bool.
+        """
+        if name == 'Date':
+            offsets = self.date_offsets[rows].astype(np.int64)
+            return (offsets * DATE_UNITS[self.date_unit] + self.epoch).view('datetime64[ns]')
+        if name == 'Breakpoint':
+            positions = self._positions(rows)
+            return (self.breakpoint_bits[positions >> 3] >> (positions & 7) & 1).astype(bool)
+        name = self.aliases.get(name, name)
+        if name not in self.arrays:
+            raise KeyError(name)
+        values = self.arrays[name][rows]
+        if name in self.decimals:
+            return values / 10.0 ** self.decimals[name]
+        if is_price_column(name):
+            return values.astype(np.float64)
+        if name == 'Volume':
+            return values.astype(np.int64)
+        return values
+
+    def column(self, name: str, start: Optional[int] = None, stop: Optional[int] = None) -> np.ndarray:
+        """Rows start..stop - 1 of a column, decoded like take()"""
+        return self.take(name, slice(start, stop))
+
+    def rows(self, rows, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Some rows of the standard DataFrame, decoding only those rows.
+
+        Args:
+            rows: A slice or an index array
+            columns: Columns to decode (all by default)
+
+        Returns:
+            pd.DataFrame: The rows, labelled by position
+        """
+        columns = self.columns if columns is None else list(columns)
+        index = pd.RangeIndex(*rows.indices(self.length)) if isinstance(rows, slice) else self._positions(rows)
+        return pd.DataFrame(
+            {column: self.take(column, rows).astype(self.dtypes[column], copy=False) for column in columns},
+            index=index
+        )
+
+    def row(self, day: int) -> pd.Series:
+        """One day's row, like DataFrame.iloc[day]"""
+        values = [self.take(column, [day]).astype(self.dtypes[column], copy=False)[0] for column in self.columns]
+        date = self.columns.index('Date')
+        values[date] = pd.Timestamp(values[date])
+        return pd.Series(values, index=self.columns, name=int(self._positions(day)), dtype=object)
+
+    def price(self, day: int, column: str = 'Price') -> float:
+        """Price of one day"""
+        return float(self.take(column, [day])[0])
+
+    def dates(self, start: Optional[int] = None, stop: Optional[int] = None) -> np.ndarray:
+        """Dates of rows start..stop - 1 as datetime64[ns]"""
+        return self.take('Date', slice(start, stop))
+
+    def date(self, day: int) -> pd.Timestamp:
+        """Date of one day"""
+        return pd.Timestamp(self.take('Date', [day])[0])
+
+    def breakpoint_mask(self, start: Optional[int] = None, stop: Optional[int] = None) -> np.ndarray:
+        """Breakpoint flags of rows start..stop - 1"""
+        return np.unpackbits(self.breakpoint_bits, count=self.length, bitorder='little')[start:stop].astype(bool)
+
+    def breakpoints(self) -> List[int]:
+        """Indices of the breakpoint days (like extract_breakpoints())"""
+        return np.flatnonzero(self.breakpoint_mask()).tolist()
+
+    def is_breakpoint(self, day: int) -> bool:
+        """Check whether a day is a breakpoint, from its bit alone"""
+        return bool(self.breakpoint_bits[day >> 3] >> (day & 7) & 1)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Expand to the standard DataFrame of load_data() (with its dataset key set).
+        """
+        df = self.rows(slice(None))
+        df.attrs['dataset_key'] = self.key
+        return df
+
+    @property
+    def nbytes(self) -> int:
+        """Memory of the stored arrays"""
+        return int(
+            sum(array.nbytes for array in self.arrays.values()) + self.date_offsets.nbytes + self.breakpoint_bits.nbytes
+        )
+
+    def memory_report(self, sessions: int = 1) -> MemoryReport:
+        """
+        Memory saved compared to the standard DataFrame.
+
+        Args:
+            sessions: Sessions holding the dataset
+
+        Returns:
+            MemoryReport: Standard and compact totals of the sessions
+        """
+        standard = sessions * self.full_bytes
+        saved = standard - sessions * self.nbytes
+        return MemoryReport(sessions, self.full_bytes, self.nbytes, saved,
+                            saved / standard * 100 if standard else 0.0, self.max_price_error)
+
+    def to_state(self) -> Dict:
+        """Export to plain data for serialization"""
+        return {
+            'format': 'compact',
+            'columns': self.columns,
+            'dtypes': self.dtypes,
+            'arrays': self.arrays,
+            'decimals': self.decimals,
+            'aliases': self.aliases,
+            'epoch': self.epoch,
+            'date_unit': self.date_unit,
+            'date_offsets': self.date_offsets,
+            'breakpoint_bits': self.breakpoint_bits,
+            'length': self.length,
+            'price_mode': self.price_mode,
+            'source_key': self.source_key,
+            'full_bytes': self.full_bytes,
+            'max_price_error': self.max_price_error
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'CompactDataset':
+        """Rebuild from to_state() output"""
+        return cls(**{name: value for name, value in state.items() if name != 'format'})
+
+class _RowIndexer:
+    """data.iloc / data.loc of a CompactDataset"""
+
+    def __init__(self, data: CompactDataset):
+        self.data = data
+
+    def __getitem__(self, key):
+        rows, column = key if isinstance(key, tuple) else (key, None)
+        if isinstance(rows, (int, np.integer)):
+            row = self.data.row(rows)
+            return row if column is None else row[column]
+        if column is None or not isinstance(column, str):
+            return self.data.rows(rows, column)
+        return self.data.rows(rows, [column])[column]
+
+def is_compact_state(state: Dict) -> bool:
+    """Check whether a serialized dataset is a CompactDataset (else an encoded DataFrame)"""
+    return state.get('format') == 'compact'
@@ -0,0 +1,191 @@
+"""
+Transaction costs: fees and execution prices away from the quoted Price.
+
+A CostModel combines four components, each zero by default:
+
+    fixed_fee       Flat fee per trade
+    commission_bps  Commission in basis points of the traded value
+    spread_bps      Bid/ask spread in basis points; buys pay half of it above
+                    the price and sells receive half of it below
+    slippage_coef   Market impact: the price moves slippage_coef * sqrt(quantity / volume)
+                    against the trade (only for data with a Volume column)
+
+Every function works on scalars and on arrays, so the same model prices one
+interactive trade in PnLCalculator.execute_trade and a whole trade log in
+one pass (replay_trade_costs).
+"""
+from typing import Dict, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+class CostModel(NamedTuple):
+    """Fee schedule and execution-price model"""
+    fixed_fee: float = 0.0
+    commission_bps: float = 0.0
+    spread_bps: float = 0.0
+    slippage_coef: float = 0.0
+
+    def execution_price(self, sides, quantities, prices, volumes=None):
+        """
+        Price a trade actually executes at.
+
+        Args:
+            sides: +1 for buys, -1 for sells
+            quantities: Number of shares
+            prices: Quoted prices
+            volumes: Traded volume of the day (None: no market impact)
+        """
+        sides = np.asarray(sides, dtype=np.float64)
+        prices = np.asarray(prices, dtype=np.float64)
+        adjustment = self.spread_bps / 2e4
+        if self.slippage_coef and volumes is not None:
+            volumes = np.asarray(volumes, dtype=np.float64)
+            quantities = np.asarray(quantities, dtype=np.float64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                participation = np.where(volumes > 0, quantities / volumes, 0.0)
+            adjustment = adjustment + self.slippage_coef * np.sqrt(participation)
+        return prices * (1 + sides * adjustment)
+
+    def fee(self, quantities, execution_prices):
+        """Fees charged on trades of quantities shares at execution_prices"""
+        quantities = np.asarray(quantities, dtype=np.float64)
+        notional = quantities * np.asarray(execution_prices, dtype=np.float64)
+        return np.where(quantities > 0, self.fixed_fee, 0.0) + notional * self.commission_bps / 1e4
+
+    def is_free(self) -> bool:
+        """Check whether the model charges nothing"""
+        return not any(self)
+
+NO_COSTS = CostModel()
+
+# Fee schedules offered in the admin panel
+COST_PRESETS = {
+    'none': NO_COSTS,
+    'discount_broker': CostModel(fixed_fee=1.0, commission_bps=0.0, spread_bps=2.0),
+    'retail': CostModel(fixed_fee=4.95, commission_bps=5.0, spread_bps=10.0, slippage_coef=0.1),
+    'institutional': CostModel(fixed_fee=0.0, commission_bps=1.0, spread_bps=2.0, slippage_coef=0.5)
+}
+
+COST_PRESET_LABELS = {
+    'none': "No Costs",
+    'discount_broker': "Discount Broker",
+    'retail': "Retail",
+    'institutional': "Institutional"
+}
+
+# Rounding slack (in currency units) when checking re-priced cash against zero
+CASH_TOLERANCE = 1e-6
+
+# Trade actions by the side they trade on
+TRADE_SIDES = {'buy': 1, 'cover': 1, 'sell': -1}
+
+def day_volume(df: pd.DataFrame, day_index: int, instrument: int = 0) -> Optional[float]:
+    """
+    Volume traded on a day, or None when the data has no Volume column.
+
+    The Volume column belongs to the first instrument of multi-instrument data.
+    """
+    if 'Volume' not in df.columns or instrument != 0:
+        return None
+    return float(df.iloc[day_index]['Volume'])
+
+def trade_cash_flows(sides, quantities, prices, volumes, cost_model: CostModel) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Price each trade of a trade log under a cost model with array operations.
+
+    Args:
+        sides: +1 for buys, -1 for sells (0 for entries that are not trades)
+        quantities: Number of shares
+        prices: Quoted prices
+        volumes: Day volumes (NaN where unknown)
+        cost_model: Cost model to apply
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (cash change, fee) per trade
+    """
+    sides = np.asarray(sides, dtype=np.float64)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    volumes = np.asarray(volumes, dtype=np.float64)
+    fills = cost_model.execution_price(sides, quantities, prices, np.where(np.isnan(volumes), 0.0, volumes))
+    fees = np.where(sides != 0, cost_model.fee(quantities, fills), 0.0)
+    return -sides * quantities * fills - fees, fees
+
+def replay_trade_costs(player_index, sides, quantities, prices, volumes, cost_model: CostModel,
+                       num_players: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Price a whole trade log under a cost model with array operations.
+
+    Args:
+        player_index: Row of each trade's player (0 .. num_players - 1)
+        sides: +1 for buys, -1 for sells (0 for entries that are not trades)
+        quantities: Number of shares
+        prices: Quoted prices
+        volumes: Day volumes (NaN where unknown)
+        cost_model: Cost model to apply
+        num_players: Number of players
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (cash change, fees paid) per player
+    """
+    cash_flows, fees = trade_cash_flows(sides, quantities, prices, volumes, cost_model)
+    return (
+        np.bincount(player_index, weights=cash_flows, minlength=num_players),
+        np.bincount(player_index, weights=fees, minlength=num_players)
+    )
+
+def apply_cost_model(portfolios: Dict, cost_model: CostModel, journal=None) -> int:
+    """
+    Switch every portfolio to a new cost model, re-pricing all past trades.
+
+    Calculators keep the quoted price and volume of every trade as arrays
+    (PnLCalculator.trade_columns), so the trade logs of all players are
+    priced in one pass and each player's cash
+    is set to its starting cash plus the re-priced cash flows; positions do
+    not change. Journal snapshots taken under the old model are dropped so
+    rewinds replay trades with the new one. Recorded valuation history is
+    kept as it was.
+
+    A player without short selling could only buy with the cash on hand, so
+    the switch is rejected when any of their re-priced buys would not have
+    been affordable; nothing is changed then.
+
+    Args:
+        portfolios: Player portfolios
+        cost_model: New cost model
+        journal: Optional TradeJournal of the portfolios
+
+    Returns:
+        int: Number of trades re-priced
+
+    Raises:
+        ValueError: If a long-only player's cash would go negative, naming the players
+    """
+    player_nums = list(portfolios)
+    calculators = [portfolios[player_num]['pnl_calculator'] for player_num in player_nums]
+    logs = [calc.trade_columns() for calc in calculators]
+    sides, quantities, prices, volumes = np.concatenate(logs, axis=1) if logs else np.empty((4, 0))
+    trade_flows, _ = trade_cash_flows(sides, quantities, prices, volumes, cost_model)
+    trade_counts = [log.shape[1] for log in logs]
+    cash_flows = np.bincount(np.repeat(np.arange(len(calculators)), trade_counts),
+                             weights=trade_flows, minlength=len(calculators))
+
+    unaffordable = []
+    offsets = np.cumsum([0] + trade_counts)
+    for player_num, calc, start, end in zip(player_nums, calculators, offsets[:-1], offsets[1:]):
+        # Cash after each of the player's trades, in trade order
+        if calc.margin_requirement is None and end > start \
+                and calc.initial_cash + np.cumsum(trade_flows[start:end]).min() < -CASH_TOLERANCE:
+            unaffordable.append(player_num)
+    if unaffordable:
+        raise ValueError(
+            "Player(s) " + ", ".join(str(player_num) for player_num in unaffordable)
+            + " could not have afforded their trades under the new fee schedule"
+        )
+
+    for player_num, calc, cash_flow in zip(player_nums, calculators, cash_flows):
+        calc.cost_model = cost_model
+        calc.cash = calc.initial_cash + float(cash_flow)
+        portfolios[player_num]['cash'] = calc.cash
+    if journal is not None:
+        journal.drop_snapshots()
+    return len(sides)
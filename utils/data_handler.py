@@ -1,13 +1,85 @@
+import numpy as np
 import pandas as pd
 from typing import List, Tuple, Union
 import os
+import hashlib
+from utils.breakpoint_detector import DEFAULT_BREAKPOINT_METHOD, detect_breakpoints
+from utils.instruments import INSTRUMENT_PREFIX
 
-def load_data(file: Union[str, any]) -> pd.DataFrame:
+# Optional OHLCV columns and the compact dtypes they are stored with. When a
+# Close column is present it becomes the Price column used for valuation.
+OHLCV_COLUMNS = {
+    'Open': 'float32',
+    'High': 'float32',
+    'Low': 'float32',
+    'Close': 'float64',
+    'Volume': 'int64'
+}
+
+def process_ohlcv_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert optional OHLCV columns to compact dtypes and derive Price from Close.
+    
+    Args:
+        df: DataFrame with price data
+        
+    Returns:
+        pd.DataFrame: DataFrame with Price (from Close when given) and compact OHLCV columns
+    """
+    for column, dtype in OHLCV_COLUMNS.items():
+        if column in df.columns:
+            values = pd.to_numeric(df[column], errors='coerce')
+            if values.isna().any():
+                raise ValueError(f"{column} column contains invalid numeric values")
+            df[column] = values.astype(dtype)
+    
+    if 'Close' in df.columns:
+        # Valuation uses the close; keep it once, as the Price column
+        df['Price'] = df.pop('Close')
+    return df
+
+def process_instrument_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Validate the Price_<TICKER> columns of multi-instrument data and derive Price from the first.
+    
+    Args:
+        df: DataFrame with price data
+        
+    Returns:
+        pd.DataFrame: DataFrame with float64 instrument columns and Price set to the first instrument
+    """
+    columns = [column for column in df.columns if column.startswith(INSTRUMENT_PREFIX)]
+    if not columns:
+        return df
+    if 'Price' in df.columns or 'Close' in df.columns:
+        raise ValueError(f"Multi-instrument data takes {INSTRUMENT_PREFIX}<TICKER> columns instead of Price or Close")
+    for column in columns:
+        values = pd.to_numeric(df[column], errors='coerce')
+        if values.isna().any():
+            raise ValueError(f"{column} column contains invalid numeric values")
+        df[column] = values.astype('float64')
+    df['Price'] = df[columns[0]]
+    return df
+
+def has_ohlc(df: pd.DataFrame) -> bool:
+    """
+    Check whether a dataset carries Open/High/Low bars in addition to Price.
+    
+    Args:
+        df: DataFrame with price data
+        
+    Returns:
+        bool: True if Open, High and Low columns are present
+    """
+    return all(col in df.columns for col in ('Open', 'High', 'Low'))
+
+def load_data(file: Union[str, any], breakpoint_method: str = DEFAULT_BREAKPOINT_METHOD) -> pd.DataFrame:
     """
     Load and validate CSV data from file path or uploaded file.
     
     Args:
         file: File path (string) or uploaded file object
+        breakpoint_method: Detection method used when the file has no Breakpoint column
         
     Returns:
         pd.DataFrame: Processed DataFrame with validated data
@@ -21,10 +93,10 @@ def load_data(file: Union[str, any]) -> pd.DataFrame:
             # Uploaded file object
             df = pd.read_csv(file)
         
-        # Validate required columns
-        required_columns = ['Date', 'Price', 'Breakpoint']
-        if not all(col in df.columns for col in required_columns):
-            raise ValueError("CSV must contain Date, Price, and Breakpoint columns")
+        # Validate required columns (Close or Price_<TICKER> columns can stand in for Price)
+        has_instruments = any(column.startswith(INSTRUMENT_PREFIX) for column in df.columns)
+        if 'Date' not in df.columns or not ('Price' in df.columns or 'Close' in df.columns or has_instruments):
+            raise ValueError(f"CSV must contain Date and Price (or Close, or {INSTRUMENT_PREFIX}<TICKER>) columns")
         
         # Convert date column to datetime
         df['Date'] = pd.to_datetime(df['Date'])
@@ -32,6 +104,12 @@ def load_data(file: Union[str, any]) -> pd.DataFrame:
         # Sort by date
         df = df.sort_values('Date').reset_index(drop=True)
         
+        # Optional OHLCV columns; Close replaces Price
+        df = process_ohlcv_columns(df)
+        
+        # Several instruments: Price follows the first one
+        df = process_instrument_columns(df)
+        
         # Validate price data
         if not df['Price'].dtype in ['float64', 'int64']:
             df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
@@ -40,8 +118,11 @@ def load_data(file: Union[str, any]) -> pd.DataFrame:
         if df['Price'].isna().any():
             raise ValueError("Price column contains invalid numeric values")
         
-        # Validate breakpoint data
-        df['Breakpoint'] = df['Breakpoint'].astype(bool)
+        # Validate breakpoint data, detecting decision points when none are marked
+        if 'Breakpoint' in df.columns:
+            df['Breakpoint'] = df['Breakpoint'].astype(bool)
+        else:
+            df['Breakpoint'] = detect_breakpoints(df['Price'].to_numpy(), breakpoint_method)
         
         return df
     
@@ -58,7 +139,7 @@ def extract_breakpoints(df: pd.DataFrame) -> List[int]:
     Returns:
         List[int]: List of indices where breakpoints occur
     """
-    return df[df['Breakpoint']].index.tolist()
+    return np.flatnonzero(df['Breakpoint'].to_numpy(dtype=bool)).tolist()
 
 def mask_future_data(df: pd.DataFrame, current_day_index: int) -> pd.DataFrame:
     """
@@ -74,3 +155,22 @@ def mask_future_data(df: pd.DataFrame, current_day_index: int) -> pd.DataFrame:
     masked_df = df.copy()
     masked_df.loc[current_day_index + 1:, 'Price'] = None
     return masked_df
+
+def get_dataset_key(df: pd.DataFrame) -> str:
+    """
+    Get a content fingerprint for a dataset, used to key per-dataset caches.
+
+    The key is computed once and remembered in df.attrs.
+    
+    Args:
+        df: DataFrame with price data
+        
+    Returns:
+        str: Hex digest identifying the dataset contents
+    """
+    key = df.attrs.get('dataset_key')
+    if key is None:
+        hashed = pd.util.hash_pandas_object(df, index=False).values
+        key = f"{len(df)}-{hashlib.sha1(hashed.tobytes()).hexdigest()[:16]}"
+        df.attrs['dataset_key'] = key
+    return key
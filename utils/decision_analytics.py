@@ -0,0 +1,171 @@
+"""
+Per-decision scoring of every player's trades against what the market did next.
+
+Each breakpoint opens a segment that runs to the next breakpoint. For every
+player and segment, from the trade logs and the price matrix alone:
+
+    actual P&L   Mark-to-market gain over the segment of the position held
+                 into it plus the trades made in it (before fees)
+    best P&L     Gain of the best single action at the breakpoint: the
+                 player's whole wealth in the instrument that rose most, the
+                 largest short the margin requirement allows (wealth / margin)
+                 in the one that fell most when shorting is enabled, or cash
+    regret       best - actual
+    timing       Return of the segment's moves in the direction the player
+                 traded (net shares bought or sold), in %; NaN without trades
+    sizing       actual / best: the share of the available gain captured;
+                 NaN when nothing could be gained
+
+All trades of all players are flattened into arrays once and binned by
+(player, segment, instrument), so the cost is a handful of array passes
+however many players and breakpoints there are.
+"""
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import numpy as np
+import pandas as pd
+from utils.cost_models import TRADE_SIDES
+
+class TradeLog(NamedTuple):
+    """Trades of every player as parallel arrays"""
+    player: np.ndarray
+    day: np.ndarray
+    side: np.ndarray
+    quantity: np.ndarray
+    price: np.ndarray
+    instrument: np.ndarray
+
+class DecisionAnalytics(NamedTuple):
+    """Scores of every (player, decision) pair, as players x decisions arrays"""
+    days: np.ndarray
+    actual_pnl: np.ndarray
+    best_pnl: np.ndarray
+    regret: np.ndarray
+    timing: np.ndarray
+    sizing: np.ndarray
+    traded: np.ndarray
+
+def trade_log_arrays(portfolios: Dict, dates: pd.Series) -> TradeLog:
+    """
+    Flatten the trading histories of all players into arrays.
+
+    Args:
+        portfolios: Player portfolios (players are numbered from 1)
+        dates: Date of every day of the dataset, to locate the trades
+
+    Returns:
+        TradeLog: One entry per trade (holds are skipped); player is 0-based
+    """
+    rows = [
+        (player_num - 1, trade['date'], TRADE_SIDES[trade['action']], trade['quantity'], trade['price'],
+         trade.get('instrument', 0))
+        for player_num, portfolio in portfolios.items()
+        for trade in portfolio['trading_history']
+        if trade['action'] in TRADE_SIDES and trade['quantity']
+    ]
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return TradeLog(empty, empty, empty, empty, np.empty(0), empty)
+    player, trade_dates, side, quantity, price, instrument = zip(*rows)
+    stamps = np.fromiter((pd.Timestamp(date).value for date in trade_dates), dtype=np.int64, count=len(trade_dates))
+    day = np.searchsorted(np.asarray(dates, dtype='datetime64[ns]'), stamps.view('datetime64[ns]'))
+    return TradeLog(
+        np.asarray(player, dtype=np.int64), day.astype(np.int64), np.asarray(side, dtype=np.int64),
+        np.asarray(quantity, dtype=np.int64), np.asarray(price, dtype=np.float64),
+        np.asarray(instrument, dtype=np.int64)
+    )
+
+def decision_analytics(prices: np.ndarray, decision_days: Sequence[int], end_day: int, trades: TradeLog,
+                       num_players: int, initial_cash: float,
+                       margin_requirement: Optional[float] = None) -> DecisionAnalytics:
+    """
+    Score every player's decisions at every breakpoint.
+
+    Args:
+        prices: Days x instruments price matrix
+        decision_days: Sorted breakpoint days to score (at most end_day)
+        end_day: Last day of the last segment (e.g. the current day, so
+            nothing after it is looked at)
+        trades: Trade logs from trade_log_arrays()
+        num_players: Number of players
+        initial_cash: Starting cash of every player
+        margin_requirement: Margin requirement for short positions (None: long only)
+
+    Returns:
+        DecisionAnalytics: players x decisions arrays
+    """
+    days = np.asarray(decision_days, dtype=np.int64)
+    num_decisions, num_instruments = len(days), prices.shape[1]
+    if num_decisions == 0:
+        empty = np.empty((num_players, 0))
+        return DecisionAnalytics(days, empty, empty, empty, empty, empty, empty.astype(bool))
+    ends = np.append(days[1:], end_day)
+    start_prices, end_prices = prices[days], prices[ends]
+
+    # Segment of every trade (trades on a breakpoint belong to the segment it opens)
+    segment = np.clip(np.searchsorted(days, trades.day, side='right') - 1, 0, num_decisions - 1)
+    cell = trades.player * num_decisions + segment
+    signed = (trades.side * trades.quantity).astype(np.float64)
+    size = num_players * num_decisions
+
+    # Net shares traded per (player, segment, instrument) and the positions held into each segment
+    net_shares = np.bincount(cell * num_instruments + trades.instrument, weights=signed,
+                             minlength=size * num_instruments).reshape(num_players, num_decisions, num_instruments)
+    positions = np.cumsum(net_shares, axis=1) - net_shares
+    spent = np.bincount(cell, weights=signed * trades.price, minlength=size).reshape(num_players, num_decisions)
+    cash = initial_cash - (np.cumsum(spent, axis=1) - spent)
+    wealth = cash + np.einsum('pdi,di->pd', positions, start_prices)
+
+    moves = end_prices - start_prices
+    trade_gains = signed * (end_prices[segment, trades.instrument] - trades.price)
+    actual = np.einsum('pdi,di->pd', positions, moves) + np.bincount(cell, weights=trade_gains, minlength=size).reshape(
+        num_players, num_decisions
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = np.where(start_prices > 0, end_prices / start_prices - 1, 0.0)
+    best_growth = np.maximum(growth.max(axis=1), 0.0)
+    if margin_requirement:
+        # A short of wealth / margin in the instrument that fell most
+        best_growth = np.maximum(best_growth, -growth.min(axis=1) / margin_requirement)
+    best = np.maximum(wealth, 0.0) * best_growth
+
+    traded_value = np.einsum('pdi,di->pd', np.abs(net_shares), start_prices)
+    traded = traded_value > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        timing = np.where(traded, np.einsum('pdi,di->pd', net_shares, moves) / traded_value * 100, np.nan)
+        sizing = np.where(best > 0, actual / best, np.nan)
+    return DecisionAnalytics(days, actual, best, best - actual, timing, sizing, traded)
+
+def decision_table(analytics: DecisionAnalytics, player_names: Dict[int, str], dates: pd.Series) -> pd.DataFrame:
+    """
+    One row per (player, decision) with its scores.
+    """
+    num_players, num_decisions = analytics.regret.shape
+    return pd.DataFrame({
+        'Player': np.repeat([player_names[player_num] for player_num in range(1, num_players + 1)], num_decisions),
+        'Breakpoint': np.tile(np.arange(1, num_decisions + 1), num_players),
+        'Date': np.tile(dates.iloc[analytics.days].to_numpy(), num_players),
+        'Traded': analytics.traded.ravel(),
+        'Actual PnL': analytics.actual_pnl.ravel(),
+        'Best PnL': analytics.best_pnl.ravel(),
+        'Regret': analytics.regret.ravel(),
+        'Timing %': analytics.timing.ravel(),
+        'Sizing %': analytics.sizing.ravel() * 100
+    })
+
+def player_summary(analytics: DecisionAnalytics, player_names: Dict[int, str]) -> List[Dict]:
+    """
+    Totals per player: regret, mean timing of the decisions that traded, and
+    the share of the best gains captured over all decisions.
+    """
+    rows = []
+    best_total = analytics.best_pnl.sum(axis=1)
+    for row, player_num in enumerate(range(1, analytics.regret.shape[0] + 1)):
+        timing = analytics.timing[row][analytics.traded[row]]
+        rows.append({
+            'Player': player_names[player_num],
+            'Total Regret': float(analytics.regret[row].sum()),
+            'Decisions Traded': int(analytics.traded[row].sum()),
+            'Mean Timing %': float(timing.mean()) if len(timing) else np.nan,
+            'Gain Captured %': float(analytics.actual_pnl[row].sum() / best_total[row] * 100) if best_total[row] > 0 else np.nan
+        })
+    return rows
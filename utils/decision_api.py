@@ -0,0 +1,351 @@
+"""
+Asyncio HTTP/WebSocket API for bot and remote players of shared game rooms.
+
+Endpoints (JSON):
+    POST /rooms/<room>/join        {"name": "bot-1"} -> {"player_num": 5, "session_id": "api-..."}
+    GET  /rooms/<room>/state       ?session_id=api-... -> room state plus the session's seat (cash,
+                                   positions and resting orders)
+    POST /rooms/<room>/decisions   {"session_id": "api-...", "decisions": [{"action": "buy", "quantity": 3}, ...]}
+                                   (resting orders: "action": "limit_buy" | "limit_sell" | "stop_loss" |
+                                   "take_profit" with a trigger "price"; multi-instrument data:
+                                   "instrument": ticker or index, default the first)
+                                   -> {"results": [null | "error message", ...]}
+    WS   /rooms/<room>/ws          [?session_id=...] pushes {"type": "state", ...} whenever the room reaches or
+                                   leaves a breakpoint; accepts {"type": "decisions", "id": ...,
+                                   "session_id": ..., "decisions": [...]} and answers
+                                   {"type": "results", "id": ..., ...}
+
+The session_id returned by /join is the bot's credential: decisions are
+only accepted for the seat that session holds (a decision's optional
+"player" must be that seat), so a client can never trade for another
+player, human or bot, nor read another seat's cash, positions or resting
+orders through /state. Sessions are only issued by /join; passing an
+earlier session_id to /join returns the same seat. In rooms with a member
+timeout, a bot keeps its membership by sending decisions or by staying
+connected to the WebSocket with its session_id.
+
+Decisions are staged with GameRoom.stage_batch, which validates every order
+exactly like PnLCalculator.execute_trade (sells beyond holdings open a short
+when the room allows short selling); decisions at the last day's breakpoint
+are applied immediately, as the clock cannot resume past it. At most max_pending_batches batches
+are queued for the room; beyond that HTTP clients get 429 and WebSocket
+clients a "busy" error, and should retry.
+
+Usage:
+    python -m utils.decision_api data/SAMPLE_SWINGS.csv [--room main] [--port 8765]
+"""
+import argparse
+import asyncio
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+import tornado.web
+import tornado.websocket
+from utils.game_room import GameRoom, RoomRegistry
+from utils.cost_models import CostModel, COST_PRESETS
+
+DEFAULT_API_PORT = 8765
+
+# Decision batches waiting for a room before new ones are refused
+MAX_PENDING_BATCHES = 256
+
+# Largest batch accepted in one request or message
+MAX_BATCH_SIZE = 1000
+
+# Seconds a room watcher waits for a room update per poll
+WATCH_TIMEOUT_SEC = 1.0
+
+# Prefix of the session ids issued by /join (browser sessions cannot be claimed over the API)
+API_SESSION_PREFIX = 'api-'
+
+class DecisionAPI:
+    """
+    Serves the rooms of a RoomRegistry to bots over HTTP and WebSocket.
+
+    One asyncio event loop handles every connection. Decision batches are
+    applied on a single worker thread, so the event loop never waits on a
+    room lock, and one watcher task per room fans breakpoint events out to
+    that room's WebSocket subscribers.
+    """
+
+    def __init__(self, registry: RoomRegistry, max_pending_batches: int = MAX_PENDING_BATCHES):
+        self.registry = registry
+        self.max_pending_batches = max_pending_batches
+        self.pending_batches = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='decision-api')
+        self._subscribers: Dict[str, Set['RoomSocketHandler']] = {}
+        self._watchers: Dict[str, asyncio.Task] = {}
+
+    def make_app(self) -> tornado.web.Application:
+        """Build the tornado application"""
+        return tornado.web.Application([
+            (r'/rooms/([^/]+)/join', JoinHandler, dict(api=self)),
+            (r'/rooms/([^/]+)/state', StateHandler, dict(api=self)),
+            (r'/rooms/([^/]+)/decisions', DecisionsHandler, dict(api=self)),
+            (r'/rooms/([^/]+)/ws', RoomSocketHandler, dict(api=self)),
+        ])
+
+    async def submit(self, room: GameRoom, player_num: int, decisions: List[Dict]) -> Optional[List[Optional[str]]]:
+        """
+        Validate and stage a batch of decisions for one seat.
+
+        Args:
+            room: Room to trade in
+            player_num: Seat of the session that sent the batch
+            decisions: Decision dicts; one naming another seat is rejected
+
+        Returns:
+            Optional[List[Optional[str]]]: Per-decision errors, or None when the
+            server is saturated and the batch was not accepted
+        """
+        if self.pending_batches >= self.max_pending_batches:
+            return None
+        results: List[Optional[str]] = []
+        orders, positions = [], []
+        for decision in decisions[:MAX_BATCH_SIZE]:
+            try:
+                price = decision.get('price')
+                instrument = decision.get('instrument', 0)
+                order = (
+                    int(decision.get('player', player_num)), str(decision['action']).lower(),
+                    int(decision.get('quantity', 0)), None if price is None else float(price),
+                    instrument if isinstance(instrument, str) else int(instrument)
+                )
+            except (AttributeError, KeyError, TypeError, ValueError):
+                results.append("Invalid decision")
+                continue
+            if order[0] != player_num:
+                results.append("Decisions are only accepted for your own seat")
+                continue
+            positions.append(len(results))
+            results.append(None)
+            orders.append(order)
+        if orders:
+            self.pending_batches += 1
+            try:
+                staged = await asyncio.get_running_loop().run_in_executor(self._executor, room.stage_batch, orders)
+            finally:
+                self.pending_batches -= 1
+            for position, error in zip(positions, staged):
+                results[position] = error
+        if len(decisions) > MAX_BATCH_SIZE:
+            results += [f"Batches are limited to {MAX_BATCH_SIZE} decisions"] * (len(decisions) - MAX_BATCH_SIZE)
+        return results
+
+    def subscribe(self, room_id: str, handler: 'RoomSocketHandler') -> None:
+        """Add a WebSocket subscriber and make sure the room is being watched"""
+        self._subscribers.setdefault(room_id, set()).add(handler)
+        if room_id not in self._watchers or self._watchers[room_id].done():
+            self._watchers[room_id] = asyncio.get_running_loop().create_task(self._watch_room(room_id))
+
+    def unsubscribe(self, room_id: str, handler: 'RoomSocketHandler') -> None:
+        """Remove a WebSocket subscriber"""
+        self._subscribers.get(room_id, set()).discard(handler)
+
+    async def _watch_room(self, room_id: str) -> None:
+        """Broadcast the room's state whenever it reaches or leaves a breakpoint"""
+        loop = asyncio.get_running_loop()
+        version = -1
+        last_phase = None
+        while self._subscribers.get(room_id):
+            room = self.registry.get(room_id)
+            if room is None:
+                for handler in list(self._subscribers.pop(room_id, ())):
+                    handler.close()
+                return
+            # Connected bots count as present in the room
+            for handler in list(self._subscribers.get(room_id, ())):
+                if handler.session_id is not None:
+                    room.touch(handler.session_id)
+            version = await loop.run_in_executor(None, room.wait_for_update, version, WATCH_TIMEOUT_SEC)
+            state = room.public_state()
+            if state['finished']:
+                phase = ('finished', state['day_index'])
+            elif state['waiting_for_trade']:
+                phase = ('breakpoint', state['day_index'])
+            else:
+                # Plain ticks between breakpoints are not pushed to bots
+                phase = ('running' if state['running'] else 'paused', None)
+            if phase == last_phase:
+                continue
+            last_phase = phase
+            message = json.dumps({'type': 'state', **state})
+            for handler in list(self._subscribers.get(room_id, ())):
+                handler.send_latest(message)
+
+    async def serve(self, port: int = DEFAULT_API_PORT, address: str = '127.0.0.1') -> None:
+        """Serve forever on the running event loop"""
+        self.make_app().listen(port, address=address)
+        await asyncio.Event().wait()
+
+    def start_in_thread(self, port: int = DEFAULT_API_PORT, address: str = '127.0.0.1') -> threading.Thread:
+        """Serve on a daemon thread with its own event loop (e.g. next to the Streamlit app)"""
+        thread = threading.Thread(target=lambda: asyncio.run(self.serve(port, address)), daemon=True)
+        thread.start()
+        return thread
+
+class _RoomHandler(tornado.web.RequestHandler):
+    def initialize(self, api: DecisionAPI):
+        self.api = api
+
+    def get_room(self, room_id: str) -> GameRoom:
+        room = self.api.registry.get(room_id)
+        if room is None:
+            raise tornado.web.HTTPError(404, reason="Unknown room")
+        return room
+
+    def get_seat(self, room: GameRoom, session_id) -> int:
+        """Seat of a session that joined as a player (403 otherwise); counts as its heartbeat"""
+        player_num = room.seat_of(session_id) if isinstance(session_id, str) else None
+        if player_num is None:
+            raise tornado.web.HTTPError(403, reason="Unknown session or not a player seat")
+        room.touch(session_id)
+        return player_num
+
+    def read_json(self) -> Dict:
+        try:
+            body = json.loads(self.request.body or b'{}')
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Body must be JSON")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="Body must be a JSON object")
+        return body
+
+class JoinHandler(_RoomHandler):
+    def post(self, room_id: str):
+        room = self.get_room(room_id)
+        body = self.read_json()
+        session_id = body.get('session_id')
+        if not (isinstance(session_id, str) and session_id.startswith(API_SESSION_PREFIX)):
+            session_id = f"{API_SESSION_PREFIX}{uuid.uuid4().hex}"
+        player_num = room.join(session_id, str(body.get('name', '')), as_player=True)
+        if player_num is None:
+            raise tornado.web.HTTPError(409, reason="No free player seats")
+        self.write({'player_num': player_num, 'session_id': session_id})
+
+class StateHandler(_RoomHandler):
+    def get(self, room_id: str):
+        room = self.get_room(room_id)
+        self.write(room.public_state(self.get_seat(room, self.get_query_argument('session_id', None))))
+
+class DecisionsHandler(_RoomHandler):
+    async def post(self, room_id: str):
+        room = self.get_room(room_id)
+        body = self.read_json()
+        decisions = body.get('decisions', [])
+        if not isinstance(decisions, list):
+            raise tornado.web.HTTPError(400, reason="'decisions' must be a list")
+        results = await self.api.submit(room, self.get_seat(room, body.get('session_id')), decisions)
+        if results is None:
+            self.set_status(429)
+            self.set_header('Retry-After', '1')
+            self.write({'error': "Too many pending decisions"})
+            return
+        self.write({'results': results})
+
+class RoomSocketHandler(tornado.websocket.WebSocketHandler):
+    def initialize(self, api: DecisionAPI):
+        self.api = api
+        self.room_id = None
+        self.session_id = None
+        self._sending = None
+        self._latest = None
+
+    def open(self, room_id: str):
+        if self.api.registry.get(room_id) is None:
+            self.close(code=4404, reason="Unknown room")
+            return
+        self.room_id = room_id
+        self.session_id = self.get_query_argument('session_id', None)
+        self.api.subscribe(room_id, self)
+        self.send_latest(json.dumps({'type': 'state', **self.api.registry.get(room_id).public_state()}))
+
+    def send_latest(self, message: str) -> None:
+        """
+        Send a state message, conflating with any unsent one.
+
+        State messages are full snapshots, so a slow client that is still
+        flushing only ever receives the newest one instead of a growing backlog.
+        """
+        if self._sending is not None and not self._sending.done():
+            self._latest = message
+            return
+        try:
+            self._sending = self.write_message(message)
+        except tornado.websocket.WebSocketClosedError:
+            return
+        self._sending.add_done_callback(self._flush_latest)
+
+    def _flush_latest(self, _future) -> None:
+        if self._latest is not None:
+            message, self._latest = self._latest, None
+            self.send_latest(message)
+
+    async def on_message(self, message):
+        try:
+            body = json.loads(message)
+        except ValueError:
+            await self.write_message({'type': 'error', 'error': "Messages must be JSON"})
+            return
+        room = self.api.registry.get(self.room_id)
+        if room is None or body.get('type') != 'decisions' or not isinstance(body.get('decisions'), list):
+            await self.write_message({'type': 'error', 'id': body.get('id'), 'error': "Expected a decisions message"})
+            return
+        session_id = body.get('session_id')
+        player_num = room.seat_of(session_id) if isinstance(session_id, str) else None
+        if player_num is None:
+            await self.write_message({'type': 'error', 'id': body.get('id'), 'error': "Unknown session or not a player seat"})
+            return
+        room.touch(session_id)
+        results = await self.api.submit(room, player_num, body['decisions'])
+        if results is None:
+            await self.write_message({'type': 'error', 'id': body.get('id'), 'error': "busy"})
+            return
+        await self.write_message({'type': 'results', 'id': body.get('id'), 'results': results})
+
+    def on_close(self):
+        if self.room_id is not None:
+            self.api.unsubscribe(self.room_id, self)
+
+def create_headless_room(room_id: str, df, starting_cash: float = 10000, time_to_run_sec: float = 10,
+                         max_players: int = 1000, decision_timeout_sec: Optional[float] = 5.0,
+                         margin_requirement: Optional[float] = None, cost_model: Optional[CostModel] = None) -> GameRoom:
+    """Create a room without chart frames, for bots only"""
+    return GameRoom(
+        room_id, df, starting_cash, time_to_run_sec,
+        lambda day_index: {'price': df.iloc[day_index]['Price']},
+        max_players=max_players,
+        decision_timeout_sec=decision_timeout_sec,
+        margin_requirement=margin_requirement,
+        cost_model=cost_model
+    )
+
+def main():
+    from utils.data_handler import load_data
+
+    parser = argparse.ArgumentParser(description="Serve a bot-only game room")
+    parser.add_argument('dataset', help="CSV file in the simulator's data format")
+    parser.add_argument('--room', default='main')
+    parser.add_argument('--port', type=int, default=DEFAULT_API_PORT)
+    parser.add_argument('--decision-timeout', type=float, default=5.0,
+                        help="Seconds bots get at each breakpoint before the clock resumes")
+    parser.add_argument('--margin', type=float, default=None,
+                        help="Margin requirement for short selling, e.g. 0.5 (shorting is off without it)")
+    parser.add_argument('--costs', choices=list(COST_PRESETS), default='none',
+                        help="Fee schedule charged on every trade")
+    args = parser.parse_args()
+
+    registry = RoomRegistry()
+    df = load_data(args.dataset)
+    room = registry.get_or_create(args.room, lambda: create_headless_room(
+        args.room, df, decision_timeout_sec=args.decision_timeout, margin_requirement=args.margin,
+        cost_model=COST_PRESETS[args.costs]
+    ))
+    room.start()
+    print(f"Serving room '{args.room}' on http://127.0.0.1:{args.port}/rooms/{args.room}/")
+    asyncio.run(DecisionAPI(registry).serve(args.port))
+
+if __name__ == '__main__':
+    main()
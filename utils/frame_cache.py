@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Upper bound on chart points held in a session's frame cache (frames x points per frame)
+MAX_CACHED_POINTS = 5_000_000
+
+class FramePrecomputer:
+    """
+    Precomputes simulation frames on a background thread while the simulation is paused.
+
+    Frames for the days up to (and including) the next breakpoint are built ahead
+    of time and held in a bounded cache. The worker blocks when the cache is full
+    and resumes as frames are consumed, so memory stays bounded for long series.
+    Everything is thrown away when the settings key changes.
+    """
+
+    def __init__(self, max_cached_points: int = MAX_CACHED_POINTS):
+        self.max_cached_points = max_cached_points
+        self._frames: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._settings_key: Optional[Hashable] = None
+        self._target_index = -1
+        self._consumed_index = -1
+        self._max_frames = 1
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # Last frame taken, for the rerun that redraws the same day (e.g. on reaching a breakpoint)
+        self._last: Optional[Tuple[int, Dict[str, Any]]] = None
+
+    def start(self, settings_key: Hashable, start_index: int, target_index: int,
+              points_per_frame: int, build_frame: Callable[[int], Dict[str, Any]]) -> None:
+        """
+        Start (or keep) precomputing frames for days start_index..target_index.
+
+        Args:
+            settings_key: Fingerprint of everything a frame depends on
+            start_index: First day index to precompute
+            target_index: Last day index to precompute (usually the next breakpoint)
+            points_per_frame: Chart points per frame, used to size the cache
+            build_frame: Callable building the frame dict for a day index
+        """
+        with self._condition:
+            if settings_key != self._settings_key:
+                self._invalidate_locked()
+                self._settings_key = settings_key
+            elif self._is_running() and self._target_index == target_index:
+                return
+            self._stop_worker_locked()
+            self._target_index = target_index
+            self._consumed_index = start_index - 1
+            self._max_frames = max(1, self.max_cached_points // max(1, points_per_frame))
+            # Drop frames that are behind the new starting point
+            for day_index in [d for d in self._frames if d < start_index]:
+                del self._frames[day_index]
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(settings_key, start_index, target_index, build_frame, self._stop),
+            daemon=True
+        )
+        self._thread.start()
+
+    def pop(self, day_index: int, settings_key: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        Take the precomputed frame for a day, if one is ready.
+
+        Args:
+            day_index: Day index of the frame
+            settings_key: Current settings fingerprint; a mismatch clears the cache
+
+        Returns:
+            Optional[Dict]: Frame dict, or None if it has not been precomputed
+        """
+        with self._condition:
+            if settings_key != self._settings_key:
+                self._invalidate_locked()
+                return None
+            frame = self._frames.pop(day_index, None)
+            if frame is None and self._last is not None and self._last[0] == day_index:
+                frame = self._last[1]
+            self._last = None if frame is None else (day_index, frame)
+            # Frames behind the consumer will never be shown
+            for stale_index in [d for d in self._frames if d < day_index]:
+                del self._frames[stale_index]
+            self._consumed_index = max(self._consumed_index, day_index)
+            self._condition.notify_all()
+            return frame
+
+    def invalidate(self) -> None:
+        """Stop the worker and discard all precomputed frames."""
+        with self._condition:
+            self._invalidate_locked()
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._frames)
+
+    def _is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def _stop_worker_locked(self) -> None:
+        self._stop.set()
+        self._condition.notify_all()
+
+    def _invalidate_locked(self) -> None:
+        self._stop_worker_locked()
+        self._frames.clear()
+        self._last = None
+        self._settings_key = None
+        self._target_index = -1
+
+    def _run(self, settings_key, start_index, target_index, build_frame, stop) -> None:
+        for day_index in range(start_index, target_index + 1):
+            with self._condition:
+                while not stop.is_set() and len(self._frames) >= self._max_frames:
+                    self._condition.wait()
+                if stop.is_set():
+                    return
+                if day_index in self._frames or day_index <= self._consumed_index:
+                    continue
+
+            frame = build_frame(day_index)
+
+            with self._condition:
+                if stop.is_set() or settings_key != self._settings_key:
+                    return
+                if day_index > self._consumed_index:
+                    self._frames[day_index] = frame
@@ -0,0 +1,527 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import pandas as pd
+from utils.data_handler import extract_breakpoints
+from utils.portfolio_manager import initialize_portfolios
+from utils.trade_buffer import TradeBuffer
+from utils.trade_journal import TradeJournal
+from utils.resting_orders import ORDER_TYPES, RestingOrderBook
+from utils.margin import settle_until
+from utils.cost_models import CostModel, NO_COSTS, apply_cost_model, day_volume
+from utils.instruments import InstrumentSet, portfolio_values, update_portfolio_values
+
+# Seats per room, matching the 2x2 trading grid; later joiners spectate
+MAX_ROOM_PLAYERS = 4
+
+# Seconds without a heartbeat after which a browser session is dropped from its room
+MEMBER_TIMEOUT_SEC = 30.0
+
+class GameRoom:
+    """
+    Server-side game shared by many browser sessions.
+
+    The room owns one dataset, one set of portfolios and one clock thread.
+    Each tick advances the simulation once, builds the chart
+    frame once and wakes every waiting viewer, so a room with many viewers
+    costs one simulation plus handing the same frame to each session.
+
+    With a member timeout, members send heartbeats with touch(); the clock
+    thread drops members that stop (e.g. closed browser tabs) and closes
+    the room once it has no members left.
+    """
+
+    def __init__(self, room_id: str, df: pd.DataFrame, starting_cash: float,
+                 time_to_run_sec: float, build_frame: Callable[[int], Dict[str, Any]],
+                 max_players: int = MAX_ROOM_PLAYERS, decision_timeout_sec: Optional[float] = None,
+                 margin_requirement: Optional[float] = None, cost_model: Optional[CostModel] = None,
+                 member_timeout_sec: Optional[float] = None):
+        """
+        Args:
+            room_id: Room name players join with
+            df: DataFrame with price data (shared, never modified)
+            starting_cash: Starting cash for every player
+            time_to_run_sec: Seconds the whole series takes to play
+            build_frame: Callable building the chart frame dict for a day index
+            max_players: Number of player seats (bot rooms can have many more than the grid)
+            decision_timeout_sec: If set, the clock resumes on its own this long
+                after reaching a breakpoint and later decisions are rejected
+            margin_requirement: Margin requirement for short positions (None disables short selling)
+            cost_model: Fees and slippage charged on trades (None: trades are free)
+            member_timeout_sec: If set, members without a heartbeat for this long
+                are dropped and the room closes itself once it is empty that long
+                (None: members stay until they leave)
+        """
+        self.room_id = room_id
+        self.df = df
+        self.breakpoints = extract_breakpoints(df)
+        self._breakpoint_set = set(self.breakpoints)
+        self.instruments = InstrumentSet(df)
+        self.starting_cash = starting_cash
+        self.margin_requirement = margin_requirement
+        self.cost_model = cost_model or NO_COSTS
+        self.time_to_run_sec = time_to_run_sec
+        self._build_frame = build_frame
+        self.max_players = max_players
+        self.decision_timeout_sec = decision_timeout_sec
+        self.member_timeout_sec = member_timeout_sec
+        # Called with the room once it has closed (the registry forgets it)
+        self.on_close: Optional[Callable[['GameRoom'], None]] = None
+
+        self._condition = threading.Condition()
+        self.current_day_index = 0
+        self.running = False
+        self.waiting_for_trade = False
+        # time.monotonic() after which the current breakpoint stops taking decisions
+        self.deadline: Optional[float] = None
+        self.portfolios: Dict[int, Dict] = {}
+        self.player_names: Dict[int, str] = {}
+        # session id -> player number (None for spectators)
+        self.members: Dict[str, Optional[int]] = {}
+        # session id -> time.monotonic() of its last heartbeat
+        self._last_seen: Dict[str, float] = {}
+        self._empty_since = time.monotonic()
+        self._next_sweep = 0.0
+        self.trade_buffer = TradeBuffer()
+        self.trade_journal = TradeJournal()
+        self.order_book = RestingOrderBook()
+        # Bumped on every published change; viewers wait for it to move
+        self.version = 0
+        self.frame = build_frame(0)
+        self._closed = False
+        if 0 in self._breakpoint_set:
+            self._arrive_at_breakpoint_locked()
+        self._thread = threading.Thread(target=self._run_clock, daemon=True)
+        self._thread.start()
+
+    def join(self, session_id: str, name: str, as_player: bool = True) -> Optional[int]:
+        """
+        Add a browser session to the room.
+
+        Args:
+            session_id: Unique id of the browser session
+            name: Display name
+            as_player: Take a player seat if one is free, otherwise spectate
+
+        Returns:
+            Optional[int]: Player number, or None for spectators
+        """
+        with self._condition:
+            if session_id in self.members:
+                return self.members[session_id]
+            player_num = None
+            if as_player:
+                free_seats = [i for i in range(1, self.max_players + 1) if i not in self.portfolios]
+                if free_seats:
+                    player_num = free_seats[0]
+                    self.portfolios[player_num] = initialize_portfolios(1, self.starting_cash, self.margin_requirement, self.cost_model)[1]
+                    self.player_names[player_num] = name or f"Player {player_num}"
+                    # Late joiners start valued at today's prices
+                    update_portfolio_values(
+                        {player_num: self.portfolios[player_num]},
+                        self.instruments.day_prices(self.current_day_index), self.df.iloc[self.current_day_index]['Date']
+                    )
+            self.members[session_id] = player_num
+            self._last_seen[session_id] = time.monotonic()
+            self._publish_locked()
+            return player_num
+
+    def leave(self, session_id: str) -> None:
+        """Remove a browser session; its seat (and portfolio) is kept for the rest of the game"""
+        with self._condition:
+            self.members.pop(session_id, None)
+            self._last_seen.pop(session_id, None)
+            if not self.members:
+                self._empty_since = time.monotonic()
+            self._publish_locked()
+
+    def touch(self, session_id: str) -> None:
+        """Record a heartbeat from a member session"""
+        with self._condition:
+            if session_id in self.members:
+                self._last_seen[session_id] = time.monotonic()
+
+    @property
+    def closed(self) -> bool:
+        """Check whether the room has been closed"""
+        return self._closed
+
+    def seat_of(self, session_id: str) -> Optional[int]:
+        """Player number of a member session (None for spectators and unknown sessions)"""
+        with self._condition:
+            return self.members.get(session_id)
+
+    def start(self) -> None:
+        """Commit staged orders and resume the shared clock"""
+        with self._condition:
+            if self.current_day_index >= len(self.df) - 1:
+                return
+            self._resume_locked()
+
+    def pause(self) -> None:
+        """Pause the shared clock"""
+        with self._condition:
+            self.running = False
+            self._publish_locked()
+
+    def skip(self) -> None:
+        """Commit staged orders and jump to the next breakpoint (or the end)"""
+        with self._condition:
+            self._commit_locked()
+            next_breakpoints = [bp for bp in self.breakpoints if bp > self.current_day_index]
+            target_index = next_breakpoints[0] if next_breakpoints else len(self.df) - 1
+            if target_index > self.current_day_index:
+                settle_until(
+                    self.portfolios, self.df, self.instruments, self.order_book,
+                    self.current_day_index, target_index, self.trade_journal
+                )
+                self.current_day_index = target_index
+            self.running = False
+            self.waiting_for_trade = False
+            self.deadline = None
+            if target_index in self._breakpoint_set:
+                self._arrive_at_breakpoint_locked()
+        self._publish_frame()
+
+    def stage(self, player_num: int, action: str, quantity: int, price: Optional[float] = None,
+              instrument=0) -> None:
+        """
+        Stage an order for a seated player at the current breakpoint.
+
+        Args:
+            player_num: Player number
+            action: 'buy', 'sell', 'hold' or a resting order type
+            quantity: Number of shares
+            price: Trigger price (resting orders only)
+            instrument: Ticker or index of the instrument (multi-instrument data)
+
+        Raises:
+            ValueError: If the room is not taking decisions or the order is not affordable
+        """
+        error = self.stage_batch([(player_num, action, quantity, price, instrument)])[0]
+        if error is not None:
+            raise ValueError(error)
+
+    def stage_batch(self, orders: List[Tuple]) -> List[Optional[str]]:
+        """
+        Stage many (player_num, action, quantity[, price[, instrument]]) orders under one lock acquisition.
+
+        Market orders trade at the current price of their instrument (a
+        ticker or index, default the first); resting orders (ORDER_TYPES)
+        need a trigger price.
+
+        Every order goes through the same validation as a single trade; a
+        rejected order does not affect the others. On the last day, when the
+        clock can no longer resume, accepted orders are committed at once.
+
+        Returns:
+            List[Optional[str]]: None for each staged order, else the error message
+        """
+        with self._condition:
+            if not self.waiting_for_trade:
+                return ["Trading is only allowed at a breakpoint"] * len(orders)
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                return ["Decision deadline has passed"] * len(orders)
+            day_index = self.current_day_index
+            prices = self.instruments.day_prices(day_index)
+            date = self.df.iloc[day_index]['Date']
+            volume = day_volume(self.df, day_index)
+            errors = []
+            for order in orders:
+                player_num, action, quantity = order[:3]
+                trigger = order[3] if len(order) > 3 else None
+                instrument = self._instrument_index(order[4] if len(order) > 4 else 0)
+                if instrument is None:
+                    errors.append("Unknown instrument")
+                    continue
+                if player_num not in self.portfolios:
+                    errors.append("Only seated players can trade")
+                    continue
+                if action not in ('buy', 'sell', 'hold') + ORDER_TYPES or quantity < 0:
+                    errors.append("Invalid order")
+                    continue
+                if action in ORDER_TYPES and trigger is None:
+                    errors.append("Resting orders need a price")
+                    continue
+                try:
+                    self.trade_buffer.stage(
+                        player_num, self.portfolios[player_num], action, quantity,
+                        trigger if action in ORDER_TYPES else float(prices[instrument]), day_index, date, volume,
+                        instrument
+                    )
+                    errors.append(None)
+                except ValueError as e:
+                    errors.append(str(e))
+            if day_index >= len(self.df) - 1 and self.trade_buffer.has_orders():
+                # Nothing follows the last day, so its orders are applied as soon as they are staged
+                try:
+                    self._commit_locked()
+                except ValueError as e:
+                    self.trade_buffer.discard()
+                    errors = [str(e) if error is None else error for error in errors]
+            self._publish_locked()
+            return errors
+
+    def public_state(self, player_num: Optional[int] = None) -> Dict:
+        """
+        Get a JSON-friendly view of the room (and optionally one seat, including staged orders).
+        """
+        with self._condition:
+            state = {
+                'room_id': self.room_id,
+                'version': self.version,
+                'day_index': self.current_day_index,
+                'num_days': len(self.df),
+                'date': str(self.df.iloc[self.current_day_index]['Date'].date()),
+                'price': float(self.instruments.prices[self.current_day_index, 0]),
+                'running': self.running,
+                'waiting_for_trade': self.waiting_for_trade,
+                'deadline_in_sec': None if self.deadline is None else max(0.0, self.deadline - time.monotonic()),
+                'finished': self.current_day_index >= len(self.df) - 1,
+            }
+            if self.instruments.is_multi:
+                state['prices'] = dict(zip(self.instruments.names, self.instruments.day_prices(self.current_day_index).tolist()))
+            if player_num in self.portfolios:
+                cash, positions = self.trade_buffer.view(player_num, self.portfolios[player_num])
+                state['player'] = {
+                    'player_num': player_num,
+                    'cash': cash,
+                    'positions': positions,
+                    'resting_orders': [
+                        {'type': order.order_type, 'quantity': order.quantity, 'price': order.price}
+                        | ({'instrument': self.instruments.names[order.instrument]} if self.instruments.is_multi else {})
+                        for order in self.order_book.live_orders(player_num)
+                    ]
+                }
+                if self.instruments.is_multi:
+                    state['player']['holdings'] = {
+                        name: self.trade_buffer.view(player_num, self.portfolios[player_num], i)[1]
+                        for i, name in enumerate(self.instruments.names)
+                    }
+            return state
+
+    def undo(self, player_num: int) -> bool:
+        """Remove a player's most recently staged order"""
+        with self._condition:
+            removed = self.trade_buffer.undo(player_num)
+            self._publish_locked()
+            return removed
+
+    def wait_for_update(self, version: int, timeout: float) -> int:
+        """
+        Block until the room changes after version (or timeout) and return the new version.
+
+        Viewers only wait on a condition variable here; none of them advances
+        the simulation.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version or self._closed, timeout=timeout)
+            return self.version
+
+    def leaderboard(self) -> List[Dict]:
+        """Get each seated player's valuation at the current day, best first"""
+        with self._condition:
+            values = portfolio_values(self.portfolios, self.instruments.day_prices(self.current_day_index))
+            rows = []
+            for (player_num, portfolio), value in zip(self.portfolios.items(), values):
+                pnl_calc = portfolio['pnl_calculator']
+                rows.append({
+                    'player_num': player_num,
+                    'name': self.player_names[player_num],
+                    'cash': portfolio['cash'],
+                    'positions': portfolio['positions'],
+                    'holdings': pnl_calc.holdings.tolist(),
+                    'portfolio_value': float(value),
+                    'pnl': float(value) - pnl_calc.initial_cash,
+                    'fees': pnl_calc.get_fees_paid()
+                })
+        return sorted(rows, key=lambda row: row['portfolio_value'], reverse=True)
+
+    def set_cost_model(self, cost_model: CostModel) -> int:
+        """
+        Change the fee schedule mid-game, re-pricing every trade of every seat in one pass.
+
+        Staged orders were validated under the old schedule, so they are
+        re-staged (and dropped if they are no longer affordable).
+
+        Returns:
+            int: Number of trades re-priced
+
+        Raises:
+            ValueError: If a long-only seat could not have afforded its trades
+                under the new schedule (the room is left unchanged)
+        """
+        with self._condition:
+            num_trades = apply_cost_model(self.portfolios, cost_model, self.trade_journal)
+            self.cost_model = cost_model
+            try:
+                self.trade_buffer = TradeBuffer.from_state(self.trade_buffer.to_state(), self.portfolios)
+            except ValueError:
+                self.trade_buffer.discard()
+            self._publish_locked()
+            return num_trades
+
+    def close(self) -> None:
+        """Stop the clock thread and wake every viewer"""
+        with self._condition:
+            self._closed = True
+            self.running = False
+            self._publish_locked()
+
+    def _advance_locked(self) -> None:
+        """
+        Advance the shared clock by one day, apply margin calls and due fills and
+        value every portfolio in one matrix product over players and instruments
+        """
+        self.current_day_index += 1
+        settle_until(
+            self.portfolios, self.df, self.instruments, self.order_book,
+            self.current_day_index - 1, self.current_day_index, self.trade_journal
+        )
+
+    def _instrument_index(self, instrument) -> Optional[int]:
+        """Column of an instrument given by ticker or index (None if there is no such instrument)"""
+        if isinstance(instrument, str):
+            return self.instruments.names.index(instrument) if instrument in self.instruments.names else None
+        return instrument if 0 <= instrument < len(self.instruments) else None
+
+    def _arrive_at_breakpoint_locked(self) -> None:
+        self.running = False
+        self.waiting_for_trade = True
+        if self.decision_timeout_sec is not None:
+            self.deadline = time.monotonic() + self.decision_timeout_sec
+
+    def _commit_locked(self) -> None:
+        """Commit staged orders and schedule the resting ones up to the day before the next breakpoint"""
+        self.trade_buffer.commit(self.portfolios, self.trade_journal, self.order_book)
+        next_breakpoints = [bp for bp in self.breakpoints if bp > self.current_day_index]
+        expiry_day = next_breakpoints[0] - 1 if next_breakpoints else len(self.df) - 1
+        self.order_book.schedule(self.instruments.crossing_indices, expiry_day, self.trade_journal, self.portfolios)
+
+    def _resume_locked(self) -> None:
+        """Commit staged orders and restart the clock"""
+        self._commit_locked()
+        self.running = True
+        self.waiting_for_trade = False
+        self.deadline = None
+        self._publish_locked()
+
+    def _expire_members_locked(self) -> bool:
+        """
+        Drop members whose heartbeat is older than the member timeout (checked
+        at most twice per timeout).
+
+        Returns:
+            bool: True if the room should close: its last members just expired,
+            or it has had none for the whole timeout
+        """
+        now = time.monotonic()
+        if self.member_timeout_sec is None or now < self._next_sweep:
+            return False
+        self._next_sweep = now + self.member_timeout_sec / 2
+        expired = [session_id for session_id, seen in self._last_seen.items() if now - seen > self.member_timeout_sec]
+        for session_id in expired:
+            del self.members[session_id]
+            del self._last_seen[session_id]
+        if expired:
+            self._publish_locked()
+        if self.members:
+            return False
+        return bool(expired) or now - self._empty_since > self.member_timeout_sec
+
+    def _wait_for_clock_locked(self) -> None:
+        """
+        Wait until the clock should run, resuming by itself when a decision
+        deadline expires and closing the room once its members are gone
+        """
+        while True:
+            if self._expire_members_locked():
+                self.close()
+            if self.running or self._closed:
+                return
+            sweep = None if self.member_timeout_sec is None else self.member_timeout_sec / 2
+            if self.deadline is None:
+                self._condition.wait(sweep)
+                continue
+            remaining = self.deadline - time.monotonic()
+            if remaining > 0:
+                self._condition.wait(remaining if sweep is None else min(remaining, sweep))
+                continue
+            try:
+                self._resume_locked()
+            except ValueError:
+                # Staged orders are validated, so this only happens if state was changed underneath
+                self.trade_buffer.discard()
+                self.running = True
+                self.waiting_for_trade = False
+                self.deadline = None
+
+    def _publish_locked(self) -> None:
+        self.version += 1
+        self._condition.notify_all()
+
+    def _publish_frame(self) -> None:
+        """Build the frame for the current day once and hand it to every viewer"""
+        day_index = self.current_day_index
+        frame = self._build_frame(day_index)
+        with self._condition:
+            if day_index == self.current_day_index:
+                self.frame = frame
+            self._publish_locked()
+
+    def _run_clock(self) -> None:
+        while True:
+            with self._condition:
+                self._wait_for_clock_locked()
+                if self._closed:
+                    break
+                if self.current_day_index >= len(self.df) - 1:
+                    self.running = False
+                    self._publish_locked()
+                    continue
+                self._advance_locked()
+                if self.current_day_index in self._breakpoint_set:
+                    self._arrive_at_breakpoint_locked()
+            self._publish_frame()
+            time.sleep(self.time_to_run_sec / max(1, len(self.df)))
+        if self.on_close is not None:
+            self.on_close(self)
+
+class RoomRegistry:
+    """Process-wide registry of game rooms, shared by every browser session"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms: Dict[str, GameRoom] = {}
+
+    def get(self, room_id: str) -> Optional[GameRoom]:
+        """Get an existing room"""
+        with self._lock:
+            return self._rooms.get(room_id)
+
+    def get_or_create(self, room_id: str, create_room: Callable[[], GameRoom]) -> GameRoom:
+        """Get a room, creating it with create_room() if it does not exist yet (or has closed)"""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None or room.closed:
+                room = self._rooms[room_id] = create_room()
+                room.on_close = self._discard
+            return room
+
+    def _discard(self, room: GameRoom) -> None:
+        """Forget a room that has closed, unless its name already belongs to a newer room"""
+        with self._lock:
+            if self._rooms.get(room.room_id) is room:
+                del self._rooms[room.room_id]
+
+    def close(self, room_id: str) -> None:
+        """Close and forget a room"""
+        with self._lock:
+            room = self._rooms.pop(room_id, None)
+        if room is not None:
+            room.close()
+
+    def room_ids(self) -> List[str]:
+        """Get the names of all open rooms"""
+        with self._lock:
+            return sorted(self._rooms)
@@ -0,0 +1,149 @@
+"""
+Technical indicators computed over a whole price series at once.
+
+Every indicator is causal: the value at row t only uses prices up to t, so
+the values for a revealed prefix are simply the first rows of the full
+series. Charts compute each indicator once per dataset and slice it per
+frame instead of recomputing it over the revealed prefix.
+"""
+from typing import Dict
+import numpy as np
+
+INDICATORS = ('sma', 'ema', 'bollinger', 'rsi')
+
+INDICATOR_LABELS = {
+    'sma': "SMA",
+    'ema': "EMA",
+    'bollinger': "Bollinger Bands",
+    'rsi': "RSI"
+}
+
+DEFAULT_PERIODS = {'sma': 20, 'ema': 20, 'bollinger': 20, 'rsi': 14}
+
+# Indicators drawn in their own panel below the price instead of over it
+PANEL_INDICATORS = ('rsi',)
+
+# Bollinger band width in standard deviations
+BOLLINGER_WIDTH = 2.0
+
+# Largest factor a^-k allowed when running a recursion block with cumulative sums
+_MAX_BLOCK_GROWTH = 1e12
+
+def linear_recursion(shocks: np.ndarray, a: float, y0: float) -> np.ndarray:
+    """
+    Compute y[t] = a * y[t-1] + shocks[t] (with y[-1] = y0) without a Python loop per row.
+
+    Within a block of k rows y[t] = a^t * (y0 + cumsum(shocks * a^-t)), which is
+    exact as long as a^-k stays small, so the series is processed in blocks of
+    that length. Several series can be run at once along the last axis.
+    """
+    shocks = np.asarray(shocks, dtype=np.float64)
+    if a == 1.0:
+        return y0 + np.cumsum(shocks, axis=-1)
+    if a == 0.0:
+        return shocks.copy()
+    block = max(1, int(np.log(_MAX_BLOCK_GROWTH) / -np.log(a)))
+    out = np.empty_like(shocks)
+    length = shocks.shape[-1]
+    start = 0
+    while start < length:
+        stop = min(start + block, length)
+        powers = a ** np.arange(1, stop - start + 1)
+        out[..., start:stop] = powers * (y0 + np.cumsum(shocks[..., start:stop] / powers, axis=-1))
+        y0 = out[..., stop - 1:stop]
+        start = stop
+    return out
+
+def _window_sums(values: np.ndarray, period: int) -> np.ndarray:
+    """Sum of each trailing window of period rows (rows period-1 onwards)"""
+    sums = np.concatenate([[0.0], np.cumsum(values)])
+    return sums[period:] - sums[:-period]
+
+def _check_period(period: int) -> None:
+    if period < 1:
+        raise ValueError("Indicator period must be at least 1 row")
+
+def sma(prices: np.ndarray, period: int) -> np.ndarray:
+    """Simple moving average (NaN until period rows are available)"""
+    _check_period(period)
+    prices = np.asarray(prices, dtype=np.float64)
+    out = np.full(len(prices), np.nan)
+    if len(prices) >= period:
+        # Summing deviations from the first price keeps the running sums small
+        out[period - 1:] = prices[0] + _window_sums(prices - prices[0], period) / period
+    return out
+
+def ema(prices: np.ndarray, period: int) -> np.ndarray:
+    """Exponential moving average with alpha = 2 / (period + 1), seeded with the first price"""
+    _check_period(period)
+    prices = np.asarray(prices, dtype=np.float64)
+    out = np.full(len(prices), np.nan)
+    if len(prices) == 0:
+        return out
+    alpha = 2 / (period + 1)
+    smoothed = np.concatenate([[prices[0]], linear_recursion(alpha * prices[1:], 1 - alpha, prices[0])])
+    out[period - 1:] = smoothed[period - 1:]
+    return out
+
+def bollinger_bands(prices: np.ndarray, period: int, width: float = BOLLINGER_WIDTH) -> Dict[str, np.ndarray]:
+    """
+    Moving average with bands width standard deviations above and below.
+
+    Returns:
+        Dict[str, np.ndarray]: 'upper', 'middle' and 'lower' series
+    """
+    _check_period(period)
+    prices = np.asarray(prices, dtype=np.float64)
+    middle = sma(prices, period)
+    std = np.full(len(prices), np.nan)
+    if len(prices) >= period:
+        deviations = prices - prices[0]
+        mean = _window_sums(deviations, period) / period
+        variance = _window_sums(deviations * deviations, period) / period - mean * mean
+        std[period - 1:] = np.sqrt(np.maximum(variance, 0.0))
+    return {'upper': middle + width * std, 'middle': middle, 'lower': middle - width * std}
+
+def rsi(prices: np.ndarray, period: int) -> np.ndarray:
+    """
+    Relative strength index with Wilder's smoothing (0-100, NaN for the first period rows).
+    """
+    _check_period(period)
+    prices = np.asarray(prices, dtype=np.float64)
+    out = np.full(len(prices), np.nan)
+    if len(prices) <= period:
+        return out
+    changes = np.diff(prices)
+    gains = np.maximum(changes, 0.0)
+    losses = np.maximum(-changes, 0.0)
+    # Averages for rows period.. : seeded with the mean of the first period changes
+    a = 1 - 1 / period
+    avg_gain = np.concatenate([[gains[:period].mean()], linear_recursion(gains[period:] / period, a, gains[:period].mean())])
+    avg_loss = np.concatenate([[losses[:period].mean()], linear_recursion(losses[period:] / period, a, losses[:period].mean())])
+    total = avg_gain + avg_loss
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[period:] = np.where(total > 0, 100 * avg_gain / total, 50.0)
+    return out
+
+def compute_indicator(name: str, prices: np.ndarray, period: int) -> Dict[str, np.ndarray]:
+    """
+    Compute an indicator over the whole series.
+
+    Args:
+        name: One of INDICATORS
+        prices: Price series
+        period: Lookback in rows
+
+    Returns:
+        Dict[str, np.ndarray]: Line label -> values (one row per price)
+    """
+    label = f"{INDICATOR_LABELS.get(name, name)} {period}"
+    if name == 'sma':
+        return {label: sma(prices, period)}
+    if name == 'ema':
+        return {label: ema(prices, period)}
+    if name == 'bollinger':
+        bands = bollinger_bands(prices, period)
+        return {f"BB {period} upper": bands['upper'], f"BB {period} lower": bands['lower']}
+    if name == 'rsi':
+        return {label: rsi(prices, period)}
+    raise ValueError(f"Unknown indicator '{name}', expected one of {', '.join(INDICATORS)}")
@@ -0,0 +1,148 @@
+"""
+Datasets with several instruments on one date index.
+
+A multi-instrument dataset has one price column per ticker, named
+Price_<TICKER>, next to the shared Date and Breakpoint columns; the first
+instrument is also the dataset's Price, so everything that works on one
+price series keeps working on it. Each player holds a vector of positions
+(PnLCalculator.holdings), and all players are valued in one matrix product
+per tick:
+
+    values = cash + holdings @ prices        (players x instruments) @ (instruments,)
+"""
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from utils.resting_orders import PriceCrossingIndex
+
+# Prefix of the price columns of a multi-instrument dataset
+INSTRUMENT_PREFIX = 'Price_'
+
+def instrument_columns(df: pd.DataFrame) -> List[str]:
+    """Price column of every instrument (['Price'] for single-instrument data)"""
+    columns = [column for column in df.columns if column.startswith(INSTRUMENT_PREFIX)]
+    return columns or ['Price']
+
+def instrument_names(df: pd.DataFrame) -> List[str]:
+    """Ticker of every instrument ([] for single-instrument data)"""
+    return [column[len(INSTRUMENT_PREFIX):] for column in df.columns if column.startswith(INSTRUMENT_PREFIX)]
+
+def day_prices(df: pd.DataFrame, day_index: int) -> np.ndarray:
+    """Price of every instrument on a day"""
+    return df.iloc[day_index][instrument_columns(df)].to_numpy(dtype=np.float64)
+
+def instrument_frame(df: pd.DataFrame, instrument: int) -> pd.DataFrame:
+    """
+    Single-instrument view of one instrument, for charts and indicators.
+
+    The first instrument is the dataset's own Price, so the dataset itself
+    is returned for it (and for single-instrument data).
+    """
+    columns = instrument_columns(df)
+    if instrument == 0 or len(columns) == 1:
+        return df
+    frame = pd.DataFrame({'Date': df['Date'], 'Price': df[columns[instrument]]})
+    if 'Breakpoint' in df.columns:
+        frame['Breakpoint'] = df['Breakpoint']
+    return frame
+
+class InstrumentSet:
+    """
+    Per-dataset instrument data, built once: tickers, the day x instrument
+    price matrix and a crossing index per instrument for resting orders.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        columns = instrument_columns(df)
+        self.names = instrument_names(df) or ['Price']
+        # Column by column, so compact data decodes one column at a time
+        self.prices = np.column_stack([df[column].to_numpy(dtype=np.float64) for column in columns])
+        self.crossing_indices = [PriceCrossingIndex.from_frame(df, self.prices[:, 0])] + [
+            PriceCrossingIndex(self.prices[:, i]) for i in range(1, len(columns))
+        ]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def is_multi(self) -> bool:
+        """Check whether the dataset has more than one instrument"""
+        return len(self.names) > 1
+
+    def day_prices(self, day_index: int) -> np.ndarray:
+        """Price of every instrument on a day"""
+        return self.prices[day_index]
+
+def holdings_matrix(portfolios: Dict, num_instruments: int) -> np.ndarray:
+    """
+    Positions of every player as a players x instruments matrix.
+    """
+    matrix = np.zeros((len(portfolios), num_instruments), dtype=np.float64)
+    for row, portfolio in enumerate(portfolios.values()):
+        holdings = portfolio['pnl_calculator'].holdings
+        count = min(len(holdings), num_instruments)
+        matrix[row, :count] = holdings[:count]
+    return matrix
+
+def portfolio_values(portfolios: Dict, prices) -> np.ndarray:
+    """
+    Value of every portfolio at one price vector, in a single matrix product.
+
+    Args:
+        portfolios: Player portfolios
+        prices: Price of every instrument (or the price of the only one)
+
+    Returns:
+        np.ndarray: Portfolio value per player, in the order of portfolios
+    """
+    prices = np.atleast_1d(np.asarray(prices, dtype=np.float64))
+    cash = np.array([portfolio['pnl_calculator'].cash for portfolio in portfolios.values()], dtype=np.float64)
+    return cash + holdings_matrix(portfolios, len(prices)) @ prices
+
+def update_portfolio_values(portfolios: Dict, prices, date: Optional[pd.Timestamp] = None) -> np.ndarray:
+    """
+    Record the value of every portfolio for a tick.
+
+    Args:
+        portfolios: Player portfolios
+        prices: Price of every instrument (a scalar for single-instrument data)
+        date: Date of the tick
+
+    Returns:
+        np.ndarray: Portfolio value per player
+    """
+    values = portfolio_values(portfolios, prices)
+    if np.ndim(prices) == 1 and len(prices) == 1:
+        prices = float(prices[0])
+    for portfolio, value in zip(portfolios.values(), values):
+        portfolio['pnl_calculator'].update_portfolio_value(prices, date, value)
+    return values
+
+def record_portfolio_values(portfolios: Dict, prices: np.ndarray, dates) -> np.ndarray:
+    """
+    Record the value of every portfolio on a run of days over which no holdings
+    change, in one matrix product over players, instruments and days.
+
+    Args:
+        portfolios: Player portfolios
+        prices: Days x instruments prices of the run
+        dates: Date of every day of the run
+
+    Returns:
+        np.ndarray: Players x days portfolio values
+    """
+    prices = np.asarray(prices, dtype=np.float64).reshape(len(dates), -1)
+    cash = np.array([portfolio['pnl_calculator'].cash for portfolio in portfolios.values()], dtype=np.float64)
+    values = cash[:, None] + holdings_matrix(portfolios, prices.shape[1]) @ prices.T
+    if len(dates):
+        last_prices = float(prices[-1, 0]) if prices.shape[1] == 1 else prices[-1]
+        for portfolio, row in zip(portfolios.values(), values):
+            portfolio['pnl_calculator'].record_values(dates, row, last_prices)
+    return values
+
+def describe_holdings(holdings, names: List[str]) -> str:
+    """Holdings as text: the share count, or 'TICKER qty' pairs for several instruments"""
+    if len(names) <= 1:
+        return f"{int(holdings[0]) if len(holdings) else 0:,}"
+    held = [f"{name} {int(quantity):,}" for name, quantity in zip(names, holdings) if quantity]
+    return ", ".join(held) or "0"
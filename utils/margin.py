@@ -0,0 +1,200 @@
+"""
+Margin calls for short positions.
+
+A short of q shares with cash c (which includes the sale proceeds) has
+equity c - q * P. It is called once the equity falls below the margin
+requirement m times the short's market value, i.e. once the price rises to
+
+    P* = c / (q * (1 + m))
+
+Between two trades a player's cash and position are fixed, so a margin call
+is the first day the high reaches P*: the same query the resting orders
+answer with a PriceCrossingIndex. Every player's level is computed at once
+and looked up in one batch, in O(log n) per player instead of a scan of
+every day for every player. Called shorts are covered in full at the level
+(or at the open when the day gaps through it).
+
+With several instruments the call level is no longer a single price, so
+players short in more than one instrument (or short one and long another)
+are checked with a scan of the days' closes instead: equity
+cash + holdings @ prices against the margin requirement times the short
+market value, day by day until the first call (path_kernels.margin_call_days,
+compiled with numba when installed). Every short of a called player is
+covered at that day's close.
+"""
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+from utils.resting_orders import PriceCrossingIndex, RestingOrder, RestingOrderBook
+from utils.cost_models import day_volume
+from utils.instruments import InstrumentSet, holdings_matrix, record_portfolio_values
+from utils.path_kernels import margin_call_days
+
+# Default margin requirement for short positions (fraction of their market value)
+DEFAULT_MARGIN_REQUIREMENT = 0.5
+
+class MarginCall(NamedTuple):
+    """A short position covered by a margin call"""
+    player_num: int
+    day: int
+    quantity: int
+    price: float
+    instrument: int = 0
+
+def margin_call_prices(cash: np.ndarray, positions: np.ndarray, margin_requirements: np.ndarray) -> np.ndarray:
+    """
+    Price at which each position is called (inf for positions that are not short).
+
+    Args:
+        cash: Cash per player
+        positions: Shares per player (negative when short)
+        margin_requirements: Margin requirement per player
+
+    Returns:
+        np.ndarray: Call price per player
+    """
+    cash = np.asarray(cash, dtype=np.float64)
+    shorted = -np.asarray(positions, dtype=np.float64)
+    short = shorted > 0
+    levels = np.full(len(cash), np.inf)
+    levels[short] = cash[short] / (shorted[short] * (1 + np.asarray(margin_requirements, dtype=np.float64)[short]))
+    return levels
+
+def find_margin_calls(index: PriceCrossingIndex, cash, positions, margin_requirements,
+                      start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the day in [start, end] on which each player's short is called.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (day per player or -1, cover price per player)
+    """
+    levels = margin_call_prices(cash, positions, margin_requirements)
+    short = np.isfinite(levels)
+    days = np.full(len(levels), -1, dtype=np.int64)
+    prices = np.full(len(levels), np.nan)
+    if short.any() and start <= end:
+        count = int(short.sum())
+        days[short] = index.first_crossing(np.full(count, start), np.full(count, end), levels[short], np.zeros(count, dtype=bool))
+        called = days >= 0
+        prices[called] = index.fill_prices(days[called], levels[called], np.zeros(int(called.sum()), dtype=bool))
+    return days, prices
+
+def find_portfolio_margin_calls(prices: np.ndarray, cash, holdings, margin_requirements,
+                                start: int, end: int) -> np.ndarray:
+    """
+    Find the day in [start, end] on which each multi-instrument portfolio is called.
+
+    Args:
+        prices: Day x instrument close prices
+        cash: Cash per player
+        holdings: Player x instrument positions (negative when short)
+        margin_requirements: Margin requirement per player
+
+    Returns:
+        np.ndarray: Day per player, or -1 if it is not called
+    """
+    return margin_call_days(prices, cash, holdings, margin_requirements, start, end)
+
+def liquidate_margin_calls(portfolios: Dict, df: pd.DataFrame, instruments: InstrumentSet,
+                           start: int, end: int, journal=None,
+                           before_day: Optional[Callable[[int], None]] = None) -> List[MarginCall]:
+    """
+    Cover every short that is called between start and end (inclusive).
+
+    Args:
+        portfolios: Player portfolios
+        df: DataFrame with price data (for trade dates)
+        instruments: Instruments of the dataset
+        start: First day to check
+        end: Last day to check
+        journal: Optional TradeJournal to record the covers in
+        before_day: Called with every call day before its covers are applied
+
+    Returns:
+        List[MarginCall]: Covered shorts, in day order
+    """
+    player_nums = list(portfolios)
+    if not player_nums or start > end:
+        return []
+    calculators = [portfolios[player_num]['pnl_calculator'] for player_num in player_nums]
+    cash = [calc.cash for calc in calculators]
+    margins = [calc.margin_requirement or 0.0 for calc in calculators]
+    holdings = holdings_matrix(portfolios, len(instruments))
+    # Portfolios holding nothing but the first instrument have a single call level
+    single = ~holdings[:, 1:].any(axis=1)
+    days, prices = find_margin_calls(
+        instruments.crossing_indices[0], cash, np.where(single, holdings[:, 0], 0), margins, start, end
+    )
+    if not single.all():
+        multi = np.flatnonzero(~single)
+        days[multi] = find_portfolio_margin_calls(
+            instruments.prices, np.take(cash, multi), holdings[multi], np.take(margins, multi), start, end
+        )
+
+    calls = []
+    for i in sorted(np.flatnonzero(days >= 0), key=lambda i: days[i]):
+        player_num, day = player_nums[i], int(days[i])
+        if before_day is not None and (not calls or calls[-1].day != day):
+            before_day(day)
+        portfolio = portfolios[player_num]
+        calc = portfolio['pnl_calculator']
+        for instrument in np.flatnonzero(calc.holdings < 0).tolist():
+            quantity = -calc.holding(instrument)
+            price = float(prices[i]) if single[i] else float(instruments.prices[day, instrument])
+            calc.execute_trade('cover', quantity, price, day_volume(df, day, instrument), instrument)
+            portfolio['trading_history'].append({
+                'action': 'cover',
+                'price': price,
+                'quantity': quantity,
+                'date': df.iloc[day]['Date'],
+                'instrument': instrument
+            })
+            if journal is not None:
+                journal.record_trades(day, [(player_num, 'cover', quantity, price, instrument)], portfolios)
+            calls.append(MarginCall(player_num, day, quantity, price, instrument))
+        portfolio['cash'] = calc.cash
+        portfolio['positions'] = calc.positions
+    return calls
+
+def settle_until(portfolios: Dict, df: pd.DataFrame, instruments: InstrumentSet, order_book: RestingOrderBook,
+                 from_day: int, to_day: int, journal=None) -> Tuple[List[RestingOrder], List[MarginCall]]:
+    """
+    Move the portfolios from from_day (exclusive) to to_day: apply margin
+    calls and resting-order fills, and record every portfolio's value at the
+    close of each day in between.
+
+    Fills change positions, so the days between consecutive fills are
+    checked for margin calls one stretch at a time; on a fill day margin
+    calls are applied before the fills. Holdings only change on call and
+    fill days, so the days between them are valued in bulk, each after that
+    day's calls and fills. Every valued run of days is recorded in the
+    journal as an advance, in order with the trades.
+
+    Returns:
+        Tuple[List[RestingOrder], List[MarginCall]]: Filled orders and margin calls
+    """
+    filled, calls = [], []
+    # First day not valued yet
+    valued_from = from_day + 1
+
+    def value_until(last_day: int) -> None:
+        nonlocal valued_from
+        if last_day < valued_from:
+            return
+        record_portfolio_values(
+            portfolios, instruments.prices[valued_from:last_day + 1], df.iloc[valued_from:last_day + 1]['Date']
+        )
+        if journal is not None:
+            journal.record_advance(last_day, portfolios, valued_from)
+        valued_from = last_day + 1
+
+    day = from_day + 1
+    for fill_day in order_book.fill_days(from_day, to_day) + [to_day]:
+        calls += liquidate_margin_calls(
+            portfolios, df, instruments, day, fill_day, journal, before_day=lambda call_day: value_until(call_day - 1)
+        )
+        value_until(fill_day - 1)
+        filled += order_book.fill_due(portfolios, df, fill_day, journal)
+        value_until(fill_day)
+        day = fill_day + 1
+    return filled, calls
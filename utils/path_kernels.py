@@ -0,0 +1,245 @@
+"""
+Path kernels: loops in which every step depends on the steps before it.
+
+    max_drawdowns      Max drawdown of simulated paths (running peak)
+    running_drawdowns  Drawdown of every valued day of a portfolio (running peak)
+    margin_call_days   First day each multi-instrument portfolio is called
+                       (scan of the days until the first call)
+    fill_orders        Which resting-order fills go through (each fill spends
+                       cash or shares later fills may need)
+
+Each kernel is written once as a plain loop and run one of two ways:
+
+    numba  The loop compiled with numba (used when it is installed)
+    numpy  The same results without numba: NumPy where the loop vectorizes
+           (running peaks by one accumulate, margin scans a block of days at
+           a time), the plain Python loop for the fills
+
+Both backends give identical results: the NumPy versions do the same float
+operations in the same order as the loops. Set TRADING_SIM_KERNELS=numpy to
+use them even when numba is installed.
+"""
+import os
+from typing import Optional
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # numba is optional; the NumPy kernel gives the same results without it
+    numba = None
+
+KERNEL_BACKENDS = ('numba', 'numpy')
+
+# Environment variable forcing the NumPy kernel
+KERNELS_ENV = 'TRADING_SIM_KERNELS'
+
+DEFAULT_BACKEND = 'numba' if numba is not None and os.environ.get(KERNELS_ENV, 'numba') != 'numpy' else 'numpy'
+
+def _max_drawdowns_loop(values, out):
+    """Max drawdown (in %) of every row of values"""
+    for row in range(values.shape[0]):
+        peak = values[row, 0]
+        worst = 0.0
+        for col in range(values.shape[1]):
+            value = values[row, col]
+            if value > peak:
+                peak = value
+            if peak > 0:
+                drawdown = (peak - value) / peak * 100
+                if drawdown > worst:
+                    worst = drawdown
+        out[row] = worst
+    return out
+
+def _running_drawdowns_loop(values, peak, out):
+    """Drawdown (in %) of every value below the running peak, starting from peak"""
+    for day in range(values.shape[0]):
+        value = values[day]
+        if value > peak:
+            peak = value
+        out[day] = (peak - value) / peak * 100 if peak > 0 else 0.0
+    return out
+
+def _margin_call_days_loop(prices, cash, holdings, margins, start, end, out):
+    """First day in [start, end] on which each row of holdings is called, else -1"""
+    for row in range(holdings.shape[0]):
+        out[row] = -1
+        has_short = False
+        for instrument in range(holdings.shape[1]):
+            if holdings[row, instrument] < 0:
+                has_short = True
+        if not has_short:
+            continue
+        for day in range(start, end + 1):
+            equity = cash[row]
+            short_value = 0.0
+            for instrument in range(holdings.shape[1]):
+                position = holdings[row, instrument]
+                equity += position * prices[day, instrument]
+                if position < 0:
+                    short_value += -position * prices[day, instrument]
+            if equity < margins[row] * short_value:
+                out[row] = day
+                break
+    return out
+
+def _fill_orders_loop(rows, instruments, buys, exits, quantities, prices, fees, cash, holdings, margins, out):
+    """
+    Apply fills in order to the cash and holdings of their rows, marking the
+    ones that go through; PnLCalculator.apply_trade() arithmetic (NaN margin:
+    no shorting). Exit sells only go through while they fit in the long position.
+    """
+    for k in range(rows.shape[0]):
+        row = rows[k]
+        instrument = instruments[k]
+        quantity = quantities[k]
+        position = holdings[row, instrument]
+        out[k] = False
+        if buys[k]:
+            cost = quantity * prices[k] + fees[k]
+            if cost > cash[row]:
+                continue
+            cash[row] = cash[row] - cost
+            holdings[row, instrument] = position + quantity
+        else:
+            if exits[k] and quantity > position:
+                continue
+            new_cash = cash[row] + quantity * prices[k] - fees[k]
+            new_position = position - quantity
+            if new_position < 0:
+                if np.isnan(margins[row]):
+                    continue
+                short_value = -new_position * prices[k]
+                if new_cash - short_value < margins[row] * short_value:
+                    continue
+            cash[row] = new_cash
+            holdings[row, instrument] = new_position
+        out[k] = True
+    return out
+
+if numba is not None:
+    _max_drawdowns_jit = numba.njit(cache=True, nogil=True)(_max_drawdowns_loop)
+    _running_drawdowns_jit = numba.njit(cache=True, nogil=True)(_running_drawdowns_loop)
+    _margin_call_days_jit = numba.njit(cache=True, nogil=True)(_margin_call_days_loop)
+    _fill_orders_jit = numba.njit(cache=True, nogil=True)(_fill_orders_loop)
+
+# Days per block of the NumPy margin scan
+MARGIN_SCAN_BLOCK = 4096
+
+def _check_backend(backend: Optional[str]) -> str:
+    backend = backend or DEFAULT_BACKEND
+    if backend not in KERNEL_BACKENDS:
+        raise ValueError(f"Unknown kernel backend '{backend}', expected one of {', '.join(KERNEL_BACKENDS)}")
+    if backend == 'numba' and numba is None:
+        raise ValueError("The numba backend needs numba installed")
+    return backend
+
+def max_drawdowns(values, backend: Optional[str] = None) -> np.ndarray:
+    """
+    Max drawdown (in %) of every row of a paths x days value matrix.
+
+    The numba kernel keeps the running peak in a register; the NumPy one
+    builds the running-peak matrix.
+    """
+    backend = _check_backend(backend)
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[1] == 0:
+        return np.zeros(values.shape[0])
+    if backend == 'numba':
+        return _max_drawdowns_jit(values, np.empty(values.shape[0]))
+    peaks = np.maximum.accumulate(values, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = np.where(peaks > 0, (peaks - values) / peaks * 100, 0.0)
+    return np.maximum(drawdowns.max(axis=1), 0.0)
+
+def running_drawdowns(values, peak: float, backend: Optional[str] = None) -> np.ndarray:
+    """
+    Drawdown (in %) of each value of a series below its running peak.
+
+    Args:
+        values: Values in day order
+        peak: Peak of the series before the first value
+
+    Returns:
+        np.ndarray: Drawdown per value (0 while the peak is not positive)
+    """
+    backend = _check_backend(backend)
+    values = np.asarray(values, dtype=np.float64)
+    if backend == 'numba':
+        return _running_drawdowns_jit(values, float(peak), np.empty(len(values)))
+    peaks = np.maximum(np.maximum.accumulate(values), peak) if len(values) else values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(peaks > 0, (peaks - values) / peaks * 100, 0.0)
+
+def margin_call_days(prices, cash, holdings, margins, start: int, end: int,
+                     backend: Optional[str] = None) -> np.ndarray:
+    """
+    First day in [start, end] on which each portfolio's equity falls below
+    the margin requirement times its short market value, at the days' closes.
+
+    Args:
+        prices: Day x instrument close prices
+        cash: Cash per portfolio
+        holdings: Portfolio x instrument positions (negative when short)
+        margins: Margin requirement per portfolio
+
+    Returns:
+        np.ndarray: Day per portfolio, or -1 if it is not called (or holds no short)
+    """
+    backend = _check_backend(backend)
+    prices = np.asarray(prices, dtype=np.float64)
+    cash = np.asarray(cash, dtype=np.float64)
+    holdings = np.asarray(holdings, dtype=np.float64).reshape(len(cash), -1)
+    margins = np.asarray(margins, dtype=np.float64)
+    if backend == 'numba':
+        return _margin_call_days_jit(prices, cash, holdings, margins, start, end, np.empty(len(cash), dtype=np.int64))
+    days = np.full(len(cash), -1, dtype=np.int64)
+    open_rows = np.flatnonzero((holdings < 0).any(axis=1))
+    for block_start in range(start, end + 1, MARGIN_SCAN_BLOCK):
+        if not len(open_rows):
+            break
+        window = prices[block_start:min(end + 1, block_start + MARGIN_SCAN_BLOCK)]
+        # Summed instrument by instrument, in the loop's order
+        equity = np.repeat(cash[open_rows, None], len(window), axis=1)
+        short_value = np.zeros_like(equity)
+        for instrument in range(holdings.shape[1]):
+            positions = holdings[open_rows, instrument, None]
+            equity += positions * window[:, instrument]
+            short_value += np.where(positions < 0, -positions * window[:, instrument], 0.0)
+        called = equity < margins[open_rows, None] * short_value
+        hit = called.any(axis=1)
+        days[open_rows[hit]] = block_start + called[hit].argmax(axis=1)
+        open_rows = open_rows[~hit]
+    return days
+
+def fill_orders(rows, instruments, buys, quantities, prices, fees, cash, holdings, margins, exits=None,
+                backend: Optional[str] = None) -> np.ndarray:
+    """
+    Decide which fills go through when they are applied in order, each
+    against the cash and shares left by the ones before it.
+
+    Args:
+        rows: Portfolio (row of cash and holdings) of each fill
+        instruments: Instrument (column of holdings) of each fill
+        buys: True for buys, False for sells
+        quantities: Shares per fill
+        prices: Execution price per fill
+        fees: Fees per fill
+        cash: Cash per portfolio
+        holdings: Portfolio x instrument positions
+        margins: Margin requirement per portfolio (NaN: no shorting)
+        exits: True for sells that only close a long position (stop-losses and
+            take-profits), which never open a short; none by default
+
+    Returns:
+        np.ndarray: True for the fills that go through
+    """
+    backend = _check_backend(backend)
+    args = (
+        np.asarray(rows, dtype=np.int64), np.asarray(instruments, dtype=np.int64), np.asarray(buys, dtype=bool),
+        np.zeros(len(rows), dtype=bool) if exits is None else np.asarray(exits, dtype=bool),
+        np.asarray(quantities, dtype=np.int64), np.asarray(prices, dtype=np.float64), np.asarray(fees, dtype=np.float64),
+        np.array(cash, dtype=np.float64), np.array(holdings, dtype=np.int64), np.asarray(margins, dtype=np.float64),
+        np.empty(len(rows), dtype=bool)
+    )
+    return (_fill_orders_jit if backend == 'numba' else _fill_orders_loop)(*args)
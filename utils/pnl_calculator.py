@@ -1,99 +1,468 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
 import pandas as pd
+from utils.cost_models import CostModel, NO_COSTS, TRADE_SIDES, replay_trade_costs
+from utils.risk_metrics import RiskTracker, TRADING_PERIODS_PER_YEAR
+from utils.range_stats import RangeStats
+from utils.path_kernels import running_drawdowns
+from utils.state_store import next_version
+
+# Columns of PnLCalculator.daily_metrics
+METRIC_COLUMNS = ('date', 'cash', 'portfolio_value', 'positions', 'pnl', 'return_pct', 'drawdown_pct')
+
+# Values recorded at once above which the risk tracker is rebuilt from the whole history
+# instead of being updated value by value
+BULK_VALUES = 256
 
 class PnLCalculator:
-    def __init__(self, initial_cash: float = 10000):
+    def __init__(self, initial_cash: float = 10000, margin_requirement: Optional[float] = None,
+                 cost_model: Optional[CostModel] = None):
+        """
+        Args:
+            initial_cash: Starting cash
+            margin_requirement: Equity a short position must keep as a fraction of
+                its market value (None disables short selling)
+            cost_model: Fees and execution-price model (None: trades are free)
+        """
+        if margin_requirement is not None and margin_requirement <= 0:
+            raise ValueError("Margin requirement must be positive")
         self.initial_cash = float(initial_cash)
+        self.margin_requirement = margin_requirement
+        self.cost_model = cost_model or NO_COSTS
         self.cash = self.initial_cash
-        self.positions = 0
+        # Shares held per instrument (negative when short); grows on the first
+        # trade in an instrument, so single-instrument games keep one entry
+        self.holdings = np.zeros(1, dtype=np.int64)
         self.trades: List[Dict] = []
+        # Side, quantity, quoted price and volume (NaN: unknown) of each trade, one
+        # column per trade, so trade logs can be re-priced without walking the dicts
+        self._trade_columns = np.empty((4, 16))
         self.portfolio_values: List[float] = [self.initial_cash]
-        self.current_price: float = 0.0
+        # Streaming risk metrics of portfolio_values
+        self.risk = RiskTracker(self.initial_cash)
+        # Price of the only instrument, or the price vector of a multi-instrument dataset
+        self.current_price = 0.0
+        
+        # Daily metrics are appended as columns and turned into a DataFrame on
+        # demand, so recording a day costs O(1) however long the game runs
+        self._metric_columns: Dict[str, list] = {column: [] for column in METRIC_COLUMNS}
+        self._metrics_frame: Optional[pd.DataFrame] = None
+        self._range_stats: Optional[RangeStats] = None
+        # Leading rows of portfolio_values still indexed as they are by _range_stats
+        self._range_rows = 0
+        
+        # Change versions for the state store: version moves on every change,
+        # trade_version only when cash, holdings or trades change
+        self.version = next_version()
+        self.trade_version = self.version
+        # Daily-metrics rows left unchanged since mark_saved() (appending keeps them)
+        self._saved_rows = 0
+    
+    @property
+    def positions(self) -> int:
+        """Shares held in the first (or only) instrument"""
+        return int(self.holdings[0])
+    
+    @positions.setter
+    def positions(self, value: int) -> None:
+        self.holdings[0] = value
+    
+    def holding(self, instrument: int) -> int:
+        """Shares held in an instrument (0 if it was never traded)"""
+        return int(self.holdings[instrument]) if instrument < len(self.holdings) else 0
+    
+    @property
+    def daily_metrics(self) -> pd.DataFrame:
+        """Daily metrics as a DataFrame (built once per change)"""
+        if self._metrics_frame is None:
+            self._metrics_frame = pd.DataFrame(self._metric_columns, columns=list(METRIC_COLUMNS))
+        return self._metrics_frame
+    
+    def range_stats(self) -> RangeStats:
+        """
+        Window statistics over the value history.
         
-        # Initialize daily metrics DataFrame
-        self.daily_metrics = pd.DataFrame(columns=[
-            'date',
-            'cash',
-            'portfolio_value',
-            'positions',
-            'pnl',
-            'return_pct',
-            'drawdown_pct'
-        ])
+        The index is built on first use and then only extended over the rows
+        appended or replaced since, so asking for it on every rerun is cheap.
+        Row 0 is the starting cash and row i the value of the i-th daily
+        metrics row, so windows can be located by date with RangeStats.row().
+        """
+        if self._range_stats is None:
+            self._range_stats = RangeStats(self.portfolio_values, self._metric_columns['date'])
+        elif self._range_rows < len(self.portfolio_values) or len(self._range_stats) != len(self.portfolio_values):
+            self._range_stats.update(self.portfolio_values, self._metric_columns['date'], self._range_rows)
+        self._range_rows = len(self.portfolio_values)
+        return self._range_stats
     
-    def update_daily_metrics(self, date: pd.Timestamp) -> None:
+    def update_daily_metrics(self, date: pd.Timestamp, portfolio_value: Optional[float] = None) -> None:
         """
-        Update daily metrics DataFrame with current portfolio state.
+        Update daily metrics with current portfolio state.
         
         Args:
             date: Current date for the metrics
+            portfolio_value: Portfolio value at the current price when already computed
         """
-        portfolio_value = self.get_portfolio_value(self.current_price)
-        pnl = self.get_current_pnl()
-        return_pct = (portfolio_value / self.initial_cash - 1) * 100
-        
-        # Calculate drawdown
-        if len(self.portfolio_values) > 0:
-            peak = max(self.portfolio_values)
-            drawdown_pct = ((peak - portfolio_value) / peak * 100) if peak > 0 else 0
-        else:
-            drawdown_pct = 0
-            
-        new_row = pd.DataFrame([{
-            'date': date,
-            'cash': self.cash,
-            'portfolio_value': portfolio_value,
-            'positions': self.positions,
-            'pnl': pnl,
-            'return_pct': return_pct,
-            'drawdown_pct': drawdown_pct
-        }])
-        
-        self.daily_metrics = pd.concat([self.daily_metrics, new_row], ignore_index=True)
+        if portfolio_value is None:
+            portfolio_value = self.get_portfolio_value(self.current_price)
+        peak = max(self.risk.peak, portfolio_value)
+        row = (
+            date,
+            self.cash,
+            portfolio_value,
+            self.positions,
+            portfolio_value - self.initial_cash,
+            (portfolio_value / self.initial_cash - 1) * 100,
+            ((peak - portfolio_value) / peak * 100) if peak > 0 else 0
+        )
+        for column, value in zip(METRIC_COLUMNS, row):
+            self._metric_columns[column].append(value)
+        self._metrics_frame = None
+        self.version = next_version()
     
-    def update_portfolio_value(self, current_price: float, date: pd.Timestamp = None) -> None:
+    def update_portfolio_value(self, current_price, date: pd.Timestamp = None, value: Optional[float] = None) -> None:
         """
         Update portfolio value with current price and daily metrics.
         
+        Valuing the portfolio again on the date of the last update (e.g. on
+        every rerun of a breakpoint) replaces that day's value and metrics
+        instead of adding a period.
+        
         Args:
-            current_price: Current price per share
+            current_price: Current price per share, or the price of every
+                instrument of a multi-instrument dataset
             date: Current date for metrics (defaults to current timestamp)
+            value: Portfolio value at current_price when already computed
+                (update_portfolio_values values all players at once)
         """
-        self.current_price = current_price
-        current_value = self.get_portfolio_value(current_price)
-        self.portfolio_values.append(current_value)
-        
+        previous_price, self.current_price = self.current_price, current_price
+        current_value = self.get_portfolio_value(current_price) if value is None else float(value)
         if date is None:
             date = pd.Timestamp.now()
-        self.update_daily_metrics(date)
+        
+        dates = self._metric_columns['date']
+        if dates and dates[-1] == date and len(self.portfolio_values) > 1:
+            columns = self._metric_columns
+            if current_value == self.portfolio_values[-1] and columns['cash'][-1] == self.cash \
+                    and columns['positions'][-1] == self.positions and np.array_equal(previous_price, current_price):
+                # Revaluing the day unchanged (e.g. on a rerun) leaves the history as it is
+                return
+            self._range_rows = min(self._range_rows, len(self.portfolio_values) - 1)
+            self.portfolio_values[-1] = current_value
+            self.risk.replace_latest(current_value)
+            for values in self._metric_columns.values():
+                values.pop()
+            self._saved_rows = min(self._saved_rows, len(dates))
+        else:
+            self.portfolio_values.append(current_value)
+            self.risk.update(current_value)
+        self.update_daily_metrics(date, current_value)
     
-    def execute_trade(self, action: str, quantity: int, price: float) -> None:
+    def record_values(self, dates, values, current_price) -> None:
         """
-        Execute a trade and update portfolio.
+        Record the values of a run of consecutive days over which the holdings
+        did not change, as update_portfolio_value() on each day in turn would.
+        
+        Args:
+            dates: Date of every day of the run
+            values: Portfolio value of every day of the run
+            current_price: Price (or price vector) of the last day
+        """
+        dates = pd.DatetimeIndex(dates)
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        # The first day may re-value the last recorded one
+        self.update_portfolio_value(current_price, dates[0], values[0])
+        rest = values[1:]
+        if len(rest) == 0:
+            return
+        drawdowns = running_drawdowns(rest, self.risk.peak)
+        self.portfolio_values.extend(rest.tolist())
+        if len(rest) > BULK_VALUES:
+            self.risk = RiskTracker.from_values(self.portfolio_values)
+        else:
+            for value in rest.tolist():
+                self.risk.update(value)
+        count = len(rest)
+        columns = self._metric_columns
+        columns['date'].extend(dates[1:].to_list())
+        columns['cash'].extend([self.cash] * count)
+        columns['portfolio_value'].extend(rest.tolist())
+        columns['positions'].extend([self.positions] * count)
+        columns['pnl'].extend((rest - self.initial_cash).tolist())
+        columns['return_pct'].extend(((rest / self.initial_cash - 1) * 100).tolist())
+        columns['drawdown_pct'].extend(drawdowns.tolist())
+        self._metrics_frame = None
+        self.version = next_version()
+    
+    @staticmethod
+    def apply_trade(cash: float, positions: int, action: str, quantity: int, price: float,
+                    margin_requirement: Optional[float] = None, fee: float = 0.0) -> Tuple[float, int]:
+        """
+        Validate a trade against a cash/positions state and return the resulting state.
+        
+        Selling more shares than held opens a short position, which is only
+        allowed with a margin requirement and while the equity after the
+        trade covers that fraction of the short's market value. 'cover' buys
+        back shorted shares without a cash check (used for liquidations).
         
         Args:
-            action: 'buy' or 'sell'
+            cash: Cash before the trade
+            positions: Shares held before the trade (negative when short)
+            action: 'buy', 'sell' or 'cover'
             quantity: Number of shares
-            price: Price per share
+            price: Execution price per share
+            margin_requirement: Margin requirement for short positions (None: no shorting)
+            fee: Fees charged on the trade
+            
+        Returns:
+            Tuple[float, int]: (cash, positions) after the trade
         """
         if action == 'buy':
-            cost = quantity * price
-            if cost > self.cash:
+            cost = quantity * price + fee
+            if cost > cash:
                 raise ValueError("Insufficient funds")
-            self.cash -= cost
-            self.positions += quantity
+            return cash - cost, positions + quantity
         elif action == 'sell':
-            if quantity > self.positions:
-                raise ValueError("Insufficient positions")
-            self.cash += quantity * price
-            self.positions -= quantity
+            cash, positions = cash + quantity * price - fee, positions - quantity
+            if positions < 0:
+                if margin_requirement is None:
+                    raise ValueError("Insufficient positions")
+                short_value = -positions * price
+                if cash - short_value < margin_requirement * short_value:
+                    raise ValueError("Insufficient margin")
+            return cash, positions
+        elif action == 'cover':
+            if quantity > -positions:
+                raise ValueError("No short position to cover")
+            return cash - quantity * price - fee, positions + quantity
+        return cash, positions
+    
+    @staticmethod
+    def max_sell_quantity(cash: float, positions: int, price: float, margin_requirement: Optional[float] = None) -> int:
+        """
+        Largest number of shares that can be sold at price, including shorting on margin.
+        
+        Selling s shares leaves cash + s * price and positions - s; the short
+        part must satisfy cash' >= (1 + margin) * short_value, which gives
+        s <= (cash + (1 + margin) * positions * price) / (margin * price).
+        """
+        if margin_requirement is None or price <= 0:
+            return max(0, positions)
+        limit = int((cash + (1 + margin_requirement) * positions * price) / (margin_requirement * price))
+        return max(0, positions, limit)
+    
+    def trade_terms(self, action: str, quantity: int, price: float, volume: Optional[float] = None) -> Tuple[float, float]:
+        """
+        Execution price and fee of a trade under this calculator's cost model.
+        
+        Returns:
+            Tuple[float, float]: (execution price, fee)
+        """
+        side = TRADE_SIDES.get(action)
+        if side is None or self.cost_model.is_free():
+            return price, 0.0
+        fill_price = float(self.cost_model.execution_price(side, quantity, price, volume))
+        return fill_price, float(self.cost_model.fee(quantity, fill_price))
+    
+    def execute_trade(self, action: str, quantity: int, price: float, volume: Optional[float] = None,
+                      instrument: int = 0) -> None:
+        """
+        Execute a trade and update portfolio.
+        
+        The trade log keeps the quoted price and volume, so the trades can be
+        re-priced in bulk when the cost model changes.
+        
+        Args:
+            action: 'buy', 'sell' or 'cover'
+            quantity: Number of shares
+            price: Quoted price per share
+            volume: Volume traded that day (for volume-dependent slippage)
+            instrument: Column of the instrument in a multi-instrument dataset
+        """
+        fill_price, fee = self.trade_terms(action, quantity, price, volume)
+        self.cash, position = self.apply_trade(
+            self.cash, self.holding(instrument), action, quantity, fill_price, self.margin_requirement, fee
+        )
+        if instrument >= len(self.holdings):
+            self.holdings = np.concatenate([self.holdings, np.zeros(instrument + 1 - len(self.holdings), dtype=np.int64)])
+        self.holdings[instrument] = position
         
+        self._record_trade_columns(len(self.trades), action, quantity, price, volume)
         self.trades.append({
             'action': action,
             'quantity': quantity,
             'price': price,
+            'volume': volume,
+            'instrument': instrument,
             'timestamp': pd.Timestamp.now()
         })
+        self.version = self.trade_version = next_version()
+    
+    def _record_trade_columns(self, position: int, action: str, quantity: int, price: float, volume: Optional[float]) -> None:
+        if position == self._trade_columns.shape[1]:
+            grown = np.empty((4, 2 * position))
+            grown[:, :position] = self._trade_columns
+            self._trade_columns = grown
+        self._trade_columns[:, position] = (TRADE_SIDES.get(action, 0), quantity, price, np.nan if volume is None else volume)
+    
+    def trade_columns(self) -> np.ndarray:
+        """
+        Trade log as arrays (a view, valid until the next trade).
+        
+        Returns:
+            np.ndarray: Rows side (+1 buy, -1 sell), quantity, quoted price and volume (NaN if unknown)
+        """
+        return self._trade_columns[:, :len(self.trades)]
+    
+    def get_fees_paid(self) -> float:
+        """
+        Total fees paid on the trades so far under the current cost model.
+        """
+        if not self.trades or self.cost_model.is_free():
+            return 0.0
+        sides, quantities, prices, volumes = self.trade_columns()
+        _, fees = replay_trade_costs(np.zeros(len(sides), dtype=np.int64), sides, quantities, prices, volumes, self.cost_model, 1)
+        return float(fees[0])
+    
+    def snapshot(self) -> Tuple:
+        """
+        Take a compact snapshot of the calculator state.
+        
+        Histories are append-only, so only their lengths are stored; restoring
+        truncates them back to those lengths.
+        
+        Returns:
+            Tuple: (cash, holdings, current_price, num_trades, num_values, num_metrics)
+        """
+        return (
+            self.cash,
+            tuple(self.holdings.tolist()),
+            self.current_price,
+            len(self.trades),
+            len(self.portfolio_values),
+            len(self._metric_columns['date'])
+        )
+    
+    def restore(self, snapshot: Optional[Tuple] = None) -> None:
+        """
+        Restore the calculator to a snapshot taken earlier on this calculator.
+        
+        Args:
+            snapshot: Value returned by snapshot(), or None for the initial state
+        """
+        if snapshot is None:
+            snapshot = (self.initial_cash, 0, 0.0, 0, 1, 0)
+        cash, holdings, current_price, num_trades, num_values, num_metrics = snapshot
+        self.cash = cash
+        self.holdings = np.array(holdings, dtype=np.int64).reshape(-1)
+        self.current_price = current_price
+        del self.trades[num_trades:]
+        if len(self.portfolio_values) > num_values:
+            del self.portfolio_values[num_values:]
+            self._range_rows = min(self._range_rows, num_values)
+            self.risk = RiskTracker.from_values(self.portfolio_values)
+        if len(self._metric_columns['date']) > num_metrics:
+            for values in self._metric_columns.values():
+                del values[num_metrics:]
+            self._metrics_frame = None
+        self._saved_rows = min(self._saved_rows, num_metrics)
+        self.version = self.trade_version = next_version()
+    
+    def to_state(self, rows: bool = True) -> Dict:
+        """
+        Export the calculator as plain values and arrays for the state store.
+        
+        Args:
+            rows: Include the daily history; without it the state is only the
+                small part that changes with trades (see rows_state())
+        
+        Returns:
+            Dict: State accepted by from_state()
+        """
+        state = {
+            'initial_cash': self.initial_cash,
+            'margin_requirement': self.margin_requirement,
+            'cost_model': tuple(self.cost_model),
+            'cash': self.cash,
+            'positions': self.positions,
+            'holdings': self.holdings.copy(),
+            'current_price': self.current_price,
+            'trades': self.trades
+        }
+        if rows:
+            state['portfolio_values'] = np.asarray(self.portfolio_values, dtype=np.float64)
+            state['daily_metrics'] = {column: np.asarray(values) for column, values in self._metric_columns.items()}
+        return state
+    
+    def unsaved_row(self) -> int:
+        """First daily-metrics row changed (other than appended) since mark_saved()"""
+        return self._saved_rows
+    
+    def mark_saved(self) -> None:
+        """Record that the whole daily history has been saved"""
+        self._saved_rows = len(self._metric_columns['date'])
+    
+    def rows_state(self, start: int) -> Dict:
+        """
+        Export the daily history from a row on, to be applied on top of an
+        earlier export with from_state().
+        
+        Row i is daily-metrics row i and portfolio value i + 1 (value 0 is the
+        starting cash).
+        
+        Args:
+            start: First daily-metrics row to export
+            
+        Returns:
+            Dict: Rows and the current price, as a from_state() row chunk
+        """
+        return {
+            'start': start,
+            'current_price': self.current_price,
+            'portfolio_values': np.asarray(self.portfolio_values[start + 1:], dtype=np.float64),
+            'daily_metrics': {column: np.asarray(values[start:]) for column, values in self._metric_columns.items()}
+        }
+    
+    @classmethod
+    def from_state(cls, state: Dict, row_chunks: Sequence[Dict] = ()) -> 'PnLCalculator':
+        """
+        Rebuild a calculator exported with to_state().
+        
+        Args:
+            state: Value returned by to_state()
+            row_chunks: Values returned by rows_state(), applied in order on top
+                of the rows in state (each replaces the rows from its start on)
+            
+        Returns:
+            PnLCalculator: Restored calculator
+        """
+        calc = cls(
+            initial_cash=state['initial_cash'],
+            margin_requirement=state.get('margin_requirement'),
+            cost_model=CostModel(*state.get('cost_model', ()))
+        )
+        calc.cash = state['cash']
+        calc.holdings = np.array(state.get('holdings', [state['positions']]), dtype=np.int64)
+        calc.current_price = state['current_price']
+        calc.trades = list(state['trades'])
+        for position, trade in enumerate(calc.trades):
+            calc._record_trade_columns(position, trade['action'], trade['quantity'], trade['price'], trade.get('volume'))
+        if 'portfolio_values' in state:
+            calc.portfolio_values = state['portfolio_values'].tolist()
+            for column in METRIC_COLUMNS:
+                calc._metric_columns[column] = list(state['daily_metrics'].get(column, ()))
+        for chunk in row_chunks:
+            start = chunk['start']
+            calc.current_price = chunk['current_price']
+            del calc.portfolio_values[start + 1:]
+            calc.portfolio_values.extend(chunk['portfolio_values'].tolist())
+            for column in METRIC_COLUMNS:
+                del calc._metric_columns[column][start:]
+                calc._metric_columns[column].extend(chunk['daily_metrics'].get(column, ()))
+        calc.risk = RiskTracker.from_values(calc.portfolio_values)
+        calc.mark_saved()
+        return calc
     
     def get_current_pnl(self) -> float:
         """
@@ -104,52 +473,35 @@ class PnLCalculator:
         """
         return self.get_portfolio_value(self.current_price) - self.initial_cash
     
-    def get_portfolio_value(self, current_price: float) -> float:
+    def get_portfolio_value(self, current_price) -> float:
         """
         Calculate current portfolio value.
         
         Args:
-            current_price: Current price per share
+            current_price: Current price per share, or the price of every
+                instrument of a multi-instrument dataset
             
         Returns:
             float: Total portfolio value
         """
-        return self.cash + (self.positions * current_price)
+        if np.ndim(current_price) == 0:
+            return self.cash + (self.positions * current_price)
+        prices = np.asarray(current_price, dtype=np.float64)
+        count = min(len(prices), len(self.holdings))
+        return self.cash + float(self.holdings[:count] @ prices[:count])
     
-    def get_performance_metrics(self) -> Dict:
+    def get_performance_metrics(self, periods_per_year: float = TRADING_PERIODS_PER_YEAR) -> Dict:
         """
         Calculate performance metrics.
         
+        The metrics are maintained as values are recorded (see RiskTracker),
+        so this is O(1) however long the game has run.
+        
+        Args:
+            periods_per_year: Return periods per year used to annualize
+                (252 for daily data)
+        
         Returns:
             Dict: Dictionary containing performance metrics
         """
-        if not self.portfolio_values or len(self.portfolio_values) < 2:
-            return {
-                'total_return': 0,
-                'max_drawdown': 0,
-                'sharpe_ratio': 0
-            }
-        
-        returns = pd.Series(self.portfolio_values).pct_change().dropna()
-        
-        total_return = (self.portfolio_values[-1] / self.initial_cash - 1) * 100
-        
-        # Calculate max drawdown safely
-        try:
-            cumulative_max = pd.Series(self.portfolio_values).cummax()
-            drawdowns = (cumulative_max - self.portfolio_values) / cumulative_max * 100
-            max_drawdown = drawdowns.max()
-        except (ZeroDivisionError, ValueError):
-            max_drawdown = 0
-        
-        # Simple Sharpe ratio calculation (assuming risk-free rate of 0)
-        try:
-            sharpe_ratio = returns.mean() / returns.std() if len(returns) > 1 and returns.std() != 0 else 0
-        except (ZeroDivisionError, ValueError):
-            sharpe_ratio = 0
-        
-        return {
-            'total_return': total_return,
-            'max_drawdown': max_drawdown,
-            'sharpe_ratio': sharpe_ratio
-        }
+        return self.risk.metrics(periods_per_year)
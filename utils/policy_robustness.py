@@ -0,0 +1,305 @@
+"""
+Monte Carlo robustness of a player's decision policy.
+
+A player's recorded breakpoint decisions are read as a policy: the exposure
+(position value / wealth) targeted at a breakpoint as a function of the
+trailing return into it. The policy is a piecewise-linear fit through the
+mean exposure of quantile bins of the recorded (return, exposure) pairs,
+flat beyond the outermost bins.
+
+The policy is then replayed on thousands of variations of the days revealed
+so far with the same breakpoints, so one lucky (or unlucky) path says less
+about skill:
+
+    bootstrap   Blocks of the returns revealed so far, resampled with
+                replacement (keeps short-range autocorrelation and
+                volatility clustering)
+    synthetic   Paths of a scenario_generator model calibrated to the
+                drift and volatility of the returns revealed so far
+
+Paths are simulated as (paths x days) arrays in chunks sized to a memory
+budget, and the chunks run across a process pool. Chunk i is drawn from
+child i of a SeedSequence, so the results do not depend on the number of
+workers. Figures are before fees.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, NamedTuple, Sequence
+import numpy as np
+import pandas as pd
+from utils.decision_analytics import trade_log_arrays
+from utils.instruments import instrument_columns
+from utils.path_kernels import max_drawdowns
+from utils.scenario_generator import DEFAULT_PARAMS, MODELS, simulate_log_returns
+
+ROBUSTNESS_METHODS = ('bootstrap', 'synthetic')
+
+# Rows of trailing return the policy looks at
+POLICY_LOOKBACK = 20
+
+# Quantile bins of the recorded decisions the policy is fitted through
+POLICY_BINS = 5
+
+# Rows per resampled block of the bootstrap
+BLOCK_LENGTH = 20
+
+# Largest absolute exposure the policy targets (keeps near-bust wealth from blowing up)
+MAX_EXPOSURE = 5.0
+
+# Memory budget of one chunk of paths
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# Bytes per (path, day) cell: log returns/prices, portfolio values and bootstrap indices (or running peaks)
+_BYTES_PER_CELL = 24
+
+def default_workers() -> int:
+    """Worker processes to use for a simulation (all but one CPU)"""
+    return max(1, (os.cpu_count() or 1) - 1)
+
+class ExposurePolicy(NamedTuple):
+    """Target exposure as a piecewise-linear function of the trailing return"""
+    knots: np.ndarray
+    levels: np.ndarray
+
+    def target(self, trailing_returns: np.ndarray) -> np.ndarray:
+        """Target exposure for each trailing return"""
+        return np.interp(trailing_returns, self.knots, self.levels)
+
+class RobustnessResult(NamedTuple):
+    """Distribution of a policy's results over simulated paths (in %)"""
+    policy: ExposurePolicy
+    final_returns: np.ndarray
+    max_drawdowns: np.ndarray
+    historical_return: float
+    historical_drawdown: float
+
+    def summary(self) -> Dict[str, float]:
+        """Percentiles of the final return and max drawdown distributions"""
+        returns, drawdowns = self.final_returns, self.max_drawdowns
+        return {
+            'Paths': len(returns),
+            'Mean Return %': float(returns.mean()),
+            'Return 5th pct %': float(np.percentile(returns, 5)),
+            'Median Return %': float(np.median(returns)),
+            'Return 95th pct %': float(np.percentile(returns, 95)),
+            'Loss Probability %': float((returns < 0).mean() * 100),
+            'Median Max DD %': float(np.median(drawdowns)),
+            'Max DD 95th pct %': float(np.percentile(drawdowns, 95)),
+            'Historical Return %': self.historical_return,
+            'Historical Max DD %': self.historical_drawdown
+        }
+
+def trailing_returns(prices: np.ndarray, days: np.ndarray, lookback: int = POLICY_LOOKBACK) -> np.ndarray:
+    """Return over the lookback rows up to each day (last axis of prices is time)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = prices[..., days] / prices[..., np.maximum(days - lookback, 0)] - 1
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+def recorded_exposures(prices: np.ndarray, decision_days: Sequence[int], portfolio: Dict, dates: pd.Series,
+                       initial_cash: float, instrument: int = 0) -> np.ndarray:
+    """
+    Exposure to one instrument a player took at each breakpoint.
+
+    The trades of a segment (up to the next breakpoint) count as the
+    decision made at the breakpoint opening it.
+
+    Args:
+        prices: Days x instruments price matrix
+        decision_days: Sorted breakpoint days
+        portfolio: The player's portfolio (its trading_history is read)
+        dates: Date of every day of the dataset
+        initial_cash: The player's starting cash
+        instrument: Instrument whose exposure is read
+
+    Returns:
+        np.ndarray: Position value / wealth after each breakpoint's trades
+    """
+    days = np.asarray(decision_days, dtype=np.int64)
+    trades = trade_log_arrays({1: portfolio}, dates)
+    num_decisions, num_instruments = len(days), prices.shape[1]
+    segment = np.clip(np.searchsorted(days, trades.day, side='right') - 1, 0, num_decisions - 1)
+    signed = (trades.side * trades.quantity).astype(np.float64)
+    net_shares = np.bincount(segment * num_instruments + trades.instrument, weights=signed,
+                             minlength=num_decisions * num_instruments).reshape(num_decisions, num_instruments)
+    after = np.cumsum(net_shares, axis=0)
+    spent = np.bincount(segment, weights=signed * trades.price, minlength=num_decisions)
+    cash_before = initial_cash - (np.cumsum(spent) - spent)
+    start_prices = prices[days]
+    wealth = cash_before + np.einsum('di,di->d', after - net_shares, start_prices)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exposures = np.where(wealth > 0, after[:, instrument] * start_prices[:, instrument] / wealth, 0.0)
+    return np.clip(exposures, -MAX_EXPOSURE, MAX_EXPOSURE)
+
+def fit_policy(features: np.ndarray, exposures: np.ndarray, bins: int = POLICY_BINS) -> ExposurePolicy:
+    """
+    Fit the exposure policy through the mean of quantile bins of the decisions.
+
+    Args:
+        features: Trailing return at each decision
+        exposures: Exposure taken at each decision
+        bins: Number of quantile bins (fewer when there are fewer decisions)
+
+    Returns:
+        ExposurePolicy: Knots at the bins' mean return, levels at their mean exposure
+    """
+    if len(features) == 0:
+        raise ValueError("The player has no decisions to fit a policy to")
+    order = np.argsort(features, kind='stable')
+    groups = np.array_split(order, min(bins, len(order)))
+    knots = np.array([features[group].mean() for group in groups])
+    levels = np.array([exposures[group].mean() for group in groups])
+    # Merge bins with the same mean return (np.interp needs increasing knots)
+    knots, first = np.unique(knots, return_index=True)
+    return ExposurePolicy(knots, levels[first])
+
+def bootstrap_log_returns(source: np.ndarray, num_paths: int, num_steps: int, rng: np.random.Generator,
+                          block_length: int = BLOCK_LENGTH) -> np.ndarray:
+    """
+    Paths x steps log returns made of blocks of source drawn with replacement.
+    """
+    # At most half the source per block, so short histories still give varied paths
+    block_length = max(1, min(block_length, len(source) // 2))
+    num_blocks = -(-num_steps // block_length)
+    starts = rng.integers(0, len(source) - block_length + 1, (num_paths, num_blocks))
+    rows = (starts[:, :, None] + np.arange(block_length)).reshape(num_paths, -1)[:, :num_steps]
+    return source[rows]
+
+def calibrated_params(model: str, source: np.ndarray, periods_per_year: float) -> Dict[str, float]:
+    """Drift and volatility of source, as the annualized parameters model takes"""
+    sigma = float(source.std(ddof=1)) * np.sqrt(periods_per_year) if len(source) > 1 else 0.0
+    params = {'mu': float(source.mean()) * periods_per_year + 0.5 * sigma ** 2, 'sigma': sigma}
+    return {name: value for name, value in params.items() if name in DEFAULT_PARAMS[model]}
+
+def synthetic_log_returns(model: str, params: Dict, num_paths: int, num_steps: int, rng: np.random.Generator,
+                          periods_per_year: float) -> np.ndarray:
+    """Paths x steps log returns of a scenario_generator model"""
+    return simulate_log_returns(model, num_steps, rng, 1 / periods_per_year, num_paths=num_paths, **params)
+
+def evaluate_policy(prices: np.ndarray, decision_days: np.ndarray, policy: ExposurePolicy, initial_cash: float,
+                    lookback: int = POLICY_LOOKBACK):
+    """
+    Replay a policy on every path of a paths x days price matrix.
+
+    At each breakpoint the wealth is rebalanced to the policy's exposure
+    and the shares are held to the next breakpoint, like a player does.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Final return and max drawdown of every path, in %
+    """
+    num_paths, num_days = prices.shape
+    values = np.full((num_paths, num_days), float(initial_cash))
+    wealth = values[:, 0].copy()
+    targets = policy.target(trailing_returns(prices, decision_days, lookback))
+    ends = np.append(decision_days[1:], num_days)
+    for k, (day, end) in enumerate(zip(decision_days.tolist(), ends.tolist())):
+        start_prices = prices[:, day]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares = np.where(start_prices > 0, targets[:, k] * np.maximum(wealth, 0.0) / start_prices, 0.0)
+        cash = wealth - shares * start_prices
+        segment = values[:, day:end]
+        np.multiply(prices[:, day:end], shares[:, None], out=segment)
+        segment += cash[:, None]
+        if end < num_days:
+            wealth = cash + shares * prices[:, end]
+    final_returns = (values[:, -1] / initial_cash - 1) * 100
+    return final_returns, max_drawdowns(values)
+
+def _run_chunk(task):
+    """Simulate one chunk of paths and replay the policy on it (runs in a worker process)"""
+    seed, num_paths, method, source, model, params, num_days, start_price, decision_days, policy, \
+        initial_cash, lookback, block_length, periods_per_year = task
+    rng = np.random.default_rng(seed)
+    if method == 'bootstrap':
+        log_prices = bootstrap_log_returns(source, num_paths, num_days - 1, rng, block_length)
+    else:
+        log_prices = synthetic_log_returns(model, params, num_paths, num_days - 1, rng, periods_per_year)
+    np.cumsum(log_prices, axis=1, out=log_prices)
+    prices = np.empty((num_paths, num_days))
+    prices[:, 0] = start_price
+    np.exp(log_prices, out=prices[:, 1:])
+    prices[:, 1:] *= start_price
+    del log_prices
+    return evaluate_policy(prices, decision_days, policy, initial_cash, lookback)
+
+def policy_robustness(df: pd.DataFrame, breakpoints: Sequence[int], portfolio: Dict, current_day_index: int,
+                      initial_cash: float, num_paths: int = 1000, method: str = 'bootstrap', model: str = 'gbm',
+                      seed: int = 0, workers: int = 1, instrument: int = 0, lookback: int = POLICY_LOOKBACK,
+                      block_length: int = BLOCK_LENGTH, periods_per_year: float = 252,
+                      chunk_bytes: int = CHUNK_BYTES) -> RobustnessResult:
+    """
+    Fit a player's policy and evaluate it on simulated variations of the dataset.
+
+    Only the decisions, breakpoints and returns up to the current day are
+    used (the simulated paths and the actual path end on it), so the
+    simulation gives nothing about the rest of the dataset away.
+
+    Args:
+        df: DataFrame with price data
+        breakpoints: Day indices where trading is allowed
+        portfolio: The player's portfolio
+        current_day_index: Last day revealed
+        initial_cash: The player's starting cash
+        num_paths: Number of simulated paths
+        method: One of ROBUSTNESS_METHODS
+        model: scenario_generator model of the synthetic paths
+        seed: Seed of the simulation
+        workers: Worker processes (1 runs in this process)
+        instrument: Instrument the policy trades
+        lookback: Rows of trailing return the policy looks at
+        block_length: Rows per bootstrap block
+        periods_per_year: Rows per year, to calibrate synthetic models
+        chunk_bytes: Memory budget of one chunk of paths
+
+    Returns:
+        RobustnessResult: The policy and its final returns and max drawdowns
+    """
+    if method not in ROBUSTNESS_METHODS:
+        raise ValueError(f"Unknown method '{method}', expected one of {', '.join(ROBUSTNESS_METHODS)}")
+    if model not in MODELS:
+        raise ValueError(f"Unknown model '{model}', expected one of {', '.join(MODELS)}")
+    prices = df[instrument_columns(df)].to_numpy(dtype=np.float64)
+    num_days = len(prices)
+    decision_days = np.unique(np.asarray([bp for bp in breakpoints if 0 <= bp < num_days], dtype=np.int64))
+    decided = decision_days[decision_days < current_day_index]
+    if len(decided) == 0:
+        raise ValueError("No decisions have been made yet")
+
+    instrument_prices = prices[:, instrument]
+    exposures = recorded_exposures(prices, decided, portfolio, df['Date'], initial_cash, instrument)
+    policy = fit_policy(trailing_returns(instrument_prices, decided, lookback), exposures)
+
+    revealed = instrument_prices[:current_day_index + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        source = np.diff(np.log(revealed))
+    source = source[np.isfinite(source)]
+    if len(source) == 0:
+        raise ValueError("Not enough revealed prices to simulate from")
+    params = calibrated_params(model, source, periods_per_year) if method == 'synthetic' else {}
+
+    num_days = len(revealed)
+    historical_return, historical_drawdown = evaluate_policy(
+        revealed[None, :], decided, policy, initial_cash, lookback
+    )
+
+    chunk_paths = max(1, min(num_paths, chunk_bytes // (_BYTES_PER_CELL * num_days)))
+    sizes = [min(chunk_paths, num_paths - start) for start in range(0, num_paths, chunk_paths)]
+    tasks = [
+        (child, size, method, source if method == 'bootstrap' else None, model, params, num_days, float(instrument_prices[0]), decided, policy,
+         float(initial_cash), lookback, block_length, periods_per_year)
+        for child, size in zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes)
+    ]
+    if workers > 1 and len(tasks) > 1:
+        # Spawned rather than forked workers: the Streamlit server process runs other threads
+        with ProcessPoolExecutor(min(workers, len(tasks)), mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+    else:
+        results = [_run_chunk(task) for task in tasks]
+
+    return RobustnessResult(
+        policy,
+        np.concatenate([final_returns for final_returns, _ in results]),
+        np.concatenate([drawdowns for _, drawdowns in results]),
+        float(historical_return[0]),
+        float(historical_drawdown[0])
+    )
@@ -1,5 +1,7 @@
+from typing import Optional
 import streamlit as st
 from utils.pnl_calculator import PnLCalculator
+from utils.cost_models import CostModel
 
 def reset_all_portfolios():
     """Reset all portfolios with the current starting cash amount"""
@@ -7,18 +9,23 @@ def reset_all_portfolios():
         st.session_state.portfolios[i] = {
             'cash': st.session_state.starting_cash,
             'positions': 0,
-            'pnl_calculator': PnLCalculator(initial_cash=st.session_state.starting_cash),
+            'pnl_calculator': PnLCalculator(
+                initial_cash=st.session_state.starting_cash,
+                margin_requirement=st.session_state.margin_requirement,
+                cost_model=st.session_state.cost_model
+            ),
             'trading_history': []
         }
 
-def initialize_portfolios(num_players: int, starting_cash: float):
-    """Initialize portfolios for all players"""
+def initialize_portfolios(num_players: int, starting_cash: float, margin_requirement: Optional[float] = None,
+                          cost_model: Optional[CostModel] = None):
+    """Initialize portfolios for all players (short selling needs a margin requirement)"""
     portfolios = {}
     for i in range(1, num_players + 1):
         portfolios[i] = {
             'cash': starting_cash,
             'positions': 0,
-            'pnl_calculator': PnLCalculator(initial_cash=starting_cash),
+            'pnl_calculator': PnLCalculator(initial_cash=starting_cash, margin_requirement=margin_requirement, cost_model=cost_model),
             'trading_history': []
         }
     return portfolios
@@ -40,7 +47,11 @@ def update_player_portfolios(num_players: int):
             new_portfolios[i] = {
                 'cash': st.session_state.starting_cash,
                 'positions': 0,
-                'pnl_calculator': PnLCalculator(initial_cash=st.session_state.starting_cash),
+                'pnl_calculator': PnLCalculator(
+                    initial_cash=st.session_state.starting_cash,
+                    margin_requirement=st.session_state.margin_requirement,
+                    cost_model=st.session_state.cost_model
+                ),
                 'trading_history': []
             }
             new_player_names[i] = f"Player {i}"
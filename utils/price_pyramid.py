@@ -0,0 +1,106 @@
+from typing import Dict, List
+import numpy as np
+
+# Each pyramid level aggregates this many buckets of the level below
+PYRAMID_FACTOR = 4
+
+class PricePyramid:
+    """
+    Multi-resolution open/high/low/close aggregates of a price series.
+
+    Level 0 holds the raw prices; level k aggregates PYRAMID_FACTOR**k rows per
+    bucket. The pyramid is built once per dataset in O(n) and answers window
+    queries with at most max_buckets buckets, whatever the length of the history.
+    """
+
+    def __init__(self, prices, open_prices=None, high_prices=None, low_prices=None,
+                 volumes=None, factor: int = PYRAMID_FACTOR):
+        prices = np.asarray(prices, dtype=np.float64)
+        self.factor = factor
+        self.num_rows = len(prices)
+        self.has_volume = volumes is not None
+
+        # Without bars every row is a flat candle at its price
+        base = {
+            'start': np.arange(self.num_rows, dtype=np.int64),
+            'open': prices if open_prices is None else np.asarray(open_prices),
+            'high': prices if high_prices is None else np.asarray(high_prices),
+            'low': prices if low_prices is None else np.asarray(low_prices),
+            'close': prices,
+        }
+        if self.has_volume:
+            base['volume'] = np.asarray(volumes, dtype=np.int64)
+        self.levels: List[Dict[str, np.ndarray]] = [base]
+
+        while len(self.levels[-1]['start']) > 1:
+            below = self.levels[-1]
+            group_starts = np.arange(0, len(below['start']), factor)
+            group_ends = np.minimum(group_starts + factor, len(below['start'])) - 1
+            level = {
+                'start': below['start'][group_starts],
+                'open': below['open'][group_starts],
+                'high': np.maximum.reduceat(below['high'], group_starts),
+                'low': np.minimum.reduceat(below['low'], group_starts),
+                'close': below['close'][group_ends],
+            }
+            if self.has_volume:
+                level['volume'] = np.add.reduceat(below['volume'], group_starts)
+            self.levels.append(level)
+
+    def level_for_window(self, start_index: int, end_index: int, max_buckets: int) -> int:
+        """
+        Pick the finest level that covers a window with at most max_buckets buckets.
+
+        Args:
+            start_index: First row of the window
+            end_index: Last row of the window (inclusive)
+            max_buckets: Maximum number of buckets to return (e.g. chart pixel width)
+
+        Returns:
+            int: Pyramid level
+        """
+        window_rows = max(1, end_index - start_index + 1)
+        level = 0
+        # +1 allows for a partial bucket at each edge of the window
+        while level < len(self.levels) - 1 and -(-window_rows // self.factor ** level) + 1 > max_buckets:
+            level += 1
+        return level
+
+    def query(self, start_index: int, end_index: int, max_buckets: int) -> Dict[str, np.ndarray]:
+        """
+        Get aggregated buckets covering rows start_index..end_index.
+
+        Args:
+            start_index: First row of the window
+            end_index: Last row of the window (inclusive)
+            max_buckets: Maximum number of buckets to return
+
+        Returns:
+            Dict[str, np.ndarray]: 'start' (first row of each bucket), 'open',
+            'high', 'low', 'close' (and 'volume') arrays plus the chosen 'level'
+        """
+        start_index = max(0, start_index)
+        end_index = min(self.num_rows - 1, end_index)
+        level = self.level_for_window(start_index, end_index, max_buckets)
+        buckets = self.levels[level]
+
+        # Buckets overlapping the window: the one containing start_index up to
+        # the one containing end_index
+        first = max(0, np.searchsorted(buckets['start'], start_index, side='right') - 1)
+        last = np.searchsorted(buckets['start'], end_index, side='right')
+        window = {key: values[first:last].copy() for key, values in buckets.items()}
+
+        # Rebuild the last bucket from raw rows if it runs past end_index, so a
+        # prefix query never includes rows after the window (no lookahead)
+        last_start = window['start'][-1]
+        if level > 0 and last_start + self.factor ** level - 1 > end_index:
+            raw = self.levels[0]
+            rows = slice(last_start, end_index + 1)
+            window['high'][-1] = raw['high'][rows].max()
+            window['low'][-1] = raw['low'][rows].min()
+            window['close'][-1] = raw['close'][end_index]
+            if self.has_volume:
+                window['volume'][-1] = raw['volume'][rows].sum()
+
+        window['level'] = level
+        return window
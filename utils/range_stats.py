@@ -0,0 +1,235 @@
+"""
+Statistics of any window of a portfolio value history.
+
+The history is indexed once and extended as rows are appended: prefix sums
+of the returns and squared returns give a window's mean and volatility in
+O(1), and per-block aggregates give its high, low and max drawdown. A
+window is its partial first and last blocks, scanned directly, and the
+whole blocks between them, merged from their aggregates. Merging keeps the
+worse of the parts' drawdowns or an earlier part's peak to a later part's
+trough, so a query costs O(RANGE_BLOCK + n / RANGE_BLOCK) and the index
+adds three values per block on top of the prefix sums.
+"""
+from typing import NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+from utils.risk_metrics import TRADING_PERIODS_PER_YEAR
+
+# Rows per block of the high/low/drawdown aggregates
+RANGE_BLOCK = 256
+
+class RangeSummary(NamedTuple):
+    """Statistics of the window between two rows of a value history"""
+    start: int
+    end: int
+    periods: int
+    total_return: float
+    annualized_return: float
+    volatility: float
+    sharpe_ratio: float
+    max_drawdown: float
+    high: float
+    low: float
+
+def _drawdown(peak, value):
+    """Fractional drop from peak to value (0 for non-positive peaks)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(peak > 0, 1 - value / peak, 0.0)
+
+def _block_aggregates(values: np.ndarray, block: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """High, low and max drawdown of each block of values (the last one may be partial)"""
+    num_blocks = -(-len(values) // block)
+    padded = np.pad(values, (0, num_blocks * block - len(values)), mode='edge').reshape(num_blocks, block)
+    peaks = np.maximum.accumulate(padded, axis=1)
+    return padded.max(axis=1), padded.min(axis=1), _drawdown(peaks, padded).max(axis=1)
+
+def _merge(first: Tuple[float, float, float], second: Tuple[float, float, float]) -> Tuple[float, float, float]:
+    """(high, low, drawdown) of two adjacent windows, first before second"""
+    return (
+        max(first[0], second[0]),
+        min(first[1], second[1]),
+        max(first[2], second[2], float(_drawdown(first[0], second[1])))
+    )
+
+def _grown(array: np.ndarray, size: int) -> np.ndarray:
+    """array with room for at least size items (doubling, so appends are amortized O(1))"""
+    if len(array) >= size:
+        return array
+    grown = np.empty(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+class RangeStats:
+    """
+    Window queries over one value history.
+
+    Row 0 is the initial value; rows can be located by date with row().
+    """
+
+    def __init__(self, values, dates=None, block: int = RANGE_BLOCK):
+        """
+        Args:
+            values: Value history (e.g. PnLCalculator.portfolio_values)
+            dates: Date of every row after the first (e.g. daily_metrics['date']);
+                the first row is before every date
+            block: Rows per block of the high/low/drawdown aggregates
+        """
+        self.block = block
+        self._length = 0
+        self._values = np.empty(0)
+        self._return_sums = np.empty(0)
+        self._square_sums = np.empty(0)
+        self._dates = None if dates is None else np.empty(0, dtype='datetime64[ns]')
+        self._highs = self._lows = self._drawdowns = np.empty(0)
+        self.update(values, dates)
+
+    def update(self, values, dates=None, unchanged: int = 0) -> None:
+        """
+        Index the history again after rows were appended, replaced or dropped.
+
+        Args:
+            values: The whole value history
+            dates: The date of every row after the first (when indexed with dates)
+            unchanged: Leading rows that are the same as when last indexed;
+                only the rows after them are indexed again
+        """
+        n = len(values)
+        if n == 0:
+            raise ValueError("Value history is empty")
+        if (dates is None) != (self._dates is None) or (dates is not None and len(dates) != n - 1):
+            raise ValueError("Every value after the first needs a date")
+        first = max(0, min(unchanged, self._length, n))
+        tail = np.asarray(values[first:], dtype=np.float64)
+
+        self._values = _grown(self._values, n)
+        self._values[first:n] = tail
+        if dates is not None:
+            self._dates = _grown(self._dates, n - 1)
+            # DatetimeIndex converts a list of Timestamps faster than numpy does
+            self._dates[max(first - 1, 0):n - 1] = pd.DatetimeIndex(dates[max(first - 1, 0):]).to_numpy()
+
+        # Returns of rows first..n - 1, summed on from the sums before them
+        self._return_sums = _grown(self._return_sums, n)
+        self._square_sums = _grown(self._square_sums, n)
+        since = max(first, 1)
+        previous = self._values[since - 1:n - 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.where(previous != 0, self._values[since:n] / previous - 1, 0.0)
+        self._return_sums[0] = self._square_sums[0] = 0.0
+        self._return_sums[since:n] = np.cumsum(np.concatenate([[self._return_sums[since - 1]], returns]))[1:]
+        self._square_sums[since:n] = np.cumsum(np.concatenate([[self._square_sums[since - 1]], returns * returns]))[1:]
+
+        # Blocks from the one holding the first changed row on
+        first_block = first // self.block
+        highs, lows, drawdowns = _block_aggregates(self._values[first_block * self.block:n], self.block)
+        self._highs = np.concatenate([self._highs[:first_block], highs])
+        self._lows = np.concatenate([self._lows[:first_block], lows])
+        self._drawdowns = np.concatenate([self._drawdowns[:first_block], drawdowns])
+        self._length = n
+
+    @property
+    def values(self) -> np.ndarray:
+        """The indexed value history"""
+        return self._values[:self._length]
+
+    @property
+    def dates(self) -> Optional[np.ndarray]:
+        """Date of every row after the first (None without dates)"""
+        return None if self._dates is None else self._dates[:self._length - 1]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory of the index, including the room kept for appended rows"""
+        arrays = [self._values, self._return_sums, self._square_sums, self._highs, self._lows, self._drawdowns]
+        return sum(array.nbytes for array in arrays) + (0 if self._dates is None else self._dates.nbytes)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def row(self, date) -> int:
+        """Last row recorded on or before date (0 if none)"""
+        if self.dates is None:
+            raise ValueError("Value history has no dates")
+        return int(np.searchsorted(self.dates, np.datetime64(date, 'ns'), side='right'))
+
+    def _check(self, start: int, end: int) -> None:
+        if not 0 <= start <= end < self._length:
+            raise ValueError(f"Invalid window [{start}, {end}] for {self._length} rows")
+
+    def _scan(self, start: int, end: int) -> Tuple[float, float, float]:
+        """(high, low, drawdown) of rows start..end by a direct scan"""
+        window = self._values[start:end + 1]
+        peaks = np.maximum.accumulate(window)
+        return float(window.max()), float(window.min()), float(_drawdown(peaks, window).max())
+
+    def extremes(self, start: int, end: int):
+        """
+        High, low and max drawdown (as a fraction) of rows start..end.
+
+        Returns:
+            Tuple[float, float, float]: (high, low, max drawdown)
+        """
+        # Rows may come from numpy (e.g. searchsorted), whose integers are kept out of the scalar maths
+        start, end = int(start), int(end)
+        self._check(start, end)
+        first_block, last_block = start // self.block + 1, end // self.block
+        if last_block - first_block < 2:
+            return self._scan(start, end)
+        # Whole blocks between the partial ones: an earlier block's peak may fall to a later block's low
+        highs = self._highs[first_block:last_block]
+        lows = self._lows[first_block:last_block]
+        earlier_peaks = np.maximum.accumulate(highs)[:-1]
+        blocks = (
+            float(highs.max()), float(lows.min()),
+            float(max(self._drawdowns[first_block:last_block].max(), _drawdown(earlier_peaks, lows[1:]).max()))
+        )
+        head = self._scan(start, first_block * self.block - 1)
+        tail = self._scan(last_block * self.block, end)
+        return _merge(_merge(head, blocks), tail)
+
+    def query(self, start: int, end: int, periods_per_year: float = TRADING_PERIODS_PER_YEAR) -> RangeSummary:
+        """
+        Statistics of the window from row start to row end.
+
+        Args:
+            start: Row the window starts from (its value is the base of the returns)
+            end: Last row of the window
+            periods_per_year: Return periods per year used to annualize
+
+        Returns:
+            RangeSummary: Returns, volatility, drawdown and annualized figures in %
+        """
+        start, end = int(start), int(end)
+        high, low, drawdown = self.extremes(start, end)
+        periods = end - start
+        base, last = self._values[start], self._values[end]
+        total_return = (last / base - 1) * 100 if base else 0.0
+        annualized_return = 0.0
+        if periods:
+            annualized_return = (
+                float(np.expm1(min(np.log(last / base) * periods_per_year / periods, 700.0))) * 100
+                if base > 0 and last > 0 else -100.0
+            )
+        volatility = sharpe = 0.0
+        if periods > 1:
+            total = self._return_sums[end] - self._return_sums[start]
+            squares = self._square_sums[end] - self._square_sums[start]
+            mean = total / periods
+            std = np.sqrt(max((squares - periods * mean * mean) / (periods - 1), 0.0))
+            scale = np.sqrt(periods_per_year)
+            volatility = float(std * scale * 100)
+            sharpe = float(mean / std * scale) if std > 0 else 0.0
+        return RangeSummary(start, end, periods, float(total_return), annualized_return, volatility, sharpe,
+                            drawdown * 100, high, low)
+
+    def query_dates(self, start_date, end_date, periods_per_year: float = TRADING_PERIODS_PER_YEAR) -> Optional[RangeSummary]:
+        """
+        Statistics between the values recorded on or before two dates.
+
+        Returns:
+            Optional[RangeSummary]: None if the window is empty or reversed
+        """
+        start, end = self.row(start_date), self.row(end_date)
+        if end < start:
+            return None
+        return self.query(start, end, periods_per_year)
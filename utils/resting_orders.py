@@ -0,0 +1,340 @@
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+import numpy as np
+import pandas as pd
+from utils.pnl_calculator import PnLCalculator
+from utils.cost_models import day_volume
+from utils.path_kernels import fill_orders
+
+# Orders that rest after a breakpoint and fill on the first later day their price is crossed
+ORDER_TYPES = ('limit_buy', 'limit_sell', 'stop_loss', 'take_profit')
+
+ORDER_TYPE_LABELS = {
+    'limit_buy': "Limit Buy",
+    'limit_sell': "Limit Sell",
+    'stop_loss': "Stop-Loss",
+    'take_profit': "Take-Profit"
+}
+
+# Orders triggered by the price falling to their level (the others trigger on a rise)
+TRIGGER_BELOW = ('limit_buy', 'stop_loss')
+
+# Trade each order type turns into when it fills
+FILL_ACTIONS = {'limit_buy': 'buy', 'limit_sell': 'sell', 'stop_loss': 'sell', 'take_profit': 'sell'}
+
+# Rows per block of the crossing index (blocks are scanned directly, ranges of blocks via sparse tables)
+CROSSING_BLOCK = 32
+
+# Orders that only close a long position (limit sells may also open a short)
+EXIT_ORDERS = ('stop_loss', 'take_profit')
+
+def validate_resting_order(cash: float, positions: int, order_type: str, quantity: int, price: float,
+                           margin_requirement: Optional[float] = None, fee: float = 0.0) -> None:
+    """
+    Check that a resting order could fill against a cash/positions state.
+
+    Args:
+        margin_requirement: Margin requirement for limit sells that open a short (None: no shorting)
+        fee: Fees the fill would be charged
+
+    Raises:
+        ValueError: If the order is malformed or not covered by cash or shares
+    """
+    if order_type not in ORDER_TYPES:
+        raise ValueError(f"Unknown order type '{order_type}'")
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive")
+    if price <= 0:
+        raise ValueError("Trigger price must be positive")
+    if order_type in EXIT_ORDERS and quantity > positions:
+        raise ValueError("Insufficient positions")
+    PnLCalculator.apply_trade(cash, positions, FILL_ACTIONS[order_type], quantity, price, margin_requirement, fee)
+
+class _BlockMinTable:
+    """
+    Range minima of one array: per-block minima with a sparse table over blocks.
+
+    Memory is O(n / block * log n), so multi-million-row series stay small.
+    """
+
+    def __init__(self, values: np.ndarray, block: int):
+        self.values = values
+        self.block = block
+        num_blocks = -(-len(values) // block)
+        padded = np.full(num_blocks * block, np.inf)
+        padded[:len(values)] = values
+        # levels[k][i] = minimum of blocks i .. i + 2^k - 1
+        self.levels = [padded.reshape(num_blocks, block).min(axis=1)]
+        while 2 ** len(self.levels) <= num_blocks:
+            below = self.levels[-1]
+            half = 2 ** (len(self.levels) - 1)
+            self.levels.append(np.minimum(below[:-half], below[half:]))
+
+    def _scan(self, starts: np.ndarray, stops: np.ndarray, levels: np.ndarray) -> np.ndarray:
+        """First row in [start, stop] (at most one block long) at or below level, else -1"""
+        rows = starts[:, None] + np.arange(self.block)
+        hits = (rows <= stops[:, None]) & (self.values[np.minimum(rows, len(self.values) - 1)] <= levels[:, None])
+        first = hits.argmax(axis=1)
+        return np.where(hits[np.arange(len(starts)), first], starts + first, -1)
+
+    def first_at_or_below(self, starts: np.ndarray, ends: np.ndarray, levels: np.ndarray) -> np.ndarray:
+        """
+        For each query, the first row in [start, end] whose value is at or below level.
+
+        All queries run together: one vectorized scan of the partial first
+        block, a binary-lifting descent over the block sparse table (O(log n)
+        steps) and one scan of the block found.
+
+        Returns:
+            np.ndarray: Row index per query, or -1 where the value never gets there
+        """
+        block = self.block
+        result = np.full(len(starts), -1, dtype=np.int64)
+        valid = starts <= ends
+        starts, ends, levels = starts[valid], ends[valid], levels[valid]
+        if not len(starts):
+            return result
+
+        # Rows up to the end of the block containing start
+        head = self._scan(starts, np.minimum(ends, (starts // block + 1) * block - 1), levels)
+
+        # Whole blocks after it: skip every run of blocks whose minimum stays above level
+        position = starts // block + 1
+        last_block = ends // block
+        for k in range(len(self.levels) - 1, -1, -1):
+            table = self.levels[k]
+            span_end = position + 2 ** k - 1
+            fits = span_end <= last_block
+            above = table[np.minimum(position, len(table) - 1)] > levels
+            position = np.where(fits & above, position + 2 ** k, position)
+        in_range = position <= last_block
+        block_start = np.minimum(position, len(self.levels[0]) - 1) * block
+        tail = np.where(in_range, self._scan(block_start, np.where(in_range, ends, -1), levels), -1)
+
+        result[valid] = np.where(head >= 0, head, tail)
+        return result
+
+class PriceCrossingIndex:
+    """
+    Finds the first day a price level is crossed, for many orders at once.
+
+    Lows are used for levels approached from above and highs for levels
+    approached from below (both are the price when the data has no bars).
+    Built once per dataset in O(n); each query costs O(log n).
+    """
+
+    def __init__(self, prices, open_prices=None, high_prices=None, low_prices=None, block: int = CROSSING_BLOCK):
+        prices = np.asarray(prices, dtype=np.float64)
+        self.opens = prices if open_prices is None else np.asarray(open_prices, dtype=np.float64)
+        self._lows = _BlockMinTable(prices if low_prices is None else np.asarray(low_prices, dtype=np.float64), block)
+        # Highs are stored negated so rises are found with the same minimum search
+        self._negated_highs = _BlockMinTable(-(prices if high_prices is None else np.asarray(high_prices, dtype=np.float64)), block)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, prices: Optional[np.ndarray] = None) -> 'PriceCrossingIndex':
+        """
+        Build the index for a dataset (using its Open/High/Low bars when present).
+
+        Args:
+            df: DataFrame with price data
+            prices: Its Price column as float64, when already decoded
+        """
+        bars = all(column in df.columns for column in ('Open', 'High', 'Low'))
+        return cls(
+            df['Price'].to_numpy() if prices is None else prices,
+            open_prices=df['Open'].to_numpy() if bars else None,
+            high_prices=df['High'].to_numpy() if bars else None,
+            low_prices=df['Low'].to_numpy() if bars else None
+        )
+
+    def first_crossing(self, starts, ends, levels, below) -> np.ndarray:
+        """
+        Find the first day in [start, end] on which each level is reached.
+
+        Args:
+            starts: First day of each window
+            ends: Last day of each window (inclusive)
+            levels: Price levels
+            below: True where the level is reached by falling to it (low <= level),
+                False where by rising to it (high >= level)
+
+        Returns:
+            np.ndarray: Day index per query, or -1 if the level is not reached
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        levels = np.asarray(levels, dtype=np.float64)
+        below = np.asarray(below, dtype=bool)
+        result = np.full(len(starts), -1, dtype=np.int64)
+        if below.any():
+            result[below] = self._lows.first_at_or_below(starts[below], ends[below], levels[below])
+        if (~below).any():
+            result[~below] = self._negated_highs.first_at_or_below(starts[~below], ends[~below], -levels[~below])
+        return result
+
+    def fill_prices(self, days, levels, below) -> np.ndarray:
+        """
+        Execution prices on the crossing days: the level itself, or the open
+        when the day gaps through it.
+        """
+        opens = self.opens[np.asarray(days, dtype=np.int64)]
+        levels = np.asarray(levels, dtype=np.float64)
+        return np.where(below, np.minimum(levels, opens), np.maximum(levels, opens))
+
+class RestingOrder(NamedTuple):
+    """A resting order and, once scheduled, the day it fills (-1: it expires unfilled)"""
+    player_num: int
+    order_type: str
+    quantity: int
+    price: float
+    placed_day: int
+    expiry_day: Optional[int] = None
+    fill_day: Optional[int] = None
+    fill_price: Optional[float] = None
+    instrument: int = 0
+
+class RestingOrderBook:
+    """
+    Resting orders of every player between two breakpoints.
+
+    Orders are added when a breakpoint's staged orders are committed and
+    scheduled in one batch against a PriceCrossingIndex, which gives each
+    order its fill day up front. As the clock moves, fill_due() applies the
+    fills that have come due; orders are cancelled at fill time if earlier
+    fills left too little cash or too few shares for them, and stop-losses
+    and take-profits if the long they exit is no longer large enough (decided
+    for all due fills in one pass of path_kernels.fill_orders).
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        """Cancel every resting order."""
+        self.orders: List[RestingOrder] = []
+
+    def add(self, player_num: int, order_type: str, quantity: int, price: float, day_index: int,
+            instrument: int = 0) -> None:
+        """Add an order placed at a breakpoint (it is scheduled by schedule())"""
+        self.orders.append(RestingOrder(player_num, order_type, quantity, price, day_index, instrument=instrument))
+
+    def schedule(self, indices: Union[PriceCrossingIndex, Sequence[PriceCrossingIndex]], expiry_day: int,
+                 journal=None, portfolios: Optional[Dict] = None) -> None:
+        """
+        Find the fill day of every unscheduled order in one batch per instrument.
+
+        Args:
+            indices: Crossing index of the dataset, or one per instrument
+            expiry_day: Last day the orders may fill on (the day before the next breakpoint)
+            journal: Optional TradeJournal to record the scheduled orders in
+            portfolios: Player portfolios (needed with a journal, for its snapshots)
+        """
+        if isinstance(indices, PriceCrossingIndex):
+            indices = [indices]
+        pending = [i for i, order in enumerate(self.orders) if order.expiry_day is None]
+        for instrument, index in enumerate(indices):
+            batch = [i for i in pending if self.orders[i].instrument == instrument]
+            if not batch:
+                continue
+            orders = [self.orders[i] for i in batch]
+            starts = np.array([order.placed_day + 1 for order in orders])
+            levels = np.array([order.price for order in orders])
+            below = np.array([order.order_type in TRIGGER_BELOW for order in orders])
+            days = index.first_crossing(starts, np.full(len(orders), expiry_day), levels, below)
+            prices = index.fill_prices(np.maximum(days, 0), levels, below)
+            for i, order, day, price in zip(batch, orders, days, prices):
+                self.orders[i] = order._replace(
+                    expiry_day=expiry_day,
+                    fill_day=int(day),
+                    fill_price=float(price) if day >= 0 else None
+                )
+        if journal is not None:
+            journal.record_orders([self.orders[i] for i in pending], portfolios)
+
+    def fill_days(self, after_day: int, day_index: int) -> List[int]:
+        """Sorted distinct days in (after_day, day_index] on which scheduled orders fill"""
+        return sorted({order.fill_day for order in self.orders if order.fill_day is not None and after_day < order.fill_day <= day_index})
+
+    def live_orders(self, player_num: Optional[int] = None) -> List[RestingOrder]:
+        """Get the orders still resting (optionally for one player)"""
+        return [order for order in self.orders if player_num is None or order.player_num == player_num]
+
+    def fill_due(self, portfolios: Dict, df: pd.DataFrame, day_index: int, journal=None) -> List[RestingOrder]:
+        """
+        Apply every fill due on or before day_index and drop expired orders.
+
+        Args:
+            portfolios: Player portfolios
+            df: DataFrame with price data (for trade dates)
+            day_index: Day the clock is moving to
+            journal: Optional TradeJournal to record the fills in
+
+        Returns:
+            List[RestingOrder]: Orders that filled, in fill order
+        """
+        due = sorted(
+            (order for order in self.orders if order.fill_day is not None and 0 <= order.fill_day <= day_index),
+            key=lambda order: order.fill_day
+        )
+        self.orders = [
+            order for order in self.orders
+            if order.expiry_day is None or (order.fill_day > day_index if order.fill_day >= 0 else order.expiry_day > day_index)
+        ]
+
+        due = [order for order in due if order.player_num in portfolios]
+        if not due:
+            return []
+        player_nums = list(portfolios)
+        calculators = [portfolios[player_num]['pnl_calculator'] for player_num in player_nums]
+        row_of = {player_num: row for row, player_num in enumerate(player_nums)}
+        rows = [row_of[order.player_num] for order in due]
+        volumes = [day_volume(df, order.fill_day, order.instrument) for order in due]
+        terms = [
+            calculators[row].trade_terms(FILL_ACTIONS[order.order_type], order.quantity, order.fill_price, volume)
+            for row, order, volume in zip(rows, due, volumes)
+        ]
+        num_instruments = max(max(len(calc.holdings) for calc in calculators), max(order.instrument for order in due) + 1)
+        holdings = np.zeros((len(calculators), num_instruments), dtype=np.int64)
+        for row, calc in enumerate(calculators):
+            holdings[row, :len(calc.holdings)] = calc.holdings
+        accepted = fill_orders(
+            rows, [order.instrument for order in due], [FILL_ACTIONS[order.order_type] == 'buy' for order in due],
+            [order.quantity for order in due], [price for price, _ in terms], [fee for _, fee in terms],
+            [calc.cash for calc in calculators], holdings,
+            [np.nan if calc.margin_requirement is None else calc.margin_requirement for calc in calculators],
+            [order.order_type in EXIT_ORDERS for order in due]
+        )
+
+        filled = []
+        for order, volume, ok in zip(due, volumes, accepted):
+            if not ok:
+                # An earlier fill used the cash or shares this order needed (or closed the long it was to exit)
+                continue
+            portfolio = portfolios[order.player_num]
+            action = FILL_ACTIONS[order.order_type]
+            portfolio['pnl_calculator'].execute_trade(action, order.quantity, order.fill_price, volume, order.instrument)
+            portfolio['cash'] = portfolio['pnl_calculator'].cash
+            portfolio['positions'] = portfolio['pnl_calculator'].positions
+            portfolio['trading_history'].append({
+                'action': action,
+                'price': order.fill_price,
+                'quantity': order.quantity,
+                'date': df.iloc[order.fill_day]['Date'],
+                'instrument': order.instrument
+            })
+            if journal is not None:
+                journal.record_trades(
+                    order.fill_day, [(order.player_num, action, order.quantity, order.fill_price, order.instrument)], portfolios
+                )
+            filled.append(order)
+        return filled
+
+    def to_state(self) -> Dict:
+        """Export the orders as plain values for the state store"""
+        return {'orders': [tuple(order) for order in self.orders]}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'RestingOrderBook':
+        """Rebuild a book exported with to_state()"""
+        book = cls()
+        book.orders = [RestingOrder(*order) for order in state['orders']]
+        return book
@@ -0,0 +1,269 @@
+"""
+Risk metrics of a portfolio value series, maintained as values arrive.
+
+Every metric is kept as running state, so recording a value and reading the
+metrics cost O(1) or O(log n) however long the game runs:
+
+- Sharpe, Sortino and hit rate: running sums of returns, squared returns,
+  squared losses and the counts of winning and non-zero periods.
+- Max drawdown and Calmar: running peak and deepest drawdown.
+- Rolling volatility: sums over a deque of the last window returns.
+- Historical VaR/CVaR: the worst returns in a max-heap sized to the tail
+  fraction and the rest in a min-heap, with the sum of the tail.
+
+The latest value is provisional: a value recorded again for the same day
+replaces it (replace_latest), and it only enters the running state when the
+next value arrives. Annualization is a scaling of the per-period figures,
+so the number of periods per year is chosen when the metrics are read.
+"""
+import heapq
+import math
+from collections import deque
+from typing import Dict, Optional
+import numpy as np
+from utils.path_kernels import max_drawdowns
+
+# Return periods per year used to annualize (trading days of daily data)
+TRADING_PERIODS_PER_YEAR = 252
+
+# Returns in the rolling volatility window
+ROLLING_WINDOW = 20
+
+# Confidence level of the historical VaR and CVaR
+VAR_CONFIDENCE = 0.95
+
+# Slack for the tail size when (1 - confidence) * n is an integer up to rounding
+_TAIL_EPSILON = 1e-9
+
+# Cap on the annualized log growth, so short games with large returns do not overflow
+_MAX_LOG_GROWTH = 700.0
+
+def period_return(previous: float, value: float) -> float:
+    """Simple return between two values (0 when the previous value is 0)"""
+    return value / previous - 1 if previous != 0 else 0.0
+
+def empty_metrics() -> Dict[str, float]:
+    """Metrics of a series without any returns"""
+    return {
+        'total_return': 0, 'max_drawdown': 0, 'sharpe_ratio': 0, 'annualized_sharpe': 0,
+        'sortino_ratio': 0, 'calmar_ratio': 0, 'annualized_return': 0, 'rolling_volatility': 0,
+        'hit_rate': 0, 'value_at_risk': 0, 'conditional_var': 0
+    }
+
+class RiskTracker:
+    """
+    Streaming risk metrics of one portfolio value series.
+    """
+
+    def __init__(self, initial_value: float, window: int = ROLLING_WINDOW, confidence: float = VAR_CONFIDENCE):
+        """
+        Args:
+            initial_value: First value of the series (the starting cash)
+            window: Returns in the rolling volatility window
+            confidence: Confidence level of VaR and CVaR (e.g. 0.95)
+        """
+        if window < 2:
+            raise ValueError("Rolling window must hold at least 2 returns")
+        if not 0 < confidence < 1:
+            raise ValueError("VaR confidence must be between 0 and 1")
+        self.initial_value = float(initial_value)
+        self.window = window
+        self.confidence = confidence
+        # Last value in the running state, and the provisional value after it
+        self._committed = self.initial_value
+        self._latest: Optional[float] = None
+        self._count = 0
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._downside_sq = 0.0
+        self._wins = 0
+        self._moves = 0
+        # The provisional return completes the rolling window
+        self._recent = deque()
+        self._recent_sum = 0.0
+        self._recent_sum_sq = 0.0
+        self._peak = self.initial_value
+        self._max_drawdown = 0.0
+        # Negated smallest returns (max-heap) and the remaining returns (min-heap)
+        self._tail = []
+        self._body = []
+        self._tail_sum = 0.0
+
+    @classmethod
+    def from_values(cls, values, window: int = ROLLING_WINDOW, confidence: float = VAR_CONFIDENCE) -> 'RiskTracker':
+        """
+        Build the tracker of a whole value series at once (after a restore).
+
+        Args:
+            values: Value series starting with the initial value
+        """
+        values = np.asarray(values, dtype=np.float64)
+        tracker = cls(values[0], window, confidence)
+        if len(values) < 2:
+            return tracker
+        committed = values[:-1]
+        previous = committed[:-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.where(previous != 0, committed[1:] / previous - 1, 0.0)
+        tracker._count = len(returns)
+        tracker._sum = float(returns.sum())
+        tracker._sum_sq = float(returns @ returns)
+        losses = np.minimum(returns, 0.0)
+        tracker._downside_sq = float(losses @ losses)
+        tracker._wins = int(np.count_nonzero(returns > 0))
+        tracker._moves = int(np.count_nonzero(returns))
+        recent = returns[len(returns) - min(len(returns), window - 1):]
+        tracker._recent = deque(recent.tolist())
+        tracker._recent_sum = float(recent.sum())
+        tracker._recent_sum_sq = float(recent @ recent)
+        tracker._peak = float(committed.max())
+        tracker._max_drawdown = float(max_drawdowns(committed[None, :])[0])
+        tail_size = min(tracker._tail_size(tracker._count + 1), len(returns))
+        ordered = np.partition(returns, tail_size - 1) if tail_size else returns
+        tracker._tail = (-ordered[:tail_size]).tolist()
+        tracker._body = ordered[tail_size:].tolist()
+        heapq.heapify(tracker._tail)
+        heapq.heapify(tracker._body)
+        tracker._tail_sum = float(ordered[:tail_size].sum())
+        tracker._committed = float(committed[-1])
+        tracker._latest = float(values[-1])
+        return tracker
+
+    @property
+    def peak(self) -> float:
+        """Highest value so far, including the provisional one"""
+        return self._peak if self._latest is None else max(self._peak, self._latest)
+
+    def update(self, value: float) -> None:
+        """Record the value of a new period."""
+        if self._latest is not None:
+            self._commit(self._latest)
+        self._latest = float(value)
+
+    def replace_latest(self, value: float) -> None:
+        """Replace the value of the latest period (it was re-valued)."""
+        if self._latest is None:
+            self.update(value)
+        else:
+            self._latest = float(value)
+
+    def _tail_size(self, count: int) -> int:
+        """Returns in the VaR tail of a series of count returns"""
+        return min(count, max(1, math.ceil((1 - self.confidence) * count - _TAIL_EPSILON)))
+
+    def _commit(self, value: float) -> None:
+        ret = period_return(self._committed, value)
+        self._committed = value
+        self._count += 1
+        self._sum += ret
+        self._sum_sq += ret * ret
+        if ret < 0:
+            self._downside_sq += ret * ret
+        self._wins += ret > 0
+        self._moves += ret != 0
+
+        if len(self._recent) == self.window - 1:
+            dropped = self._recent.popleft()
+            self._recent_sum -= dropped
+            self._recent_sum_sq -= dropped * dropped
+        self._recent.append(ret)
+        self._recent_sum += ret
+        self._recent_sum_sq += ret * ret
+
+        self._peak = max(self._peak, value)
+        if self._peak > 0:
+            self._max_drawdown = max(self._max_drawdown, (self._peak - value) / self._peak * 100)
+
+        # The heaps are sized for the tail including the provisional return
+        if self._tail and ret < -self._tail[0]:
+            heapq.heappush(self._tail, -ret)
+            self._tail_sum += ret
+        else:
+            heapq.heappush(self._body, ret)
+        target = self._tail_size(self._count + 1)
+        while len(self._tail) > target:
+            moved = -heapq.heappop(self._tail)
+            self._tail_sum -= moved
+            heapq.heappush(self._body, moved)
+        while len(self._tail) < target and self._body:
+            moved = heapq.heappop(self._body)
+            heapq.heappush(self._tail, -moved)
+            self._tail_sum += moved
+
+    def _tail_with(self, ret: float):
+        """
+        VaR return and tail sum once the provisional return joins the committed ones.
+
+        The tail holds the smallest tail_size(count + 1) committed returns (or
+        all of them while there are fewer), so the provisional return either
+        stays out of it or takes the place of its largest return.
+        """
+        target = self._tail_size(self._count + 1)
+        if len(self._tail) < target:
+            largest = -self._tail[0] if self._tail else ret
+            return max(largest, ret), self._tail_sum + ret
+        largest = -self._tail[0]
+        if ret >= largest:
+            return largest, self._tail_sum
+        runner_up = -min(self._tail[1:3]) if len(self._tail) > 1 else ret
+        return max(runner_up, ret), self._tail_sum - largest + ret
+
+    def metrics(self, periods_per_year: float = TRADING_PERIODS_PER_YEAR) -> Dict[str, float]:
+        """
+        Current risk metrics, in O(1).
+
+        Args:
+            periods_per_year: Return periods per year used to annualize
+
+        Returns:
+            Dict: total_return, max_drawdown, annualized_return, rolling_volatility,
+                hit_rate, value_at_risk and conditional_var (all in %), and the
+                per-period sharpe_ratio, annualized_sharpe, sortino_ratio and calmar_ratio
+        """
+        if self._latest is None:
+            return empty_metrics()
+        latest = self._latest
+        ret = period_return(self._committed, latest)
+        count = self._count + 1
+        scale = math.sqrt(periods_per_year)
+
+        mean = (self._sum + ret) / count
+        variance = ((self._sum_sq + ret * ret) - count * mean * mean) / (count - 1) if count > 1 else 0.0
+        std = math.sqrt(max(variance, 0.0))
+        sharpe = mean / std if std > 0 else 0
+        downside = math.sqrt((self._downside_sq + min(ret, 0.0) ** 2) / count)
+        sortino = mean / downside * scale if downside > 0 else 0
+
+        peak = max(self._peak, latest)
+        drawdown = (peak - latest) / peak * 100 if peak > 0 else 0
+        max_drawdown = max(self._max_drawdown, drawdown)
+        growth = latest / self.initial_value if self.initial_value > 0 else 0
+        annualized_return = -100.0
+        if growth > 0:
+            annualized_return = math.expm1(min(math.log(growth) * periods_per_year / count, _MAX_LOG_GROWTH)) * 100
+        calmar = annualized_return / max_drawdown if max_drawdown > 0 else 0
+
+        window_count = len(self._recent) + 1
+        rolling_volatility = 0.0
+        if window_count > 1:
+            window_mean = (self._recent_sum + ret) / window_count
+            window_variance = ((self._recent_sum_sq + ret * ret) - window_count * window_mean * window_mean) / (window_count - 1)
+            rolling_volatility = math.sqrt(max(window_variance, 0.0)) * scale * 100
+
+        moves = self._moves + (ret != 0)
+        hit_rate = (self._wins + (ret > 0)) / moves * 100 if moves else 0
+
+        var_return, tail_sum = self._tail_with(ret)
+        return {
+            'total_return': (latest / self.initial_value - 1) * 100 if self.initial_value else 0,
+            'max_drawdown': max_drawdown,
+            'sharpe_ratio': sharpe,
+            'annualized_sharpe': sharpe * scale,
+            'sortino_ratio': sortino,
+            'calmar_ratio': calmar,
+            'annualized_return': annualized_return,
+            'rolling_volatility': rolling_volatility,
+            'hit_rate': hit_rate,
+            'value_at_risk': max(0.0, -var_return * 100),
+            'conditional_var': max(0.0, -tail_sum / self._tail_size(count) * 100)
+        }
@@ -0,0 +1,281 @@
+"""
+Vectorized synthetic price scenarios in the simulator's CSV format.
+
+Models (log-price dynamics, parameters annualized):
+    gbm               geometric Brownian motion (mu, sigma)
+    jump_diffusion    Merton jump diffusion (mu, sigma, jump_rate, jump_mean, jump_std)
+    regime_switching  GBM whose (mu, sigma) cycle through regimes with geometric
+                      durations (mus, sigmas, mean_durations in rows)
+    mean_reversion    Ornstein-Uhlenbeck log price (theta, sigma, long_run_price)
+
+Every scenario is drawn from its own child of a SeedSequence, so scenario i of
+a seed is identical whether it is generated alone or in a batch.
+
+Scenarios with --instruments N > 1 have one Price_<TICKER> column per
+instrument (independent paths of the same model) on the shared dates and
+breakpoints.
+
+Usage:
+    python -m utils.scenario_generator --model gbm --rows 1000000 --count 10 --seed 42 [--ohlcv] [--instruments 5] [--out data]
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, Optional
+import numpy as np
+import pandas as pd
+from utils.indicators import linear_recursion
+from utils.instruments import INSTRUMENT_PREFIX
+
+MODELS = ('gbm', 'jump_diffusion', 'regime_switching', 'mean_reversion')
+
+DEFAULT_PARAMS: Dict[str, Dict] = {
+    'gbm': dict(mu=0.05, sigma=0.2),
+    'jump_diffusion': dict(mu=0.05, sigma=0.2, jump_rate=5.0, jump_mean=-0.02, jump_std=0.05),
+    'regime_switching': dict(mus=(0.15, -0.25), sigmas=(0.12, 0.35), mean_durations=(250, 60)),
+    'mean_reversion': dict(theta=5.0, sigma=0.2, long_run_price=None),
+}
+
+BREAKPOINT_METHODS = ('fixed', 'random')
+
+# Rows per year used to scale annualized parameters (daily bars)
+PERIODS_PER_YEAR = 252
+
+# Rows per year for other Date frequencies (trading hours only)
+PERIODS_PER_YEAR_BY_FREQ = {'D': 252, 'B': 252, 'h': 252 * 7, 'min': 252 * 390}
+
+# Longer scenarios default to minute dates (daily dates run past pandas' year 2262 limit)
+MAX_DAILY_ROWS = 50_000
+
+def simulate_log_returns(model: str, num_steps: int, rng: np.random.Generator,
+                         dt: float = 1 / PERIODS_PER_YEAR, start_price: float = 100.0,
+                         num_paths: Optional[int] = None, **params) -> np.ndarray:
+    """
+    Draw num_steps log returns from a price model.
+
+    Args:
+        model: One of MODELS
+        num_steps: Number of returns (rows - 1)
+        rng: Random generator
+        dt: Time step in years
+        start_price: First price (mean reversion level defaults to it)
+        num_paths: Draw this many independent paths at once (None: a single path)
+        **params: Model parameters overriding DEFAULT_PARAMS[model]
+
+    Returns:
+        np.ndarray: Log returns (num_paths x num_steps when num_paths is given)
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown model '{model}', expected one of {', '.join(MODELS)}")
+    p = {**DEFAULT_PARAMS[model], **params}
+    shape = num_steps if num_paths is None else (num_paths, num_steps)
+    shocks = rng.standard_normal(shape)
+
+    if model == 'gbm':
+        return (p['mu'] - 0.5 * p['sigma'] ** 2) * dt + p['sigma'] * np.sqrt(dt) * shocks
+
+    if model == 'jump_diffusion':
+        # Sum of n normal jumps is N(n * mean, n * std^2)
+        counts = rng.poisson(p['jump_rate'] * dt, shape)
+        jumps = counts * p['jump_mean'] + np.sqrt(counts) * p['jump_std'] * rng.standard_normal(shape)
+        compensator = p['jump_rate'] * (np.exp(p['jump_mean'] + 0.5 * p['jump_std'] ** 2) - 1)
+        drift = (p['mu'] - 0.5 * p['sigma'] ** 2 - compensator) * dt
+        return drift + p['sigma'] * np.sqrt(dt) * shocks + jumps
+
+    if model == 'regime_switching':
+        mus = np.asarray(p['mus'], dtype=np.float64)
+        sigmas = np.asarray(p['sigmas'], dtype=np.float64)
+        mean_durations = np.asarray(p['mean_durations'], dtype=np.float64)
+        num_regimes = len(mus)
+        # Regimes follow each other in a cycle with geometric run lengths (one row of runs per path)
+        paths = 1 if num_paths is None else num_paths
+        num_runs = int(num_steps / mean_durations.mean() * 2) + 2 * num_regimes
+        first_regime = rng.integers(num_regimes, size=(paths, 1))
+        run_regimes = (first_regime + np.arange(num_runs)) % num_regimes
+        run_lengths = rng.geometric(1 / mean_durations[run_regimes])
+        while run_lengths.sum(axis=1).min() < num_steps:
+            extra = (run_regimes[:, -1:] + 1 + np.arange(num_runs)) % num_regimes
+            run_regimes = np.concatenate([run_regimes, extra], axis=1)
+            run_lengths = np.concatenate([run_lengths, rng.geometric(1 / mean_durations[extra])], axis=1)
+        # Run of every step: the number of runs ended by it, searched in one sorted array over all paths
+        run_ends = np.cumsum(run_lengths, axis=1)
+        stride = int(run_ends[:, -1].max()) + 1
+        offsets = np.arange(paths)[:, None] * stride
+        runs = np.searchsorted((run_ends + offsets).ravel(), (np.arange(num_steps) + offsets).ravel(), side='right')
+        regimes = run_regimes.ravel()[runs].reshape(shape)
+        mu, sigma = mus[regimes], sigmas[regimes]
+        return (mu - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * shocks
+
+    # Mean reversion: exact OU discretization of the log price around its long-run level
+    level = np.log(p['long_run_price'] if p['long_run_price'] is not None else start_price)
+    a = np.exp(-p['theta'] * dt)
+    step_std = p['sigma'] * np.sqrt((1 - a ** 2) / (2 * p['theta']))
+    deviations = linear_recursion(step_std * shocks, a, np.log(start_price) - level)
+    return np.diff(level + deviations, axis=-1, prepend=np.log(start_price))
+
+def place_breakpoints(num_rows: int, method: str = 'fixed', spacing: int = 20, count: Optional[int] = None,
+                      min_spacing: int = 5, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Choose decision points.
+
+    Args:
+        num_rows: Series length
+        method: 'fixed' (every spacing rows) or 'random' (count points at least
+            min_spacing rows apart, uniformly over all such placements)
+        spacing: Rows between fixed breakpoints
+        count: Number of random breakpoints (default num_rows // spacing)
+        min_spacing: Minimum rows between random breakpoints
+        rng: Random generator for 'random'
+
+    Returns:
+        np.ndarray: Boolean Breakpoint column
+    """
+    flags = np.zeros(num_rows, dtype=bool)
+    if method == 'fixed':
+        flags[spacing - 1::spacing] = True
+        return flags
+    if method != 'random':
+        raise ValueError(f"Unknown breakpoint method '{method}', expected one of {', '.join(BREAKPOINT_METHODS)}")
+
+    rng = rng if rng is not None else np.random.default_rng()
+    count = num_rows // spacing if count is None else count
+    # Distinct sorted slots are at least 1 apart; reserving gap extra rows
+    # after each one makes them at least min_spacing apart
+    gap = max(0, min_spacing - 1)
+    count = min(count, (num_rows + gap) // (gap + 1))
+    if count <= 0:
+        return flags
+    free_rows = num_rows - (count - 1) * gap
+    slots = np.sort(rng.choice(free_rows, size=count, replace=False))
+    flags[slots + np.arange(count) * gap] = True
+    return flags
+
+def _ohlcv_from_closes(closes: np.ndarray, log_returns: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """Derive open/high/low/volume bars around a close series"""
+    opens = np.concatenate([[closes[0]], closes[:-1]])
+    bar_sigma = max(float(np.std(log_returns)) if len(log_returns) else 0.0, 1e-4)
+    wick_up = np.exp(np.abs(rng.standard_normal(len(closes))) * bar_sigma * 0.5)
+    wick_down = np.exp(-np.abs(rng.standard_normal(len(closes))) * bar_sigma * 0.5)
+    abs_returns = np.abs(np.concatenate([[0.0], log_returns]))
+    volumes = 1_000_000 * np.exp(0.3 * rng.standard_normal(len(closes))) * (1 + 5 * abs_returns / bar_sigma)
+    return {
+        'Open': opens,
+        'High': np.maximum(opens, closes) * wick_up,
+        'Low': np.minimum(opens, closes) * wick_down,
+        'Close': closes,
+        'Volume': volumes.astype(np.int64),
+    }
+
+def generate_scenario(model: str = 'gbm', num_rows: int = 1000, seed=None, start_price: float = 100.0,
+                      start_date: str = '2024-01-01', freq: Optional[str] = None, periods_per_year: Optional[int] = None,
+                      breakpoints: str = 'fixed', breakpoint_spacing: int = 20, breakpoint_count: Optional[int] = None,
+                      min_spacing: int = 5, ohlcv: bool = False, instruments: int = 1, **params) -> pd.DataFrame:
+    """
+    Generate one scenario in the loader's format.
+
+    Args:
+        model: One of MODELS
+        num_rows: Number of rows
+        seed: Seed (int or SeedSequence) for reproducible output
+        start_price: First price
+        start_date: First date
+        freq: Pandas frequency of the Date column (default daily, or minutes
+            above MAX_DAILY_ROWS rows)
+        periods_per_year: Rows per year, to scale annualized parameters (default from freq)
+        breakpoints: Breakpoint placement method (see place_breakpoints)
+        breakpoint_spacing: Rows between breakpoints (fixed) or average spacing (random)
+        breakpoint_count: Number of random breakpoints
+        min_spacing: Minimum rows between random breakpoints
+        ohlcv: Write Open/High/Low/Close/Volume bars instead of a Price column
+        instruments: Number of instruments (more than one writes Price_S01, Price_S02, ... columns)
+        **params: Model parameters overriding DEFAULT_PARAMS[model]
+
+    Returns:
+        pd.DataFrame: Date, Price (or OHLCV, or one price column per instrument) and Breakpoint columns
+    """
+    if instruments < 1:
+        raise ValueError("A scenario needs at least one instrument")
+    if ohlcv and instruments > 1:
+        raise ValueError("OHLCV bars are only generated for single-instrument scenarios")
+    if freq is None:
+        freq = 'D' if num_rows <= MAX_DAILY_ROWS else 'min'
+    if periods_per_year is None:
+        periods_per_year = PERIODS_PER_YEAR_BY_FREQ.get(freq, PERIODS_PER_YEAR)
+    rng = np.random.default_rng(seed)
+    data = {'Date': pd.date_range(start_date, periods=num_rows, freq=freq)}
+    for instrument in range(instruments):
+        log_returns = simulate_log_returns(model, num_rows - 1, rng, 1 / periods_per_year, start_price, **params)
+        log_prices = np.empty(num_rows)
+        log_prices[0] = 0.0
+        np.cumsum(log_returns, out=log_prices[1:])
+        prices = start_price * np.exp(log_prices)
+        if instruments > 1:
+            data[f"{INSTRUMENT_PREFIX}S{instrument + 1:02d}"] = prices
+        elif ohlcv:
+            data.update(_ohlcv_from_closes(prices, log_returns, rng))
+        else:
+            data['Price'] = prices
+    data['Breakpoint'] = place_breakpoints(
+        num_rows, breakpoints, breakpoint_spacing, breakpoint_count, min_spacing, rng
+    ).astype(np.int8)
+    return pd.DataFrame(data)
+
+def generate_scenarios(count: int, seed: int = 0, **kwargs) -> Iterator[pd.DataFrame]:
+    """
+    Generate count scenarios; scenario i only depends on (seed, i).
+
+    Args:
+        count: Number of scenarios
+        seed: Base seed
+        **kwargs: Arguments for generate_scenario()
+    """
+    for child in np.random.SeedSequence(seed).spawn(count):
+        yield generate_scenario(seed=child, **kwargs)
+
+def write_scenario(df: pd.DataFrame, path: str) -> None:
+    """Write a scenario as a CSV file that load_data() and the uploader accept"""
+    daily = bool((df['Date'] == df['Date'].dt.normalize()).all())
+    df.to_csv(path, index=False, float_format='%.4f', date_format='%Y-%m-%d' if daily else '%Y-%m-%d %H:%M:%S')
+
+def _generate_and_write(task) -> str:
+    """Generate one scenario from its seed and write it (runs in a worker process)"""
+    child_seed, path, kwargs = task
+    df = generate_scenario(seed=child_seed, **kwargs)
+    write_scenario(df, path)
+    return f"Wrote {path} ({len(df):,} rows, {int(df['Breakpoint'].sum())} breakpoints)"
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic price scenarios")
+    parser.add_argument('--model', choices=MODELS, default='gbm')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--freq', default=None, help="Pandas frequency of the Date column (e.g. D, h, min)")
+    parser.add_argument('--breakpoints', choices=BREAKPOINT_METHODS, default='fixed')
+    parser.add_argument('--spacing', type=int, default=20, help="Rows between breakpoints")
+    parser.add_argument('--min-spacing', type=int, default=5, help="Minimum rows between random breakpoints")
+    parser.add_argument('--ohlcv', action='store_true', help="Write OHLCV bars instead of a Price column")
+    parser.add_argument('--instruments', type=int, default=1, help="Instruments per scenario (Price_<TICKER> columns)")
+    parser.add_argument('--out', default='data', help="Output directory")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    kwargs = dict(
+        model=args.model, num_rows=args.rows, freq=args.freq, breakpoints=args.breakpoints,
+        breakpoint_spacing=args.spacing, min_spacing=args.min_spacing, ohlcv=args.ohlcv, instruments=args.instruments
+    )
+    tasks = [
+        (child, os.path.join(args.out, f"SYNTH_{args.model.upper()}_{args.seed}_{i}.csv"), kwargs)
+        for i, child in enumerate(np.random.SeedSequence(args.seed).spawn(args.count))
+    ]
+    if args.workers > 1:
+        with ProcessPoolExecutor(args.workers) as pool:
+            for message in pool.map(_generate_and_write, tasks):
+                print(message)
+    else:
+        for task in tasks:
+            print(_generate_and_write(task))
+
+if __name__ == '__main__':
+    main()
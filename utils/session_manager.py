@@ -1,6 +1,37 @@
+import time
+import uuid
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from utils.pnl_calculator import PnLCalculator
 from utils.portfolio_manager import initialize_portfolios, initialize_player_names
+from utils.frame_cache import FramePrecomputer
+from utils.trade_journal import TradeJournal
+from utils.trade_buffer import TradeBuffer
+from utils.resting_orders import RestingOrderBook
+from utils.margin import DEFAULT_MARGIN_REQUIREMENT
+from utils.cost_models import NO_COSTS
+from utils.risk_metrics import TRADING_PERIODS_PER_YEAR
+from utils.data_handler import get_dataset_key
+from utils.compact_data import CompactDataset, is_compact_state
+from utils.session_memory import get_memory_tracker
+from utils.state_store import get_state_store, encode_state, decode_state, encode_frame, decode_frame, blob_digest
+
+# Session state values saved to the state store with every game
+PERSISTED_SETTINGS = [
+    'current_day_index', 'num_players', 'starting_cash', 'time_to_run_sec', 'player_names',
+    'auto_progress', 'waiting_for_trade', 'trade_made', 'selected_ticker', 'data_source',
+    'chart_hoverlabel_font_size', 'chart_mode', 'chart_indicators', 'margin_requirement', 'cost_model',
+    'selected_instrument', 'periods_per_year', 'compact_data'
+]
+
+# Saves attempted before giving up when other workers keep saving the same game first
+SAVE_ATTEMPTS = 3
+
+# Row chunks kept per player before the player's daily history is rewritten as one chunk
+MAX_ROW_CHUNKS = 32
+
+# While the clock runs, reruns that only moved the day forward are saved at most this often
+TICK_SAVE_INTERVAL_SEC = 15.0
 
 def initialize_session_state():
     """Initialize all session state variables"""
@@ -12,8 +43,12 @@ def initialize_session_state():
         st.session_state.starting_cash = 10000
     if 'time_to_run_sec' not in st.session_state:
         st.session_state.time_to_run_sec = 10
+    if 'margin_requirement' not in st.session_state:
+        st.session_state.margin_requirement = DEFAULT_MARGIN_REQUIREMENT  # None disables short selling
+    if 'cost_model' not in st.session_state:
+        st.session_state.cost_model = NO_COSTS  # Fees and slippage charged on every trade
     if 'portfolios' not in st.session_state:
-        st.session_state.portfolios = initialize_portfolios(1, 10000)
+        st.session_state.portfolios = initialize_portfolios(1, 10000, st.session_state.margin_requirement, st.session_state.cost_model)
     if 'player_names' not in st.session_state:
         st.session_state.player_names = initialize_player_names(1)
     if 'auto_progress' not in st.session_state:
@@ -26,14 +61,271 @@ def initialize_session_state():
         st.session_state.selected_ticker = 'SAMPLE_SWINGS'
     if 'uploaded_data' not in st.session_state:
         st.session_state.uploaded_data = None
+    if 'compact_data' not in st.session_state:
+        st.session_state.compact_data = None  # None (standard) or one of COMPACT_PRICE_MODES for uploads
     if 'data_source' not in st.session_state:
         st.session_state.data_source = 'predefined'  # 'predefined' or 'uploaded'
     if 'chart_hoverlabel_font_size' not in st.session_state:
         st.session_state.chart_hoverlabel_font_size = 16
+    if 'chart_mode' not in st.session_state:
+        st.session_state.chart_mode = 'line'  # 'line' or 'candlestick'
+    if 'chart_indicators' not in st.session_state:
+        st.session_state.chart_indicators = ()  # (name, period) pairs overlaid on the price chart
+    if 'periods_per_year' not in st.session_state:
+        st.session_state.periods_per_year = TRADING_PERIODS_PER_YEAR  # Return periods per year used to annualize risk metrics
+    if 'selected_instrument' not in st.session_state:
+        st.session_state.selected_instrument = 0  # Instrument charted and traded in multi-instrument data
+    if 'frame_precomputer' not in st.session_state:
+        st.session_state.frame_precomputer = FramePrecomputer()
+    if 'trade_journal' not in st.session_state:
+        st.session_state.trade_journal = TradeJournal()
+    if 'trade_buffer' not in st.session_state:
+        st.session_state.trade_buffer = TradeBuffer()
+    if 'order_book' not in st.session_state:
+        st.session_state.order_book = RestingOrderBook()
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if 'room_id' not in st.session_state:
+        st.session_state.room_id = None  # Shared game room this session has joined
+    if 'room_player_num' not in st.session_state:
+        st.session_state.room_player_num = None  # None while spectating
 
 def reset_simulation_state():
     """Reset simulation-specific state variables"""
     st.session_state.current_day_index = 0
     st.session_state.auto_progress = False
     st.session_state.waiting_for_trade = False
-    st.session_state.trade_made = False 
\ No newline at end of file
+    st.session_state.trade_made = False
+    st.session_state.frame_precomputer.invalidate()
+    st.session_state.trade_journal.reset()
+    st.session_state.trade_buffer.discard()
+    st.session_state.order_book.clear()
+
+def get_game_id() -> str:
+    """Get the id of this browser's game from the URL, creating one for new games"""
+    game_id = st.query_params.get('game')
+    if not game_id:
+        game_id = uuid.uuid4().hex
+        st.query_params['game'] = game_id
+    return game_id
+
+def load_session_from_store():
+    """
+    Load the game from the state store if it holds a newer version than this session.
+
+    This lets any worker process serve a game (the game id travels in the URL)
+    and brings back games after a worker restart.
+    """
+    store = get_state_store()
+    game_id = get_game_id()
+    prefix = f"game/{game_id}/"
+    meta_blob = store.load(prefix + 'meta')
+    if meta_blob is None:
+        return
+    meta = decode_state(meta_blob)
+    if st.session_state.get('store_game_id') == game_id and meta['version'] <= st.session_state.store_version:
+        return
+
+    settings = meta['settings']
+    row_chunks = meta['row_chunks']
+    chunk_keys = {
+        i: [prefix + f"portfolio/{i}/rows/{chunk}" for chunk in range(row_chunks.get(i, (0, 0))[0])]
+        for i in range(1, settings['num_players'] + 1)
+    }
+    keys = [prefix + f"portfolio/{i}" for i in range(1, settings['num_players'] + 1)]
+    keys += [key for i_keys in chunk_keys.values() for key in i_keys]
+    keys += [prefix + 'journal', prefix + 'buffer', prefix + 'orders']
+    if meta['dataset_key'] is not None:
+        keys.append(f"dataset/{meta['dataset_key']}")
+    blobs = store.load_many(keys)
+
+    for name, value in settings.items():
+        st.session_state[name] = value
+    portfolios = {}
+    for i in range(1, settings['num_players'] + 1):
+        state = decode_state(blobs[prefix + f"portfolio/{i}"])
+        portfolios[i] = {
+            'cash': state['cash'],
+            'positions': state['positions'],
+            'pnl_calculator': PnLCalculator.from_state(
+                state['pnl_calculator'], [decode_state(blobs[key]) for key in chunk_keys[i]]
+            ),
+            'trading_history': state['trading_history']
+        }
+    st.session_state.portfolios = portfolios
+    st.session_state.trade_journal = TradeJournal.from_state(decode_state(blobs[prefix + 'journal']))
+    st.session_state.trade_buffer = TradeBuffer.from_state(decode_state(blobs[prefix + 'buffer']), portfolios)
+    st.session_state.order_book = RestingOrderBook.from_state(decode_state(blobs[prefix + 'orders']))
+    if meta['dataset_key'] is not None:
+        dataset = decode_state(blobs[f"dataset/{meta['dataset_key']}"])
+        st.session_state.uploaded_data = CompactDataset.from_state(dataset) if is_compact_state(dataset) else decode_frame(dataset)
+    st.session_state.frame_precomputer.invalidate()
+
+    st.session_state.store_game_id = game_id
+    st.session_state.store_version = meta['version']
+    st.session_state.store_digests = {
+        key: blob_digest(blob) for key, blob in blobs.items() if key in (prefix + 'buffer', prefix + 'orders') or key.startswith('dataset/')
+    }
+    st.session_state.store_digests['meta'] = blob_digest(encode_state((settings, meta['dataset_key'])))
+    st.session_state.store_row_chunks = dict(row_chunks)
+    st.session_state.store_parts = {'journal': st.session_state.trade_journal.version}
+    for i, portfolio in portfolios.items():
+        st.session_state.store_parts[f"portfolio/{i}"] = _portfolio_version(portfolio)
+        if i in row_chunks:
+            st.session_state.store_parts[f"rows/{i}"] = portfolio['pnl_calculator'].version
+    st.session_state.store_tick_key = _tick_key(settings, meta['dataset_key'])
+    st.session_state.store_saved_at = time.monotonic()
+
+def save_session_to_store():
+    """
+    Save the parts of the game that changed since the last save in one batched write.
+
+    Portfolios and the journal carry change versions, so parts that did not
+    change are not serialized at all. A player's daily history is appended
+    as a chunk of the rows added since the last save (compacted into one
+    chunk every MAX_ROW_CHUNKS saves); the small resting-order and staged
+    order blobs are compared by digest. While the clock runs, reruns that
+    only moved the day forward are saved at most every TICK_SAVE_INTERVAL_SEC
+    (a breakpoint, a pause or a trade saves right away).
+
+    Everything goes out with a new meta version in a single transaction that
+    only commits if the stored version is still the one this session last
+    read. If another worker saved the game first, its state is loaded (this
+    session's unsaved changes lose) and the save is retried.
+    Uploaded datasets are stored once under their content key.
+    """
+    if 'portfolios' not in st.session_state:
+        return
+    store = get_state_store()
+    game_id = get_game_id()
+    prefix = f"game/{game_id}/"
+    if st.session_state.get('store_game_id') != game_id:
+        st.session_state.store_game_id = game_id
+        st.session_state.store_version = 0
+        st.session_state.store_digests = {}
+        st.session_state.store_parts = {}
+        st.session_state.store_row_chunks = {}
+        st.session_state.store_tick_key = None
+        st.session_state.store_saved_at = 0.0
+    if _is_plain_tick():
+        return
+    for _ in range(SAVE_ATTEMPTS):
+        if _save_changes(store, prefix):
+            return
+        load_session_from_store()
+
+def _portfolio_version(portfolio) -> tuple:
+    """Changes whenever a portfolio's blob (everything but the daily history) changes"""
+    calc = portfolio['pnl_calculator']
+    return (calc.trade_version, calc.margin_requirement, tuple(calc.cost_model), len(portfolio['trading_history']))
+
+def _tick_key(settings, dataset_key) -> tuple:
+    """Everything a plain tick of the clock leaves unchanged"""
+    return (
+        {name: value for name, value in settings.items() if name != 'current_day_index'},
+        dataset_key,
+        [_portfolio_version(portfolio) for portfolio in st.session_state.portfolios.values()],
+        len(st.session_state.trade_journal.events)
+    )
+
+def _uploaded_dataset_key():
+    """Content key of the uploaded dataset (None when playing a predefined ticker)"""
+    uploaded_data = st.session_state.uploaded_data
+    if st.session_state.data_source != 'uploaded' or uploaded_data is None:
+        return None
+    return uploaded_data.key if isinstance(uploaded_data, CompactDataset) else get_dataset_key(uploaded_data)
+
+def _is_plain_tick() -> bool:
+    """Check whether this rerun only advanced the running clock and a save is not due yet"""
+    if not st.session_state.auto_progress or st.session_state.waiting_for_trade:
+        return False
+    if time.monotonic() - st.session_state.store_saved_at >= TICK_SAVE_INTERVAL_SEC:
+        return False
+    settings = {name: st.session_state[name] for name in PERSISTED_SETTINGS}
+    return _tick_key(settings, _uploaded_dataset_key()) == st.session_state.store_tick_key
+
+def _save_changes(store, prefix: str) -> bool:
+    """Write this session's changed blobs with the next meta version; False if another writer won"""
+    digests = st.session_state.store_digests
+    parts = dict(st.session_state.store_parts)
+    row_chunks = dict(st.session_state.store_row_chunks)
+
+    items = {}
+    saved_calculators = []
+    for i, portfolio in st.session_state.portfolios.items():
+        calc = portfolio['pnl_calculator']
+        version = _portfolio_version(portfolio)
+        if parts.get(f"portfolio/{i}") != version:
+            items[prefix + f"portfolio/{i}"] = encode_state({
+                'cash': portfolio['cash'],
+                'positions': portfolio['positions'],
+                'pnl_calculator': calc.to_state(rows=False),
+                'trading_history': portfolio['trading_history']
+            })
+            parts[f"portfolio/{i}"] = version
+        if parts.get(f"rows/{i}") != calc.version:
+            # Only the rows added (or changed by a rewind) since the last save
+            num_chunks, num_rows = row_chunks.get(i, (0, 0))
+            start = min(calc.unsaved_row(), num_rows)
+            if num_chunks >= MAX_ROW_CHUNKS:
+                num_chunks, start = 0, 0
+            items[prefix + f"portfolio/{i}/rows/{num_chunks}"] = encode_state(calc.rows_state(start))
+            row_chunks[i] = (num_chunks + 1, len(calc.portfolio_values) - 1)
+            parts[f"rows/{i}"] = calc.version
+            saved_calculators.append(calc)
+    journal = st.session_state.trade_journal
+    if parts.get('journal') != journal.version:
+        items[prefix + 'journal'] = encode_state(journal.to_state())
+        parts['journal'] = journal.version
+    for key, blob in [
+        (prefix + 'buffer', encode_state(st.session_state.trade_buffer.to_state())),
+        (prefix + 'orders', encode_state(st.session_state.order_book.to_state()))
+    ]:
+        if digests.get(key) != blob_digest(blob):
+            items[key] = blob
+
+    dataset_key = _uploaded_dataset_key()
+    if dataset_key is not None and f"dataset/{dataset_key}" not in digests:
+        uploaded_data = st.session_state.uploaded_data
+        # Compact uploads are stored compact
+        compact = isinstance(uploaded_data, CompactDataset)
+        items[f"dataset/{dataset_key}"] = encode_state(uploaded_data.to_state() if compact else encode_frame(uploaded_data))
+
+    settings = {name: st.session_state[name] for name in PERSISTED_SETTINGS}
+    meta_digest = blob_digest(encode_state((settings, dataset_key)))
+    if not items and digests.get('meta') == meta_digest:
+        return True
+
+    version = st.session_state.store_version
+    items[prefix + 'meta'] = encode_state({
+        'version': version + 1,
+        'settings': settings,
+        'dataset_key': dataset_key,
+        'row_chunks': row_chunks
+    })
+    if not store.save_versioned(items, prefix + 'meta', version):
+        return False
+    st.session_state.store_version = version + 1
+    for key, blob in items.items():
+        if key in (prefix + 'buffer', prefix + 'orders') or key.startswith('dataset/'):
+            digests[key] = blob_digest(blob)
+    digests['meta'] = meta_digest
+    for calc in saved_calculators:
+        calc.mark_saved()
+    st.session_state.store_parts = parts
+    st.session_state.store_row_chunks = row_chunks
+    st.session_state.store_tick_key = _tick_key(settings, dataset_key)
+    st.session_state.store_saved_at = time.monotonic()
+    return True
+
+def begin_session_run():
+    """Tell the memory tracker this session is running, so it is not evicted mid-run"""
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        get_memory_tracker().begin_run(ctx.session_id, ctx.session_state)
+
+def end_session_run():
+    """Measure this session after its run and enforce the memory caps"""
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        get_memory_tracker().end_run(ctx.session_id, ctx.session_state, st.session_state.get('store_game_id'))
@@ -0,0 +1,214 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Per-session size above which rebuildable caches are dropped after a run
+SESSION_MEMORY_CAP_BYTES = int(os.environ.get('TRADING_SIM_SESSION_CAP_MB', 256)) * 1024 * 1024
+
+# Total tracked size above which idle sessions are evicted, least recently used first
+TOTAL_MEMORY_CAP_BYTES = int(os.environ.get('TRADING_SIM_TOTAL_CAP_MB', 2048)) * 1024 * 1024
+
+# Sessions idle this long are evicted whatever the total size
+IDLE_EVICT_SEC = int(os.environ.get('TRADING_SIM_IDLE_EVICT_SEC', 30 * 60))
+
+# Evicted sessions are forgotten by the tracker after this long
+FORGET_AFTER_SEC = 24 * 60 * 60
+
+# Game state dropped on eviction; it is already saved in the state store and
+# is reloaded by load_session_from_store() when the session comes back
+EVICTABLE_KEYS = ['uploaded_data', 'portfolios', 'trade_journal', 'trade_buffer', 'order_book']
+
+# Containers longer than this are sized from an even sample of their items
+# (value histories hold one float, Timestamp or dict per day)
+SAMPLE_ITEMS = 64
+
+def _sample(items) -> list:
+    """SAMPLE_ITEMS items spread evenly over a list, tuple or deque"""
+    step = len(items) / SAMPLE_ITEMS
+    return [items[int(i * step)] for i in range(SAMPLE_ITEMS)]
+
+def estimate_size(obj, seen: Optional[set] = None) -> int:
+    """
+    Estimate the memory held by an object graph in bytes.
+
+    DataFrames and arrays report their buffers, figures the arrays of their
+    traces; containers and plain objects are walked recursively. Objects
+    reachable twice are only counted once. Containers of more than
+    SAMPLE_ITEMS items are sized from their length and the mean size of a
+    sample of their items, so measuring a long game stays cheap.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, go.Figure):
+        return sum(estimate_size(trace.to_plotly_json(), seen) for trace in obj.data)
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return sys.getsizeof(obj)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        items = list(obj.items())
+        if len(items) > SAMPLE_ITEMS:
+            sample = _sample(items)
+            return size + sum(estimate_size(key, seen) + estimate_size(value, seen) for key, value in sample) \
+                * len(items) // SAMPLE_ITEMS
+        size += sum(estimate_size(key, seen) + estimate_size(value, seen) for key, value in items)
+    elif isinstance(obj, (list, tuple, deque, set, frozenset)):
+        items = obj if isinstance(obj, (list, tuple, deque)) else list(obj)
+        if len(items) > SAMPLE_ITEMS:
+            return size + sum(estimate_size(item, seen) for item in _sample(items)) * len(items) // SAMPLE_ITEMS
+        size += sum(estimate_size(item, seen) for item in list(items))
+    elif hasattr(obj, '__dict__'):
+        size += estimate_size(vars(obj), seen)
+    return size
+
+class SessionMemoryTracker:
+    """
+    Process-wide accounting of session_state sizes with caps and idle eviction.
+
+    Sessions report themselves at the start and end of every script run.
+    After a run the session is measured; a session over its cap drops its
+    rebuildable chart frame cache, and when the total over all sessions is
+    over the process cap (or a session has been idle for IDLE_EVICT_SEC) idle
+    sessions are evicted: their game state, which the state store already
+    holds, is dropped from memory.
+    """
+
+    def __init__(self, session_cap_bytes: int = SESSION_MEMORY_CAP_BYTES,
+                 total_cap_bytes: int = TOTAL_MEMORY_CAP_BYTES, idle_evict_sec: float = IDLE_EVICT_SEC):
+        self.session_cap_bytes = session_cap_bytes
+        self.total_cap_bytes = total_cap_bytes
+        self.idle_evict_sec = idle_evict_sec
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict] = {}
+
+    def begin_run(self, session_id: str, session_state) -> None:
+        """Mark a session as running (running sessions are never evicted)"""
+        with self._lock:
+            entry = self._sessions.setdefault(session_id, {'size_bytes': 0, 'breakdown': {}, 'evicted': False})
+            entry.update(session_state=session_state, running=True, last_active=time.time())
+
+    def end_run(self, session_id: str, session_state, game_id: Optional[str] = None) -> int:
+        """
+        Measure a session after its run and enforce the caps.
+
+        Returns:
+            int: Estimated session size in bytes
+        """
+        breakdown = self.measure(session_state)
+        size_bytes = sum(breakdown.values())
+        if size_bytes > self.session_cap_bytes and 'frame_precomputer' in session_state:
+            # Chart frames are rebuilt on demand, so they go first
+            session_state['frame_precomputer'].invalidate()
+            breakdown = self.measure(session_state)
+            size_bytes = sum(breakdown.values())
+
+        with self._lock:
+            entry = self._sessions.setdefault(session_id, {})
+            entry.update(
+                session_state=session_state, running=False, last_active=time.time(),
+                size_bytes=size_bytes, breakdown=breakdown, game_id=game_id, evicted=False
+            )
+        self.enforce()
+        return size_bytes
+
+    @staticmethod
+    def measure(session_state) -> Dict[str, int]:
+        """Estimate the size of every session_state entry"""
+        seen = set()
+        return {key: estimate_size(value, seen) for key, value in session_state.filtered_state.items()}
+
+    def enforce(self) -> List[str]:
+        """
+        Evict idle sessions past the idle timeout, then least recently used
+        idle sessions until the total is under the process cap.
+
+        Returns:
+            List[str]: Ids of the evicted sessions
+        """
+        now = time.time()
+        evicted = []
+        with self._lock:
+            for session_id in [sid for sid, entry in self._sessions.items()
+                               if entry.get('evicted') and now - entry['last_active'] > FORGET_AFTER_SEC]:
+                del self._sessions[session_id]
+
+            idle = sorted(
+                (entry['last_active'], session_id) for session_id, entry in self._sessions.items()
+                if not entry.get('running') and not entry.get('evicted')
+            )
+            total = sum(entry.get('size_bytes', 0) for entry in self._sessions.values())
+            for last_active, session_id in idle:
+                if now - last_active <= self.idle_evict_sec and total <= self.total_cap_bytes:
+                    break
+                total -= self._evict_locked(session_id)
+                evicted.append(session_id)
+        return evicted
+
+    def evict(self, session_id: str) -> bool:
+        """Evict one session now if it is idle"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry.get('running') or entry.get('evicted'):
+                return False
+            self._evict_locked(session_id)
+            return True
+
+    def _evict_locked(self, session_id: str) -> int:
+        """Drop a session's game state; returns the bytes released"""
+        entry = self._sessions[session_id]
+        session_state = entry['session_state']
+        released = 0
+        for key in EVICTABLE_KEYS:
+            if key in session_state:
+                released += entry['breakdown'].get(key, 0)
+                del session_state[key]
+        if 'frame_precomputer' in session_state:
+            session_state['frame_precomputer'].invalidate()
+            released += entry['breakdown'].get('frame_precomputer', 0)
+        # Force a reload from the state store on the session's next run
+        session_state['store_game_id'] = None
+        entry['evicted'] = True
+        entry['size_bytes'] = max(0, entry['size_bytes'] - released)
+        return released
+
+    def sessions(self) -> List[Dict]:
+        """Get every tracked session, heaviest first"""
+        now = time.time()
+        with self._lock:
+            rows = [{
+                'session_id': session_id,
+                'game_id': entry.get('game_id'),
+                'size_bytes': entry.get('size_bytes', 0),
+                'idle_sec': 0.0 if entry.get('running') else now - entry['last_active'],
+                'running': entry.get('running', False),
+                'evicted': entry.get('evicted', False),
+                'breakdown': dict(entry.get('breakdown', {}))
+            } for session_id, entry in self._sessions.items()]
+        return sorted(rows, key=lambda row: row['size_bytes'], reverse=True)
+
+    def total_bytes(self) -> int:
+        """Get the tracked size of all sessions"""
+        with self._lock:
+            return sum(entry.get('size_bytes', 0) for entry in self._sessions.values())
+
+_tracker = SessionMemoryTracker()
+
+def get_memory_tracker() -> SessionMemoryTracker:
+    """Get the process-wide session memory tracker"""
+    return _tracker
@@ -0,0 +1,222 @@
+import hashlib
+import itertools
+import os
+import pickle
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+
+# Backend used by get_state_store(): 'sqlite' (default) or 'memory'
+STATE_STORE_ENV = 'TRADING_SIM_STATE_STORE'
+
+# SQLite database file shared by every worker process
+STATE_DB_ENV = 'TRADING_SIM_STATE_DB'
+DEFAULT_STATE_DB = 'trading_state.db'
+
+# Fast compression; state blobs are written on every rerun
+COMPRESSION_LEVEL = 1
+
+# Source of change versions (see next_version())
+_versions = itertools.count(1)
+
+def next_version() -> int:
+    """
+    Get a new change version for dirty tracking.
+
+    Versions increase across the whole process, so an object that replaced
+    another one never carries a version the session already saved.
+    """
+    return next(_versions)
+
+def encode_state(value) -> bytes:
+    """
+    Serialize plain values and numpy arrays into a compact binary blob.
+
+    Arrays are stored as raw buffers (pickle protocol 5) and the result is
+    zlib-compressed.
+    """
+    return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), COMPRESSION_LEVEL)
+
+def decode_state(blob: bytes):
+    """Inverse of encode_state(); only use on blobs this application wrote"""
+    return pickle.loads(zlib.decompress(blob))
+
+def encode_frame(df: pd.DataFrame) -> Dict:
+    """Export a DataFrame as one numpy array per column (dates as int64 nanoseconds)"""
+    return {
+        'columns': list(df.columns),
+        'arrays': [
+            df[column].to_numpy().view(np.int64) if pd.api.types.is_datetime64_ns_dtype(df[column]) else df[column].to_numpy()
+            for column in df.columns
+        ],
+        'datetime_columns': [column for column in df.columns if pd.api.types.is_datetime64_ns_dtype(df[column])]
+    }
+
+def decode_frame(state: Dict) -> pd.DataFrame:
+    """Inverse of encode_frame()"""
+    return pd.DataFrame({
+        column: array.view('datetime64[ns]') if column in state['datetime_columns'] else array
+        for column, array in zip(state['columns'], state['arrays'])
+    })
+
+class StateStore:
+    """
+    Key/value store for serialized game state.
+
+    Implementations must make save_many() and save_versioned() atomic, so a
+    reader never sees half of a batch.
+    """
+
+    def load(self, key: str) -> Optional[bytes]:
+        """Get the blob stored under key, or None"""
+        raise NotImplementedError
+
+    def load_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """Get the blobs stored under keys (missing keys are left out)"""
+        return {key: blob for key in keys if (blob := self.load(key)) is not None}
+
+    def save_many(self, items: Dict[str, bytes]) -> None:
+        """Write several blobs in one batch"""
+        raise NotImplementedError
+
+    def save_versioned(self, items: Dict[str, bytes], version_key: str, expected_version: int) -> bool:
+        """
+        Write several blobs in one batch if version_key is still at expected_version.
+
+        The version is a counter kept next to the blobs and bumped to
+        expected_version + 1 in the same batch (compare-and-swap), so of two
+        writers that started from the same version only the first succeeds.
+        A key without a version yet accepts any expected_version.
+
+        Args:
+            items: Blobs to write
+            version_key: Key whose version guards the batch
+            expected_version: Version the writer last read
+
+        Returns:
+            bool: False if another writer got there first (nothing was written)
+        """
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> None:
+        """Delete every key starting with prefix"""
+        raise NotImplementedError
+
+class MemoryStateStore(StateStore):
+    """In-process store, for tests and single-worker runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items: Dict[str, bytes] = {}
+        self._versions: Dict[str, int] = {}
+
+    def load(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._items.get(key)
+
+    def save_many(self, items: Dict[str, bytes]) -> None:
+        with self._lock:
+            self._items.update(items)
+
+    def save_versioned(self, items: Dict[str, bytes], version_key: str, expected_version: int) -> bool:
+        with self._lock:
+            if self._versions.get(version_key, expected_version) != expected_version:
+                return False
+            self._versions[version_key] = expected_version + 1
+            self._items.update(items)
+            return True
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self._items if key.startswith(prefix)]:
+                del self._items[key]
+            for key in [key for key in self._versions if key.startswith(prefix)]:
+                del self._versions[key]
+
+class SQLiteStateStore(StateStore):
+    """
+    SQLite store in WAL mode, shared by several worker processes.
+
+    WAL lets readers in other processes keep reading while one process
+    writes. Each save_many() and save_versioned() is a single transaction;
+    versions live in their own table.
+    """
+
+    def __init__(self, path: str = DEFAULT_STATE_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS versions (key TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (Streamlit runs each session on its own thread)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, key: str) -> Optional[bytes]:
+        row = self._connection().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def load_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        rows = self._connection().execute(f"SELECT key, value FROM state WHERE key IN ({placeholders})", keys)
+        return dict(rows.fetchall())
+
+    def save_many(self, items: Dict[str, bytes]) -> None:
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT INTO state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                items.items()
+            )
+
+    def save_versioned(self, items: Dict[str, bytes], version_key: str, expected_version: int) -> bool:
+        with self._connection() as connection:
+            # The version write takes the database's write lock, so the check
+            # and the blobs below commit together or not at all
+            cursor = connection.execute(
+                "INSERT INTO versions (key, version) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET version = excluded.version WHERE versions.version = ?",
+                (version_key, expected_version + 1, expected_version)
+            )
+            if cursor.rowcount != 1:
+                return False
+            connection.executemany(
+                "INSERT INTO state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                items.items()
+            )
+            return True
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM state WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            connection.execute("DELETE FROM versions WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+_default_store: Optional[StateStore] = None
+_default_store_lock = threading.Lock()
+
+def get_state_store() -> StateStore:
+    """Get the process-wide state store configured by the environment"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            if os.environ.get(STATE_STORE_ENV, 'sqlite') == 'memory':
+                _default_store = MemoryStateStore()
+            else:
+                _default_store = SQLiteStateStore(os.environ.get(STATE_DB_ENV, DEFAULT_STATE_DB))
+        return _default_store
+
+def blob_digest(blob: bytes) -> str:
+    """Short digest used to skip rewriting unchanged blobs"""
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
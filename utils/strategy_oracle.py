@@ -0,0 +1,203 @@
+"""
+Reference strategies for a dataset: the hindsight-optimal trade path and
+simple baselines, to compare the players' results against.
+
+    optimal       Best sequence of long holdings with perfect foresight,
+                  trading only at the breakpoints like the players do (short
+                  positions are not modelled: a short's value is not a fixed
+                  ratio over a segment and margin calls can cut it short)
+    buy_and_hold  Everything invested at the first breakpoint (split evenly
+                  across the instruments) and held to the end
+    cash          Never trading
+
+Between two breakpoints a portfolio that is fully in one instrument (or in
+cash) grows by that instrument's price ratio over the segment, so the
+optimum is a dynamic program over 1 + instruments states per breakpoint in
+log wealth: O(breakpoints x instruments), with the per-day values filled in
+with array operations afterwards. Proportional costs (commission and
+spread) enter the program as entry and exit factors. The chosen path is
+then executed with PnLCalculator.apply_trade, so it obeys the same
+integer-share and cash constraints as the players' trades and pays the full
+cost model. (Positions are Python integers there: compounding every swing
+of a long dataset outgrows the calculator's int64 holdings.)
+"""
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from utils.cost_models import CostModel, NO_COSTS, day_volume
+from utils.instruments import instrument_columns
+from utils.pnl_calculator import PnLCalculator
+
+REFERENCE_STRATEGIES = ('optimal', 'buy_and_hold', 'cash')
+
+REFERENCE_LABELS = {
+    'optimal': "Long-Only Optimal",
+    'buy_and_hold': "Buy & Hold",
+    'cash': "Cash Only"
+}
+
+# Holding state of the optimal path while in cash
+CASH = -1
+
+class ReferencePaths(NamedTuple):
+    """Daily values of the reference strategies of one dataset"""
+    optimal: np.ndarray
+    buy_and_hold: np.ndarray
+    cash: np.ndarray
+    # Trades of the optimal path: (day, action, quantity, instrument)
+    optimal_trades: List[Tuple[int, str, int, int]]
+
+    def lines(self) -> Dict[str, np.ndarray]:
+        """Daily values of every strategy by name"""
+        return {name: getattr(self, name) for name in REFERENCE_STRATEGIES}
+
+def optimal_states(prices: np.ndarray, decision_days: Sequence[int], entry_factor: float = 1.0,
+                   exit_factor: float = 1.0) -> np.ndarray:
+    """
+    Best holding after each decision day, with perfect foresight.
+
+    Args:
+        prices: Days x instruments price matrix
+        decision_days: Sorted days on which holdings can change
+        entry_factor: Fraction of the cash that ends up invested when buying
+        exit_factor: Fraction of the holding's value received when selling
+
+    Returns:
+        np.ndarray: Instrument held from each decision day to the next (CASH for none)
+    """
+    days = np.asarray(decision_days, dtype=np.int64)
+    if len(days) == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = np.append(days[1:], len(prices) - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_growth = np.log(prices[ends] / prices[days])
+    log_growth[~np.isfinite(log_growth)] = -np.inf
+    enter, leave = np.log(entry_factor), np.log(exit_factor)
+
+    # One step per decision over a handful of states: plain floats beat array calls here
+    instruments = range(prices.shape[1])
+    cash = 0.0
+    held = [-np.inf] * prices.shape[1]
+    # Instrument sold into cash at each decision (CASH: the cash was kept)
+    sold = [CASH] * len(days)
+    # Holdings bought at each decision rather than kept
+    bought = [()] * len(days)
+    for k, growth in enumerate(log_growth.tolist()):
+        best = max(instruments, key=held.__getitem__)
+        if held[best] + leave > cash:
+            cash = held[best] + leave
+            sold[k] = best
+        entry = cash + enter
+        bought[k] = [entry > value for value in held]
+        held = [(entry if buy else value) + change for buy, value, change in zip(bought[k], held, growth)]
+
+    # Walk the decisions backwards from the best final state
+    states = np.empty(len(days), dtype=np.int64)
+    best = max(instruments, key=held.__getitem__)
+    state = best if held[best] > cash else CASH
+    for k in range(len(days) - 1, -1, -1):
+        states[k] = state
+        if state == CASH or bought[k][state]:
+            state = sold[k]
+    return states
+
+class _PathAccount:
+    """Cash and positions of a reference path, traded with the players' rules"""
+
+    def __init__(self, initial_cash: float, num_instruments: int, cost_model: CostModel):
+        self.terms = PnLCalculator(initial_cash, cost_model=cost_model)
+        self.cash = float(initial_cash)
+        self.positions = [0] * num_instruments
+
+    def trade(self, action: str, quantity: int, price: float, volume: Optional[float], instrument: int) -> None:
+        fill_price, fee = self.terms.trade_terms(action, quantity, price, volume)
+        self.cash, self.positions[instrument] = PnLCalculator.apply_trade(
+            self.cash, self.positions[instrument], action, quantity, fill_price, None, fee
+        )
+
+    def buy_max(self, budget: float, price: float, volume: Optional[float], instrument: int) -> int:
+        """Buy as many shares as budget allows (after costs); returns the quantity bought"""
+        cost_model = self.terms.cost_model
+        fill_price, _ = self.terms.trade_terms('buy', 1, price)
+        share_cost = fill_price * (1 + cost_model.commission_bps / 1e4)
+        quantity = int((min(budget, self.cash) - cost_model.fixed_fee) // share_cost) if share_cost > 0 else 0
+        while quantity > 0:
+            try:
+                self.trade('buy', quantity, price, volume, instrument)
+                return quantity
+            except ValueError:
+                # Volume-dependent slippage makes large orders dearer per share
+                quantity -= max(1, quantity // 100)
+        return 0
+
+def _values(prices: np.ndarray, days: np.ndarray, cash: np.ndarray, holdings: np.ndarray, initial_cash: float) -> np.ndarray:
+    """Daily values of a path whose cash and holdings change only on days (days[0] onwards)"""
+    lengths = np.diff(np.append(days, len(prices)))
+    values = np.full(len(prices), float(initial_cash))
+    held_prices = prices[days[0]:]
+    if prices.shape[1] == 1:
+        invested = np.repeat(holdings[:, 0], lengths) * held_prices[:, 0]
+    else:
+        invested = np.einsum('ij,ij->i', np.repeat(holdings, lengths, axis=0), held_prices)
+    values[days[0]:] = np.repeat(cash, lengths) + invested
+    return values
+
+def reference_paths(df: pd.DataFrame, breakpoints: Sequence[int], initial_cash: float,
+                    cost_model: Optional[CostModel] = None) -> ReferencePaths:
+    """
+    Compute the reference strategies of a dataset.
+
+    Args:
+        df: DataFrame with price data
+        breakpoints: Day indices where trading is allowed
+        initial_cash: Starting cash
+        cost_model: Fees and execution-price model (None: trades are free)
+
+    Returns:
+        ReferencePaths: Daily values of each strategy and the optimal path's trades
+    """
+    cost_model = cost_model or NO_COSTS
+    prices = df[instrument_columns(df)].to_numpy(dtype=np.float64)
+    days = np.unique(np.asarray([bp for bp in breakpoints if 0 <= bp < len(prices)], dtype=np.int64))
+    num_instruments = prices.shape[1]
+    cash_values = np.full(len(prices), float(initial_cash))
+    if len(days) == 0:
+        return ReferencePaths(cash_values, cash_values.copy(), cash_values, [])
+
+    spread = cost_model.spread_bps / 2e4
+    commission = cost_model.commission_bps / 1e4
+    states = optimal_states(
+        prices, days, 1 / ((1 + spread) * (1 + commission)), (1 - spread) * (1 - commission)
+    )
+
+    # Execute the optimal path
+    account = _PathAccount(initial_cash, num_instruments, cost_model)
+    cash = np.empty(len(days))
+    holdings = np.zeros((len(days), num_instruments))
+    trades = []
+    state = CASH
+    for k, (day, target) in enumerate(zip(days.tolist(), states.tolist())):
+        if target != state:
+            if state != CASH and account.positions[state] > 0:
+                quantity = account.positions[state]
+                account.trade('sell', quantity, prices[day, state], day_volume(df, day, state), state)
+                trades.append((day, 'sell', quantity, state))
+            if target != CASH:
+                quantity = account.buy_max(account.cash, prices[day, target], day_volume(df, day, target), target)
+                if quantity:
+                    trades.append((day, 'buy', quantity, target))
+            state = target
+        cash[k] = account.cash
+        holdings[k] = account.positions
+    optimal = _values(prices, days, cash, holdings, initial_cash)
+
+    # Buy and hold from the first breakpoint, an equal share of the cash per instrument
+    account = _PathAccount(initial_cash, num_instruments, cost_model)
+    first = int(days[0])
+    for instrument in range(num_instruments):
+        account.buy_max(account.cash / (num_instruments - instrument), prices[first, instrument],
+                        day_volume(df, first, instrument), instrument)
+    buy_and_hold = _values(prices, days[:1], np.array([account.cash]), np.array([account.positions], dtype=np.float64),
+                           initial_cash)
+
+    return ReferencePaths(optimal, buy_and_hold, cash_values, trades)
@@ -0,0 +1,253 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from utils.pnl_calculator import PnLCalculator
+from utils.resting_orders import ORDER_TYPES, FILL_ACTIONS, validate_resting_order
+
+class StagedOrder(NamedTuple):
+    """
+    One node of a player's staged-order chain.
+
+    Each node stores the cash/holdings after its order and points at the node
+    before it, so staging and undoing are O(1) and share all earlier state.
+    """
+    cash: float
+    holdings: Tuple[int, ...]
+    action: Optional[str]
+    quantity: int
+    price: float
+    parent: Optional['StagedOrder']
+    instrument: int = 0
+
+    def position(self, instrument: int) -> int:
+        """Shares held in an instrument after this order"""
+        return self.holdings[instrument] if instrument < len(self.holdings) else 0
+
+def _replace_position(holdings: Tuple[int, ...], instrument: int, position: int) -> Tuple[int, ...]:
+    padded = holdings + (0,) * (instrument + 1 - len(holdings))
+    return padded[:instrument] + (position,) + padded[instrument + 1:]
+
+class TradeBuffer:
+    """
+    Transactional per-breakpoint buffer of player orders.
+
+    Orders are validated with PnLCalculator.apply_trade against the player's
+    staged state and only applied to the real portfolios by commit(), which
+    happens when the simulation resumes. Portfolios and their metrics history
+    are never copied while orders are staged. Resting orders (limit, stop-loss,
+    take-profit) are validated against the staged state but do not change it;
+    commit() hands them to a RestingOrderBook.
+    """
+
+    def __init__(self):
+        self.discard()
+
+    def discard(self) -> None:
+        """Drop every staged order."""
+        self._heads: Dict[int, StagedOrder] = {}
+        self.day_index: Optional[int] = None
+        self.date = None
+        self.volume: Optional[float] = None
+
+    def view(self, player_num: int, portfolio: Dict, instrument: int = 0):
+        """
+        Get a player's cash and positions including staged orders, in O(1).
+
+        Args:
+            instrument: Instrument whose position is returned
+
+        Returns:
+            Tuple[float, int]: (cash, positions)
+        """
+        head = self._heads.get(player_num)
+        if head is None:
+            return portfolio['cash'], portfolio['pnl_calculator'].holding(instrument)
+        return head.cash, head.position(instrument)
+
+    def stage(self, player_num: int, portfolio: Dict, action: str, quantity: int, price: float,
+              day_index: int, date, volume: Optional[float] = None, instrument: int = 0) -> None:
+        """
+        Stage an order ('buy', 'sell', 'hold' or a resting order type) for a player.
+
+        Args:
+            player_num: Player number
+            portfolio: Player's committed portfolio
+            action: 'buy', 'sell', 'hold' or one of ORDER_TYPES
+            quantity: Number of shares
+            price: Price per share (trigger price for resting orders)
+            day_index: Breakpoint day the order is placed on
+            date: Date of that day
+            volume: Volume traded that day (for volume-dependent slippage)
+            instrument: Instrument traded (column of a multi-instrument dataset)
+
+        Raises:
+            ValueError: If the order is not affordable (including costs) given the staged state
+        """
+        if day_index != self.day_index:
+            # Orders from an earlier breakpoint were never committed
+            self.discard()
+            self.day_index = day_index
+            self.date = date
+            self.volume = volume
+        head = self._heads.get(player_num)
+        calc = portfolio['pnl_calculator']
+        if head is None:
+            head = StagedOrder(portfolio['cash'], tuple(calc.holdings.tolist()), None, 0, 0.0, None)
+        position = head.position(instrument)
+        if action in ORDER_TYPES:
+            # Resting orders fill on a later day, so only the price-independent costs are known
+            fill_price, fee = calc.trade_terms(FILL_ACTIONS[action], quantity, price)
+            validate_resting_order(head.cash, position, action, quantity, fill_price, calc.margin_requirement, fee)
+            cash, holdings = head.cash, head.holdings
+        else:
+            fill_price, fee = calc.trade_terms(action, quantity, price, self._volume(instrument))
+            cash, position = PnLCalculator.apply_trade(
+                head.cash, position, action, quantity, fill_price, calc.margin_requirement, fee
+            )
+            holdings = _replace_position(head.holdings, instrument, position)
+        self._heads[player_num] = StagedOrder(cash, holdings, action, quantity, price, head, instrument)
+
+    def _volume(self, instrument: int) -> Optional[float]:
+        # The Volume column belongs to the first instrument
+        return self.volume if instrument == 0 else None
+
+    def undo(self, player_num: int) -> bool:
+        """
+        Remove a player's most recently staged order.
+
+        Returns:
+            bool: True if an order was removed
+        """
+        head = self._heads.get(player_num)
+        if head is None or head.action is None:
+            return False
+        self._heads[player_num] = head.parent
+        return True
+
+    def amend(self, player_num: int, portfolio: Dict, action: str, quantity: int, price: float,
+              instrument: Optional[int] = None) -> None:
+        """
+        Replace a player's most recently staged order.
+
+        Args:
+            instrument: Instrument of the new order (None: the replaced order's)
+
+        Raises:
+            ValueError: If the new order is not affordable; the old order is kept
+        """
+        head = self._heads.get(player_num)
+        if head is None or head.action is None:
+            raise ValueError("No staged order to amend")
+        self._heads[player_num] = head.parent
+        try:
+            self.stage(
+                player_num, portfolio, action, quantity, price, self.day_index, self.date, self.volume,
+                head.instrument if instrument is None else instrument
+            )
+        except ValueError:
+            self._heads[player_num] = head
+            raise
+
+    def staged_orders(self, player_num: int) -> List[StagedOrder]:
+        """
+        Get a player's staged orders, oldest first.
+        """
+        orders = []
+        node = self._heads.get(player_num)
+        while node is not None and node.action is not None:
+            orders.append(node)
+            node = node.parent
+        return orders[::-1]
+
+    def has_orders(self) -> bool:
+        """Check whether any player has staged orders."""
+        return any(head.action is not None for head in self._heads.values())
+
+    def to_state(self) -> Dict:
+        """Export the staged orders as plain values for the state store"""
+        return {
+            'day_index': self.day_index,
+            'date': self.date,
+            'volume': self.volume,
+            'orders': {
+                player_num: [
+                    (order.action, order.quantity, order.price, order.instrument) for order in self.staged_orders(player_num)
+                ]
+                for player_num in self._heads
+            }
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict, portfolios: Dict) -> 'TradeBuffer':
+        """Rebuild a buffer exported with to_state() by re-staging its orders"""
+        buffer = cls()
+        for player_num, orders in state['orders'].items():
+            for action, quantity, price, *instrument in orders:
+                buffer.stage(
+                    player_num, portfolios[player_num], action, quantity, price,
+                    state['day_index'], state['date'], state.get('volume'), *instrument
+                )
+        buffer.day_index = state['day_index']
+        buffer.date = state['date']
+        buffer.volume = state.get('volume')
+        return buffer
+
+    def commit(self, portfolios: Dict, journal=None, order_book=None) -> None:
+        """
+        Atomically apply all staged orders to the portfolios and clear the buffer.
+
+        If any order fails, every calculator is restored to its state before
+        the commit and the error is re-raised.
+
+        Args:
+            portfolios: Player portfolios
+            journal: Optional TradeJournal to record the committed trades in
+            order_book: RestingOrderBook receiving staged resting orders (they
+                are dropped without one)
+        """
+        if not self.has_orders():
+            self.discard()
+            return
+
+        snapshots = {
+            player_num: (portfolio['pnl_calculator'].snapshot(), len(portfolio['trading_history']))
+            for player_num, portfolio in portfolios.items()
+        }
+        try:
+            for player_num in sorted(self._heads):
+                portfolio = portfolios[player_num]
+                for order in self.staged_orders(player_num):
+                    if order.action in ORDER_TYPES:
+                        continue
+                    if order.action != 'hold':
+                        portfolio['pnl_calculator'].execute_trade(
+                            order.action, order.quantity, order.price, self._volume(order.instrument), order.instrument
+                        )
+                    portfolio['trading_history'].append({
+                        'action': order.action,
+                        'price': order.price,
+                        'quantity': order.quantity,
+                        'date': self.date,
+                        'instrument': order.instrument
+                    })
+        except ValueError:
+            for player_num, (calc_snapshot, history_length) in snapshots.items():
+                portfolios[player_num]['pnl_calculator'].restore(calc_snapshot)
+                del portfolios[player_num]['trading_history'][history_length:]
+            raise
+        finally:
+            for portfolio in portfolios.values():
+                portfolio['cash'] = portfolio['pnl_calculator'].cash
+                portfolio['positions'] = portfolio['pnl_calculator'].positions
+
+        if journal is not None:
+            journal.record_trades(self.day_index, [
+                (player_num, order.action, order.quantity, order.price, order.instrument)
+                for player_num in sorted(self._heads)
+                for order in self.staged_orders(player_num)
+                if order.action not in ORDER_TYPES
+            ], portfolios)
+        if order_book is not None:
+            for player_num in sorted(self._heads):
+                for order in self.staged_orders(player_num):
+                    if order.action in ORDER_TYPES:
+                        order_book.add(player_num, order.action, order.quantity, order.price, self.day_index, order.instrument)
+        self.discard()
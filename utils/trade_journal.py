@@ -0,0 +1,308 @@
+import copy
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from utils.cost_models import day_volume
+from utils.instruments import instrument_columns, record_portfolio_values
+from utils.resting_orders import RestingOrder
+from utils.state_store import next_version
+
+# Snapshot all calculators after this many journal events
+SNAPSHOT_INTERVAL = 25
+
+class TradeJournal:
+    """
+    Append-only journal of trades, resting orders and day advances with periodic snapshots.
+
+    Consecutive day advances are coalesced into one ('advance', from_day, to_day)
+    event, replayed as one valuation per day of the run; the journal starts
+    with the valuation of day 0. Trades are stored as ('trade', day, player_num,
+    action, quantity, price, instrument) and the resting orders committed at a
+    breakpoint, once scheduled, as ('orders', day, orders). Every
+    SNAPSHOT_INTERVAL events the state of every PnLCalculator is captured with
+    PnLCalculator.snapshot(), so seeking or rewinding to a day costs one snapshot restore
+    plus the replay of at most SNAPSHOT_INTERVAL events.
+    """
+
+    def __init__(self, snapshot_interval: int = SNAPSHOT_INTERVAL):
+        self.snapshot_interval = snapshot_interval
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clear the journal back to the valuation of day 0; the implicit first
+        snapshot is the initial portfolio state.
+        """
+        self.events: List[Tuple] = [('advance', 0, 0)]
+        # Day of each event (last day for advances), non-decreasing
+        self._event_days: List[int] = [0]
+        # (event position, {player_num: (calculator snapshot, trading history length)})
+        self.snapshots: List[Tuple[int, Optional[Dict[int, Tuple]]]] = [(0, None)]
+        self._snapshot_positions: List[int] = [0]
+        # Positions of the 'orders' events
+        self._order_positions: List[int] = []
+        self._run_open = True
+        # Moves on every change, so the state store only re-saves a changed journal
+        self.version = next_version()
+
+    def record_advance(self, day_index: int, portfolios: Dict, first_day: Optional[int] = None) -> None:
+        """
+        Record that the simulation moved forward to day_index, valuing every
+        portfolio on each day from first_day.
+
+        Args:
+            day_index: New current day index
+            portfolios: Player portfolios (used for periodic snapshots)
+            first_day: First day valued by this advance (default: day_index only)
+        """
+        first_day = day_index if first_day is None else first_day
+        if self._run_open and self.events[-1][2] <= day_index:
+            # Extend the current run of advances instead of adding an event
+            self.events[-1] = ('advance', self.events[-1][1], day_index)
+            self._event_days[-1] = day_index
+            self.version = next_version()
+            return
+        self._run_open = True
+        self.events.append(('advance', first_day, day_index))
+        self._event_days.append(day_index)
+        self._maybe_snapshot(portfolios)
+        self.version = next_version()
+
+    def record_trade(self, day_index: int, player_num: int, action: str, quantity: int,
+                     price: float, portfolios: Dict) -> None:
+        """
+        Record a trade (or hold) that has been applied to a player's portfolio.
+
+        Args:
+            day_index: Day index the trade was made on
+            player_num: Player number
+            action: 'buy', 'sell', 'cover' or 'hold'
+            quantity: Number of shares
+            price: Quoted price before trading costs (the calculator applies
+                the cost model, also when the trade is replayed)
+            portfolios: Player portfolios (used for periodic snapshots)
+        """
+        self.record_trades(day_index, [(player_num, action, quantity, price)], portfolios)
+
+    def record_trades(self, day_index: int, trades: List[Tuple], portfolios: Dict) -> None:
+        """
+        Record a batch of trades that have all been applied to the portfolios.
+
+        A snapshot is only considered after the whole batch, so it always
+        matches the portfolios' current state.
+
+        Args:
+            day_index: Day index the trades were made on
+            trades: (player_num, action, quantity, quoted price[, instrument]) tuples in execution order
+            portfolios: Player portfolios (used for periodic snapshots)
+        """
+        for player_num, action, quantity, price, *instrument in trades:
+            self.events.append(('trade', day_index, player_num, action, quantity, price, instrument[0] if instrument else 0))
+            self._event_days.append(day_index)
+        self._run_open = False
+        self._maybe_snapshot(portfolios)
+        self.version = next_version()
+
+    def record_orders(self, orders: List[RestingOrder], portfolios: Dict) -> None:
+        """
+        Record resting orders placed at a breakpoint, once the order book has
+        scheduled them (their fill and expiry days are part of the record).
+
+        Args:
+            orders: Scheduled orders, all placed on the same day
+            portfolios: Player portfolios (used for periodic snapshots)
+        """
+        if not orders:
+            return
+        day_index = orders[0].placed_day
+        self._order_positions.append(len(self.events))
+        self.events.append(('orders', day_index, tuple(tuple(order) for order in orders)))
+        self._event_days.append(day_index)
+        self._run_open = False
+        self._maybe_snapshot(portfolios)
+        self.version = next_version()
+
+    def to_state(self) -> Dict:
+        """Export the journal as plain values for the state store"""
+        return {
+            'snapshot_interval': self.snapshot_interval,
+            'events': self.events,
+            'event_days': self._event_days,
+            'snapshots': self.snapshots,
+            'run_open': self._run_open
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'TradeJournal':
+        """Rebuild a journal exported with to_state()"""
+        journal = cls(state['snapshot_interval'])
+        journal.events = list(state['events'])
+        journal._event_days = list(state['event_days'])
+        journal.snapshots = list(state['snapshots'])
+        journal._snapshot_positions = [position for position, _ in journal.snapshots]
+        journal._order_positions = [position for position, event in enumerate(journal.events) if event[0] == 'orders']
+        journal._run_open = state['run_open']
+        return journal
+
+    def seek(self, portfolios: Dict, df: pd.DataFrame, day_index: int) -> Tuple[Dict, List[RestingOrder]]:
+        """
+        Rebuild the portfolios as they were on arrival at day_index (after that
+        day's settlement fills, margin calls and valuation, before the players'
+        trades) without touching the game or the journal, e.g. for a replay or
+        a post-game review.
+
+        Args:
+            portfolios: Player portfolios of the game, left unchanged
+            df: DataFrame with price data (for replayed valuations)
+            day_index: Day index to seek to
+
+        Returns:
+            Tuple[Dict, List[RestingOrder]]: Copies of the portfolios restored
+            to day_index and the orders still resting on arrival there
+        """
+        copies = copy.deepcopy(portfolios)
+        position, _, _ = self._restore(copies, df, day_index)
+        return copies, self._resting_orders(bisect_left(self._order_positions, position), day_index)
+
+    def rewind(self, portfolios: Dict, df: pd.DataFrame, day_index: int, order_book=None) -> None:
+        """
+        Restore every portfolio in place to its state on arrival at day_index
+        and discard the journal after that point, so play resumes from there.
+
+        Args:
+            portfolios: Player portfolios to restore in place
+            df: DataFrame with price data (for replayed valuations)
+            day_index: Day index to rewind to
+            order_book: Optional RestingOrderBook, refilled with the orders
+                still resting on arrival at day_index
+        """
+        position, partial_advance, snapshot_index = self._restore(portfolios, df, day_index)
+        order_count = bisect_left(self._order_positions, position)
+        if order_book is not None:
+            order_book.orders = self._resting_orders(order_count, day_index)
+
+        # Drop the future: the journal now ends at the target day
+        del self.events[position:]
+        del self._event_days[position:]
+        del self.snapshots[snapshot_index + 1:]
+        del self._snapshot_positions[snapshot_index + 1:]
+        del self._order_positions[order_count:]
+        self._run_open = False
+        if partial_advance is not None:
+            self.events.append(partial_advance)
+            self._event_days.append(day_index)
+            self._run_open = True
+        self.version = next_version()
+
+    def _restore(self, portfolios: Dict, df: pd.DataFrame, day_index: int) -> Tuple[int, Optional[Tuple], int]:
+        """
+        Restore portfolios in place to their state on arrival at day_index
+        from the nearest snapshot, leaving the journal unchanged.
+
+        Returns:
+            Tuple[int, Optional[Tuple], int]: Position of the first event after
+            the arrival, the advance replayed up to day_index when a run of
+            advances reaches past it (else None), and the snapshot used
+        """
+        # Events strictly before the target day are replayed in full
+        position = bisect_left(self._event_days, day_index)
+        day_end = bisect_right(self._event_days, day_index)
+
+        # Settlement trades on the target day are followed by its valuation, so
+        # everything up to the day's last advance belongs to the arrival
+        for index in range(day_end - 1, position - 1, -1):
+            if self.events[index][0] == 'advance':
+                position = index + 1
+                break
+
+        # An advance run reaching past the target day is replayed up to it
+        partial_advance = None
+        if day_end < len(self.events) and self.events[day_end][0] == 'advance' \
+                and self.events[day_end][1] <= day_index:
+            position = day_end
+            partial_advance = ('advance', self.events[day_end][1], day_index)
+
+        snapshot_index = bisect_right(self._snapshot_positions, position) - 1
+        snapshot_position, player_snapshots = self.snapshots[snapshot_index]
+
+        for player_num, portfolio in portfolios.items():
+            calc_snapshot, history_length = (None, 0) if player_snapshots is None else player_snapshots[player_num]
+            portfolio['pnl_calculator'].restore(calc_snapshot)
+            del portfolio['trading_history'][history_length:]
+
+        replay = self.events[snapshot_position:position]
+        if partial_advance is not None:
+            replay.append(partial_advance)
+        for event in replay:
+            self._apply(event, portfolios, df)
+
+        for portfolio in portfolios.values():
+            portfolio['cash'] = portfolio['pnl_calculator'].cash
+            portfolio['positions'] = portfolio['pnl_calculator'].positions
+        return position, partial_advance, snapshot_index
+
+    def _resting_orders(self, order_count: int, day_index: int) -> List[RestingOrder]:
+        """
+        Orders of the first order_count 'orders' events still resting on
+        arrival at day_index, i.e. kept by RestingOrderBook.fill_due(day_index).
+
+        Orders expire before the next breakpoint, so expiry days never go
+        down along the journal and the walk back stops at the first event
+        that has expired.
+        """
+        orders = []
+        for position in reversed(self._order_positions[:order_count]):
+            event_orders = [RestingOrder(*order) for order in self.events[position][2]]
+            if all(order.expiry_day <= day_index for order in event_orders):
+                break
+            orders[:0] = [
+                order for order in event_orders
+                if (order.fill_day > day_index if order.fill_day >= 0 else order.expiry_day > day_index)
+            ]
+        return orders
+
+    def drop_snapshots(self) -> None:
+        """Forget every snapshot but the initial state (e.g. after trades were re-priced)"""
+        del self.snapshots[1:]
+        del self._snapshot_positions[1:]
+        self.version = next_version()
+
+    def _maybe_snapshot(self, portfolios: Dict) -> None:
+        if len(self.events) - self.snapshots[-1][0] >= self.snapshot_interval:
+            self.snapshots.append((len(self.events), {
+                player_num: (portfolio['pnl_calculator'].snapshot(), len(portfolio['trading_history']))
+                for player_num, portfolio in portfolios.items()
+            }))
+            self._snapshot_positions.append(len(self.events))
+            # A snapshot seals the current advance run
+            self._run_open = False
+
+    @staticmethod
+    def _apply(event: Tuple, portfolios: Dict, df: pd.DataFrame) -> None:
+        """Re-apply one journal event to the portfolios"""
+        if event[0] == 'orders':
+            # Resting orders only change the portfolios through their fills, journaled as trades
+            return
+        if event[0] == 'advance':
+            _, first_day, last_day = event
+            record_portfolio_values(
+                portfolios,
+                df.iloc[first_day:last_day + 1][instrument_columns(df)].to_numpy(dtype=np.float64),
+                df.iloc[first_day:last_day + 1]['Date']
+            )
+            return
+
+        _, day_index, player_num, action, quantity, price, instrument = event
+        portfolio = portfolios[player_num]
+        if action != 'hold':
+            portfolio['pnl_calculator'].execute_trade(
+                action, quantity, price, day_volume(df, day_index, instrument), instrument
+            )
+        portfolio['trading_history'].append({
+            'action': action,
+            'price': price,
+            'quantity': quantity,
+            'date': df.iloc[day_index]['Date'],
+            'instrument': instrument
+        })
@@ -1,3 +1,5 @@
+import plotly.graph_objects as go
+
 # Player colors for consistent visualization
 PLAYER_COLORS = {
     1: '#1f77b4',  # Blue
@@ -8,9 +10,16 @@ PLAYER_COLORS = {
 
 CURRENCY_INDICATOR = '₹'
 
+# Traces with more points than this are drawn with WebGL (Scattergl) instead of SVG
+WEBGL_POINT_THRESHOLD = 5000
+
 def get_hoverlabel_config():
     """Get consistent hoverlabel configuration for all charts"""
     import streamlit as st
     return dict(
         font=dict(size=st.session_state.chart_hoverlabel_font_size)
-    )
\ No newline at end of file
+    )
+
+def get_scatter_class(num_points: int):
+    """Pick the scatter trace class (SVG or WebGL) for a trace with num_points points"""
+    return go.Scattergl if num_points > WEBGL_POINT_THRESHOLD else go.Scatter
@@ -9,10 +9,16 @@ import numpy as np
 from io import BytesIO
 import base64
 from utils.visual_configs import PLAYER_COLORS, CURRENCY_INDICATOR
+from utils.instruments import day_prices, describe_holdings, instrument_names, update_portfolio_values
+from utils.risk_metrics import TRADING_PERIODS_PER_YEAR
+from utils.strategy_oracle import REFERENCE_LABELS
 
-def create_portfolio_summary_image(df, current_day_index, portfolios, player_names, num_players):
+def create_portfolio_summary_image(df, current_day_index, portfolios, player_names, num_players,
+                                   periods_per_year=TRADING_PERIODS_PER_YEAR, reference=None):
     """
     Create a combined image of portfolio stats and performance charts
+    (risk ratios annualized with periods_per_year, reference strategy lines
+    from get_reference_lines() drawn dashed next to the players)
     Returns a base64 encoded image string
     """
     # Create figure with subplots
@@ -35,27 +41,31 @@ def create_portfolio_summary_image(df, current_day_index, portfolios, player_nam
         'Stock\nQty',
         'Returns\n%',
         'Max\nDrawdown',
-        'Sharpe'
+        'Sharpe\n(ann.)',
+        'Sortino'
     ]
     
+    names = instrument_names(df)
+    values = dict(zip(
+        portfolios,
+        update_portfolio_values(portfolios, day_prices(df, current_day_index), df.iloc[current_day_index]['Date'])
+    ))
     for player_num in range(1, num_players + 1):
-        current_price = df.iloc[current_day_index]['Price']
         portfolio = portfolios[player_num]
         pnl_calc = portfolio['pnl_calculator']
         
-        pnl_calc.update_portfolio_value(current_price, df.iloc[current_day_index]['Date'])
-        portfolio_value = pnl_calc.get_portfolio_value(current_price)
-        pnl = pnl_calc.get_current_pnl()
-        metrics = pnl_calc.get_performance_metrics()
+        portfolio_value = values[player_num]
+        pnl = portfolio_value - pnl_calc.initial_cash
+        metrics = pnl_calc.get_performance_metrics(periods_per_year)
         
         # Calculate all metrics
         cash_in_hand = portfolio['cash']
-        equity_in_hand = portfolio['positions'] * current_price
-        stock_qty = portfolio['positions']
+        equity_in_hand = portfolio_value - pnl_calc.cash
+        stock_qty = describe_holdings(pnl_calc.holdings, names)
         total_investment = pnl_calc.initial_cash
         total_returns_pct = metrics['total_return']
         drawdown = metrics['max_drawdown']
-        sharpe = metrics['sharpe_ratio']
+        sharpe = metrics['annualized_sharpe']
         
         stats_data.append([
             player_names[player_num],
@@ -64,10 +74,11 @@ def create_portfolio_summary_image(df, current_day_index, portfolios, player_nam
             f"{CURRENCY_INDICATOR}{pnl:,.0f}",
             f"{CURRENCY_INDICATOR}{cash_in_hand:,.0f}",
             f"{CURRENCY_INDICATOR}{equity_in_hand:,.0f}",
-            f"{stock_qty:,}",
+            stock_qty,
             f"{'+' if total_returns_pct > 0 else ''}{total_returns_pct:.1f}%",
             f"{'-' if drawdown > 0 else ''}{drawdown:.1f}%",
-            f"{sharpe:.3f}"
+            f"{sharpe:.3f}",
+            f"{metrics['sortino_ratio']:.3f}"
         ])
     
     # Create table
@@ -103,6 +114,10 @@ def create_portfolio_summary_image(df, current_day_index, portfolios, player_nam
                         label=player_names[player_num],
                         linewidth=2)
     
+    for name, (dates, values) in (reference or {}).items():
+        ax2.plot(dates, values, color='gray', linestyle='--' if name == 'optimal' else ':',
+                 label=REFERENCE_LABELS[name], linewidth=1.5)
+    
     ax2.set_xlabel('Date')
     ax2.set_ylabel(f'Value ({CURRENCY_INDICATOR})')
     ax2.legend()